@@ -1,17 +1,39 @@
 #define HWSERIAL Serial1
 
+// Binary protocol (utils/teensy_protocol.py): every message is
+//   0xA5 0x5A | type | payload length | payload | CRC-16/CCITT (init 0xFFFF) over type, length, payload
+// little-endian. TAP records carry the press and onset times on the 64-bit micros() clock; the host
+// maps them onto its own clock from the PING/ECHO exchanges.
+const uint8_t SYNC0    = 0xA5;
+const uint8_t SYNC1    = 0x5A;
+const uint8_t MSG_TAP  = 0x01;
+const uint8_t MSG_PING = 0x02;
+const uint8_t MSG_ECHO = 0x03;
+
 const int buttonPin      = 2;   // Pin where the button is connected
 const int micPin         = 23;  // Pin where the microphone sensor is connected
 const int threshold      = 30;  // Threshold for detecting audio onset
 const int errorThreshold = 5;   // Ignore any delays ≤ this (ms)
 const int upperThreshold = 50;
+const unsigned long holdOffUs = 100000;  // no new press before this delay after a logged tap
+
+uint64_t buttonPressTime;
+uint64_t audioDetectTime;
+uint64_t holdOffUntil = 0;
+uint32_t tapSeq = 0;
 
-unsigned long buttonPressTime;
-unsigned long audioDetectTime;
+// 64-bit micros(): extends the 32-bit counter (wraps every ~71 min), called at least once per loop
+uint32_t lastMicros = 0;
+uint32_t microsHigh = 0;
 
-unsigned long sampleTimeA;
-unsigned long sampleTimeB;
-unsigned long sampleTime;
+uint64_t micros64() {
+  uint32_t now = micros();
+  if (now < lastMicros) {
+    microsHigh++;
+  }
+  lastMicros = now;
+  return ((uint64_t)microsHigh << 32) | now;
+}
 
 // 0 = idle (waiting for press)
 // 1 = pressed (waiting for mic to go quiet)
@@ -19,6 +41,72 @@ unsigned long sampleTime;
 // 3 = done (waiting for release)
 int state = 0;
 
+// ---------------------- Framing ----------------------
+uint16_t crc16(const uint8_t *data, size_t len) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendFrame(uint8_t type, const uint8_t *payload, uint8_t len) {
+  uint8_t frame[2 + 2 + 32 + 2];
+  frame[0] = SYNC0;
+  frame[1] = SYNC1;
+  frame[2] = type;
+  frame[3] = len;
+  memcpy(frame + 4, payload, len);
+  uint16_t crc = crc16(frame + 2, len + 2);
+  frame[4 + len] = crc & 0xFF;
+  frame[5 + len] = crc >> 8;
+  Serial.write(frame, len + 6);
+  Serial.send_now();  // do not wait for the USB packet to fill up
+}
+
+void sendTap(uint32_t seq, uint64_t pressUs, uint64_t onsetUs) {
+  uint8_t payload[20];
+  memcpy(payload, &seq, 4);
+  memcpy(payload + 4, &pressUs, 8);
+  memcpy(payload + 12, &onsetUs, 8);
+  sendFrame(MSG_TAP, payload, sizeof(payload));
+}
+
+// PING parser: the reception time is taken when the frame starts arriving
+uint8_t rxFrame[2 + 2 + 4 + 2];
+uint8_t rxLen = 0;
+uint64_t rxTime = 0;
+
+void pollPing() {
+  while (Serial.available()) {
+    uint8_t c = Serial.read();
+    if (rxLen == 0) {
+      if (c != SYNC0) continue;
+      rxTime = micros64();
+    } else if (rxLen == 1 && c != SYNC1) {
+      rxLen = (c == SYNC0) ? 1 : 0;
+      continue;
+    }
+    rxFrame[rxLen++] = c;
+    if (rxLen == 4 && (rxFrame[2] != MSG_PING || rxFrame[3] != 4)) {
+      rxLen = 0;  // only pings go to the Teensy
+      continue;
+    }
+    if (rxLen == sizeof(rxFrame)) {
+      rxLen = 0;
+      uint16_t crc = rxFrame[8] | ((uint16_t)rxFrame[9] << 8);
+      if (crc != crc16(rxFrame + 2, 6)) continue;
+      uint8_t payload[12];
+      memcpy(payload, rxFrame + 4, 4);  // ping id
+      memcpy(payload + 4, &rxTime, 8);
+      sendFrame(MSG_ECHO, payload, sizeof(payload));
+    }
+  }
+}
+
 void setup() {
   pinMode(buttonPin, INPUT_PULLUP);
   Serial.begin(115200);
@@ -26,9 +114,11 @@ void setup() {
 }
 
 void loop() {
+  uint64_t now = micros64();
+  pollPing();
+
   // read mic "delta"
   // int mn = 1024, mx = 0;
-  // sampleTimeA = micros();
   // for (int i = 0; i < 5; i++) {
   //   int v = analogRead(micPin);
   //   mn = min(mn, v);
@@ -36,17 +126,14 @@ void loop() {
   // }
   // int delta = mx - mn;
   int delta = analogRead(micPin);
-  // sampleTimeB = micros();
-  // sampleTime = (sampleTimeB-sampleTimeA);
-  // Serial.println(sampleTime);
 
   bool pressed = (digitalRead(buttonPin) == LOW);
   // Serial.println(delta);
 
   switch (state) {
     case 0: // idle
-      if (pressed) {
-        buttonPressTime = millis();
+      if (pressed && now >= holdOffUntil) {
+        buttonPressTime = now;
         state = 1;
       }
       break;
@@ -59,15 +146,12 @@ void loop() {
 
     case 2: // waiting for sound onset
       if (delta >= threshold) {
-        audioDetectTime = millis();
-        unsigned long delayTime = audioDetectTime - buttonPressTime;
-        if ((delayTime > errorThreshold) && (delayTime < upperThreshold)){
-        // if ((delayTime > errorThreshold)){
-          Serial.println(delayTime);
-          Serial.println();
-        delay(100);
-
-          // HWSERIAL.print(delayTime);
+        audioDetectTime = micros64();
+        uint64_t delayUs = audioDetectTime - buttonPressTime;
+        if ((delayUs > errorThreshold * 1000ULL) && (delayUs < upperThreshold * 1000ULL)) {
+          sendTap(tapSeq++, buttonPressTime, audioDetectTime);
+          // instead of delay(100): the clock sync pings keep being answered
+          holdOffUntil = audioDetectTime + holdOffUs;
         }
         // Move to “done” so we don’t log again until button release
         state = 3;
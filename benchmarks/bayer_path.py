@@ -0,0 +1,107 @@
+"""
+Benchmark: per-frame cost of the camera-to-detector color path, on synthetic Bayer frames.
+
+BGR path (default): the mosaic is demosaiced to BGR on the producer side (what PySpin's
+ImageProcessor does), the 3-channel frame is written to the shared-memory ring, and the detector
+converts it again, BGR to RGB, into a new array.
+
+Bayer path (`--bayer`): the 1-channel mosaic is written to the ring as is, and the detector
+demosaics it once, straight to RGB, into its preallocated buffer.
+
+Also checks the RGGB pattern mapping: a mosaic of a synthetic BGR image, demosaiced through the
+Bayer path, must give back the same image in RGB order.
+
+Usage:
+    python -m benchmarks.bayer_path [--frames 2000]
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from utils.bayer import BAYER_RG2BGR, BAYER_RG2RGB, demosaic, mosaic_rg
+from utils.frame_ring import FrameRing
+
+FRAME_SIZE = (540, 720)  # (height, width), as in latency_mp.py
+
+
+def check_pattern():
+    # smooth color gradients, so bilinear demosaicing is nearly exact away from the borders
+    h, w = FRAME_SIZE
+    yy, xx = np.mgrid[0:h, 0:w]
+    bgr = np.stack([xx * 255 // w, yy * 255 // h, (xx + yy) * 255 // (w + h)], axis=-1).astype(np.uint8)
+    rgb = demosaic(mosaic_rg(bgr), BAYER_RG2RGB)
+    err = np.abs(rgb[4:-4, 4:-4].astype(int) - bgr[4:-4, 4:-4, ::-1].astype(int))
+    return int(err.max())
+
+
+def run_bgr(raw, n_frames):
+    ring = FrameRing.create(4, FRAME_SIZE + (3,), np.uint8)
+    samples = np.empty((n_frames, 2))
+    try:
+        for i in range(n_frames):
+            t0 = time.perf_counter()
+            frame = demosaic(raw, BAYER_RG2BGR)
+            frame_id = ring.write(frame, t0)
+            t1 = time.perf_counter()
+            view = ring.acquire(frame_id)
+            image_rgb = cv2.cvtColor(view, cv2.COLOR_BGR2RGB)
+            t2 = time.perf_counter()
+            samples[i] = t1 - t0, t2 - t1
+        return samples, frame.nbytes, image_rgb
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def run_bayer(raw, n_frames):
+    ring = FrameRing.create(4, FRAME_SIZE, np.uint8)
+    rgb = np.empty(FRAME_SIZE + (3,), dtype=np.uint8)
+    samples = np.empty((n_frames, 2))
+    try:
+        for i in range(n_frames):
+            t0 = time.perf_counter()
+            frame = raw.copy()  # Flircam(bayer=True) copies the mosaic out of the camera buffer
+            frame_id = ring.write(frame, t0)
+            t1 = time.perf_counter()
+            view = ring.acquire(frame_id)
+            image_rgb = demosaic(view, BAYER_RG2RGB, out=rgb)
+            t2 = time.perf_counter()
+            samples[i] = t1 - t0, t2 - t1
+        return samples, frame.nbytes, image_rgb
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def main():
+    p = argparse.ArgumentParser(description="BGR vs raw Bayer path between the camera and the detector.")
+    p.add_argument('--frames', type=int, default=2000, help='Frames per path (default: 2000)')
+    args = p.parse_args()
+
+    max_err = check_pattern()
+    print(f"RGGB -> RGB mapping: max error {max_err} on a synthetic gradient")
+
+    rng = np.random.default_rng(0)
+    raw = rng.integers(0, 256, FRAME_SIZE, dtype=np.uint8)
+
+    bgr_samples, bgr_bytes, bgr_rgb = run_bgr(raw, args.frames)
+    bayer_samples, bayer_bytes, bayer_rgb = run_bayer(raw, args.frames)
+    if not np.array_equal(bgr_rgb, bayer_rgb):
+        print("Both paths give different RGB frames")
+        raise SystemExit(1)
+
+    print(f"Frames: {args.frames}, {FRAME_SIZE[1]}x{FRAME_SIZE[0]} (median ms per frame)")
+    print(f"{'':8s} {'ring bytes':>11s} {'producer':>9s} {'consumer':>9s} {'total':>8s}")
+    for name, samples, nbytes in (('BGR', bgr_samples, bgr_bytes), ('Bayer', bayer_samples, bayer_bytes)):
+        med = np.median(samples, axis=0) * 1e3
+        print(f"{name:8s} {nbytes:11d} {med[0]:9.3f} {med[1]:9.3f} {med.sum():8.3f}")
+    saved = (np.median(bgr_samples.sum(axis=1)) - np.median(bayer_samples.sum(axis=1))) * 1e3
+    print(f"Saved per frame: {bgr_bytes - bayer_bytes} bytes through shared memory, {saved:.3f} ms")
+    if max_err > 8:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
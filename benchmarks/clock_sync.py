@@ -0,0 +1,113 @@
+"""
+Check: accuracy of the camera-to-host clock mapping (utils/clock_sync.py) on synthetic timestamp streams.
+
+A simulated camera clock runs with an offset and a drift that changes during the run (40 to 60 ppm),
+and jumps once (camera reset). Sync samples come from simulated clock latches, one per second once
+the fit window is full (ten per second before): the latch happens at a random instant within a
+jittered USB round trip, and a few samples are hit by a much longer, asymmetric delay. Frames are timestamped at 522 fps in between and
+mapped to host time, then compared with their true host exposure time.
+
+Usage:
+    python -m benchmarks.clock_sync [--duration 600] [--seed 0]
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from utils.clock_sync import NS_PER_S, ClockSync
+
+FPS = 522.0
+SYNC_INTERVAL_S = 1.0
+RTT_US = 250.0         # typical latch round trip
+RTT_JITTER_US = 150.0  # exponential extra round trip
+OUTLIER_RATE = 0.05
+OUTLIER_DELAY_US = (2000.0, 20000.0)
+MAX_P99_ERROR_US = 150.0  # under a tenth of a frame period
+JUMP_SETTLE_S = 4.0  # frames right after the clock jump are mapped wrong until it is detected, not counted
+
+
+class SimulatedCamera:
+    """
+    Device clock with an offset and a drift varying linearly over the run, and one jump
+    """
+    def __init__(self, duration_s, jump_at_s, rng):
+        self.duration_s = duration_s
+        self.jump_at_s = jump_at_s
+        self.offset_ns = int(rng.integers(1, 1000) * NS_PER_S)
+
+    def drift(self, host_s):
+        return (40.0 + 20.0 * host_s / self.duration_s) * 1e-6
+
+    def device_ns(self, host_ns):
+        host_s = host_ns / NS_PER_S
+        # integral of the drift from 0 to host_s
+        gained = 40e-6 * host_s + 20e-6 * host_s ** 2 / (2 * self.duration_s)
+        device = self.offset_ns + host_ns + int(gained * NS_PER_S)
+        if host_s >= self.jump_at_s:
+            device -= 37 * NS_PER_S
+        return device
+
+
+def run(duration_s, seed):
+    rng = np.random.default_rng(seed)
+    cam = SimulatedCamera(duration_s, jump_at_s=duration_s * 0.6, rng=rng)
+    clock = ClockSync()
+
+    errors = []
+    add_times = []
+    map_times = []
+    period_ns = int(NS_PER_S / FPS)
+    host_ns = 0
+    next_sync = 0
+    while host_ns < duration_s * NS_PER_S:
+        if host_ns >= next_sync:
+            rtt = int((RTT_US + rng.exponential(RTT_JITTER_US)) * 1000)
+            latch_at = host_ns + int(rng.uniform(0, rtt))
+            t1 = host_ns + rtt
+            if rng.random() < OUTLIER_RATE:
+                # e.g. the process was preempted right before the latch reached the camera
+                latch_at = min(t1, latch_at + int(rng.uniform(*OUTLIER_DELAY_US) * 1000))
+                t1 = latch_at + int(rng.uniform(0, 50_000))
+            t0 = host_ns
+            t_start = time.perf_counter()
+            clock.add(cam.device_ns(latch_at), (t0 + t1) // 2, (t1 - t0) // 2)
+            add_times.append(time.perf_counter() - t_start)
+            next_sync = host_ns + int((SYNC_INTERVAL_S if len(clock) >= clock.window else SYNC_INTERVAL_S / 10) * NS_PER_S)
+            host_ns = t1
+
+        exposure_ns = host_ns + int(rng.uniform(0, period_ns))
+        device = cam.device_ns(exposure_ns)
+        t_start = time.perf_counter()
+        mapped = clock.to_host(device)
+        map_times.append(time.perf_counter() - t_start)
+        if mapped and not cam.jump_at_s <= exposure_ns / NS_PER_S < cam.jump_at_s + JUMP_SETTLE_S:
+            errors.append(mapped - exposure_ns)
+        host_ns += period_ns
+
+    return clock, cam, np.abs(np.asarray(errors)) / 1000.0, np.asarray(add_times), np.asarray(map_times)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Camera-to-host clock mapping accuracy on synthetic timestamps.")
+    p.add_argument('--duration', type=float, default=600.0, help='Simulated run duration (s, default: 600)')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    clock, cam, errors, add_times, map_times = run(args.duration, args.seed)
+    p50, p99 = np.percentile(errors, [50, 99])
+    print(f"{clock}")
+    print(f"Frames mapped: {len(errors)} (excluding {JUMP_SETTLE_S:.0f} s after the clock jump), "
+          f"error p50 {p50:.1f} us, p99 {p99:.1f} us, max {errors.max():.1f} us")
+    # host time runs slower than the device clock by the device drift
+    print(f"Drift at the end: estimated {clock.drift_ppm:.2f} ppm, true {-cam.drift(args.duration) * 1e6:.2f} ppm")
+    print(f"ClockSync.add: median {np.median(add_times) * 1e6:.1f} us, to_host: median {np.median(map_times) * 1e6:.2f} us")
+    if p99 > MAX_P99_ERROR_US or clock.n_resets != 1:
+        print(f"FAILED: p99 error above {MAX_P99_ERROR_US} us or clock jump not detected")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Allocation check for the consumer hot loop of latency_mp.py.
+
+Runs `consumer_step` (latency_measurement/tap_decision.py), the per-frame step of the consumer loop
+(frame cursor, detection, torn-read check, ROI tracking, `TapDecision.on_frame`, telemetry record), against a
+ring fed in-process with synthetic frames, and uses tracemalloc to verify that the steady-state loop does not
+allocate any numpy buffer per frame. `TapDecision` is the real one, with live metrics, landmark streaming,
+online recalibration and the tableB RunLogger, for the horizontal reference line, a tilted one and a zone set
+(calibration files written to a temporary folder). Detection itself is replaced by canned hand results:
+MediaPipe allocations are outside of the loop's control.
+
+Usage:
+    python -m benchmarks.consumer_alloc [--frames 5000]
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from latency_measurement.tap_decision import TapDecision, consumer_step
+from utils.frame_ring import FrameCursor, FrameRing
+from utils.hand_landmarks import LEFT, HandLandmarks
+from utils.roi_tracker import RoiTracker
+from utils.telemetry import TelemetryRing
+
+FRAME_SHAPE = (540, 720, 3)
+Y_LINE = 398
+CALIBRATION = {'y_line': Y_LINE, 'std_offset': 1.2, 'mean_offset': 19.1}
+VARIANTS = {
+    'line': {},
+    'tilted': {'line': [[0, Y_LINE - 20], [FRAME_SHAPE[1] - 1, Y_LINE + 20]]},
+    'zones': {'zones': [
+        {'name': 'line', 'kind': 'line', 'p0': [0, Y_LINE], 'p1': [1, Y_LINE], 'address': '/trigger'},
+        {'name': 'pad_1', 'kind': 'pad', 'center': [200, 380], 'radius': 30, 'landmarks': [8], 'hand': 'any',
+         'address': '/pad/1'},
+        {'name': 'rect_1', 'kind': 'rect', 'p0': [500, 300], 'p1': [650, 420], 'angle': 10, 'address': '/rect/1'},
+    ]},
+}
+
+
+def _hands(y):
+    hands = HandLandmarks(1)
+    hands.n = 1
+    hands.handedness[0] = LEFT
+    hands.landmarks[0, :, 0] = 0.5
+    hands.landmarks[0, :, 1] = y
+    return hands
+
+
+class CannedDetector:
+    """
+    Stands in for the hand pose detector: the hand alternates above and on the line every 50 frames
+    """
+    def __init__(self):
+        self.hands_up = _hands(300 / FRAME_SHAPE[0])
+        self.hands_down = _hands((Y_LINE - 10) / FRAME_SHAPE[0])
+        self.calls = 0
+
+    def detect_landmarks(self, frame, roi=None):
+        self.calls += 1
+        return self.hands_down if (self.calls // 50) % 2 else self.hands_up
+
+
+def write_config(folder, variant):
+    os.makedirs(os.path.join(folder, 'config'))
+    with open(os.path.join(folder, 'config', 'calibration.json'), 'w') as f:
+        json.dump({**CALIBRATION, **VARIANTS[variant]}, f)
+    for name in ('log_config.json', 'streaming.json'):
+        shutil.copy(os.path.join('config', name), os.path.join(folder, 'config', name))
+
+
+def check_variant(variant, n_frames, n_slots, receiver_port):
+    ring = FrameRing.create(n_slots, FRAME_SHAPE)
+    src = np.random.randint(0, 255, FRAME_SHAPE, dtype=np.uint8)
+    telemetry = TelemetryRing.create(1024)
+    detector = CannedDetector()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder, open(os.devnull, 'w') as devnull:
+        write_config(folder, variant)
+        os.chdir(folder)  # TapDecision reads config/ relative to the working directory
+        try:
+            with contextlib.redirect_stdout(devnull):
+                decision = TapDecision(ring, folder,
+                                       osc_targets=[f'udp:127.0.0.1:{receiver_port}'], metrics={},
+                                       stream={'config': 'config/streaming.json'}, recalibrate={})
+            roi_tracker = RoiTracker(FRAME_SHAPE, Y_LINE)
+            cursor = FrameCursor(ring, metrics=decision.metrics)
+
+            def run(n):
+                for _ in range(n):
+                    ring.write(src, time.perf_counter(), 0.0, 0.001, 0.001, 0.0, 0.0)
+                    consumer_step(cursor, ring, detector, decision, roi_tracker, telemetry)
+
+            metrics = decision.metrics
+            with contextlib.redirect_stdout(devnull):  # one console line per tap
+                # traced from the warm-up on, so that the bounded state replaced in steady state was traced
+                # too: caches, interned ints, first tap rows, every slot of the metric sample rings, every
+                # slice of the rolling windows
+                tracemalloc.start()
+                run(400 + max(len(m._buf) for m in metrics.latencies))
+                for _ in range(metrics._max_slices):
+                    metrics.collect()
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                t0 = time.perf_counter()
+                run(n_frames)
+                elapsed = time.perf_counter() - t0
+                metrics.collect()  # samples not binned yet are not a leak
+                after, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                decision.close()
+        finally:
+            os.chdir(cwd)
+    taps = decision.taps.counter if hasattr(decision.taps, 'counter') else int(decision.taps.tap_numbers.max())
+    stats = cursor.stats()
+    ring.close()
+    ring.unlink()
+    telemetry.close()
+    telemetry.unlink()
+    return taps, elapsed / n_frames * 1e6, stats, after - before, peak - before
+
+
+def main():
+    p = argparse.ArgumentParser(description="Check that the consumer hot loop makes no per-frame numpy allocations.")
+    p.add_argument('--frames', type=int, default=5000, help='Number of measured frames (default: 5000)')
+    p.add_argument('--slots', type=int, default=4, help='Ring slots (default: 4)')
+    args = p.parse_args()
+
+    # trigger and landmark stream receiver, never read: sends beyond its buffer are dropped
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+
+    frame_nbytes = int(np.prod(FRAME_SHAPE))
+    ok = True
+    for variant in VARIANTS:
+        taps, us_per_frame, stats, growth, peak = check_variant(variant, args.frames, args.slots,
+                                                                receiver.getsockname()[1])
+        print(f"{variant}: frames {args.frames}  taps {taps}  loop {us_per_frame:.1f} us/frame")
+        print(f"  Cursor: {stats}")
+        print(f"  Traced memory growth: {growth} B, peak above baseline: {peak} B (one frame = {frame_nbytes} B)")
+        # A single frame-sized buffer anywhere in the loop would push the peak above this bound, which leaves room
+        # for the metrics collector binning up to a second of samples meanwhile (~50 kB); a leak of a few bytes
+        # per frame would push the growth above 16 kB
+        ok &= peak <= frame_nbytes // 10 and growth <= 16384
+    receiver.close()
+
+    if not ok:
+        print("FAIL: the consumer loop allocates per frame")
+        sys.exit(1)
+    print("OK: no per-frame numpy allocations")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark: per-frame cost and accuracy of the classical contact detector, on synthetic frames.
+
+A textured static background with a reference line is overlaid with a "hand" (a dark ellipse with
+sensor noise) that repeatedly comes down to the line, rests on it a few frames and goes back up.
+Some approaches stop a few pixels short of the line (near misses) and must not fire. Frames go
+through `ContactDetector` and `TapDetector` exactly like in latency_mp.py (`--detector contact`),
+in BGR and as raw Bayer mosaics.
+
+Reported: per-frame detection time (p50 / p99 / max, against the camera frame budget), taps found
+vs simulated, false taps on near misses, and the contact-to-trigger delay in frames (negative: the
+tap fired within `tap_threshold` of the line, before the simulated contact).
+
+Usage:
+    python -m benchmarks.contact_detector [--taps 40] [--speed 900]
+"""
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from utils.bayer import mosaic_rg
+from utils.contact_detector import ContactDetector
+from utils.tap_detection import TapDetector
+
+FRAME_SHAPE = (540, 720, 3)  # as in latency_mp.py
+FPS = 522.0
+Y_LINE = 398  # as in config/calibration.json
+HAND_AXES = (90, 60)  # ellipse half-width, half-height (px)
+REST_FRAMES = 6  # frames resting on the line
+REST_BOTTOM = Y_LINE - 150  # bottom of the hand between taps
+NEAR_MISS_GAP = 8  # px left between the hand and the line on a near miss
+
+
+def background(rng):
+    h, w, _ = FRAME_SHAPE
+    noise = rng.integers(0, 255, (h // 8, w // 8, 3), dtype=np.uint8)
+    bg = cv2.GaussianBlur(cv2.resize(noise, (w, h), interpolation=cv2.INTER_LINEAR), (0, 0), 3)
+    bg = cv2.addWeighted(bg, 0.5, np.full_like(bg, 160), 0.5, 0)
+    cv2.line(bg, (0, Y_LINE), (w - 1, Y_LINE), (40, 40, 200), 2)  # the foil line
+    return bg
+
+
+def trajectory(n_taps, speed, rng):
+    """
+    Bottom y of the hand per frame, and the frames where it first touches the line (-1: near miss)
+    """
+    step = speed / FPS
+    bottoms, contacts = [], []
+    for i in range(n_taps):
+        near_miss = i % 5 == 4
+        target = Y_LINE - NEAR_MISS_GAP if near_miss else Y_LINE + 2  # pressing covers the line
+        bottoms += [REST_BOTTOM] * int(rng.integers(10, 40))
+        down = list(np.arange(REST_BOTTOM, target, step)) + [target] * REST_FRAMES
+        if not near_miss:
+            contacts.append(len(bottoms) + next(k for k, y in enumerate(down) if y >= Y_LINE - 1))
+        else:
+            contacts.append(-1)
+        bottoms += down + list(np.arange(target, REST_BOTTOM, -step))
+    return np.asarray(bottoms), contacts
+
+
+def render(bg, bottom, x, rng, out):
+    np.copyto(out, bg)
+    center = (int(x), int(round(bottom)) - HAND_AXES[1])
+    cv2.ellipse(out, center, HAND_AXES, 0, 0, 360, (70, 95, 125), -1)
+    out += rng.integers(0, 6, out.shape, dtype=np.uint8)  # sensor noise
+    return out
+
+
+def run(bg, bottoms, xs, contacts, bayer, seed):
+    rng = np.random.default_rng(seed)
+    detector = ContactDetector(Y_LINE, FRAME_SHAPE[:2] if bayer else FRAME_SHAPE)
+    taps = TapDetector(Y_LINE, detector.tap_threshold)
+    image = np.empty(FRAME_SHAPE, dtype=np.uint8)
+    times = np.empty(len(bottoms))
+    fired = []
+    for i, (bottom, x) in enumerate(zip(bottoms, xs)):
+        render(bg, bottom, x, rng, image)
+        frame = mosaic_rg(image) if bayer else image
+        t0 = time.perf_counter()
+        hands = detector.detect_landmarks(frame)
+        times[i] = time.perf_counter() - t0
+        if taps.update(hands, FRAME_SHAPE[0], frame_id=i):
+            fired.append(i)
+
+    true_contacts = [c for c in contacts if c >= 0]
+    delays, false_taps = [], 0
+    for f in fired:
+        # a tap belongs to the last contact before it, within a few frames
+        previous = [c for c in true_contacts if c <= f + 1]
+        if previous and f - previous[-1] <= REST_FRAMES:
+            delays.append(f - previous[-1])
+        else:
+            false_taps += 1
+    return times, len(true_contacts), len(delays), false_taps, np.asarray(delays), detector
+
+
+def main():
+    p = argparse.ArgumentParser(description="Cost and accuracy of the classical contact detector.")
+    p.add_argument('--taps', type=int, default=40, help='Simulated approaches, every fifth a near miss (default: 40)')
+    p.add_argument('--speed', type=float, default=900.0, help='Hand speed (px/s, default: 900)')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    bg = background(rng)
+    bottoms, contacts = trajectory(args.taps, args.speed, rng)
+    xs = FRAME_SHAPE[1] / 2 + 80 * np.sin(np.arange(len(bottoms)) / 200.0)
+    print(f"{len(bottoms)} frames ({len(bottoms) / FPS:.1f} s at {FPS:.0f} fps), rendered on the fly")
+
+    budget_ms = 1000.0 / FPS
+    ok = True
+    for name, bayer in (('BGR', False), ('Bayer', True)):
+        times, n_contacts, n_found, false_taps, delays, detector = run(bg, bottoms, xs, contacts, bayer, args.seed)
+        p50, p99 = np.percentile(times * 1000, [50, 99])
+        print(f"{name:5s}: detect p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {times.max() * 1000:.3f} ms "
+              f"(budget {budget_ms:.2f} ms); taps {n_found}/{n_contacts}, false taps {false_taps}; "
+              f"contact-to-trigger delay {delays.mean() if len(delays) else float('nan'):.2f} frames "
+              f"(max {delays.max() if len(delays) else -1}); {detector}")
+        ok &= p99 < budget_ms and n_found == n_contacts and false_taps == 0 and (len(delays) == 0 or delays.max() <= 1)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: Python overhead of turning a MediaPipe result into tap distances.
+
+Compares, on synthetic HandLandmarkerResult objects (no model inference involved):
+- the compatibility path: protobuf landmark list per hand (`detect_hand_pose`) and a list comprehension over landmarks 17-20
+- the array path: preallocated `HandLandmarks` (`detect_landmarks`) and the vectorized pinky edge distance
+
+Usage:
+    python -m benchmarks.detector_overhead [--iterations 20000] [--hands 1]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+from mediapipe.tasks.python.components.containers import category as category_module
+from mediapipe.tasks.python.components.containers import landmark as landmark_module
+from mediapipe.tasks.python.vision import HandLandmarkerResult
+
+from utils.hand_landmarks import HandLandmarks, pinky_edge_y
+from utils.hand_pose_detector import TempHandLandmarks, convert_to_landmark_list
+
+FRAME_HEIGHT = 540
+Y_LINE = 398
+
+
+def synthetic_result(n_hands):
+    hand_landmarks = [[landmark_module.NormalizedLandmark(x=random.random(), y=random.random(), z=random.random())
+                       for _ in range(21)] for _ in range(n_hands)]
+    handedness = [[category_module.Category(index=i % 2, score=0.9, display_name=('Left', 'Right')[i % 2],
+                                            category_name=('Left', 'Right')[i % 2])] for i in range(n_hands)]
+    return HandLandmarkerResult(handedness=handedness, hand_landmarks=hand_landmarks, hand_world_landmarks=[])
+
+
+def compat_path(results):
+    output = []
+    for hand_landmarks, handedness in zip(results.hand_landmarks, results.handedness):
+        lms_list = list(convert_to_landmark_list(hand_landmarks).landmark)
+        output.append({"label": handedness[0].display_name, "landmarks": TempHandLandmarks(lms_list)})
+    dists = []
+    for hand in output:
+        ys = [hand['landmarks'].landmark[i].y * FRAME_HEIGHT for i in range(17, 21)]
+        dists.append(abs(np.mean(ys) - Y_LINE))
+    return dists
+
+
+def array_path(results, hands, dist):
+    hands.fill(results)
+    d = pinky_edge_y(hands, FRAME_HEIGHT, dist)
+    d -= Y_LINE
+    np.abs(d, out=d)
+    return d
+
+
+def timeit(fn, iterations):
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def main():
+    p = argparse.ArgumentParser(description="Python overhead per detection: protobuf/dict path vs NumPy array path.")
+    p.add_argument('--iterations', type=int, default=20000, help='Iterations per path (default: 20000)')
+    p.add_argument('--hands', type=int, default=1, help='Hands per synthetic result (default: 1)')
+    args = p.parse_args()
+
+    results = synthetic_result(args.hands)
+    hands = HandLandmarks(args.hands)
+    dist = np.empty(args.hands, dtype=np.float32)
+
+    # both paths must agree before being compared
+    assert np.allclose(compat_path(results), array_path(results, hands, dist), atol=1e-3)
+
+    compat_us = timeit(lambda: compat_path(results), args.iterations)
+    array_us = timeit(lambda: array_path(results, hands, dist), args.iterations)
+
+    print(f"Hands per result: {args.hands}, iterations: {args.iterations}")
+    print(f"  protobuf/dict + list comprehension: {compat_us:8.2f} us/detection")
+    print(f"  HandLandmarks + vectorized NumPy:   {array_us:8.2f} us/detection")
+    print(f"  saved: {compat_us - array_us:.2f} us/detection ({compat_us / array_us:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: per-frame detection time in ROI mode vs full-frame.
+
+Runs the hand pose detector on every frame of a recording twice, once on the full frame and once on
+the crop proposed by the ROI tracker, and prints detect_time_ms statistics for both modes, and how many
+times the ROI detector had to allocate its RGB conversion buffer (crops change size almost every frame).
+
+Usage:
+    python -m benchmarks.detector_roi --replay path/to/frames_or_video [--frames 1000] [--device cpu]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from latency_measurement.tap_decision import load_calibration
+from utils.hand_pose_detector import HandPoseDetector
+from utils.roi_tracker import RoiTracker
+from video.sources import open_video_input
+
+
+def describe(name, times_ms):
+    t = np.asarray(times_ms)
+    print(f"{name:>10}: mean {t.mean():.3f} ms | median {np.median(t):.3f} ms | "
+          f"p95 {np.percentile(t, 95):.3f} ms | max {t.max():.3f} ms")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Compare detect_time_ms in ROI mode vs full-frame.")
+    p.add_argument('--replay', required=True, help='Recording to run the detector on (video, .npy or frames folder)')
+    p.add_argument('--frames', type=int, default=1000, help='Number of frames to benchmark (default: 1000)')
+    p.add_argument('--device', default='gpu', choices=['cpu', 'gpu'], help='MediaPipe delegate (default: gpu)')
+    p.add_argument('--calibration', default='config/calibration.json', help='Calibration file giving y_line')
+    p.add_argument('--warmup', type=int, default=20, help='Untimed frames before measuring (default: 20)')
+    args = p.parse_args()
+
+    cam = open_video_input(args.replay, free_run=True, loop=True)
+    full_detector = HandPoseDetector(device=args.device)
+    roi_detector = HandPoseDetector(device=args.device)
+    tracker = None
+
+    full_ms, roi_ms, roi_area = [], [], []
+    agree = 0
+    rgb_buffer, rgb_allocations = None, 0
+    for i in range(args.warmup + args.frames):
+        frame, _, _ = cam.read_frame()
+        if tracker is None:
+            tracker = RoiTracker(frame.shape, load_calibration(args.calibration)[0])
+
+        t0 = time.perf_counter()
+        hands_full = full_detector.detect_landmarks(frame)
+        t1 = time.perf_counter()
+        roi = tracker.roi()
+        hands_roi = roi_detector.detect_landmarks(frame, roi)
+        t2 = time.perf_counter()
+        tracker.update(hands_roi)
+        if roi_detector._rgb is not rgb_buffer:
+            rgb_buffer, rgb_allocations = roi_detector._rgb, rgb_allocations + 1
+
+        if i < args.warmup:
+            continue
+        full_ms.append((t1 - t0) * 1000.0)
+        roi_ms.append((t2 - t1) * 1000.0)
+        if roi is not None:
+            roi_area.append((roi[2] - roi[0]) * (roi[3] - roi[1]) / (frame.shape[0] * frame.shape[1]))
+        agree += (hands_full.n > 0) == (hands_roi.n > 0)
+
+    cam.cleanup()
+
+    print(f"Frames: {args.frames} ({args.device})")
+    describe('full-frame', full_ms)
+    describe('ROI', roi_ms)
+    tracked = len(roi_area)
+    print(f"ROI tracked on {100.0 * tracked / args.frames:.1f}% of frames, "
+          f"mean crop {100.0 * (np.mean(roi_area) if tracked else 1.0):.1f}% of the frame, "
+          f"re-acquisitions {tracker.n_lost}")
+    print(f"Hand presence agreement with full-frame: {100.0 * agree / args.frames:.1f}%")
+    print(f"RGB buffer allocations of the ROI detector: {rgb_allocations}")
+    print(f"Mean detect time saved: {np.mean(full_ms) - np.mean(roi_ms):.3f} ms/frame")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: consumer wakeup on new frames, polling loop vs `FrameCursor`.
+
+A producer process publishes synthetic frames at the camera rate while a consumer process "detects"
+them with a fixed busy time, faster or slower than the camera. The polling loop (the previous
+consumer) re-detects the current frame whenever it is faster than the camera; the cursor sleeps
+until a new frame is published. Reports the detections run, repeated frames, skipped frames, the
+wakeup latency (publication to hand-out) and the consumer CPU time.
+
+Usage:
+    python -m benchmarks.frame_wakeup [--duration 3] [--fps 522]
+"""
+import argparse
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from utils.frame_ring import FrameCursor, FrameRing, new_meta_record
+
+FRAME_SHAPE = (540, 720, 3)
+
+
+def busy(duration):
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        pass
+
+
+def producer(ring, stop_event, start_event, fps):
+    src = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+    period = 1.0 / fps
+    start_event.wait()
+    due = time.perf_counter()
+    while not stop_event.is_set():
+        due += period
+        busy(due - time.perf_counter())
+        ring.write(src, time.perf_counter())
+    ring.close()
+
+
+def consumer(ring, stop_event, start_event, mode, detect_s, results):
+    detections = repeated = 0
+    wakeups = []
+    cpu_0 = time.process_time()
+    if mode == 'poll':
+        meta = new_meta_record()
+        last_id = 0
+        start_event.set()
+        while not stop_event.is_set():
+            frame_id = ring.latest_id()
+            if ring.acquire(frame_id, meta) is None:
+                continue
+            if frame_id == last_id:
+                repeated += 1
+            else:
+                wakeups.append(time.perf_counter() - meta['ts'][0])
+            last_id = frame_id
+            busy(detect_s)
+            detections += 1
+        skipped = None
+    else:
+        cursor = FrameCursor(ring, timeout=0.05)
+        start_event.set()
+        while not stop_event.is_set():
+            if cursor.next_frame() is None:
+                continue
+            wakeups.append(time.perf_counter() - cursor.meta['ts'][0])
+            busy(detect_s)
+            detections += 1
+        skipped = cursor.skipped.value
+    results.put((mode, detect_s, detections, repeated, skipped, float(np.median(wakeups)) * 1e6,
+                 float(np.percentile(wakeups, 99)) * 1e6, time.process_time() - cpu_0))
+    ring.close()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Consumer wakeup: polling loop vs FrameCursor.")
+    p.add_argument('--duration', type=float, default=3.0, help='Seconds per run (default: 3)')
+    p.add_argument('--fps', type=float, default=522.0, help='Producer frame rate (default: 522)')
+    args = p.parse_args()
+
+    mp.set_start_method('forkserver', force=True)
+    period = 1.0 / args.fps
+    print(f"Camera: {args.fps:.0f} fps over {args.duration:.0f} s, ~{int(args.fps * args.duration)} frames")
+    print(f"{'mode':6s} {'detect ms':>9s} {'detections':>10s} {'repeated':>9s} {'skipped':>8s} "
+          f"{'wake p50 us':>11s} {'wake p99 us':>11s} {'CPU s':>6s}")
+    for detect_s in (period * 0.3, period * 2.5):
+        for mode in ('poll', 'cursor'):
+            ring = FrameRing.create(4, FRAME_SHAPE, n_readers=1)
+            stop_event, start_event, results = mp.Event(), mp.Event(), mp.Queue()
+            procs = [mp.Process(target=producer, args=(ring, stop_event, start_event, args.fps)),
+                     mp.Process(target=consumer, args=(ring, stop_event, start_event, mode, detect_s, results))]
+            for proc in procs:
+                proc.start()
+            start_event.wait()
+            time.sleep(args.duration)
+            stop_event.set()
+            mode, detect_s, detections, repeated, skipped, wake_50, wake_99, cpu = results.get()
+            for proc in procs:
+                proc.join()
+            ring.close()
+            ring.unlink()
+            print(f"{mode:6s} {detect_s * 1e3:9.2f} {detections:10d} {repeated:9d} "
+                  f"{'-' if skipped is None else skipped:>8} {wake_50:11.1f} {wake_99:11.1f} {cpu:6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark: control throughput of the landmark stream (utils/landmark_stream.py) vs sending every landmark.
+
+Two synthetic hands move smoothly for a few seconds at the camera rate, with landmark jitter of the
+order of MediaPipe's. Every frame goes to:
+- the naive output: every landmark (x, y) of every hand, one bundle per frame
+- `LandmarkStream`, with the rates and deadbands of config/streaming.json
+
+Both send to a local UDP receiver. Reported: messages/s, packets/s and bytes/s sent (and the bound
+set by the configured rates), packets received, the per-frame cost of the stream, and how closely the
+last streamed pinch value follows the noise-free one, next to the error of the measured pinch itself.
+
+Usage:
+    python -m benchmarks.landmark_stream [--duration 5] [--config config/streaming.json]
+"""
+import argparse
+import socket
+import sys
+import time
+
+import numpy as np
+
+from utils.hand_landmarks import LEFT, RIGHT, HandLandmarks
+from utils.landmark_stream import DEFAULT_CONFIG_PATH, LandmarkStream, load_stream_config
+from utils.trigger_output import TriggerOutput, encode_osc_bundle, encode_osc_message
+
+FRAME_SHAPE = (540, 720, 3)  # as in latency_mp.py
+FPS = 522.0
+Y_LINE = 398
+JITTER = 0.002  # landmark noise, normalized coordinates
+
+
+def synthetic_hands(n_frames, rng):
+    """
+    (n_frames, 2, 21, 2) landmarks of two hands drifting, opening and closing their pinch, and the
+    noise-free pinch (relative to the palm length)
+    """
+    t = np.arange(n_frames) / FPS
+    base = rng.uniform(0.3, 0.7, (1, 2, 21, 2))
+    motion = np.stack([0.1 * np.sin(2 * np.pi * 0.5 * t), 0.05 * np.sin(2 * np.pi * 1.3 * t)], axis=-1)
+    landmarks = base + motion[:, None, None, :]
+    # pinch: the thumb tip (4) orbits the index tip (8)
+    pinch = 0.05 + 0.04 * np.sin(2 * np.pi * 0.8 * t)
+    landmarks[:, :, 4] = landmarks[:, :, 8]
+    landmarks[:, :, 4, 0] += pinch[:, None]
+    landmarks[:, :, 9] = landmarks[:, :, 0] + [0.0, -0.1]  # palm length 0.1
+    landmarks += rng.normal(0, JITTER, landmarks.shape)
+    return landmarks.astype(np.float32), pinch / 0.1
+
+
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    sock.bind(('127.0.0.1', 0))
+    sock.setblocking(False)
+    return sock
+
+
+def drain(sock):
+    n = 0
+    try:
+        while True:
+            sock.recv(65536)
+            n += 1
+    except BlockingIOError:
+        pass
+    return n
+
+
+def run_naive(frames, target, sock):
+    output = TriggerOutput([target])
+    n_bytes = received = 0
+    for frame in frames:
+        messages = [encode_osc_message(f"/hand/{side}/landmarks", *frame[h].ravel().tolist())
+                    for h, side in enumerate(('left', 'right'))]
+        data = encode_osc_bundle(messages)
+        output.send_raw(data)
+        n_bytes += len(data)
+        received += drain(sock)
+    output.close()
+    return 2 * len(frames), len(frames), n_bytes, received + drain(sock)
+
+
+def run_stream(frames, true_pinch, config, target, sock):
+    stream = LandmarkStream(Y_LINE, FRAME_SHAPE, config['parameters'], [target], config.get('keepalive_s', 1.0),
+                            config.get('address_prefix', '/hand'))
+    hands = HandLandmarks(2)
+    hands.n = 2
+    hands.handedness[:] = [LEFT, RIGHT]
+    times = np.empty(len(frames))
+    streamed_err, measured_err = [], []
+    received = 0
+    for i, frame in enumerate(frames):
+        hands.landmarks[:, :, :2] = frame
+        t0 = time.perf_counter()
+        stream.update(hands, i / FPS)
+        times[i] = time.perf_counter() - t0
+        if 'pinch' in stream.names:
+            streamed_err.append(abs(float(stream.sent[LEFT]['pinch'][0]) - true_pinch[i]))
+            measured_err.append(abs(float(stream.values[LEFT]['pinch'][0]) - true_pinch[i]))
+        received += drain(sock)
+    stream.close()
+    errors = [np.percentile(e, 99) if e else float('nan') for e in (streamed_err, measured_err)]
+    return (stream.n_messages, stream.n_packets, stream.n_bytes, received + drain(sock), times * 1e6, errors,
+            stream.max_throughput())
+
+
+def main():
+    p = argparse.ArgumentParser(description="Landmark stream throughput vs sending every landmark.")
+    p.add_argument('--duration', type=float, default=5.0, help='Simulated seconds at the camera rate (default: 5)')
+    p.add_argument('--config', default=DEFAULT_CONFIG_PATH, help=f'Streaming config (default: {DEFAULT_CONFIG_PATH})')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    frames, true_pinch = synthetic_hands(int(args.duration * FPS), np.random.default_rng(args.seed))
+    sock = receiver()
+    target = f"udp:127.0.0.1:{sock.getsockname()[1]}"
+
+    naive = run_naive(frames, target, sock)
+    messages, packets, n_bytes, received, times, (streamed_err, measured_err), (max_messages, max_bytes) = \
+        run_stream(frames, true_pinch, load_stream_config(args.config), target, sock)
+    sock.close()
+
+    print(f"{len(frames)} frames ({args.duration:.0f} s at {FPS:.0f} fps), two hands")
+    print(f"{'output':8s} {'msg/s':>8s} {'packets/s':>10s} {'kB/s':>8s} {'received':>9s}")
+    for name, (m, pk, b, r) in (('naive', naive), ('stream', (messages, packets, n_bytes, received))):
+        print(f"{name:8s} {m / args.duration:8.0f} {pk / args.duration:10.0f} {b / args.duration / 1024:8.1f} "
+              f"{r:5d}/{pk:<5d}")
+    print(f"Stream bound from the configured rates: {max_messages:.0f} msg/s, {max_bytes / 1024:.1f} kB/s")
+    print(f"Stream update: p50 {np.percentile(times, 50):.1f} us, p99 {np.percentile(times, 99):.1f} us")
+    print(f"Pinch p99 error vs noise-free: streamed {streamed_err:.3f}, measured every frame {measured_err:.3f}")
+    ok = messages / args.duration <= max_messages and n_bytes / args.duration <= max_bytes
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
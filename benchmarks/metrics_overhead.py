@@ -0,0 +1,90 @@
+"""
+Benchmark: hot-path cost of the live metrics (utils/metrics.py).
+
+Measures `LatencyMetric.record` and `CounterMetric.inc` while the collector thread runs, as in
+latency_mp.py and log_serial.py, checks the percentiles reported for a known distribution, and
+that a run whose metrics port is already taken goes on without the HTTP endpoint.
+
+Usage:
+    python -m benchmarks.metrics_overhead [--samples 500000]
+"""
+import argparse
+import random
+import socket
+import sys
+import time
+
+import numpy as np
+
+from utils.metrics import Metrics
+
+
+def check_port_taken():
+    busy = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    busy.bind(('127.0.0.1', 0))
+    busy.listen(1)
+    metrics = Metrics('bench', windows=(1,), slice_s=0.05)
+    counter = metrics.counter('events')
+    try:
+        metrics.start(http_port=busy.getsockname()[1])
+        counter.inc()
+        time.sleep(0.1)
+        metrics.close()
+    except OSError as e:
+        print(f"Metrics.start on a taken port raised {e!r}")
+        return False
+    finally:
+        busy.close()
+    return metrics._server is None and counter.value == 1
+
+
+def main():
+    p = argparse.ArgumentParser(description="Hot-path cost of metric updates.")
+    p.add_argument('--samples', type=int, default=500000, help='Updates per metric (default: 500000)')
+    args = p.parse_args()
+
+    metrics = Metrics('bench', windows=(1,), slice_s=0.05)
+    latency = metrics.latency('latency')
+    counter = metrics.counter('events')
+    metrics.start()
+
+    values = [random.lognormvariate(1.0, 0.5) for _ in range(args.samples)]
+    record = latency.record
+    t0 = time.perf_counter()
+    for v in values:
+        record(v)
+    record_ns = (time.perf_counter() - t0) / args.samples * 1e9
+
+    inc = counter.inc
+    t0 = time.perf_counter()
+    for _ in range(args.samples):
+        inc()
+    inc_ns = (time.perf_counter() - t0) / args.samples * 1e9
+
+    # Percentiles check on a paced stream the collector can keep up with
+    expected = np.percentile(values[:20000], [50, 95, 99])
+    metrics.close()
+    metrics = Metrics('bench', windows=(60,), slice_s=0.05)
+    latency = metrics.latency('latency')
+    metrics.start()
+    for i, v in enumerate(values[:20000]):
+        latency.record(v)
+        if i % 2000 == 1999:
+            time.sleep(0.06)
+    time.sleep(0.1)
+    metrics.close()
+    reported = latency.hist.percentiles()
+
+    print(f"LatencyMetric.record: {record_ns:6.1f} ns/update")
+    print(f"CounterMetric.inc:    {inc_ns:6.1f} ns/update")
+    print("p50/p95/p99 exact:    " + " / ".join(f"{v:.3f}" for v in expected))
+    print("p50/p95/p99 reported: " + " / ".join(f"{v:.3f}" for v in reported))
+    port_ok = check_port_taken()
+    print(f"Metrics port already taken: {'runs without the endpoint' if port_ok else 'FAILED'}")
+    ok = record_ns < 1000 and inc_ns < 1000 and np.allclose(reported, expected, rtol=0.02) and port_ok
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
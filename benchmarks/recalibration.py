@@ -0,0 +1,195 @@
+"""
+Benchmark: automatic reference-line detection and online drift recalibration.
+
+- Line detection: synthetic calibration frames (textured table, bright foil strip with a tilt
+  between -15 and 15 degrees, sensor noise) go through `detect_reference_line`; reports the angle
+  and offset errors of the top foil edge and the detection time.
+- Online recalibration: a simulated session at the camera rate (hand resting on the surface with
+  landmark jitter, taps, hovering above the line, hand lost) where the resting offset drifts from
+  the calibrated mean; `OnlineRecalibrator` must follow the drift, ignore taps and hovering, and cost
+  little per frame. Its estimate is checked against the exponentially weighted mean of the true
+  resting offset over the rest frames, with the recalibrator's window: the lag behind the drift
+  depends on the window and the session length, not on the estimator's accuracy.
+- Atomic writes: a reader thread keeps loading the calibration file while it is rewritten, with
+  `save_calibration` and with a plain `open(..., 'w')` + `json.dump`; counts the failed reads.
+
+Usage:
+    python -m benchmarks.recalibration [--session_s 120]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from utils.hand_landmarks import LEFT, HandLandmarks
+from utils.recalibration import OnlineRecalibrator, load_calibration_file, save_calibration
+from utils.reference_line import detect_reference_line, line_angle_deg, line_y_at
+
+FRAME_SHAPE = (540, 720, 3)  # as in latency_mp.py
+FPS = 522.0
+Y_LINE = 398  # as in config/calibration.json
+MEAN, STD = 19.1, 1.2  # resting offset of config/calibration.json
+DRIFT_PX = 4.0  # resting offset drift over the session
+
+
+def foil_frame(angle_deg, rng):
+    h, w, _ = FRAME_SHAPE
+    noise = rng.integers(0, 255, (h // 8, w // 8, 3), dtype=np.uint8)
+    frame = cv2.addWeighted(np.full(FRAME_SHAPE, 110, np.uint8), 0.6, cv2.resize(noise, (w, h)), 0.4, 0)
+    slope = np.tan(np.radians(angle_deg))
+    y_left, y_right = Y_LINE - slope * (w / 2), Y_LINE + slope * (w / 2)
+    strip = np.array([[0, y_left], [w, y_right], [w, y_right + 30], [0, y_left + 30]])
+    cv2.fillPoly(frame, [np.round(strip * 16).astype(np.int32)], (225, 225, 230), lineType=cv2.LINE_AA, shift=4)
+    return cv2.add(frame, rng.integers(0, 12, frame.shape, dtype=np.uint8))
+
+
+def check_detection(rng):
+    angle_err, offset_err, times = [], [], []
+    for angle in np.linspace(-15, 15, 13):
+        frame = foil_frame(angle, rng)
+        t0 = time.perf_counter()
+        found = detect_reference_line(frame)
+        times.append(time.perf_counter() - t0)
+        if found is None:
+            angle_err.append(np.inf)
+            offset_err.append(np.inf)
+            continue
+        line = found[0]
+        angle_err.append(abs(line_angle_deg(line) - angle))
+        offset_err.append(abs(line_y_at(line, FRAME_SHAPE[1] / 2) - Y_LINE))
+    return max(angle_err), max(offset_err), 1000 * float(np.median(times))
+
+
+def session(duration_s, rng):
+    """
+    Per-frame pinky edge distance to the line (NaN: hand lost), the true resting offset and the rest frames
+    """
+    n = int(duration_s * FPS)
+    dist = np.full(n, np.nan)
+    rest = np.zeros(n, dtype=bool)
+    true_mean = MEAN + DRIFT_PX * np.arange(n) / n
+    i = 0
+    while i < n:
+        kind = rng.choice(['rest', 'tap', 'hover', 'lost'], p=[0.5, 0.3, 0.1, 0.1])
+        length = int(FPS * {'rest': rng.uniform(1, 4), 'tap': 0.4, 'hover': rng.uniform(0.5, 2),
+                            'lost': rng.uniform(0.2, 1)}[kind])
+        j = min(n, i + length)
+        if kind == 'rest':
+            dist[i:j] = true_mean[i:j] + rng.normal(0, STD, j - i)
+            rest[i:j] = True
+        elif kind == 'tap':
+            # up to 80 px and back down
+            phase = np.linspace(0, np.pi, j - i)
+            dist[i:j] = true_mean[i:j] + 60 * np.sin(phase) + rng.normal(0, STD, j - i)
+        elif kind == 'hover':
+            dist[i:j] = true_mean[i:j] + rng.uniform(15, 50) + rng.normal(0, STD, j - i)
+        i = j
+    return dist, true_mean, rest
+
+
+def lagged_stats(true_mean, rest, alpha):
+    """
+    Exponentially weighted mean and std of the true resting offset over the rest frames, started at
+    MEAN: the estimator's recursion on noise-free samples, the landmark jitter STD added to the spread
+    the drift causes within the window
+    """
+    mean, drift_var = MEAN, 0.0
+    for value in true_mean[rest]:
+        delta = value - mean
+        mean += alpha * delta
+        drift_var = (1.0 - alpha) * (drift_var + alpha * delta * delta)
+    return mean, (STD ** 2 + drift_var) ** 0.5
+
+
+def check_online(duration_s, rng, calib_file):
+    dist, true_mean, rest = session(duration_s, rng)
+    recal = OnlineRecalibrator([[0, Y_LINE], [FRAME_SHAPE[1] - 1, Y_LINE]], FRAME_SHAPE, MEAN, STD, calib_file,
+                               write_interval_s=min(10.0, duration_s / 4))
+    hands = HandLandmarks(2)
+    hands.handedness[0] = LEFT
+    times = np.empty(len(dist))
+    for i, d in enumerate(dist):
+        hands.n = 0 if np.isnan(d) else 1
+        if hands.n:
+            hands.landmarks[0, 17:21, 1] = (Y_LINE - d) / FRAME_SHAPE[0]
+        t0 = time.perf_counter()
+        recal.update(hands, i / FPS)
+        times[i] = time.perf_counter() - t0
+    recal.close()
+    return recal, true_mean[-1], lagged_stats(true_mean, rest, recal.alpha), times * 1e6
+
+
+def reader(path, stop, failures, reads):
+    while not stop.is_set():
+        try:
+            with open(path) as fp:
+                json.load(fp)
+            reads[0] += 1
+        except (ValueError, OSError):
+            failures[0] += 1
+
+
+def plain_write(data, path):
+    with open(path, 'w') as fp:
+        json.dump(data, fp)
+
+
+def check_atomic(path, n_writes=2000):
+    data = load_calibration_file(path)
+    data['zones'] = [{'name': f'pad_{i}', 'kind': 'pad', 'center': [i, i], 'radius': 10} for i in range(50)]
+    results = {}
+    for name, write in (('atomic', lambda d: save_calibration(d, path)),
+                        ('plain', lambda d: plain_write(d, path))):
+        save_calibration(data, path)
+        stop, failures, reads = threading.Event(), [0], [0]
+        thread = threading.Thread(target=reader, args=(path, stop, failures, reads))
+        thread.start()
+        for i in range(n_writes):
+            data['mean_offset'] = MEAN + i * 1e-4
+            write(data)
+        stop.set()
+        thread.join()
+        results[name] = (failures[0], reads[0] + failures[0])
+    return results
+
+
+def main():
+    p = argparse.ArgumentParser(description="Reference line detection and online recalibration.")
+    p.add_argument('--session_s', type=float, default=120.0, help='Simulated session length (default: 120 s)')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    angle_err, offset_err, detect_ms = check_detection(rng)
+    print(f"Line detection, tilt -15..15 deg: max angle error {angle_err:.2f} deg, max offset error {offset_err:.2f} px, "
+          f"{detect_ms:.1f} ms per frame")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        calib_file = os.path.join(tmp, 'calibration.json')
+        save_calibration({'y_line': Y_LINE, 'std_offset': STD, 'mean_offset': MEAN}, calib_file)
+        recal, final_mean, (expected_mean, expected_std), times = check_online(args.session_s, rng, calib_file)
+        stored = load_calibration_file(calib_file)
+        print(f"Online recalibration over {args.session_s:.0f} s: resting offset {MEAN:.1f} -> {final_mean:.1f} px, "
+              f"estimate {recal.mean:.2f} px (expected with the {1 / recal.alpha:.0f}-sample window "
+              f"{expected_mean:.2f} px, std {recal.std:.2f}, expected {expected_std:.2f}), stored {stored['mean_offset']:.2f} px; "
+              f"{recal}")
+        print(f"  update p50 {np.percentile(times, 50):.1f} us, p99 {np.percentile(times, 99):.1f} us")
+
+        atomic = check_atomic(calib_file)
+    for name, (failures, reads) in atomic.items():
+        print(f"Concurrent reads during {name} writes: {failures} failed of {reads}")
+
+    ok = (angle_err < 0.5 and offset_err < 1.5 and abs(recal.mean - expected_mean) < 0.5
+          and abs(recal.std - expected_std) < 0.3 and recal.n_writes > 0 and atomic['atomic'][0] == 0)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
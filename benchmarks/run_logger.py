@@ -0,0 +1,75 @@
+"""
+Benchmark: cost of logging one tableB row on the detection thread.
+
+Compares the previous approach (open tableB.csv in append mode and build a csv.writer per row)
+with `RunLogger.log` (queue append, written by the background thread), and checks that every
+queued row reaches the CSV and columnar outputs after `close()`.
+
+Usage:
+    python -m benchmarks.run_logger [--rows 5000]
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from utils.run_logger import RunLogger
+
+COLUMNS = ['record_time_perf', 'tap_number', 'frame_age_ms', 'detect_time_ms', 'frames_folder']
+DTYPES = ['f8', 'i4', 'f8', 'f8', 'U128']
+
+
+def per_row_append(path, row):
+    with open(path, 'a', newline='') as ff:
+        csv.writer(ff).writerow(row)
+
+
+def percentiles(samples):
+    samples = np.sort(np.asarray(samples)) * 1e6
+    return np.median(samples), np.percentile(samples, 99), samples[-1]
+
+
+def main():
+    p = argparse.ArgumentParser(description="Per-row logging cost: open/append per row vs background RunLogger.")
+    p.add_argument('--rows', type=int, default=5000, help='Rows logged per variant (default: 5000)')
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'append.csv')
+        with open(path, 'w', newline='') as ff:
+            csv.writer(ff).writerow(COLUMNS)
+        samples = []
+        for i in range(args.rows):
+            row = [time.perf_counter(), i, 1.5, 3.2, '']
+            t0 = time.perf_counter()
+            per_row_append(path, row)
+            samples.append(time.perf_counter() - t0)
+        append_stats = percentiles(samples)
+
+        logger = RunLogger(tmp, 'tableB', COLUMNS, DTYPES, formats=('csv', 'columnar'))
+        samples = []
+        for i in range(args.rows):
+            row = (time.perf_counter(), i, 1.5, 3.2, '')
+            t0 = time.perf_counter()
+            logger.log(row)
+            samples.append(time.perf_counter() - t0)
+        logger_stats = percentiles(samples)
+        logger.close()
+
+        with open(os.path.join(tmp, 'tableB.csv')) as ff:
+            n_csv = sum(1 for _ in ff) - 1
+        n_columnar = len(np.load(os.path.join(tmp, 'tableB_columns', 'tap_number.npy')))
+
+    print(f"Rows: {args.rows} (median / p99 / max per row)")
+    print(f"  open + csv.writer per row: {append_stats[0]:8.2f} us / {append_stats[1]:8.2f} us / {append_stats[2]:8.2f} us")
+    print(f"  RunLogger.log:             {logger_stats[0]:8.2f} us / {logger_stats[1]:8.2f} us / {logger_stats[2]:8.2f} us")
+    print(f"  written after close: csv {n_csv}, columnar {n_columnar}, dropped {logger.dropped}")
+    if n_csv != args.rows or n_columnar != args.rows:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
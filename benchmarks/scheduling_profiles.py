@@ -0,0 +1,133 @@
+"""
+Benchmark: tail latency of the pipeline processes under each scheduling profile of config/scheduling.json.
+
+For every profile, a producer process (role 'producer') publishes synthetic frames at the camera
+rate, sleeping until each frame is due, and a consumer process (role 'consumer') waits for them
+with a `FrameCursor` and "detects" each one with a fixed busy time. Optional background processes
+keep every core busy, standing in for the desktop and PureData. Both processes apply their role
+settings exactly like latency_mp.py and print what took effect.
+
+Reported per profile: producer wakeup lateness (due time to publication) and consumer wakeup
+latency (publication to hand-out), p50 / p99 / p99.9 / max, and the frames skipped.
+
+Usage:
+    python -m benchmarks.scheduling_profiles [--profiles default pinned realtime] [--load 4] [--duration 5]
+"""
+import argparse
+import json
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from utils.frame_ring import FrameCursor, FrameRing
+from utils.scheduling import DEFAULT_CONFIG_PATH, load_scheduling_profile, run_role
+
+FRAME_SHAPE = (540, 720, 3)
+
+
+def busy(duration):
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        pass
+
+
+def hog(stop_event):
+    while not stop_event.is_set():
+        busy(0.01)
+
+
+def producer(ring, stop_event, start_event, fps, results):
+    src = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+    period = 1.0 / fps
+    lateness = []
+    start_event.wait()
+    due = time.perf_counter()
+    while not stop_event.is_set():
+        due += period
+        remaining = due - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        now = time.perf_counter()
+        ring.write(src, now)
+        lateness.append(now - due)
+        if now - due > 10 * period:
+            due = now  # do not burst to catch up after a long stall
+    results.put(('producer', np.asarray(lateness)))
+    ring.close()
+
+
+def consumer(ring, stop_event, start_event, detect_s, results):
+    cursor = FrameCursor(ring, timeout=0.05)
+    latency = []
+    start_event.set()
+    while not stop_event.is_set():
+        if cursor.next_frame() is None:
+            continue
+        latency.append(time.perf_counter() - cursor.meta['ts'][0])
+        busy(detect_s)
+    results.put(('consumer', np.asarray(latency), cursor.skipped.value))
+    ring.close()
+
+
+def tail(samples):
+    return np.percentile(samples, [50, 99, 99.9]).tolist() + [float(samples.max())]
+
+
+def run_profile(name, args):
+    _, sched = load_scheduling_profile(name, args.config)
+    ring = FrameRing.create(4, FRAME_SHAPE, n_readers=1)
+    stop_event, start_event, results = mp.Event(), mp.Event(), mp.Queue()
+    hogs = [mp.Process(target=hog, args=(stop_event,)) for _ in range(args.load)]
+    procs = [mp.Process(target=run_role, args=('producer', sched, producer,
+                                               ring, stop_event, start_event, args.fps, results)),
+             mp.Process(target=run_role, args=('consumer', sched, consumer,
+                                               ring, stop_event, start_event, args.detect_ms / 1000.0, results))]
+    for proc in hogs + procs:
+        proc.start()
+    start_event.wait()
+    time.sleep(args.duration)
+    stop_event.set()
+    out = {}
+    for _ in procs:
+        item = results.get()
+        out[item[0]] = item[1:]
+    for proc in hogs + procs:
+        proc.join()
+    ring.close()
+    ring.unlink()
+    return out
+
+
+def main():
+    p = argparse.ArgumentParser(description="Tail latency of the pipeline processes across scheduling profiles.")
+    p.add_argument('--config', default=DEFAULT_CONFIG_PATH, help=f'Scheduling config (default: {DEFAULT_CONFIG_PATH})')
+    p.add_argument('--profiles', nargs='+', default=None, help='Profiles to compare (default: all of the config)')
+    p.add_argument('--load', type=int, default=mp.cpu_count(), help='Background busy processes (default: one per core)')
+    p.add_argument('--duration', type=float, default=5.0, help='Seconds per profile (default: 5)')
+    p.add_argument('--fps', type=float, default=522.0, help='Producer frame rate (default: 522)')
+    p.add_argument('--detect_ms', type=float, default=1.0, help='Simulated detection time (default: 1 ms)')
+    args = p.parse_args()
+
+    profiles = args.profiles
+    if profiles is None:
+        with open(args.config) as cfg_file:
+            profiles = list(json.load(cfg_file).get('profiles', {}))
+
+    mp.set_start_method('forkserver', force=True)
+    rows = []
+    for name in profiles:
+        print(f"--- profile {name} ({args.load} background processes)")
+        out = run_profile(name, args)
+        rows.append((name, tail(out['producer'][0]), tail(out['consumer'][0]), out['consumer'][1]))
+
+    print(f"\n{'profile':10s} {'producer lateness p50/p99/p99.9/max (us)':>42s}   "
+          f"{'consumer wakeup p50/p99/p99.9/max (us)':>40s} {'skipped':>8s}")
+    for name, prod, cons, skipped in rows:
+        prod_s = " / ".join(f"{v * 1e6:.0f}" for v in prod)
+        cons_s = " / ".join(f"{v * 1e6:.0f}" for v in cons)
+        print(f"{name:10s} {prod_s:>42s}   {cons_s:>40s} {skipped:8d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Check: asyncio serial ingest (utils/serial_ingest.py) against the pty fake Teensy.
+
+- Throughput: bursts of binary records and of decimal text lines written back to back into the pty;
+  every record must come out, the rate is reported
+- Backpressure: a consumer slower than the device, with a small queue; records beyond the queue are
+  dropped and counted, the reads never stall: received = consumed + dropped + still queued
+- Reconnect: the fake Teensy is unplugged and replugged on a new pty behind a stable symlink while
+  it taps; the ingest must reconnect by itself and keep delivering records, clock-synced again
+
+Usage:
+    python -m benchmarks.serial_ingest [--burst 100000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from latency_measurement.fake_teensy import FakeTeensy
+from utils.serial_ingest import SerialIngest
+
+
+async def consume(ingest, n_expected, timeout, delay=0.0):
+    consumed = 0
+    deadline = time.perf_counter() + timeout
+    while consumed < n_expected and time.perf_counter() < deadline:
+        try:
+            await asyncio.wait_for(ingest.queue.get(), 0.1)
+        except asyncio.TimeoutError:
+            continue
+        consumed += 1
+        if delay:
+            await asyncio.sleep(delay)
+    return consumed
+
+
+async def check_throughput(link_path, protocol, n):
+    teensy = FakeTeensy(tap_interval=(3600.0, 3600.0), link_path=link_path, protocol=protocol).start()
+    ingest = SerialIngest(link_path, protocol=protocol, queue_size=n)
+    run = asyncio.create_task(ingest.run())
+    await asyncio.sleep(0.5)
+    loop = asyncio.get_running_loop()
+    t0 = time.perf_counter()
+    sent = await loop.run_in_executor(None, teensy.burst, n)
+    consumed = await consume(ingest, sent, timeout=30.0)
+    elapsed = time.perf_counter() - t0
+    ingest.stop()
+    await run
+    teensy.close()
+    return sent, consumed, elapsed, ingest
+
+
+async def check_backpressure(link_path, n, queue_size=256):
+    teensy = FakeTeensy(tap_interval=(3600.0, 3600.0), link_path=link_path).start()
+    ingest = SerialIngest(link_path, queue_size=queue_size)
+    run = asyncio.create_task(ingest.run())
+    await asyncio.sleep(0.5)
+    loop = asyncio.get_running_loop()
+    writer = loop.run_in_executor(None, teensy.burst, n)
+    # a consumer needing 1 ms per record
+    consumed = await consume(ingest, n, timeout=2.0, delay=0.001)
+    sent = await writer
+    await asyncio.sleep(0.2)
+    ingest.stop()
+    await run
+    teensy.close()
+    return sent, consumed, ingest
+
+
+async def check_reconnect(link_path, duration_s=6.0):
+    teensy = FakeTeensy(tap_interval=(0.05, 0.1), link_path=link_path).start()
+    ingest = SerialIngest(link_path)
+    run = asyncio.create_task(ingest.run())
+    loop = asyncio.get_running_loop()
+    records = []
+
+    async def collect(until):
+        while loop.time() < until:
+            try:
+                records.append(await asyncio.wait_for(ingest.queue.get(), 0.1))
+            except asyncio.TimeoutError:
+                pass
+
+    await collect(loop.time() + duration_s / 2)
+    t_replug = time.perf_counter_ns()
+    await loop.run_in_executor(None, teensy.replug, 0.5)
+    await collect(loop.time() + duration_s / 2)
+    ingest.stop()
+    await run
+    teensy.close()
+    after = [r for r in records if r.arrival_ns > t_replug]
+    return records, after, ingest
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        link_path = os.path.join(tmp, 'ttyTEENSY')
+        ok = True
+        for protocol in ('binary', 'text'):
+            sent, consumed, elapsed, ingest = await check_throughput(link_path, protocol, args.burst)
+            print(f"Throughput ({protocol}): {consumed}/{sent} records in {elapsed:.2f} s, "
+                  f"{consumed / elapsed:,.0f} records/s, dropped {ingest.dropped}")
+            ok &= consumed == sent and ingest.dropped == 0
+
+        sent, consumed, ingest = await check_backpressure(link_path, args.burst // 10)
+        queued = ingest.queue.qsize()
+        print(f"Backpressure: {sent} sent, {ingest.received} received, {consumed} consumed, "
+              f"{ingest.dropped} dropped, {queued} still queued")
+        ok &= ingest.received == sent and ingest.received == consumed + ingest.dropped + queued and ingest.dropped > 0
+
+        records, after, ingest = await check_reconnect(link_path)
+        synced_after = sum(r.synced for r in after)
+        print(f"Reconnect: {ingest.n_connections} connections, {len(records)} records, {len(after)} after the "
+              f"replug ({synced_after} clock-synced)")
+        ok &= ingest.n_connections == 2 and synced_after > 0
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Asyncio serial ingest against the pty fake Teensy.")
+    p.add_argument('--burst', type=int, default=100000, help='Records per throughput burst (default: 100000)')
+    sys.exit(0 if asyncio.run(main(p.parse_args())) else 1)
@@ -0,0 +1,147 @@
+"""
+Benchmark: loading a run table through the session store (utils/session_store.py) vs the CSV readers.
+
+- Synthetic merged table (tableB + tableA columns) written as CSV
+- Loading `latency_ms`: row-by-row `csv.DictReader` (the former plot_latency.py), `csv.reader` of
+  every column, pandas `read_csv` when installed, and the store: one-time conversion of the CSV
+  (`persist=True`), then memory-mapped single column loads
+- Checks: loading without `persist` leaves the run folder untouched, the store columns equal the
+  CSV values, the CSV export reads back the same, the vectorized nearest join of join_tables.py
+  matches a brute-force search, and a table being written by a RunLogger (columnar format) loads
+  consistently while it grows
+
+Usage:
+    python -m benchmarks.session_store [--rows 500000]
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from data_cleanup.join_tables import nearest_match
+from utils.run_logger import RunLogger
+from utils.session_store import RunStore, read_csv_columns
+
+COLUMNS = ['record_time_perf', 'tap_number', 'frame_age_ms', 't_read_total_ms', 'detect_time_ms', 'frames_folder',
+           'timestamp_perf_counter', 'latency_ms', 'match_dt_ms']
+
+
+def write_synthetic(path, n, rng):
+    t = np.cumsum(rng.uniform(0.3, 0.8, n)) + 1000.0
+    columns = [t, np.arange(n), rng.gamma(2.0, 0.5, n), rng.normal(1.8, 0.1, n), rng.normal(3.0, 0.3, n),
+               [f'frames/trial_{i:06d}' if i % 7 == 0 else '' for i in range(n)],
+               t + rng.normal(0.0, 0.01, n), rng.normal(20.0, 3.0, n), rng.uniform(0.0, 20.0, n)]
+    columns[3][rng.random(n) < 0.01] = np.nan
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(zip(*[c.tolist() if isinstance(c, np.ndarray) else c for c in columns]))
+
+
+def timed(fn, repeat=3):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def dict_reader(path):
+    with open(path, 'r') as f:
+        return np.array([float(row['latency_ms']) for row in csv.DictReader(f)])
+
+
+def full_reader(path):
+    return read_csv_columns(path)['latency_ms']
+
+
+def check_nearest(rng, n=2000):
+    tb = np.sort(rng.uniform(0, 100, n))
+    ta = rng.uniform(0, 100, n)
+    ta[::50] = np.nan
+    match = nearest_match(tb, ta, 0.05)
+    dt = np.abs(tb[:, None] - np.where(np.isnan(ta), np.inf, ta)[None, :])
+    best = dt.argmin(axis=1)
+    expected = np.where(dt[np.arange(n), best] <= 0.05, best, -1)
+    return np.array_equal(match, expected)
+
+
+def check_live(folder, n=20000):
+    log = RunLogger(folder, 'tableB', ['record_time_perf', 'tap_number'], ['f8', 'i4'], formats=('columnar',),
+                    flush_interval=0.01)
+    lengths, consistent = [], True
+    for i in range(n):
+        log.log((i * 0.5, i))
+        if i % 2000 == 0:
+            table = RunStore(folder).load('tableB')
+            taps = np.asarray(table['tap_number'])
+            consistent &= np.array_equal(np.asarray(table['record_time_perf']), taps * 0.5)
+            lengths.append(len(table))
+            time.sleep(0.02)
+    log.close()
+    table = RunStore(folder).load('tableB')
+    lengths.append(len(table))
+    return consistent and lengths == sorted(lengths) and lengths[-1] == n, lengths
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as run_dir:
+        path = os.path.join(run_dir, 'merged.csv')
+        write_synthetic(path, args.rows, rng)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"Synthetic merged table: {args.rows} rows, {len(COLUMNS)} columns, {size_mb:.1f} MB of CSV")
+
+        t_dict, lat_dict = timed(lambda: dict_reader(path), repeat=1)
+        t_full, _ = timed(lambda: full_reader(path), repeat=1)
+        print(f"  csv.DictReader, latency_ms only:    {t_dict * 1000:9.1f} ms")
+        print(f"  csv.reader, every column typed:     {t_full * 1000:9.1f} ms")
+        try:
+            import pandas as pd
+            t_pd, _ = timed(lambda: pd.read_csv(path)['latency_ms'].values)
+            print(f"  pandas.read_csv:                    {t_pd * 1000:9.1f} ms")
+        except ImportError:
+            print("  pandas.read_csv:                    (pandas not installed)")
+
+        before = sorted(os.listdir(run_dir))
+        RunStore(run_dir).load('merged')
+        read_only = sorted(os.listdir(run_dir)) == before
+        print(f"  run folder untouched by a default load: {read_only}")
+        t_import, _ = timed(lambda: RunStore(run_dir, persist=True).load('merged'), repeat=1)
+        t_col, lat_store = timed(lambda: np.asarray(RunStore(run_dir).load('merged', ['latency_ms'])['latency_ms']))
+        print(f"  store, one-time CSV conversion:     {t_import * 1000:9.1f} ms")
+        print(f"  store, latency_ms column:           {t_col * 1000:9.3f} ms "
+              f"({t_dict / t_col:,.0f}x faster than DictReader)")
+
+        store = RunStore(run_dir)
+        table = store.load('merged')
+        reference = read_csv_columns(path)
+        same = all(np.array_equal(np.asarray(table[c]), reference[c], equal_nan=reference[c].dtype.kind == 'f')
+                   for c in COLUMNS)
+        exported = store.export_csv('merged', os.path.join(run_dir, 'export.csv'))
+        round_trip = read_csv_columns(exported)
+        same_export = all(np.array_equal(round_trip[c], reference[c], equal_nan=reference[c].dtype.kind == 'f')
+                          for c in COLUMNS)
+        dtypes = ', '.join(f"{c} {table[c].dtype}" for c in ('tap_number', 'latency_ms', 'frames_folder'))
+        print(f"Store columns equal to the CSV: {same} ({dtypes}); CSV export reads back the same: {same_export}")
+        ok = read_only and same and same_export and np.allclose(lat_store, lat_dict)
+
+    nearest_ok = check_nearest(rng)
+    print(f"Nearest join equal to brute force: {nearest_ok}")
+    with tempfile.TemporaryDirectory() as run_dir:
+        live_ok, lengths = check_live(run_dir)
+    print(f"Table loaded while a RunLogger writes it: consistent {live_ok}, lengths {lengths[:4]} ... {lengths[-1]}")
+    ok &= nearest_ok and live_ok
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Session store loading against the CSV readers.")
+    p.add_argument('--rows', type=int, default=500000, help='Rows of the synthetic merged table (default: 500000)')
+    main(p.parse_args())
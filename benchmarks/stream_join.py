@@ -0,0 +1,179 @@
+"""
+Check: online join of tableB and tableA (data_cleanup/stream_join.py) against the offline nearest join.
+
+- Synthetic run: taps with Teensy records jittered around them, pipeline false positives (taps
+  without a record) and false negatives (records without a tap), each row arriving with a random
+  delay (out of order within the disorder margin). Rows are fed in arrival order with the simulated
+  host clock; the matches must equal the brute-force nearest join of the complete tables (the
+  `pd.merge_asof` pairing of join_tables.py), and the windows must stay small over a long run
+- Live run: two RunLoggers write tableA.csv and tableB.csv and stream their rows over UDP while
+  taps are generated in real time; the file tail and the UDP joins must both write merged rows
+  during the run and end with the offline join of the final tables
+
+Usage:
+    python -m benchmarks.stream_join [--taps 200000]
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from data_cleanup.stream_join import CsvTail, StreamJoin, UdpSource, stream_join
+from utils.run_logger import RunLogger
+
+TOL_S = 0.05
+A_COLUMNS = ['timestamp_perf_counter', 'latency_ms', 'seq']
+B_COLUMNS = ['record_time_perf', 'tap_number', 'detect_time_ms']
+
+
+def nearest_join(tb, ta, tol=TOL_S):
+    """
+    Reference: index of the nearest `ta` within `tol` of every `tb`, -1 if none
+    """
+    order = np.argsort(ta, kind='stable')
+    ta = ta[order]
+    i = np.clip(np.searchsorted(ta, tb), 1, len(ta) - 1)
+    left, right = ta[i - 1], ta[i]
+    pick = np.where(tb - left <= right - tb, i - 1, i)
+    dt = np.abs(ta[pick] - tb)
+    return np.where(dt <= tol, order[pick], -1)
+
+
+def synthetic_run(n_taps, rng, p_false_pos=0.05, p_false_neg=0.05):
+    t_tap = np.cumsum(rng.uniform(0.1, 0.8, n_taps)) + 10.0
+    tb = t_tap + rng.normal(0.0, 0.01, n_taps)
+    ta = t_tap + rng.normal(0.0, 0.01, n_taps)
+    tb = np.concatenate([tb, rng.uniform(t_tap[0], t_tap[-1], int(n_taps * p_false_pos))])
+    ta = ta[rng.random(n_taps) >= p_false_neg]
+    ta = np.concatenate([ta, rng.uniform(t_tap[0], t_tap[-1], int(n_taps * p_false_neg))])
+    return tb, ta
+
+
+def check_synthetic(n_taps, seed=0):
+    rng = np.random.default_rng(seed)
+    tb, ta = synthetic_run(n_taps, rng)
+    reference = nearest_join(tb, ta)
+
+    # arrival on the host: Teensy buffering for tableA, up to 0.2 s for late resolved taps in tableB
+    events = [(t + d, 0, i) for i, (t, d) in enumerate(zip(ta, rng.uniform(0.005, 0.06, len(ta))))]
+    events += [(t + d, 1, i) for i, (t, d) in enumerate(zip(tb, rng.uniform(0.0, 0.2, len(tb))))]
+    events.sort()
+
+    join = StreamJoin(TOL_S)
+    matched = np.full(len(tb), -1)
+    max_pending = [0, 0]
+    t_next = events[0][0]
+    t0 = time.perf_counter()
+    for arrival, side, i in events:
+        if side:
+            join.add_b(tb[i], i)
+        else:
+            join.add_a(ta[i], i)
+        if arrival >= t_next:
+            for b, a, _ in join.advance(arrival):
+                matched[b] = a
+            max_pending = [max(m, p) for m, p in zip(max_pending, join.pending)]
+            t_next = arrival + 0.05
+    for b, a, _ in join.advance(flush=True):
+        matched[b] = a
+    elapsed = time.perf_counter() - t0
+    return join, matched, reference, max_pending, elapsed
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))
+    return rows[0], rows[1:]
+
+
+def live_producer(folder, n_taps, rate, rng, stream_to):
+    table_a = RunLogger(folder, 'tableA', A_COLUMNS, stream_to=stream_to)
+    table_b = RunLogger(folder, 'tableB', B_COLUMNS, stream_to=stream_to)
+    pending = []
+    t_next = time.perf_counter()
+    for n in range(n_taps):
+        t_next += rng.uniform(0.5, 1.5) / rate
+        while time.perf_counter() < t_next:
+            time.sleep(0.001)
+        t = time.perf_counter()
+        if rng.random() >= 0.05:
+            table_b.log((t + rng.normal(0.0, 0.005), n, 3.0))
+        if rng.random() >= 0.05:
+            # the Teensy record reaches the logger a few tens of milliseconds later
+            pending.append((t + rng.uniform(0.02, 0.06), (t + rng.normal(0.0, 0.005), 20.0, n)))
+        while pending and pending[0][0] <= t:
+            table_a.log(pending.pop(0)[1])
+    for _, row in pending:
+        table_a.log(row)
+    table_a.close()
+    table_b.close()
+
+
+def check_live(folder, n_taps=300, rate=100.0, port=9219):
+    rng = np.random.default_rng(1)
+    stop = threading.Event()
+    joins = {
+        'tail': (os.path.join(folder, 'merged.csv'),
+                 [CsvTail(os.path.join(folder, 'tableA.csv'), 'tableA'),
+                  CsvTail(os.path.join(folder, 'tableB.csv'), 'tableB')]),
+        'udp': (os.path.join(folder, 'merged_udp.csv'), [UdpSource(('127.0.0.1', port))]),
+    }
+    threads = [threading.Thread(target=stream_join, args=(sources, out),
+                                kwargs={'report_interval': 0, 'stop_event': stop})
+               for out, sources in joins.values()]
+    for thread in threads:
+        thread.start()
+    live_producer(folder, n_taps, rate, rng, ('127.0.0.1', port))
+    rows_during_run = {name: len(read_csv(out)[1]) if os.path.getsize(out) else 0
+                       for name, (out, _) in joins.items()}
+    time.sleep(0.5)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    _, a_rows = read_csv(os.path.join(folder, 'tableA.csv'))
+    _, b_rows = read_csv(os.path.join(folder, 'tableB.csv'))
+    ta = np.array([float(r[0]) for r in a_rows])
+    tb = np.array([float(r[0]) for r in b_rows])
+    reference = nearest_join(tb, ta)
+    expected = sorted((int(b_rows[b][1]), int(a_rows[a][2])) for b, a in enumerate(reference) if a >= 0)
+    results = {}
+    for name, (out, _) in joins.items():
+        header, rows = read_csv(out)
+        pairs = sorted((int(float(r[header.index('tap_number')])), int(float(r[header.index('seq')])))
+                       for r in rows)
+        results[name] = (pairs == expected, rows_during_run[name], len(rows))
+    return len(expected), results
+
+
+def main(args):
+    join, matched, reference, max_pending, elapsed = check_synthetic(args.taps)
+    stats = join.stats()
+    n_rows = stats['taps'] + stats['teensy']
+    same = np.array_equal(matched, reference)
+    print(f"Synthetic: {stats['taps']} taps, {stats['teensy']} Teensy records, {stats['matched']} matched "
+          f"({'same' if same else 'DIFFERENT'} pairs as the offline join), unmatched taps "
+          f"{stats['unmatched_taps_pct']:.1f}%, unmatched Teensy {stats['unmatched_teensy_pct']:.1f}%")
+    print(f"  {n_rows / elapsed:,.0f} rows/s, largest windows: {max_pending[0]} taps, {max_pending[1]} Teensy "
+          f"records, late {stats['late']}, forced {stats['forced']}")
+    ok = same and stats['late'] == 0 and stats['forced'] == 0 and max(max_pending) < 100
+
+    with tempfile.TemporaryDirectory() as folder:
+        n_expected, results = check_live(folder)
+    for name, (same, during, total) in results.items():
+        print(f"Live ({name}): {total}/{n_expected} merged rows, {during} written during the run, "
+              f"{'same' if same else 'DIFFERENT'} pairs as the offline join")
+        ok &= same and during > 0
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Online stream join against the offline nearest join.")
+    p.add_argument('--taps', type=int, default=200000, help='Taps of the synthetic run (default: 200000)')
+    main(p.parse_args())
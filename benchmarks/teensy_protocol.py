@@ -0,0 +1,69 @@
+"""
+Check: host-time press timestamps of the binary Teensy protocol against a pty fake Teensy.
+
+`FakeTeensy` (latency_measurement/fake_teensy.py) runs a drifting device clock, answers the clock
+sync pings after a jittered USB delay (with a few long outliers) and emits tap records that reach
+the host after a random buffering delay. `TeensyLink` reads them through pyserial like log_serial.py
+and maps the Teensy press timestamps onto the host clock; the error against the true press time is
+compared with stamping the record on arrival (the text protocol). The simulated USB delay only hits
+the echoes, so the mid-round-trip sync samples carry a bias of about half of it.
+
+Usage:
+    python -m benchmarks.teensy_protocol [--duration 30] [--drift_ppm 50]
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import serial
+
+from latency_measurement.fake_teensy import FakeTeensy
+from utils.teensy_protocol import TeensyLink
+
+MAX_P99_ERROR_US = 500.0
+
+
+def main():
+    p = argparse.ArgumentParser(description="Binary Teensy protocol and clock sync against a fake Teensy.")
+    p.add_argument('--duration', type=float, default=30.0, help='Run length in seconds (default: 30)')
+    p.add_argument('--drift_ppm', type=float, default=50.0)
+    p.add_argument('--ping_interval', type=float, default=0.5)
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    teensy = FakeTeensy(args.drift_ppm, tap_interval=(0.1, 0.3), seed=args.seed).start()
+    ser = serial.Serial(teensy.port, 115200, timeout=0.01)
+    link = TeensyLink(ser, ping_interval=args.ping_interval)
+    records = []
+    t_end = time.perf_counter() + args.duration
+    try:
+        while time.perf_counter() < t_end:
+            records += link.poll()
+    finally:
+        ser.close()
+        teensy.close()
+
+    synced = [r for r in records if r.synced and r.seq in teensy.truth]
+    press_err = np.array([r.press_ns - teensy.truth[r.seq][0] for r in synced]) / 1000.0
+    arrival_err = np.array([r.arrival_ns - teensy.truth[r.seq][0] for r in synced]) / 1000.0
+    # the Teensy measures the latency on its own clock: the drift is a few ppm of it
+    latency_err = np.array([r.latency_ms * 1e3 - (teensy.truth[r.seq][1] - teensy.truth[r.seq][0]) / 1e3
+                            for r in synced])
+    print(f"{len(records)} records ({len(synced)} after the clock sync was ready) in {args.duration:.0f} s, "
+          f"{link}")
+    print(f"Clock fit: host vs device drift {link.clock.drift_ppm:+.2f} ppm "
+          f"(device clock {args.drift_ppm:+.2f} ppm fast), last ping round trip {link.last_rtt_ns / 1000:.0f} us")
+    for name, err in (('mapped press time', press_err), ('arrival time', arrival_err)):
+        print(f"  {name:<18} error vs true press: median {np.median(err):+8.1f} us, "
+              f"p99 |err| {np.percentile(np.abs(err), 99):8.1f} us, max |err| {np.abs(err).max():8.1f} us")
+    print(f"  latency (onset - press, device clock) error: max |err| {np.abs(latency_err).max():.1f} us")
+
+    ok = (len(synced) > 0 and link.stats()['lost'] == 0 and link.stats()['crc_errors'] == 0
+          and np.percentile(np.abs(press_err), 99) < MAX_P99_ERROR_US)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
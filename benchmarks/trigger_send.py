@@ -0,0 +1,183 @@
+"""
+Check and benchmark of the trigger output layer (utils/trigger_output.py).
+
+- Checks the pre-encoded `/trigger 1` message against python-osc's encoding (when installed), and that it
+  reaches a local UDP receiver and a local Unix-domain datagram receiver unchanged.
+- Checks that sends to unreachable targets are counted as dropped, with their errno, instead of raising.
+- Measures the send time per trigger of `TriggerOutput` against `pythonosc.udp_client.SimpleUDPClient`.
+
+Usage:
+    python -m benchmarks.trigger_send [--iterations 20000]
+"""
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import time
+
+from utils.trigger_output import TriggerOutput, encode_osc_bundle, encode_osc_message
+
+EXPECTED_TRIGGER = b'/trigger\x00\x00\x00\x00,i\x00\x00\x00\x00\x00\x01'
+
+
+def udp_receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(1.0)
+    return sock
+
+
+def unix_receiver(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    sock.settimeout(1.0)
+    return sock
+
+
+def drain(sock):
+    sock.setblocking(False)
+    n = 0
+    try:
+        while True:
+            sock.recv(65536)
+            n += 1
+    except BlockingIOError:
+        pass
+    sock.settimeout(1.0)
+    return n
+
+
+def check_wire_format(udp_sock, unix_path, unix_sock):
+    ok = True
+    message = encode_osc_message('/trigger', 1)
+    if message != EXPECTED_TRIGGER:
+        print(f"  encoded /trigger 1 differs from the OSC 1.0 layout: {message!r}")
+        ok = False
+
+    try:
+        from pythonosc.osc_message_builder import OscMessageBuilder
+        from pythonosc.osc_bundle_builder import OscBundleBuilder, IMMEDIATELY
+    except ImportError:
+        print("  python-osc not installed, skipping the cross-check")
+    else:
+        builder = OscMessageBuilder('/lm')
+        for arg in (3, 0.25, 'left'):
+            builder.add_arg(arg)
+        reference = builder.build()
+        if encode_osc_message('/lm', 3, 0.25, 'left') != reference.dgram:
+            print("  message encoding differs from python-osc")
+            ok = False
+        bundle = OscBundleBuilder(IMMEDIATELY)
+        bundle.add_content(reference)
+        if encode_osc_bundle([reference.dgram]) != bundle.build().dgram:
+            print("  bundle encoding differs from python-osc")
+            ok = False
+
+    out = TriggerOutput([f'udp:127.0.0.1:{udp_sock.getsockname()[1]}', f'unix:{unix_path}'])
+    out.register('trigger', '/trigger', 1)
+    out.send('trigger')
+    for name, sock in (('udp', udp_sock), ('unix', unix_sock)):
+        try:
+            data = sock.recv(65536)
+        except socket.timeout:
+            print(f"  {name}: nothing received")
+            ok = False
+            continue
+        if data != EXPECTED_TRIGGER:
+            print(f"  {name}: received {data!r}")
+            ok = False
+    out.close()
+    return ok
+
+
+def check_unreachable(tmp):
+    """
+    Sends to targets that fail at once (broadcast without SO_BROADCAST, missing socket file):
+    counted as dropped with their errno, never raised
+    """
+    out = TriggerOutput(['udp:255.255.255.255:11111', f"unix:{os.path.join(tmp, 'missing.sock')}"])
+    out.register('trigger', '/trigger', 1)
+    try:
+        for _ in range(3):
+            out.send('trigger')
+    except OSError as e:
+        print(f"  send raised {e!r}")
+        return False
+    finally:
+        out.close()
+    print(f"  {out.drop_report()}")
+    return all(t.dropped == 3 and t.last_errno is not None for t in out.transports)
+
+
+def timeit(fn, iterations, receivers):
+    samples = []
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+        if i % 8 == 7:
+            # keep the receive buffers from filling up (Unix datagram queues are short)
+            for sock in receivers:
+                drain(sock)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def main():
+    p = argparse.ArgumentParser(description="Trigger output check and send overhead benchmark.")
+    p.add_argument('--iterations', type=int, default=20000, help='Sends per variant (default: 20000)')
+    args = p.parse_args()
+
+    udp_sock = udp_receiver()
+    port = udp_sock.getsockname()[1]
+    with tempfile.TemporaryDirectory() as tmp:
+        unix_path = os.path.join(tmp, 'trigger.sock')
+        unix_sock = unix_receiver(unix_path)
+
+        print("Wire format:")
+        ok = check_wire_format(udp_sock, unix_path, unix_sock)
+        print("  OK" if ok else "  FAILED")
+
+        print("Unreachable targets:")
+        unreachable_ok = check_unreachable(tmp)
+        print("  OK" if unreachable_ok else "  FAILED")
+        ok &= unreachable_ok
+
+        print(f"Send time per trigger ({args.iterations} sends, median / p99):")
+        variants = []
+        try:
+            from pythonosc import udp_client
+        except ImportError:
+            pass
+        else:
+            client = udp_client.SimpleUDPClient('127.0.0.1', port)
+            variants.append(('SimpleUDPClient.send_message', lambda: client.send_message('/trigger', 1)))
+
+        udp_out = TriggerOutput([f'udp:127.0.0.1:{port}'])
+        udp_out.register('trigger', '/trigger', 1)
+        variants.append(('TriggerOutput udp', lambda: udp_out.send('trigger')))
+
+        unix_out = TriggerOutput([f'unix:{unix_path}'])
+        unix_out.register('trigger', '/trigger', 1)
+        variants.append(('TriggerOutput unix', lambda: unix_out.send('trigger')))
+
+        both_out = TriggerOutput([f'udp:127.0.0.1:{port}', f'unix:{unix_path}'])
+        both_out.register('trigger', '/trigger', 1)
+        variants.append(('TriggerOutput udp + unix', lambda: both_out.send('trigger')))
+
+        for name, fn in variants:
+            median, p99 = timeit(fn, args.iterations, (udp_sock, unix_sock))
+            print(f"  {name:30s} {median:7.2f} us / {p99:7.2f} us")
+
+        dropped = udp_out.dropped + unix_out.dropped + both_out.dropped
+        if dropped:
+            print(f"  {dropped} send(s) dropped (receiver buffer full): "
+                  f"{'; '.join(out.drop_report() for out in (udp_out, unix_out, both_out) if out.dropped)}")
+        unix_sock.close()
+    udp_sock.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
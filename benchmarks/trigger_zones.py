@@ -0,0 +1,166 @@
+"""
+Benchmark: cost and correctness of the vectorized multi-zone trigger engine (utils/trigger_zones.py).
+
+Correctness, on random hands:
+- the signed distances of every zone kind match a straightforward per-zone, per-hand Python
+  implementation
+- a set holding only the reference line zone fires exactly like `TapDetector` on one-hand sequences,
+  and like `LineTapDetector` when the line is tilted
+
+Cost: `TriggerZones.update` per frame (two hands) for growing numbers of zones of every kind,
+against `TapDetector.update` for the single line and `LineTapDetector.update` for the tilted line.
+
+Usage:
+    python -m benchmarks.trigger_zones [--frames 20000]
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from utils.hand_landmarks import LEFT, RIGHT, UNKNOWN, HandLandmarks
+from utils.tap_detection import LineTapDetector, TapDetector
+from utils.trigger_zones import TriggerZones, legacy_line_zone
+
+FRAME_SHAPE = (540, 720, 3)  # as in latency_mp.py
+Y_LINE = 398
+THRESHOLD = 22.8  # mean + 3 * std of config/calibration.json
+TILTED_LINE = [[0, Y_LINE - 25], [FRAME_SHAPE[1] - 1, Y_LINE + 25]]  # about 4 deg
+
+
+def random_zones(n, rng):
+    h, w = FRAME_SHAPE[:2]
+    zones = []
+    for i in range(n):
+        kind = ('line', 'rect', 'pad')[i % 3]
+        zone = {'name': f'{kind}_{i}', 'kind': kind, 'address': f'/zone/{i}', 'hand': ('left', 'right', 'any')[i % 3],
+                'landmarks': sorted(rng.choice(21, int(rng.integers(1, 5)), replace=False).tolist()),
+                'hysteresis': 2.0}
+        if kind == 'pad':
+            zone.update(center=[float(rng.uniform(0, w)), float(rng.uniform(0, h))], radius=float(rng.uniform(10, 60)))
+        else:
+            zone.update(p0=[float(rng.uniform(0, w)), float(rng.uniform(0, h))],
+                        p1=[float(rng.uniform(0, w)), float(rng.uniform(0, h))])
+            if kind == 'rect':
+                zone['angle'] = float(rng.uniform(-45, 45))
+            else:
+                zone['threshold'] = 5.0
+        zones.append(zone)
+    return zones
+
+
+def reference_distance(zone, point):
+    """
+    Per-zone signed distance written out, for comparison with the vectorized engine
+    """
+    x, y = point
+    if zone['kind'] == 'pad':
+        return math.hypot(x - zone['center'][0], y - zone['center'][1]) - zone['radius']
+    (x0, y0), (x1, y1) = zone['p0'], zone['p1']
+    if zone['kind'] == 'line':
+        return abs((x1 - x0) * (y - y0) - (y1 - y0) * (x - x0)) / math.hypot(x1 - x0, y1 - y0)
+    a = math.radians(zone.get('angle', 0.0))
+    dx, dy = x - (x0 + x1) / 2, y - (y0 + y1) / 2
+    u, v = abs(dx * math.cos(a) + dy * math.sin(a)), abs(-dx * math.sin(a) + dy * math.cos(a))
+    qx, qy = u - abs(x1 - x0) / 2, v - abs(y1 - y0) / 2
+    return math.hypot(max(qx, 0), max(qy, 0)) + min(max(qx, qy), 0)
+
+
+def random_hands(hands, rng, n_max=2):
+    hands.n = int(rng.integers(0, n_max + 1))
+    hands.landmarks[:] = rng.random(hands.landmarks.shape)
+    hands.handedness[:] = rng.choice([LEFT, RIGHT, UNKNOWN], len(hands.handedness))
+    return hands
+
+
+def check_distances(rng, n_frames=500):
+    zones = random_zones(30, rng)
+    engine = TriggerZones(zones, FRAME_SHAPE)
+    hands = HandLandmarks(2)
+    scale = np.array(FRAME_SHAPE[1::-1], dtype=np.float64)
+    err = 0.0
+    for _ in range(n_frames):
+        random_hands(hands, rng)
+        dist = engine.distances(hands)
+        for h in range(hands.n):
+            for z, zone in enumerate(zones):
+                point = hands.landmarks[h, zone['landmarks'], :2].astype(np.float64).mean(axis=0) * scale
+                err = max(err, abs(float(dist[h, z]) - reference_distance(zone, point)))
+    return err
+
+
+def check_legacy(rng, line=None, n_frames=20000):
+    engine = TriggerZones([legacy_line_zone(Y_LINE, THRESHOLD, line=line)], FRAME_SHAPE)
+    legacy = TapDetector(Y_LINE, THRESHOLD) if line is None else LineTapDetector(Y_LINE, THRESHOLD, line, FRAME_SHAPE)
+    hands = HandLandmarks(2)
+    mismatches = 0
+    y = Y_LINE - 100.0
+    for _ in range(n_frames):
+        # one hand wandering around the line, sometimes lost or flipped to the right hand
+        y = float(np.clip(y + rng.normal(0, 6), Y_LINE - 150, Y_LINE + 10))
+        hands.n = int(rng.random() > 0.05)
+        hands.landmarks[0, :, 0] = rng.uniform(0.2, 0.8)
+        hands.landmarks[0, :, 1] = y / FRAME_SHAPE[0]
+        hands.handedness[0] = RIGHT if rng.random() < 0.05 else LEFT
+        mismatches += engine.update(hands, FRAME_SHAPE[0]) != legacy.update(hands, FRAME_SHAPE[0])
+    return mismatches, engine.counter, legacy.counter
+
+
+def time_update(detector, frames):
+    times = np.empty(len(frames))
+    for i, hands in enumerate(frames):
+        t0 = time.perf_counter()
+        detector.update(hands, FRAME_SHAPE[0])
+        times[i] = time.perf_counter() - t0
+    return times * 1e6
+
+
+def main():
+    p = argparse.ArgumentParser(description="Cost and correctness of the multi-zone trigger engine.")
+    p.add_argument('--frames', type=int, default=20000, help='Frames per timing run (default: 20000)')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    err = check_distances(rng)
+    mismatches, n_zone_taps, n_legacy_taps = check_legacy(rng)
+    tilted_mismatches, n_tilted_zone_taps, n_tilted_taps = check_legacy(rng, TILTED_LINE)
+    print(f"Max distance error vs per-zone reference: {err:.4f} px")
+    print(f"Reference line zone vs TapDetector: {mismatches} mismatching frames, "
+          f"{n_zone_taps} vs {n_legacy_taps} taps")
+    print(f"Tilted reference line zone vs LineTapDetector: {tilted_mismatches} mismatching frames, "
+          f"{n_tilted_zone_taps} vs {n_tilted_taps} taps")
+
+    frames = []
+    for _ in range(args.frames):
+        hands = random_hands(HandLandmarks(2), rng, n_max=2)
+        hands.n = 2
+        frames.append(hands)
+
+    baseline = time_update(TapDetector(Y_LINE, THRESHOLD), frames)
+    print(f"\n{'zones':>6s} {'p50 us':>8s} {'p99 us':>8s}")
+    print(f"{'legacy':>6s} {np.percentile(baseline, 50):8.1f} {np.percentile(baseline, 99):8.1f}")
+    tilted = time_update(LineTapDetector(Y_LINE, THRESHOLD, TILTED_LINE, FRAME_SHAPE), frames)
+    print(f"{'tilted':>6s} {np.percentile(tilted, 50):8.1f} {np.percentile(tilted, 99):8.1f}")
+    tilted_zone = time_update(TriggerZones([legacy_line_zone(Y_LINE, THRESHOLD, line=TILTED_LINE)], FRAME_SHAPE),
+                              frames)
+    print(f"{'(zone)':>6s} {np.percentile(tilted_zone, 50):8.1f} {np.percentile(tilted_zone, 99):8.1f}")
+    p50 = {}
+    for n_zones in (1, 4, 16, 32, 64):
+        times = time_update(TriggerZones(random_zones(n_zones, rng), FRAME_SHAPE), frames)
+        p50[n_zones] = np.percentile(times, 50)
+        print(f"{n_zones:6d} {p50[n_zones]:8.1f} {np.percentile(times, 99):8.1f}")
+    # the per-frame work is a fixed number of NumPy calls on preallocated buffers: going from one zone to 64
+    # must not cost more than a constant factor (64x the zones, well under 2x the time)
+    growth = p50[64] / p50[1]
+    print(f"p50 64 zones / 1 zone: {growth:.2f}x")
+
+    ok = err < 0.01 and mismatches == 0 and tilted_mismatches == 0 and growth < 2.0
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
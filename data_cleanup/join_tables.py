@@ -1,62 +1,91 @@
 #!/usr/bin/env python3
 """
-Join tableB.csv and tableA.csv by nearest perf-counter within tolerance (default 50 ms),
+Join tableB and tableA by nearest perf-counter within tolerance (default 50 ms),
 but KEEP ONLY rows that have a match in tableA (drop unmatched tableB rows).
 
-Output: tableB_joined_nearest.csv (adds timestamp_perf_counter, latency_ms, match_dt_ms)
+The tables are read through the run's session store (utils/session_store.py), without writing into it.
+Output: merged.csv in the run folder (tableB columns, then timestamp_perf_counter, latency_ms, ...
+of tableA and match_dt_ms), also stored as the run's columnar `merged` table with --persist.
+Without --run_dir, --tablea/--tableb/--out name CSV files as before (tableB_joined_nearest.csv).
+
+tableA `timestamp_perf_counter` is the host time of the button press, mapped from the Teensy clock, with the
+binary protocol of log_serial.py (its default, which needs the current arduino/latency/latency.ino firmware);
+with `--protocol text`, in older runs and in rows with `clock_synced` False, it is the time the record was read,
+later by the USB-serial buffering (a few ms). The default tolerance covers both; the read time of binary runs is
+kept in `arrival_perf_counter`.
 """
 import argparse
 import os
 import sys
 
-try:
-    import pandas as pd
-except ImportError:
-    print("This script requires pandas. Install with: pip install pandas")
-    sys.exit(1)
-
-
-def join_nearest_keep_matched(tableb_path, tablea_path, out_path, tolerance_s=0.05):
-    tb = pd.read_csv(tableb_path)
-    ta = pd.read_csv(tablea_path)
-
+import numpy as np
+
+from utils.session_store import RunStore, load_table, write_csv
+
+
+def nearest_match(tb_times, ta_times, tolerance_s=0.05):
+    """
+    Index of the nearest `ta_times` within `tolerance_s` of every `tb_times`, -1 if none
+    (`pd.merge_asof(direction='nearest', tolerance=...)`)
+    """
+    tb_times = np.asarray(tb_times, dtype=np.float64)
+    ta_times = np.asarray(ta_times, dtype=np.float64)
+    match = np.full(len(tb_times), -1, dtype=np.int64)
+    valid = np.flatnonzero(~np.isnan(ta_times))
+    if not len(valid) or not len(tb_times):
+        return match
+    order = valid[np.argsort(ta_times[valid], kind='stable')]
+    ta_sorted = ta_times[order]
+    i = np.searchsorted(ta_sorted, tb_times)
+    left = np.clip(i - 1, 0, len(ta_sorted) - 1)
+    right = np.clip(i, 0, len(ta_sorted) - 1)
+    dt_left = np.abs(tb_times - ta_sorted[left])
+    dt_right = np.abs(ta_sorted[right] - tb_times)
+    pick = np.where(dt_left <= dt_right, left, right)
+    dt = np.minimum(dt_left, dt_right)
+    found = dt <= tolerance_s  # False for NaN times
+    match[found] = order[pick[found]]
+    return match
+
+
+def join_nearest_keep_matched(tb, ta, tolerance_s=0.05):
+    """
+    Parameters
+    ---
+    tb, ta: Table
+        tableB and tableA
+
+    Returns
+    ---
+    (number of tableB rows, dict of the columns of the matched rows, sorted by record_time_perf)
+    """
     # Required columns
-    if 'record_time_perf' not in tb.columns:
+    if 'record_time_perf' not in tb:
         raise ValueError("tableB must contain 'record_time_perf' column.")
-    if 'timestamp_perf_counter' not in ta.columns:
+    if 'timestamp_perf_counter' not in ta:
         raise ValueError("tableA must contain 'timestamp_perf_counter' column.")
 
-    # Ensure floats
-    tb['record_time_perf'] = tb['record_time_perf'].astype(float)
-    ta['timestamp_perf_counter'] = ta['timestamp_perf_counter'].astype(float)
-
-    # Sort (required by merge_asof)
-    tb = tb.sort_values('record_time_perf').reset_index(drop=True)
-    ta = ta.sort_values('timestamp_perf_counter').reset_index(drop=True)
-
-    # Perform nearest merge with tolerance
-    merged = pd.merge_asof(
-        tb,
-        ta,
-        left_on='record_time_perf',
-        right_on='timestamp_perf_counter',
-        direction='nearest',
-        tolerance=tolerance_s
-    )
+    tb_times = np.asarray(tb['record_time_perf'], dtype=np.float64)
+    ta_times = np.asarray(ta['timestamp_perf_counter'], dtype=np.float64)
+    order = np.argsort(tb_times, kind='stable')
+    match = nearest_match(tb_times[order], ta_times, tolerance_s)
+    keep = match >= 0
+    b_rows, a_rows = order[keep], match[keep]
 
+    matched = {c: np.asarray(tb[c])[b_rows] for c in tb.columns}
+    for c in ta.columns:
+        matched[c if c not in matched else f'{c}_a'] = np.asarray(ta[c])[a_rows]
     # Add match difference in milliseconds
-    merged['match_dt_ms'] = (merged['record_time_perf'] - merged['timestamp_perf_counter']).abs() * 1000.0
-
-    # Keep only matched rows (timestamp_perf_counter not null)
-    matched = merged.dropna(subset=['timestamp_perf_counter']).reset_index(drop=True)
-
-    # Save matched only
-    matched.to_csv(out_path, index=False)
-    return merged, matched
+    matched['match_dt_ms'] = np.abs(tb_times[b_rows] - ta_times[a_rows]) * 1000.0
+    return len(tb_times), matched
 
 
 def main():
     p = argparse.ArgumentParser(description="Join tableB and tableA by nearest perf-counter and keep only matched rows.")
+    p.add_argument('--run_dir', default=None,
+                   help='Run folder: read its tableA/tableB and write the result as its merged table (merged.csv)')
+    p.add_argument('--persist', action='store_true',
+                   help='With --run_dir: also write the columnar copies of merged, tableA and tableB in the run folder')
     p.add_argument('--tableb', default='tableB.csv', help='Path to tableB CSV (default: tableB.csv)')
     p.add_argument('--tablea', default='tableA.csv', help='Path to tableA CSV (default: tableA.csv)')
     p.add_argument('--out', default='tableB_joined_nearest.csv', help='Output CSV path for matched rows')
@@ -65,21 +94,33 @@ def main():
 
     tol_s = args.tol_ms / 1000.0
 
-    if not os.path.exists(args.tableb):
-        print(f"Error: {args.tableb} not found.")
-        sys.exit(2)
-    if not os.path.exists(args.tablea):
-        print(f"Error: {args.tablea} not found.")
+    try:
+        if args.run_dir:
+            store = RunStore(args.run_dir, persist=args.persist)
+            tb, ta = store.load('tableB'), store.load('tableA')
+        else:
+            tb, ta = load_table(args.tableb), load_table(args.tablea)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
         sys.exit(2)
 
-    merged_all, matched = join_nearest_keep_matched(args.tableb, args.tablea, args.out, tolerance_s=tol_s)
+    total_b, matched = join_nearest_keep_matched(tb, ta, tolerance_s=tol_s)
+
+    if args.run_dir:
+        out = os.path.join(args.run_dir, 'merged.csv')
+        if args.persist:
+            store.save('merged', matched, source='join_tables', export_csv=True)
+        else:
+            write_csv(out, matched)
+    else:
+        write_csv(args.out, matched)
+        out = args.out
 
-    total_b = len(merged_all)
-    matched_n = len(matched)
+    matched_n = len(matched['match_dt_ms'])
     unmatched = total_b - matched_n
     mean_dt = matched['match_dt_ms'].mean() if matched_n else float('nan')
 
-    print(f"Saved matched merged table to: {args.out}")
+    print(f"Saved matched merged table to: {out}")
     print(f"Rows in tableB processed: {total_b}")
     print(f"Rows matched within {args.tol_ms} ms: {matched_n}")
     print(f"Rows dropped (no match): {unmatched}")
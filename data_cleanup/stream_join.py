@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Online join of tableB (latency_mp.py taps) and tableA (log_serial.py Teensy latencies) while the run goes on.
+
+Same pairing as join_tables.py: every tableB row gets the tableA row nearest in time
+(`record_time_perf` vs `timestamp_perf_counter`) within the tolerance (default 50 ms). The rows are
+read as they are written, by tailing tableA.csv and tableB.csv, or from the UDP datagrams of the
+run loggers (`"stream_to": "127.0.0.1:9210"` in config/log_config.json), and each tableB row is
+written to merged.csv as soon as its match is final:
+- a tableB row at t is final once no later tableA row can be nearer: the tableA stream has moved
+  past t + tolerance, or past t + the distance of the best match already seen
+- a stream "has moved past" a time when its latest row is later by more than `disorder` (rows
+  logged slightly out of order, e.g. predictive taps resolved after their contact), or when the
+  host clock is later by more than `lateness` (a stream that stopped, e.g. a missed Teensy record).
+  All timestamps are host perf_counter seconds, so the clock applies to live runs only (`--replay`
+  ignores it, for finished runs)
+- tableA rows are kept while a pending or future tableB row may still pick them, then dropped;
+  those never picked are Teensy records without a tap (false negatives of the pipeline)
+
+`timestamp_perf_counter` is the clock-mapped press time with the binary Teensy protocol (log_serial.py
+default, current firmware) and the read time with `--protocol text` or before the clock sync is ready
+(`clock_synced` False), later by the USB-serial buffering: the tolerance and `lateness` cover both.
+
+Both streams are held in small time-sorted windows (bisect lookups), a few hundred milliseconds
+each whatever the run length; past `max_pending` rows (a stalled stream), the oldest are forced
+out. The unmatched rates (taps without a Teensy record, Teensy records without a tap) are printed
+every `--report_interval` seconds.
+
+Usage:
+    python -m data_cleanup.stream_join --run_dir latency_logs/<experiment>
+    python -m data_cleanup.stream_join --listen 127.0.0.1:9210 --out merged.csv
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import socket
+import sys
+import time
+from bisect import bisect_left, bisect_right
+
+from utils.run_logger import parse_address
+
+A_TIME = 'timestamp_perf_counter'
+B_TIME = 'record_time_perf'
+TOLERANCE_S = 0.05
+DISORDER_S = 0.25
+LATENESS_S = 2.0  # event to join delay bound: Teensy buffering, writer flush, tail polling
+MAX_PENDING = 10000
+CHUNK_LINES = 10000  # rows read per file and per poll
+POLL_INTERVAL_S = 0.05
+REPORT_INTERVAL_S = 5.0
+
+
+class StreamJoin:
+    """
+    Incremental nearest-time join with a tolerance, keeping matched tableB rows (`pd.merge_asof`,
+    direction='nearest', followed by dropping the unmatched rows).
+
+    Parameters
+    ---
+    tolerance_s: float, default=TOLERANCE_S
+        Largest time difference of a match (s)
+
+    disorder_s: float, default=DISORDER_S
+        How far back in time (s) a stream may go from its latest row
+
+    lateness_s: float, default=LATENESS_S
+        Longest delay (s) between the timestamp of a row and its arrival here, used with the `now` of `advance`
+
+    max_pending: int, default=MAX_PENDING
+        Rows kept per stream; beyond, the oldest are finalized or dropped (counted in `forced`)
+    """
+    def __init__(self, tolerance_s=TOLERANCE_S, disorder_s=DISORDER_S, lateness_s=LATENESS_S,
+                 max_pending=MAX_PENDING):
+        self.tolerance_s = tolerance_s
+        self.disorder_s = disorder_s
+        self.lateness_s = lateness_s
+        self.max_pending = max_pending
+        # time-sorted windows: times (bisect index), rows, and for tableA the number of taps matched
+        self.a_t, self.a_rows, self.a_hits = [], [], []
+        self.b_t, self.b_rows = [], []
+        self.a_latest = -math.inf
+        self.b_latest = -math.inf
+        self.b_done = -math.inf  # latest tableB row finalized
+        self.n_a = 0
+        self.n_b = 0
+        self.n_matched = 0
+        self.n_unmatched_b = 0
+        self.n_unmatched_a = 0
+        self.n_shared_a = 0  # tableA rows matched by several taps
+        self.n_late = 0      # rows arriving after the part of the join they belong to was finalized
+        self.n_forced = 0
+
+    def add_a(self, t, row):
+        self.n_a += 1
+        if t + self.tolerance_s < self.b_done:
+            self.n_late += 1
+        i = bisect_left(self.a_t, t) if self.a_t and t < self.a_t[-1] else len(self.a_t)
+        self.a_t.insert(i, t)
+        self.a_rows.insert(i, row)
+        self.a_hits.insert(i, 0)
+        self.a_latest = max(self.a_latest, t)
+
+    def add_b(self, t, row):
+        self.n_b += 1
+        if t < self.b_done:
+            self.n_late += 1
+        i = bisect_right(self.b_t, t) if self.b_t and t < self.b_t[-1] else len(self.b_t)
+        self.b_t.insert(i, t)
+        self.b_rows.insert(i, row)
+        self.b_latest = max(self.b_latest, t)
+
+    def _frontier(self, latest, now):
+        # no later row of the stream can be timestamped before the frontier
+        frontier = latest - self.disorder_s
+        if now is not None:
+            frontier = max(frontier, now - self.lateness_s)
+        return frontier
+
+    def _nearest(self, t):
+        a_t = self.a_t
+        i = bisect_left(a_t, t)
+        best = None
+        if i < len(a_t):
+            best = i
+        if i > 0 and (best is None or t - a_t[i - 1] <= a_t[i] - t):
+            best = i - 1
+        if best is None or abs(a_t[best] - t) > self.tolerance_s:
+            return None, math.inf
+        return best, abs(a_t[best] - t)
+
+    def advance(self, now=None, flush=False):
+        """
+        Finalizes what the streams received so far allow.
+
+        Parameters
+        ---
+        now: float, optional
+            Current host perf_counter time (s); None: rely on the streams alone (replay)
+
+        flush: bool, default=False
+            Finalize everything (end of the streams)
+
+        Returns
+        ---
+        List of (tableB row, tableA row, match_dt_ms) of the new matches, in tableB time order
+        """
+        tol = self.tolerance_s
+        a_frontier = math.inf if flush else self._frontier(self.a_latest, now)
+        matches = []
+        while self.b_t:
+            tb = self.b_t[0]
+            j, dt = self._nearest(tb)
+            # later tableA rows are at least `a_frontier - tb` away
+            forced = len(self.b_t) > self.max_pending
+            if not (a_frontier - tb >= tol or dt <= a_frontier - tb or forced):
+                break
+            self.n_forced += forced
+            del self.b_t[0]
+            row = self.b_rows.pop(0)
+            self.b_done = max(self.b_done, tb)
+            if j is None:
+                self.n_unmatched_b += 1
+                continue
+            self.n_matched += 1
+            self.a_hits[j] += 1
+            self.n_shared_a += self.a_hits[j] == 2
+            matches.append((row, self.a_rows[j], dt * 1000.0))
+
+        # tableA rows that no pending or later tableB row can reach
+        b_frontier = math.inf if flush else self._frontier(self.b_latest, now)
+        if self.b_t:
+            b_frontier = min(b_frontier, self.b_t[0])
+        k = bisect_left(self.a_t, b_frontier - tol)
+        if len(self.a_t) - k > self.max_pending:
+            self.n_forced += len(self.a_t) - k - self.max_pending
+            k = len(self.a_t) - self.max_pending
+        if k:
+            self.n_unmatched_a += self.a_hits[:k].count(0)
+            del self.a_t[:k], self.a_rows[:k], self.a_hits[:k]
+        return matches
+
+    @property
+    def pending(self):
+        return len(self.b_t), len(self.a_t)
+
+    def stats(self):
+        n_b_final = self.n_matched + self.n_unmatched_b
+        n_a_final = self.n_a - len(self.a_t)
+        return {'taps': self.n_b, 'teensy': self.n_a, 'matched': self.n_matched,
+                'unmatched_taps': self.n_unmatched_b,
+                'unmatched_taps_pct': 100.0 * self.n_unmatched_b / n_b_final if n_b_final else math.nan,
+                'unmatched_teensy': self.n_unmatched_a,
+                'unmatched_teensy_pct': 100.0 * self.n_unmatched_a / n_a_final if n_a_final else math.nan,
+                'shared_teensy': self.n_shared_a, 'late': self.n_late, 'forced': self.n_forced,
+                'pending_taps': len(self.b_t), 'pending_teensy': len(self.a_t)}
+
+
+# ---------------------- Sources ----------------------
+class CsvTail:
+    """
+    Rows appended to a CSV file being written (RunLogger), read without waiting: the file may not
+    exist yet, its last line may be incomplete, and a recreated or truncated file is read from the start.
+    """
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self.file = None
+        self.inode = None
+        self.columns = None
+        self.partial = b''
+        self.n_reopen = 0
+
+    def _open(self):
+        try:
+            self.file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.columns = None
+        self.partial = b''
+        return True
+
+    def _replaced(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return st.st_ino != self.inode or st.st_size < self.file.tell()
+
+    def poll(self, max_lines=CHUNK_LINES):
+        """
+        Returns
+        ---
+        List of (table, columns, rows) of the complete lines appended since the last poll
+        """
+        if self.file is None and not self._open():
+            return []
+        if self._replaced():
+            self.file.close()
+            self.n_reopen += 1
+            if not self._open():
+                return []
+        lines = []
+        while len(lines) < max_lines:
+            line = self.file.readline()
+            if not line:
+                break
+            if not line.endswith(b'\n'):
+                self.partial += line  # the writer is halfway through this row
+                break
+            lines.append((self.partial + line).decode())
+            self.partial = b''
+        rows = list(csv.reader(lines))
+        if self.columns is None and rows:
+            self.columns = rows.pop(0)
+        return [(self.table, self.columns, rows)] if rows else []
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class UdpSource:
+    """
+    Datagrams of the `StreamSink` of the run loggers (utils/run_logger.py), on a local UDP port
+    """
+    def __init__(self, address):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        self.sock.bind(address)
+        self.sock.setblocking(False)
+        self.next_batch = {}
+        self.n_lost = 0
+        self.n_invalid = 0
+
+    def poll(self, max_datagrams=1000):
+        batches = []
+        for _ in range(max_datagrams):
+            try:
+                data = self.sock.recv(1 << 16)
+            except BlockingIOError:
+                break
+            try:
+                message = json.loads(data)
+                table, batch = message['table'], message['batch']
+            except (ValueError, KeyError, TypeError):
+                self.n_invalid += 1
+                continue
+            # batch numbers restart with a new logger
+            expected = self.next_batch.get(table, batch)
+            if batch > expected:
+                self.n_lost += batch - expected
+            self.next_batch[table] = batch + 1
+            batches.append((table, message['columns'], message['rows']))
+        return batches
+
+    def close(self):
+        self.sock.close()
+
+
+# ---------------------- Join ----------------------
+def _time(row, index):
+    try:
+        t = float(row[index])
+    except (ValueError, TypeError, IndexError):
+        return None
+    return None if math.isnan(t) else t
+
+
+def format_report(stats):
+    return (f"[join] taps {stats['taps']}: {stats['matched']} matched, {stats['unmatched_taps']} unmatched "
+            f"({stats['unmatched_taps_pct']:.1f}%) | Teensy {stats['teensy']}: {stats['unmatched_teensy']} "
+            f"unmatched ({stats['unmatched_teensy_pct']:.1f}%) | pending {stats['pending_taps']}/"
+            f"{stats['pending_teensy']}, late {stats['late']}, forced {stats['forced']}")
+
+
+def stream_join(sources, out_path, join=None, replay=False, report_interval=REPORT_INTERVAL_S,
+                poll_interval=POLL_INTERVAL_S, duration=None, stop_event=None):
+    """
+    Feeds the rows of `sources` to `join` and writes the final matches to `out_path` as they come.
+
+    Parameters
+    ---
+    sources: list of CsvTail or UdpSource
+        Objects whose `poll()` returns (table, columns, rows) batches, table 'tableA' or 'tableB'
+
+    join: StreamJoin, optional
+        Default: StreamJoin()
+
+    replay: bool, default=False
+        Finished run: ignore the host clock and stop at the end of the sources
+
+    duration: float, optional
+        Stop after this many seconds
+
+    stop_event: threading.Event, optional
+        Stops the join when set
+
+    Returns
+    ---
+    The StreamJoin
+    """
+    join = join if join is not None else StreamJoin()
+    columns = {}
+    time_index = {}
+    # the run folder may not exist yet when the join starts before the loggers
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    out_file = open(out_path, 'w', newline='')
+    writer = csv.writer(out_file)
+
+    def write(matches):
+        if not matches:
+            return
+        if out_file.tell() == 0:
+            writer.writerow(columns['tableB'] + columns['tableA'] + ['match_dt_ms'])
+        writer.writerows(list(b_row) + list(a_row) + [dt_ms] for b_row, a_row, dt_ms in matches)
+        out_file.flush()
+
+    n_invalid = 0
+    t_start = time.perf_counter()
+    t_report = t_start + report_interval if report_interval else math.inf
+
+    try:
+        while True:
+            n_rows = 0
+            for source in sources:
+                for table, table_columns, rows in source.poll():
+                    if columns.get(table) != table_columns:
+                        columns[table] = table_columns
+                        key = A_TIME if table == 'tableA' else B_TIME
+                        if key not in table_columns:
+                            raise ValueError(f"{table} must contain '{key}' column.")
+                        time_index[table] = table_columns.index(key)
+                    add = join.add_a if table == 'tableA' else join.add_b
+                    index = time_index[table]
+                    for row in rows:
+                        t = _time(row, index)
+                        if t is None:
+                            n_invalid += 1
+                            continue
+                        add(t, row)
+                    n_rows += len(rows)
+
+            now = time.perf_counter()
+            done = ((replay and n_rows == 0) or (duration is not None and now - t_start >= duration)
+                    or (stop_event is not None and stop_event.is_set()))
+            write(join.advance(None if replay else now, flush=done))
+            if done:
+                break
+            if now >= t_report:
+                print(format_report(join.stats()))
+                t_report = now + report_interval
+            if not n_rows:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("\nJoin stopped by user.")
+        write(join.advance(flush=True))
+    finally:
+        out_file.close()
+        for source in sources:
+            source.close()
+    if n_invalid:
+        print(f"Skipped {n_invalid} row(s) without a valid timestamp")
+    return join
+
+
+def main():
+    p = argparse.ArgumentParser(description="Join tableB and tableA live by nearest perf-counter, writing the "
+                                            "matched rows as they become final.")
+    p.add_argument('--run_dir', default=None,
+                   help='Experiment folder: tail its tableA.csv and tableB.csv and write its merged.csv')
+    p.add_argument('--tableb', default=None, help='Path to tableB CSV (default: <run_dir>/tableB.csv)')
+    p.add_argument('--tablea', default=None, help='Path to tableA CSV (default: <run_dir>/tableA.csv)')
+    p.add_argument('--listen', default=None, metavar='HOST:PORT',
+                   help='Receive the rows from the run loggers on this UDP address (the "stream_to" entry of '
+                        'config/log_config.json) instead of tailing the files')
+    p.add_argument('--out', default=None, help='Output CSV path for matched rows (default: <run_dir>/merged.csv)')
+    p.add_argument('--tol_ms', type=float, default=TOLERANCE_S * 1000, help='Tolerance in milliseconds (default: 50)')
+    p.add_argument('--disorder_ms', type=float, default=DISORDER_S * 1000,
+                   help=f'Out-of-order margin of each stream in milliseconds (default: {DISORDER_S * 1000:.0f})')
+    p.add_argument('--lateness_s', type=float, default=LATENESS_S,
+                   help=f'Longest delay between a row timestamp and its arrival (default: {LATENESS_S})')
+    p.add_argument('--max_pending', type=int, default=MAX_PENDING,
+                   help=f'Rows kept per stream (default: {MAX_PENDING})')
+    p.add_argument('--replay', action='store_true',
+                   help='Finished run: join the files without the host clock and stop at their end')
+    p.add_argument('--report_interval', type=float, default=REPORT_INTERVAL_S,
+                   help=f'Period (s) of the unmatched rate report, 0 to disable (default: {REPORT_INTERVAL_S})')
+    p.add_argument('--duration', type=float, default=None, help='Stop after this many seconds (default: until Ctrl-C)')
+    args = p.parse_args()
+
+    if args.listen:
+        if args.replay:
+            p.error("--replay reads files, not --listen")
+        sources = [UdpSource(parse_address(args.listen))]
+    else:
+        tablea = args.tablea or (args.run_dir and os.path.join(args.run_dir, 'tableA.csv'))
+        tableb = args.tableb or (args.run_dir and os.path.join(args.run_dir, 'tableB.csv'))
+        if not tablea or not tableb:
+            p.error("give --run_dir, or --tablea and --tableb, or --listen")
+        if args.replay:
+            for path in (tablea, tableb):
+                if not os.path.exists(path):
+                    print(f"Error: {path} not found.")
+                    sys.exit(2)
+        sources = [CsvTail(tablea, 'tableA'), CsvTail(tableb, 'tableB')]
+    out = args.out or (args.run_dir and os.path.join(args.run_dir, 'merged.csv'))
+    if not out:
+        p.error("give --out or --run_dir")
+
+    join = StreamJoin(args.tol_ms / 1000.0, args.disorder_ms / 1000.0, args.lateness_s, args.max_pending)
+    print(f"Joining into {out} (tolerance {args.tol_ms} ms)")
+    stream_join(sources, out, join, replay=args.replay, report_interval=args.report_interval,
+                duration=args.duration)
+
+    stats = join.stats()
+    print(format_report(stats))
+    print(f"Saved matched merged table to: {out}")
+    print(f"Rows in tableB processed: {stats['taps']}")
+    print(f"Rows matched within {args.tol_ms} ms: {stats['matched']}")
+    print(f"Rows dropped (no match): {stats['unmatched_taps']}")
+    if args.listen and sources[0].n_lost:
+        print(f"WARNING: {sources[0].n_lost} datagram(s) lost")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,82 +1,201 @@
+import argparse
 import cv2
 import numpy as np
 from utils.hand_pose_detector import HandPoseDetector
-from video.flircam import Flircam
+from utils.recalibration import load_calibration_file, save_calibration
+from utils.reference_line import (EDGES, detect_reference_line, is_tilted, line_angle_deg, line_distances,
+                                  line_through, line_y_at, pinky_edge_points)
+from utils.trigger_zones import DEFAULT_ADDRESS, ZONE_KINDS, legacy_line_zone, load_zones
+from video.sources import add_video_source_args, open_video_input, video_source_kwargs
 
 """
 Calibration script:
-- Grabs a frame from FLIR camera
-- Lets user click two points to define horizontal reference line
-- Collects noise samples for N frames while hand is steady
+- Grabs a frame from FLIR camera (or from a recording with --replay)
+- Fits the reference line on the foil edge (utils/reference_line.py, tilted lines accepted), or lets
+  user click two points on it (--manual_line, or when no line is found)
+- Collects noise samples for N frames while hand is steady (--skip_noise keeps the stored ones, e.g.
+  after a camera bump; latency_mp.py --recalibrate keeps them up to date online)
 - Computes and prints reference line Y, noise standard deviation and mean
-- Saves results to calibration.json (or prints to stdout)
+- Optionally lets user click the trigger zones (lines, rectangles, pads, see utils/trigger_zones.py)
+- Saves results to calibration.json atomically, keeping the zones already stored there
 """
 
-def calibrate_and_save(n_noise_frames=100, output_file='config/calibration.json'):
-    cam = Flircam()
+ZONE_CLICKS = {'line': "two points on the line", 'rect': "two opposite corners", 'pad': "the center, then a point on the edge"}
+
+
+def parse_zone_spec(spec):
+    """
+    `KIND:NAME[:ADDRESS]` -> zone dict without geometry
+    """
+    parts = spec.split(':', 2)
+    if len(parts) < 2 or parts[0] not in ZONE_KINDS:
+        raise ValueError(f"Invalid zone {spec!r}, expected KIND:NAME[:ADDRESS] with KIND in {ZONE_KINDS}")
+    return {'name': parts[1], 'kind': parts[0], 'address': parts[2] if len(parts) > 2 else DEFAULT_ADDRESS}
+
+
+def click_points(frame, title, n_points, drawn=(), line_preview=False):
+    """
+    Lets user click `n_points` points on the frame, returns them as [x, y] lists (None if aborted).
+    With `line_preview`, the line through the first two points is drawn across the frame.
+    """
+    points = []
+    def on_mouse(event, x, y, flags, param):
+        if event == cv2.EVENT_LBUTTONDOWN and len(points) < n_points:
+            points.append([x, y])
+            print(f"Point {len(points)}: (x={x}, y={y})")
+
+    cv2.namedWindow(title)
+    cv2.setMouseCallback(title, on_mouse)
+    while len(points) < n_points:
+        disp = frame.copy()
+        for p0, p1 in drawn:
+            cv2.line(disp, tuple(p0), tuple(p1), (0, 255, 255), 1)
+        for p in points:
+            cv2.circle(disp, tuple(p), 3, (0, 255, 0), -1)
+        if line_preview and len(points) == 1:
+            cv2.line(disp, (0, points[0][1]), (disp.shape[1], points[0][1]), (0, 255, 0), 1)
+        cv2.imshow(title, disp)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            cv2.destroyWindow(title)
+            return None
+    cv2.destroyWindow(title)
+    return points
+
+
+def click_zone(frame, zone):
+    """
+    Completes a zone dict with the geometry clicked by the user
+    """
+    print(f"Zone '{zone['name']}' ({zone['kind']}): click {ZONE_CLICKS[zone['kind']]}.")
+    points = click_points(frame, f"Zone {zone['name']}", 2)
+    if points is None:
+        return None
+    if zone['kind'] == 'pad':
+        zone['center'] = points[0]
+        zone['radius'] = float(np.hypot(points[1][0] - points[0][0], points[1][1] - points[0][1]))
+    else:
+        zone['p0'], zone['p1'] = points
+    return zone
+
+def calibrate_and_save(n_noise_frames=100, output_file='config/calibration.json', video_source=None,
+                       zone_specs=(), reference_zone=True, manual_line=False, line_search=None, edge='top',
+                       measure_noise=True):
+    cam = open_video_input(**(video_source or {}))
 
     # Grab frame for line calibration
-    frame, _, _ = cam.read_frame()
-    if not frame.any():
+    result = cam.read_frame()
+    frame = result[0] if result is not None else None
+    if frame is None or not frame.any():
         print("Failed to grab calibration frame")
         cam.cleanup()
         return
+    width = frame.shape[1]
 
-    # Mouse callback to pick two points
-    y_points = []
-    def on_mouse(event, x, y, flags, param):
-        nonlocal y_points
-        if event == cv2.EVENT_LBUTTONDOWN and len(y_points) < 2:
-            y_points.append(y)
-            print(f"Point {len(y_points)}: (x={x}, y={y})")
-
-    cv2.namedWindow('Calibrate Line')
-    cv2.setMouseCallback('Calibrate Line', on_mouse)
-    print("Click two points to define the reference horizontal line.")
-    while len(y_points) < 2:
-        disp = frame.copy()
-        for py in y_points:
-            cv2.line(disp, (0, py), (disp.shape[1], py), (0,255,0), 2)
-        cv2.imshow('Calibrate Line', disp)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+    # Reference line: fitted on the foil edge, or clicked as a fallback
+    line = None
+    if not manual_line:
+        found = detect_reference_line(frame, line_search, edge)
+        if found is None:
+            print("No reference line found automatically, falling back to clicks.")
+        else:
+            line, n_support, rms = found
+            print(f"Reference line detected: {line_angle_deg(line):+.2f} deg, {n_support} edge pixels, "
+                  f"RMS residual {rms:.2f} px")
+    if line is None:
+        print("Click two points on the reference line.")
+        points = click_points(frame, 'Calibrate Line', 2, line_preview=True)
+        if points is None or points[0][0] == points[1][0]:
             print("Calibration aborted by user.")
             cam.cleanup(); cv2.destroyAllWindows(); return
-    cv2.destroyWindow('Calibrate Line')
-
-    y_line = int(sum(y_points)/2)
-    print(f"Reference line Y: {y_line}")
-
-    # Noise sampling
-    distances = []
-    detector = HandPoseDetector()
-    print(f"Collecting noise for {n_noise_frames} frames...")
-    count = 0
-    while count < n_noise_frames:
-        f, ts, _= cam.read_frame()
-        if not f.any(): break
-        hands = detector.detect_hand_pose(f)
-        if hands:
-            for hand in hands:
-                ys = [hand['landmarks'].landmark[i].y * f.shape[0] for i in range(17, 21)]
-                avg_y = np.mean(ys)
-                distances.append(abs(avg_y - y_line))
-        count += 1
-        cv2.line(f, (0, y_line), (f.shape[1], y_line), (255,0,0), 2)
-        cv2.imshow('Noise Sample', f)
-        if cv2.waitKey(1) & 0xFF == ord('q'): break
-    cv2.destroyWindow('Noise Sample')
-
-    dist_arr = np.array(distances)
-    std_offset = float(np.std(dist_arr))
-    mean_offset = np.mean(dist_arr)
-    print(f"Noise std deviation: {std_offset:.2f} px")
-
-    # Save to file
-    import json
-    with open(output_file, 'w+') as fp:
-        json.dump({'y_line': y_line, 'std_offset': std_offset, 'mean_offset':mean_offset}, fp)
+        line = [[float(x), float(y)] for x, y in line_through(points[0], points[1], width)]
+
+    y_line = int(round(line_y_at(line, width / 2)))
+    print(f"Reference line Y: {y_line}" + (f" (tilted, {line[0][1]:.1f} to {line[1][1]:.1f})" if is_tilted(line) else ""))
+
+    # Trigger zones: new ones replace the stored set, otherwise the stored set is kept
+    zones = load_zones(output_file)
+    if zone_specs:
+        zones = [legacy_line_zone(y_line, line=line)] if reference_zone else []
+        for spec in zone_specs:
+            zone = click_zone(frame, parse_zone_spec(spec))
+            if zone is None:
+                print("Calibration aborted by user.")
+                cam.cleanup(); cv2.destroyAllWindows(); return
+            zones.append(zone)
+    elif zones:
+        # the reference line zone follows the new line
+        for zone in zones:
+            if zone.get('name') == 'line' and zone.get('kind') == 'line':
+                zone['p0'], zone['p1'] = line
+        print(f"Keeping the {len(zones)} trigger zone(s) of {output_file}")
+
+    calibration = load_calibration_file(output_file)
+    calibration.update({'y_line': y_line, 'line': line})
+    if zones:
+        calibration['zones'] = zones
+
+    if measure_noise:
+        # Noise sampling: distance of the resting pinky edge to the line
+        distances = []
+        detector = HandPoseDetector()
+        print(f"Collecting noise for {n_noise_frames} frames...")
+        count = 0
+        p0, p1 = (tuple(int(round(v)) for v in p) for p in line)
+        while count < n_noise_frames:
+            result = cam.read_frame()
+            if result is None: break
+            f, ts, _ = result
+            if not f.any(): break
+            hands = detector.detect_landmarks(f)
+            if hands.n:
+                distances.extend(line_distances(pinky_edge_points(hands, f.shape), line).tolist())
+            count += 1
+            cv2.line(f, p0, p1, (255,0,0), 2)
+            cv2.imshow('Noise Sample', f)
+            if cv2.waitKey(1) & 0xFF == ord('q'): break
+        cv2.destroyWindow('Noise Sample')
+
+        dist_arr = np.array(distances)
+        std_offset = float(np.std(dist_arr))
+        mean_offset = float(np.mean(dist_arr))
+        print(f"Noise std deviation: {std_offset:.2f} px")
+        calibration.update({'std_offset': std_offset, 'mean_offset': mean_offset})
+        for key in ('recalibrated_at', 'recalibration_samples'):
+            calibration.pop(key, None)
+    elif 'mean_offset' not in calibration:
+        print(f"No resting offset stored in {output_file}, run without --skip_noise")
+        cam.cleanup(); cv2.destroyAllWindows(); return
+    else:
+        print(f"Keeping the resting offset of {output_file}: mean {calibration['mean_offset']:.2f} px, "
+              f"std {calibration['std_offset']:.2f} px")
+
+    # Save to file, atomically: a pipeline starting meanwhile never reads a partial file
+    save_calibration(calibration, output_file)
     print(f"Calibration saved to {output_file}")
     cam.cleanup()
 
 if __name__ == '__main__':
-    calibrate_and_save()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Reference line and noise calibration for tap detection.")
+    parser.add_argument('--n_noise_frames', type=int, default=100, help='Frames used to measure the resting noise (default: 100)')
+    parser.add_argument('--output', default='config/calibration.json', help='Calibration output file')
+    parser.add_argument('--zone', action='append', default=[], metavar='KIND:NAME[:ADDRESS]',
+                        help=f'Trigger zone to click, repeatable, KIND in {ZONE_KINDS}, ADDRESS the OSC address '
+                             f'(default: {DEFAULT_ADDRESS}). Replaces the zones stored in the output file')
+    parser.add_argument('--no_reference_zone', action='store_true',
+                        help='With --zone: do not include the reference line as a trigger zone')
+    parser.add_argument('--manual_line', action='store_true', help='Click the reference line instead of detecting it')
+    parser.add_argument('--line_search', type=int, nargs=2, default=None, metavar=('Y0', 'Y1'),
+                        help='Rows searched for the reference line (default: the whole frame)')
+    parser.add_argument('--edge', choices=EDGES, default='top',
+                        help='Foil edge used as reference line among the detected ones (default: top)')
+    parser.add_argument('--skip_noise', action='store_true',
+                        help='Only find the reference line again, keep the stored resting offset')
+    add_video_source_args(parser)
+    args = parser.parse_args()
+    for spec in args.zone:
+        try:
+            parse_zone_spec(spec)
+        except ValueError as e:
+            parser.error(str(e))
+    calibrate_and_save(args.n_noise_frames, args.output, video_source_kwargs(args), args.zone,
+                       not args.no_reference_zone, args.manual_line, args.line_search, args.edge, not args.skip_noise)
\ No newline at end of file
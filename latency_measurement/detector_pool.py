@@ -0,0 +1,247 @@
+import queue
+import time
+
+from utils.clock_sync import NS_PER_S
+from utils.frame_ring import FrameRing, new_meta_record
+from utils.hand_pose_detector import HandPoseDetector
+from utils.roi_tracker import RoiTracker
+from utils.startup import StartupProfile, warm_up
+from utils.telemetry import TelemetryRing
+from utils.trigger_output import DEFAULT_TARGETS
+from latency_measurement.tap_decision import TapDecision, load_calibration
+
+"""
+Detector worker pool for latency_mp.py.
+
+A single MediaPipe instance cannot keep up with the camera (~522 fps), so every frame arriving
+during an inference is lost. With a pool:
+- N detector workers each claim the newest unclaimed frame of the ring, so they always work on
+  distinct frames, and run the hand pose detector on a zero-copy view of it; idle workers sleep
+  until the producer publishes a frame
+- every claim gets a contiguous sequence number; results are sent to the decision process, which
+  reorders them by sequence (i.e. frame order) before running the tap logic
+- the decision process periodically reports per-worker utilization, reorder delay and the
+  effective detection rate
+"""
+
+REPORT_INTERVAL_S = 5.0
+CLAIM_WAIT_S = 0.1  # longest sleep of an idle worker, so it can check the stop event
+REORDER_TIMEOUT_S = 0.1  # a missing result is given up after this delay (e.g. dead worker)
+
+
+def claim_frame(ring: FrameRing, claims):
+    """
+    Claims the newest frame of the ring that no worker has taken yet.
+
+    Parameters
+    ---
+    claims: multiprocessing.Array('q', 2)
+        Shared [last claimed frame id, next claim sequence number]
+
+    Returns
+    ---
+    (seq, frame_id), or None if there is no new frame
+    """
+    latest = ring.latest_id()
+    if latest <= claims[0]:
+        return None
+    with claims.get_lock():
+        if latest <= claims[0]:
+            return None
+        claims[0] = latest
+        seq = claims[1]
+        claims[1] = seq + 1
+    return seq, latest
+
+
+def detector_worker(worker_id, ring: FrameRing, stop_event, claims, results, roi_mode=False, warmup=None, ready=None,
+                    profile_reports=None):
+    """
+    Detector process: claims frames, detects hands and sends results to the decision process.
+    With `roi_mode`, each worker tracks the hand on the frames it processes and detects on a crop around it.
+    The detector is warmed up with the `warmup` settings (see utils/startup.py), then `ready` is set and the
+    startup profile is sent to `profile_reports`.
+
+    Each result is a tuple `(seq, worker_id, frame_id, meta, hands, detect_time, frame_age_ms, busy_time)`,
+    where `hands` is None when the frame was overwritten before or during detection.
+    `busy_time` is the cumulative detection time of the worker, used for utilization reports.
+    """
+    profile = StartupProfile(f'worker {worker_id}')
+    profile.start()
+    detector = HandPoseDetector()
+    profile.lap('model load')
+    warm_up(detector, ring.frame_shape, warmup, profile)
+    roi_tracker = RoiTracker(ring.frame_shape, load_calibration()[0]) if roi_mode else None
+    roi = None
+    meta = new_meta_record()
+    meta_ts = meta['ts']
+    meta_exposure = meta['exposure_ns']
+    busy_time = 0.0
+    profile.lap('setup')
+    if ready is not None:
+        ready.set()
+    profile.send(profile_reports)
+
+    try:
+        while not stop_event.is_set():
+            claim = claim_frame(ring, claims)
+            if claim is None:
+                # sleep until the producer publishes a frame newer than the last claimed one
+                ring.wait_for_frame(claims[0], CLAIM_WAIT_S, worker_id)
+                continue
+            seq, frame_id = claim
+
+            frame = ring.acquire(frame_id, meta)
+            if frame is None:
+                results.put((seq, worker_id, frame_id, None, None, 0.0, 0.0, busy_time))
+                continue
+
+            exposure_ns = int(meta_exposure[0])
+            t_origin = exposure_ns / NS_PER_S if exposure_ns else meta_ts[0]
+            frame_age_ms = (time.perf_counter() - t_origin) * 1000.0
+
+            if roi_tracker is not None:
+                roi = roi_tracker.roi()
+
+            detect_start = time.perf_counter()
+            hands = detector.detect_landmarks(frame, roi)
+            detect_time = time.perf_counter() - detect_start
+            busy_time += detect_time
+
+            if not ring.is_valid(frame_id):
+                # the producer lapped the ring during detection: the view was torn, drop the result
+                results.put((seq, worker_id, frame_id, None, None, detect_time, frame_age_ms, busy_time))
+                continue
+            if roi_tracker is not None:
+                roi_tracker.update(hands)
+            # Queue.put pickles in a feeder thread: send copies, `meta` and `hands` are reused for the next frame
+            results.put((seq, worker_id, frame_id, meta.copy(), hands.copy(), detect_time, frame_age_ms, busy_time))
+
+    except KeyboardInterrupt:
+        print(f"WORKER {worker_id}: KeyboardInterrupt")
+    finally:
+        ring.close()
+        print(f"WORKER {worker_id} EXITS GRACEFULLY")
+
+
+class ReorderBuffer:
+    """
+    Releases results in sequence order.
+
+    A result is held until all the results with a lower sequence number have been released,
+    or until the oldest missing one has been waited for more than `timeout` seconds.
+    """
+    def __init__(self, timeout=REORDER_TIMEOUT_S):
+        self.timeout = timeout
+        self.next_seq = 0
+        self.pending = {}  # seq -> (arrival time, item)
+        self.skipped = 0
+
+    def push(self, seq, item, t_arrival):
+        if seq >= self.next_seq:
+            self.pending[seq] = (t_arrival, item)
+
+    def pop_ready(self, now):
+        """
+        Returns the list of `(item, reorder_delay)` that can be released, in sequence order
+        """
+        ready = []
+        while self.pending:
+            entry = self.pending.pop(self.next_seq, None)
+            if entry is None:
+                oldest_arrival = min(t for t, _ in self.pending.values())
+                if now - oldest_arrival < self.timeout:
+                    break
+                # give up on the missing result(s)
+                first = min(self.pending)
+                self.skipped += first - self.next_seq
+                self.next_seq = first
+                continue
+            t_arrival, item = entry
+            ready.append((item, now - t_arrival))
+            self.next_seq += 1
+        return ready
+
+
+def decision_process(ring: FrameRing, stop_event, results, n_workers, run_folder, trial_requests=None,
+                     prediction=None, osc_targets=DEFAULT_TARGETS, telemetry: TelemetryRing = None, metrics=None,
+                     stream=None, recalibrate=None, ready=None, profile_reports=None):
+    """
+    Decision process: reassembles worker results in frame order and runs the tap logic on them.
+    `ready` is set once the tap logic is set up, and the startup profile is sent to `profile_reports`.
+    With `telemetry`, one record per released result is appended to the telemetry ring.
+    With `metrics`, live latency metrics are served (see utils/metrics.py).
+    With `stream`, hand control parameters are streamed over OSC (see utils/landmark_stream.py).
+    With `recalibrate`, the resting offset statistics are updated online (see utils/recalibration.py).
+    """
+    profile = StartupProfile('decision')
+    profile.start()
+    decision = TapDecision(ring, run_folder, trial_requests, prediction, osc_targets, metrics, stream=stream,
+                           recalibrate=recalibrate)
+    reorder = ReorderBuffer()
+    profile.lap('setup')
+    if ready is not None:
+        ready.set()
+    profile.send(profile_reports)
+
+    busy = [0.0] * n_workers
+    busy_reported = [0.0] * n_workers
+    processed = [0] * n_workers
+    torn = 0
+    delay_sum, delay_max, n_released = 0.0, 0.0, 0
+    t_report = time.perf_counter()
+
+    print(f"Starting hand-tap detection with {n_workers} detector workers.")
+
+    try:
+        while not stop_event.is_set():
+            try:
+                result = results.get(timeout=REORDER_TIMEOUT_S)
+                now = time.perf_counter()
+                reorder.push(result[0], result, now)
+            except queue.Empty:
+                now = time.perf_counter()
+
+            for (seq, worker_id, frame_id, meta, hands, detect_time, frame_age_ms, busy_time), delay \
+                    in reorder.pop_ready(now):
+                busy[worker_id] = busy_time
+                delay_sum += delay
+                delay_max = max(delay_max, delay)
+                n_released += 1
+                if hands is None:
+                    torn += 1
+                    if telemetry is not None:
+                        telemetry.record(frame_id, None, frame_age_ms / 1000.0, detect_time, now, valid=False,
+                                         worker=worker_id, queue_delay=delay)
+                    continue
+                processed[worker_id] += 1
+                fired = decision.on_frame(frame_id, meta, hands, detect_time, frame_age_ms)
+                if telemetry is not None:
+                    telemetry.record(frame_id, meta, frame_age_ms / 1000.0, detect_time, time.perf_counter(),
+                                     hands.n, decision.taps.last_dist if hands.n else float('nan'), tap=fired,
+                                     worker=worker_id, queue_delay=delay)
+
+            if now - t_report >= REPORT_INTERVAL_S:
+                interval = now - t_report
+                utilization = " | ".join(
+                    f"w{i}: {100.0 * (busy[i] - busy_reported[i]) / interval:.0f}%"
+                    for i in range(n_workers))
+                mean_delay_ms = delay_sum / n_released * 1000.0 if n_released else 0.0
+                print(f"[pool] {sum(processed) / interval:.1f} frames/s detected | {utilization} | "
+                      f"reorder delay mean {mean_delay_ms:.2f} ms max {delay_max * 1000.0:.2f} ms | "
+                      f"torn {torn} | skipped {reorder.skipped}")
+                busy_reported = list(busy)
+                processed = [0] * n_workers
+                torn = 0
+                delay_sum, delay_max, n_released = 0.0, 0.0, 0
+                t_report = now
+
+    except KeyboardInterrupt:
+        print("DECISION: KeyboardInterrupt")
+    finally:
+        stop_event.set()
+        decision.close()
+        ring.close()
+        if telemetry is not None:
+            telemetry.close()
+        print("DECISION EXITS GRACEFULLY")
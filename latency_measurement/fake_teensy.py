@@ -0,0 +1,235 @@
+import argparse
+import os
+import select
+import threading
+import time
+import tty
+
+import numpy as np
+
+from utils.teensy_protocol import MSG_ECHO, MSG_PING, MSG_TAP, FrameParser, encode_frame
+
+"""
+Fake Teensy on a pseudo-terminal, speaking the binary protocol of arduino/latency/latency.ino.
+
+It opens a pty pair and plays the firmware on the master side; the slave path (e.g. /dev/pts/5)
+is opened by the host like the real /dev/ttyACM0:
+- its device clock runs from the host clock with an offset and a drift
+- it answers every PING with an ECHO stamped on the device clock, after a simulated USB delay
+  (base + exponential jitter, and an occasional much longer delay)
+- it emits TAP records at random intervals with random latencies; each record leaves after the
+  audio onset plus a simulated buffering delay, like the USB-serial path the text protocol suffered from
+
+The true host times of every press and onset are kept in `truth`, to check the host-side mapping.
+With `link_path`, a symlink to the current pty is kept there (like the udev /dev/serial/by-id/ links):
+`replug()` simulates an unplug/replug, on a new pty. `burst(n)` writes n records back to back, for
+throughput tests. `protocol='text'` prints the decimal lines of the older firmware instead.
+
+Usage (then run log_serial.py with the printed port):
+    python -m latency_measurement.fake_teensy [--drift_ppm 50] [--tap_interval 0.3 0.8]
+"""
+
+NS_PER_US = 1000
+
+
+class FakeTeensy:
+    """
+    Parameters
+    ---
+    drift_ppm: float, default=50.0
+        Device clock drift relative to the host clock
+
+    tap_interval: (float, float), default=(0.3, 0.8)
+        Range of the delay (s) between two taps
+
+    latency_ms: (float, float), default=(8.0, 40.0)
+        Range of the simulated press-to-onset latencies
+
+    buffering_ms: (float, float), default=(0.0, 15.0)
+        Range of the delay between the onset and the record reaching the host
+
+    echo_delay_us: (float, float), default=(60.0, 100.0)
+        Base and mean exponential extra delay of the echoes
+
+    echo_outlier_rate: float, default=0.05
+        Fraction of the echoes delayed by 2 to 10 ms more
+
+    seed: int, default=0
+
+    link_path: str, optional
+        Stable symlink to the current pty
+
+    protocol: str, default='binary'
+        'binary' or 'text'
+    """
+    def __init__(self, drift_ppm=50.0, tap_interval=(0.3, 0.8), latency_ms=(8.0, 40.0), buffering_ms=(0.0, 15.0),
+                 echo_delay_us=(60.0, 100.0), echo_outlier_rate=0.05, seed=0, link_path=None, protocol='binary'):
+        self.rng = np.random.default_rng(seed)
+        self.drift = drift_ppm * 1e-6
+        self.offset_ns = int(self.rng.integers(1, 3600)) * 1_000_000_000 - time.perf_counter_ns()
+        self.tap_interval = tap_interval
+        self.latency_ms = latency_ms
+        self.buffering_ms = buffering_ms
+        self.echo_delay_us = echo_delay_us
+        self.echo_outlier_rate = echo_outlier_rate
+
+        self.link_path = link_path
+        self.protocol = protocol
+        self.truth = {}  # seq -> (press host ns, onset host ns)
+        self.seq = 0
+        self.n_pings = 0
+        self.n_replugs = 0
+        self._open_pty()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._serve_pings, name='fake-teensy-rx', daemon=True),
+                         threading.Thread(target=self._emit_taps, name='fake-teensy-taps', daemon=True)]
+
+    def _open_pty(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # bytes go through untouched
+        self.port = os.ttyname(self.slave)
+        if self.link_path is not None:
+            tmp_link = f'{self.link_path}.tmp'
+            if os.path.lexists(tmp_link):
+                os.unlink(tmp_link)
+            os.symlink(self.port, tmp_link)
+            os.replace(tmp_link, self.link_path)
+
+    def replug(self, downtime_s=0.5):
+        """
+        Closes the pty (the host sees the device vanish) and opens a new one after `downtime_s`
+        """
+        with self._write_lock:
+            master, slave = self.master, self.slave
+            if self.link_path is not None and os.path.lexists(self.link_path):
+                os.unlink(self.link_path)
+            os.close(master)
+            os.close(slave)
+            self._stop.wait(downtime_s)
+            self._open_pty()
+            self.n_replugs += 1
+
+    def device_us(self, host_ns):
+        return int((host_ns + self.offset_ns + self.drift * host_ns) // NS_PER_US)
+
+    def _write(self, data):
+        """
+        False when the device is unplugged
+        """
+        with self._write_lock:
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self.master, view):]
+                return True
+            except OSError:
+                return False
+
+    def _tap_message(self, seq, press_ns, onset_ns):
+        if self.protocol == 'text':
+            return f"{int((onset_ns - press_ns) // 1_000_000)}\r\n\r\n".encode()
+        return encode_frame(MSG_TAP, seq, self.device_us(press_ns), self.device_us(onset_ns))
+
+    def burst(self, n):
+        """
+        Writes `n` records back to back (press and onset 10 ms apart, now); returns the number written
+        """
+        now = time.perf_counter_ns()
+        with self._write_lock:
+            seq0 = self.seq
+            self.seq += n
+        messages = b''.join(self._tap_message(seq, now, now + 10_000_000) for seq in range(seq0, seq0 + n))
+        return n if self._write(messages) else 0
+
+    def _sleep_until(self, t_ns):
+        remaining = (t_ns - time.perf_counter_ns()) / 1e9
+        if remaining > 0:
+            self._stop.wait(remaining)
+
+    def _serve_pings(self):
+        parser = FrameParser()
+        while not self._stop.is_set():
+            try:
+                master = self.master
+                readable, _, _ = select.select([master], [], [], 0.05)
+                if not readable:
+                    continue
+                data = os.read(master, 4096)
+            except (OSError, ValueError):
+                # unplugged: the new pty starts with a new parser
+                parser = FrameParser()
+                self._stop.wait(0.01)
+                continue
+            t_rx = time.perf_counter_ns()
+            for msg_type, fields in parser.feed(data):
+                if msg_type != MSG_PING:
+                    continue
+                self.n_pings += 1
+                base_us, jitter_us = self.echo_delay_us
+                delay_us = base_us + self.rng.exponential(jitter_us)
+                if self.rng.random() < self.echo_outlier_rate:
+                    delay_us += self.rng.uniform(2000.0, 10000.0)
+                self._sleep_until(t_rx + int(delay_us * NS_PER_US))
+                self._write(encode_frame(MSG_ECHO, fields[0], self.device_us(t_rx)))
+
+    def _emit_taps(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.rng.uniform(*self.tap_interval))
+            press_ns = time.perf_counter_ns()
+            onset_ns = press_ns + int(self.rng.uniform(*self.latency_ms) * 1e6)
+            self._sleep_until(onset_ns + int(self.rng.uniform(*self.buffering_ms) * 1e6))
+            if self._stop.is_set():
+                break
+            with self._write_lock:
+                seq = self.seq
+                self.seq += 1
+            if self._write(self._tap_message(seq, press_ns, onset_ns)):
+                self.truth[seq] = (press_ns, onset_ns)
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+        if self.link_path is not None and os.path.lexists(self.link_path):
+            os.unlink(self.link_path)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Fake Teensy speaking the binary latency protocol on a pty.")
+    p.add_argument('--drift_ppm', type=float, default=50.0)
+    p.add_argument('--tap_interval', type=float, nargs=2, default=(0.3, 0.8), metavar=('MIN', 'MAX'))
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--link', default=None, help='Stable symlink to the pty, e.g. /tmp/ttyTEENSY')
+    p.add_argument('--protocol', choices=('binary', 'text'), default='binary')
+    p.add_argument('--replug_every', type=float, default=0.0,
+                   help='Simulate an unplug/replug every N seconds, 0 to disable (default: 0)')
+    args = p.parse_args()
+
+    teensy = FakeTeensy(args.drift_ppm, tuple(args.tap_interval), seed=args.seed, link_path=args.link,
+                        protocol=args.protocol).start()
+    print(f"Fake Teensy on {args.link or teensy.port} (Ctrl-C to stop)")
+    try:
+        while True:
+            if args.replug_every > 0:
+                time.sleep(args.replug_every)
+                teensy.replug()
+                print(f"Replugged on {teensy.port}")
+            else:
+                time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        teensy.close()
+        print(f"{len(teensy.truth)} taps sent, {teensy.n_pings} pings answered")
+
+
+if __name__ == '__main__':
+    main()
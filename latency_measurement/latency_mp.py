@@ -1,22 +1,31 @@
-from multiprocessing import Lock, shared_memory, Event, Process, Value
-import multiprocessing as mp
 import time
+T_START = time.perf_counter()  # startup profile: module imports
+from multiprocessing import Event, Process
+import multiprocessing as mp
+import argparse
+import signal
+from datetime import datetime
 import numpy as np
 import json
-import csv
 import os
-from datetime import datetime
-from collections import deque
-from pythonosc import udp_client
-from video.flircam import Flircam
+from video.sources import add_video_source_args, open_video_input, video_source_kwargs
+from utils.clock_sync import NS_PER_S, ClockSync
+from utils.contact_detector import ContactDetector
 from utils.hand_pose_detector import HandPoseDetector
-import matplotlib.image as mpimg
-
-
-def load_calibration(calib_file='config/calibration.json'):
-    with open(calib_file, 'r') as fp:
-        data = json.load(fp)
-    return data['y_line'], data['std_offset'], data['mean_offset']
+from utils.landmark_stream import DEFAULT_CONFIG_PATH as STREAM_CONFIG_PATH
+from utils.recalibration import load_calibration_file
+from utils.reference_line import is_tilted
+from utils.frame_ring import FrameCursor, FrameRing
+from utils.roi_tracker import RoiTracker
+from utils.scheduling import load_scheduling_profile, run_role
+from utils.startup import (READY_TIMEOUT_S, WARMUP_MAX_RUNS, StartupProfile, collect_profiles, format_profiles,
+                           save_profiles, wait_ready, warm_up)
+from utils.telemetry import TelemetryRing
+from utils.trigger_output import DEFAULT_TARGETS
+from latency_measurement.tap_decision import TapDecision, consumer_step, load_calibration
+from latency_measurement.detector_pool import decision_process, detector_worker
+from latency_measurement.trial_writer import TRIAL_FORMATS, trial_writer
+IMPORT_TIME_S = time.perf_counter() - T_START
 
 
 def precise_sleep(target_duration):
@@ -25,13 +34,36 @@ def precise_sleep(target_duration):
         pass
 
 
-FRAME_SHAPE = (540, 720, 3)
+FRAME_SHAPE = (540, 720, 3)  # (540, 720) raw mosaics with --bayer
 FRAME_DTYPE = np.uint8
 LAST_N_FRAMES = 7  # save the last N frames per trial
 
 # ---- New flag ----
 SAVE_FRAMES = False  # set to False to disable frame saving
 
+# Frames kept in the shared-memory ring between producer and consumer(s).
+# When saving frames the ring doubles as the pre-tap frame history: it must hold the last N frames
+# plus enough headroom (~60 ms at 522 FPS) for the trial writer process to copy them out before
+# the producer overwrites them.
+TRIAL_CAPTURE_MARGIN = 32
+RING_SLOTS = LAST_N_FRAMES + TRIAL_CAPTURE_MARGIN if SAVE_FRAMES else 4
+
+
+# Per-frame telemetry records kept in shared memory (~17 min at 522 FPS, 52 MB), exported at exit
+TELEMETRY_FRAMES = 1 << 19
+
+# Camera clock latches mapping the frame timestamps onto the host clock, so frame ages start at the
+# exposure (utils/clock_sync.py). Each latch is one USB round trip taken between two frame reads.
+CLOCK_SYNC_INTERVAL = 1.0  # s, a tenth of it until the fit window is full
+MAX_EXPOSURE_TO_READ_NS = 100_000_000  # mapped exposure times further back are discarded (camera clock jump)
+
+METRICS_PORT = 9101  # live metrics endpoint, http://127.0.0.1:9101/metrics
+
+
+def ring_slots(n_workers):
+    # each extra worker holds one more frame in flight and delays decisions by up to one inference
+    return RING_SLOTS + 2 * (n_workers - 1)
+
 
 # ---------------------- Config + Output Folder ----------------------
 def load_experiment_folder(config_path="config/log_config.json", base_output="latency_logs"):
@@ -52,217 +84,343 @@ def load_experiment_folder(config_path="config/log_config.json", base_output="la
     return output_dir
 
 
-def producer(shm_name0, shm_name1, cur_idx, stop_event, ts_value,
-             t_read_total_v, t_frameacq_v, t_getts_v, t_frameconv_v):
-
-    cam = Flircam()
-    shm0 = shared_memory.SharedMemory(name=shm_name0)
-    shm1 = shared_memory.SharedMemory(name=shm_name1)
-    buf0 = np.ndarray(FRAME_SHAPE, dtype=FRAME_DTYPE, buffer=shm0.buf)
-    buf1 = np.ndarray(FRAME_SHAPE, dtype=FRAME_DTYPE, buffer=shm1.buf)
+def producer(ring: FrameRing, stop_event, video_source: dict, clock_sync_interval=CLOCK_SYNC_INTERVAL,
+             ready_events=(), profile_reports=None):
+    """
+    Producer: captures frames and publishes them into the ring.
+    The camera is initialized while the detectors warm up; acquisition starts once all `ready_events` are set.
+    """
+    profile = StartupProfile('producer')
+    profile.start()
+    cam = open_video_input(**video_source)
+    profile.lap('camera init')
+    clock = ClockSync()
+    next_sync = 0.0
 
     try:
+        if not wait_ready(ready_events, stop_event):
+            print("PRODUCER: the detector processes did not get ready, stopping")
+            stop_event.set()
+        profile.lap('wait ready')
+        profile.info['acquisition_start'] = time.perf_counter()
+        profile.send(profile_reports)
+
         while not stop_event.is_set():
             t_start = time.perf_counter()
-            frame, cam_ts_inner, (t_frameacq, t_getts, t_frameconv) = cam.read_frame()
-            t_end = time.perf_counter()
+            if clock_sync_interval and t_start >= next_sync:
+                sample = cam.latch_timestamp()
+                if sample is not None:
+                    clock.add(*sample)
+                next_sync = t_start + (clock_sync_interval if len(clock) >= clock.window else clock_sync_interval / 10)
+                t_start = time.perf_counter()
+
+            result = cam.read_frame()
+            t_end_ns = time.perf_counter_ns()
+            t_end = t_end_ns / NS_PER_S
             t_total = t_end - t_start
 
+            if result is None:
+                if cam.finished:
+                    print("PRODUCER: end of video source")
+                    stop_event.set()
+                    break
+                continue
+            frame, cam_ts_inner, (t_frameacq, t_getts, t_frameconv) = result
+
             if not frame.any():
                 stop_event.set()
                 break
 
-            write_idx = 1 - cur_idx.value
-            if write_idx == 0:
-                np.copyto(buf0, frame)
-            else:
-                np.copyto(buf1, frame)
+            # host time of the exposure, 0 until the camera clock is mapped
+            exposure_ns = clock.to_host(int(round(cam_ts_inner * NS_PER_S)))
+            if not 0 < t_end_ns - exposure_ns < MAX_EXPOSURE_TO_READ_NS:
+                exposure_ns = 0
 
-            t_read_total_v.value = t_total
-            t_frameacq_v.value = t_frameacq
-            t_getts_v.value = t_getts
-            t_frameconv_v.value = t_frameconv
-            ts_value.value = t_end
-            cur_idx.value = write_idx
+            # frame, timestamps and timings are published together under the slot seqlock
+            ring.write(frame, t_end, cam_ts_inner, t_total, t_frameacq, t_getts, t_frameconv, exposure_ns)
 
     except KeyboardInterrupt:
         print("PRODUCER: KeyboardInterrupt")
     finally:
+        print(f"PRODUCER: camera clock {clock}")
         cam.cleanup()
-        shm0.close()
-        shm1.close()
+        ring.close()
         print("PRODUCER EXITS GRACEFULLY")
 
 
-def consumer(shm_name0, shm_name1, cur_idx, stop_event, ts_value,
-             t_read_total_v, t_frameacq_v, t_getts_v, t_frameconv_v,
-             run_folder: str):
+def consumer(ring: FrameRing, stop_event, run_folder: str, roi_mode: bool = False, prediction: dict = None,
+             osc_targets=DEFAULT_TARGETS, trial_requests=None, telemetry: TelemetryRing = None,
+             metrics: dict = None, deadline_ms: float = None, detector_kind: str = 'mediapipe',
+             validate_contacts: bool = False, stream: dict = None, recalibrate: dict = None, warmup: dict = None,
+             ready=None, profile_reports=None):
     """
     Consumer: detects taps, logs to CSV, optionally saves frames.
+    It sleeps until the producer publishes a frame and detects every frame at most once (see `FrameCursor`).
+    With `roi_mode`, detection runs on a crop around the last known hand box near the reference line.
+    With `prediction`, taps are triggered on the predicted contact (see utils/tap_prediction.py).
+    `osc_targets` lists the receivers of the trigger (see utils/trigger_output.py).
+    With `trial_requests`, the frames preceding each tap are saved by the trial writer process.
+    With `telemetry`, one record per processed frame is appended to the telemetry ring.
+    With `metrics`, live latency metrics are served (see utils/metrics.py).
+    With `deadline_ms`, frames older than this when detection could start are dropped.
+    With `detector_kind='contact'`, the band around the reference line is watched by the classical
+    `ContactDetector` instead of MediaPipe (`validate_contacts`: MediaPipe checks each episode is a hand).
+    With `stream`, hand control parameters are streamed over OSC (see utils/landmark_stream.py).
+    With `recalibrate`, the resting offset statistics are updated online (see utils/recalibration.py).
+    The detector is warmed up with the `warmup` settings (see utils/startup.py), then `ready` is set and the
+    startup profile is sent to `profile_reports`.
     """
+    profile = StartupProfile('consumer')
+    profile.start()
+    if detector_kind == 'contact':
+        validator = HandPoseDetector() if validate_contacts else None
+        detector = ContactDetector(load_calibration()[0], ring.frame_shape, validator=validator)
+        threshold = detector.tap_threshold
+        roi_mode = False  # the band around the line is the ROI
+        profile.lap('model load')
+        if validator is not None:
+            # the contact detector itself learns a background: only its validator is warmed up
+            warm_up(validator, ring.frame_shape, warmup, profile)
+    else:
+        detector = HandPoseDetector()
+        threshold = None
+        profile.lap('model load')
+        warm_up(detector, ring.frame_shape, warmup, profile)
+    decision = TapDecision(ring, run_folder, trial_requests, prediction, osc_targets, metrics, threshold, stream,
+                           recalibrate)
+
+    roi_tracker = RoiTracker(ring.frame_shape, load_calibration()[0]) if roi_mode else None
+
+    # Everything the loop touches is allocated once
+    cursor = FrameCursor(ring, deadline_ms, metrics=decision.metrics)
+    profile.lap('setup')
+    if ready is not None:
+        ready.set()
+    profile.send(profile_reports)
 
-    y_line, stdev, mean = load_calibration()
-    threshold = mean + 3 * stdev
-    print(f"Using y_line={y_line}, threshold={threshold:.2f}px")
-
-    osc_ip, osc_port = '127.0.0.1', 11111
-    client = udp_client.SimpleUDPClient(osc_ip, osc_port)
-
-    detector = HandPoseDetector()
-
-    shm0 = shared_memory.SharedMemory(name=shm_name0)
-    shm1 = shared_memory.SharedMemory(name=shm_name1)
-    buf0 = np.ndarray(FRAME_SHAPE, dtype=FRAME_DTYPE, buffer=shm0.buf)
-    buf1 = np.ndarray(FRAME_SHAPE, dtype=FRAME_DTYPE, buffer=shm1.buf)
-
-    # Prepare CSV files inside experiment folder
-    fixed_csv = os.path.join(run_folder, 'tableB.csv')
-
-    header = ['record_time_perf', 'tap_number', 'frame_age_ms',
-              't_read_total_ms', 't_frameacq_ms', 't_getts_ms', 't_frameconv_ms',
-              'detect_time_ms', 'frames_folder']
-
-    with open(fixed_csv, 'w', newline='') as ff:
-        writer_f = csv.writer(ff)
-        writer_f.writerow(header)
-
-    time.sleep(0.5)  # warm up
-
-    frame_buffer = deque(maxlen=LAST_N_FRAMES)
-
-    state = 0
-    counter = 0
     print("Starting hand-tap detection.")
 
     try:
         while not stop_event.is_set():
-            read_idx = cur_idx.value
-            frame = buf0.copy() if read_idx == 0 else buf1.copy()
-
-            frame_buffer.append(frame.copy())
-
-            frame_age_ms = (time.perf_counter() - ts_value.value) * 1000.0
-            t_read_total = t_read_total_v.value
-            t_frameacq = t_frameacq_v.value
-            t_getts = t_getts_v.value
-            t_frameconv = t_frameconv_v.value
-
-            detect_start = time.perf_counter()
-            hands = detector.detect_hand_pose(frame)
-            detect_end = time.perf_counter()
-            detect_time = detect_end - detect_start
-
-            if hands:
-                for hand in hands:
-                    if hand.get('label', '').lower() == 'right':
-                        continue
-
-                    ys = [hand['landmarks'].landmark[i].y * frame.shape[0] for i in range(17, 21)]
-                    avg_y = np.mean(ys)
-                    dist = abs(avg_y - y_line)
-
-                    if dist >= threshold and state == 1:
-                        state = 0
-                    elif dist < threshold and state == 0:
-                        state = 1
-                        counter += 1
-                        print(f"Tap #{counter}")
-
-                        client.send_message('/trigger', 1)
-
-                        row = [
-                            time.perf_counter(),
-                            counter,
-                            round(frame_age_ms, 6),
-                            round(t_read_total * 1000.0, 6),
-                            round(t_frameacq * 1000.0, 6),
-                            round(t_getts * 1000.0, 6),
-                            round(t_frameconv * 1000.0, 6),
-                            round(detect_time * 1000.0, 6),
-                            ''
-                        ]
-
-                        trial_folder = ''
-                        if SAVE_FRAMES:
-                            trial_sub = f"frames/trial_{counter:04d}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                            trial_folder = os.path.join(run_folder, trial_sub)
-                            os.makedirs(trial_folder, exist_ok=True)
-
-                            for i, f in enumerate(list(frame_buffer)):
-                                fname = os.path.join(trial_folder, f'frame_{i:03d}.png')
-                                try:
-                                    f_save = f if f.dtype == np.uint8 else np.clip(f, 0, 255).astype(np.uint8)
-                                    if f_save.ndim == 3 and f_save.shape[2] == 3:
-                                        f_save = f_save[..., ::-1]
-                                    mpimg.imsave(fname, f_save)
-                                except Exception as e:
-                                    print(f"Failed to save frame {i}: {e}")
-
-                            frame_buffer.clear()
-
-                        row[-1] = trial_folder
-                        with open(fixed_csv, 'a', newline='') as ff:
-                            writer_f = csv.writer(ff)
-                            writer_f.writerow(row)
-
+            consumer_step(cursor, ring, detector, decision, roi_tracker, telemetry)
     except KeyboardInterrupt:
         print("CONSUMER: KeyboardInterrupt")
     finally:
         stop_event.set()
-        shm0.close()
-        shm1.close()
+        print(f"CONSUMER: frames {cursor.stats()}")
+        if detector_kind == 'contact':
+            print(f"CONSUMER: {detector}")
+        decision.close()
+        ring.close()
+        if telemetry is not None:
+            telemetry.close()
         print("CONSUMER EXITS GRACEFULLY")
 
 
 if __name__ == "__main__":
-    mp.set_start_method('forkserver', force=True)
+    parser = argparse.ArgumentParser(description="Multiprocess hand-tap detection pipeline for latency measurements.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of detector processes (default: 1, detection and decision in a single consumer)')
+    parser.add_argument('--roi', action='store_true',
+                        help='Run detection on a crop around the tracked hand near the reference line')
+    parser.add_argument('--predictive', action='store_true',
+                        help='Trigger taps on the predicted contact instead of waiting for the threshold crossing')
+    parser.add_argument('--lead_ms', type=float, default=8.0,
+                        help='Predictive mode: downstream latency budget to fire ahead of the contact (default: 8 ms)')
+    parser.add_argument('--predict_min_velocity', type=float, default=150.0,
+                        help='Predictive mode: minimum approach velocity in px/s (default: 150)')
+    parser.add_argument('--predict_arm_px', type=float, default=40.0,
+                        help='Predictive mode: only predict within this distance of the line in px (default: 40)')
+    parser.add_argument('--predict_min_frames', type=int, default=3,
+                        help='Predictive mode: consecutive approaching frames required (default: 3)')
+    parser.add_argument('--osc_target', action='append', default=None,
+                        help='Trigger receiver, repeatable: udp:HOST:PORT, multicast:GROUP:PORT[:TTL] or unix:PATH '
+                             f'(default: {DEFAULT_TARGETS[0]})')
+    parser.add_argument('--trial_format', choices=TRIAL_FORMATS, default='raw',
+                        help='With SAVE_FRAMES: raw frames.npy per trial (default), png or jpg images')
+    parser.add_argument('--telemetry_frames', type=int, default=TELEMETRY_FRAMES,
+                        help=f'Per-frame telemetry records kept and exported to telemetry.npz, 0 to disable '
+                             f'(default: {TELEMETRY_FRAMES})')
+    parser.add_argument('--metrics_port', type=int, default=METRICS_PORT,
+                        help=f'Local HTTP port of the live metrics, 0 to disable (default: {METRICS_PORT})')
+    parser.add_argument('--metrics_interval', type=float, default=10.0,
+                        help='Period (s) of the terminal metrics summary, 0 to disable (default: 10)')
+    parser.add_argument('--clock_sync_interval', type=float, default=CLOCK_SYNC_INTERVAL,
+                        help='Period (s) of the camera clock latches used to measure frame ages from the exposure, '
+                             f'0 to measure them from the frame read (default: {CLOCK_SYNC_INTERVAL})')
+    parser.add_argument('--frame_deadline_ms', type=float, default=0.0,
+                        help='Single consumer: drop frames older than this when detection could start, 0 to disable '
+                             '(default: 0)')
+    parser.add_argument('--sched_profile', default=None,
+                        help='Scheduling profile of config/scheduling.json (CPU affinity, real-time priority, '
+                             'memory locking) applied to the pipeline processes (default: the config "profile")')
+    parser.add_argument('--bayer', action='store_true',
+                        help='Ship raw Bayer mosaics through shared memory, demosaiced once to RGB by the detector')
+    parser.add_argument('--detector', choices=('mediapipe', 'contact'), default='mediapipe',
+                        help='Single consumer: MediaPipe hand landmarks (default) or the classical contact detector '
+                             'watching a band around the reference line (utils/contact_detector.py)')
+    parser.add_argument('--contact_validate', action='store_true',
+                        help='Contact detector: validate each band occupancy with MediaPipe (hand, handedness)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream hand control parameters (fingertips, pinch, height) over OSC, with the rates '
+                             'and deadbands of --stream_config')
+    parser.add_argument('--stream_config', default=STREAM_CONFIG_PATH,
+                        help=f'Landmark streaming config (default: {STREAM_CONFIG_PATH})')
+    parser.add_argument('--stream_target', action='append', default=None,
+                        help='Landmark stream receiver, repeatable, same forms as --osc_target (default: the trigger '
+                             'receivers)')
+    parser.add_argument('--recalibrate', action='store_true',
+                        help='Update the resting offset mean/std of config/calibration.json online, from the frames '
+                             'where the hand rests on the surface, and move the threshold with them')
+    parser.add_argument('--recalibrate_interval', type=float, default=30.0,
+                        help='Online recalibration: shortest time (s) between two calibration updates (default: 30)')
+    parser.add_argument('--warmup_runs', type=int, default=WARMUP_MAX_RUNS,
+                        help='Most dummy inferences run by every detector before acquisition starts, stopping early '
+                             f'once the inference time is stable, 0 to disable (default: {WARMUP_MAX_RUNS})')
+    parser.add_argument('--warmup_frame', default=None,
+                        help='Frame used for the warm-up inferences (image or .npy, e.g. a saved trial frame with a '
+                             'hand, to warm up the landmark model too), default: sensor-like noise')
+    add_video_source_args(parser)
+    args = parser.parse_args()
+    if args.detector == 'contact' and args.workers > 1:
+        parser.error("--detector contact runs in the single consumer, use --workers 1")
+    if args.detector == 'contact' and args.recalibrate:
+        parser.error("--recalibrate measures landmark offsets, it needs --detector mediapipe")
+    if args.detector == 'contact':
+        # the contact detector only watches a horizontal band of rows at y_line
+        calibration = load_calibration_file()
+        if calibration.get('zones'):
+            parser.error("--detector contact watches the band around y_line, it cannot trigger the zones of "
+                         "config/calibration.json: use --detector mediapipe or remove the zones")
+        if calibration.get('line') and is_tilted(calibration['line']):
+            parser.error("--detector contact watches a horizontal band at y_line, the reference line of "
+                         "config/calibration.json is tilted: use --detector mediapipe or recalibrate a "
+                         "horizontal line")
+
+    prediction = None
+    if args.predictive:
+        prediction = {'lead_ms': args.lead_ms, 'min_velocity': args.predict_min_velocity,
+                      'arm_distance': args.predict_arm_px, 'min_frames': args.predict_min_frames}
+
+    osc_targets = tuple(args.osc_target) if args.osc_target else DEFAULT_TARGETS
+    metrics = {'http_port': args.metrics_port, 'summary_interval': args.metrics_interval}
+    stream = {'config': args.stream_config, 'targets': args.stream_target} if args.stream else None
+    recalibrate = {'write_interval_s': args.recalibrate_interval} if args.recalibrate else None
+    warmup = {'max_runs': args.warmup_runs, 'frame': args.warmup_frame}
+
+    sched_name, sched = load_scheduling_profile(args.sched_profile)
+    print(f"Scheduling profile: {sched_name}")
 
-    size = int(np.prod(FRAME_SHAPE) * np.dtype(FRAME_DTYPE).itemsize)
-    shm0 = shared_memory.SharedMemory(create=True, size=size)
-    shm1 = shared_memory.SharedMemory(create=True, size=size)
+    mp.set_start_method('forkserver', force=True)
 
-    cur_idx = Value('i', 0)
-    ts = Value('d', 0.0)
+    frame_shape = FRAME_SHAPE[:2] if args.bayer else FRAME_SHAPE
+    ring = FrameRing.create(ring_slots(args.workers), frame_shape, FRAME_DTYPE, n_readers=args.workers)
     stop_event = Event()
-
-    t_read_total = Value('d', 0.0)
-    t_frameacq = Value('d', 0.0)
-    t_getts = Value('d', 0.0)
-    t_frameconv = Value('d', 0.0)
+    profile_reports = mp.Queue()
+    main_profile = StartupProfile('main')
+    main_profile.add('imports', IMPORT_TIME_S)
+    main_profile.start()
 
     # Use the same experiment folder as tableA
     run_folder = load_experiment_folder()
 
-    p1 = Process(target=producer, args=(shm0.name, shm1.name,
-                                        cur_idx, stop_event, ts,
-                                        t_read_total, t_frameacq, t_getts, t_frameconv))
-    p2 = Process(target=consumer, args=(shm0.name, shm1.name,
-                                        cur_idx, stop_event, ts,
-                                        t_read_total, t_frameacq, t_getts, t_frameconv,
-                                        run_folder))
-
+    telemetry = TelemetryRing.create(args.telemetry_frames) if args.telemetry_frames > 0 else None
+
+    def export_telemetry(suffix=''):
+        path = os.path.join(run_folder, f'telemetry{suffix}.npz')
+        n = telemetry.export(path)
+        print(f"Telemetry: {n} frame records exported to {path}")
+
+    if telemetry is not None:
+        # `kill -USR1 <pid>` exports a snapshot while the run goes on
+        signal.signal(signal.SIGUSR1,
+                      lambda *_: export_telemetry(datetime.now().strftime('_%Y%m%d_%H%M%S')))
+
+    video_source = dict(video_source_kwargs(args), bayer=args.bayer)
+    # the producer starts the acquisition once every consumer process has set its ready event
+    ready_events = [Event() for _ in range(1 if args.workers <= 1 else args.workers + 1)]
+    # every process applies the settings of its role in the scheduling profile before it starts
+    p1 = Process(target=run_role, args=('producer', sched, producer,
+                                        ring, stop_event, video_source, args.clock_sync_interval,
+                                        ready_events, profile_reports))
+    trial_requests = mp.Queue() if SAVE_FRAMES else None
+    if args.workers <= 1:
+        consumers = [Process(target=run_role, args=('consumer', sched, consumer,
+                                                    ring, stop_event, run_folder, args.roi, prediction,
+                                                    osc_targets, trial_requests, telemetry, metrics,
+                                                    args.frame_deadline_ms or None, args.detector,
+                                                    args.contact_validate, stream, recalibrate, warmup,
+                                                    ready_events[0], profile_reports))]
+    else:
+        claims = mp.Array('q', 2)
+        results = mp.Queue()
+        consumers = [Process(target=run_role, args=('consumer', sched, detector_worker,
+                                                    i, ring, stop_event, claims, results, args.roi, warmup,
+                                                    ready_events[i], profile_reports))
+                     for i in range(args.workers)]
+        consumers.append(Process(target=run_role,
+                                 args=('decision', sched, decision_process,
+                                       ring, stop_event, results, args.workers, run_folder,
+                                       trial_requests, prediction, osc_targets, telemetry, metrics, stream,
+                                       recalibrate, ready_events[-1], profile_reports)))
+
+    def report_startup(profiles):
+        producer_info = next((p['info'] for p in profiles if p['role'] == 'producer'), {})
+        print("Startup profile:")
+        print(format_profiles(profiles))
+        if 'acquisition_start' in producer_info:
+            print(f"  acquisition started {producer_info['acquisition_start'] - T_START:.2f} s after launch")
+        path = os.path.join(run_folder, 'startup_profile.json')
+        save_profiles(profiles, path)
+
+    writer = None
+    if SAVE_FRAMES:
+        writer = Process(target=run_role, args=('writer', sched, trial_writer,
+                                                ring, trial_requests, stop_event, LAST_N_FRAMES, args.trial_format))
+
+    if writer is not None:
+        writer.start()
     p1.start()
-    p2.start()
+    for p in consumers:
+        p.start()
+    main_profile.lap('process start')  # includes the forkserver start and its import of this module
+    profiles = [main_profile.as_dict()]
+    n_profiles = 2 + len(consumers)
+    t_launch = time.perf_counter()
 
     try:
         while p1.is_alive():
-            p1.join(timeout=0.5)
+            if len(profiles) < n_profiles:
+                profiles += collect_profiles(profile_reports, n_profiles - len(profiles), 0.5)
+                if len(profiles) == n_profiles:
+                    report_startup(profiles)
+                elif not all(p.is_alive() for p in consumers) or time.perf_counter() - t_launch > READY_TIMEOUT_S:
+                    # a detector process died (or hangs) before getting ready: the producer would wait for it
+                    print("MAIN: a detector process failed during startup, stopping")
+                    stop_event.set()
+                    n_profiles = len(profiles)
+            else:
+                p1.join(timeout=0.5)
     except KeyboardInterrupt:
         stop_event.set()
     finally:
         stop_event.set()
         p1.join(timeout=1.0)
-        p2.join(timeout=1.0)
+        for p in consumers:
+            p.join(timeout=1.0)
+        if writer is not None:
+            # the writer finishes the queued trials before exiting
+            writer.join(timeout=30.0)
 
         try:
-            shm0.close()
-            shm0.unlink()
-        except Exception:
-            pass
-        try:
-            shm1.close()
-            shm1.unlink()
+            ring.close()
+            ring.unlink()
         except Exception:
             pass
 
+        if telemetry is not None:
+            export_telemetry()
+            telemetry.close()
+            telemetry.unlink()
+
         print("MAIN EXIT")
@@ -1,23 +1,39 @@
-import serial
+import argparse
+import asyncio
 from datetime import datetime
-import time
 import os
 import json
-import csv
+from utils.metrics import Metrics
+from utils.run_logger import RunLogger, load_log_formats, load_stream_address
+from utils.scheduling import apply_role, load_scheduling_profile
+from utils.serial_ingest import PROTOCOLS, QUEUE_SIZE, SerialIngest
+from utils.session_store import RunStore
+from utils.teensy_protocol import PING_INTERVAL_S
 
 """
 This script logs latency measurements from a serial device.
 It uses a config.json file for experiment parameters,
 creates a clean folder per experiment, and stores:
 - log.txt : experiment metadata + text log
-- tableA.csv : structured latency data
+- tableA.csv, tableA_columns/ : structured latency data (log_formats entry of the config)
+- session.json : experiment parameters of the run, for the session store (utils/session_store.py)
+
+With the binary protocol (default, arduino/latency/latency.ino), the Teensy sends its own microsecond
+press and onset timestamps and answers periodic clock sync pings (utils/teensy_protocol.py):
+`timestamp_perf_counter` is the host time of the button press, free of the USB-serial buffering
+delay (`arrival_perf_counter` keeps the read time). The Teensy must run the current firmware:
+`--protocol text` reads the decimal lines of the older firmware, stamped on arrival, as before.
+
+The experiment parameters come from the config file, overridden with `--set key=value`, without any
+prompt, so the logger can run unattended; `--interactive` asks for them as before. The serial port
+is read by `SerialIngest` (utils/serial_ingest.py): port discovery, reconnection, bounded record
+queue. `log_serial` is a coroutine, to run the logger in the event loop of another program.
 """
 
-# ---------------------- Paths and defaults ----------------------
-default_config_path = "config/log_config.json"
-base_output_dir = "latency_logs"
+DEFAULT_CONFIG_PATH = "config/log_config.json"
+BASE_OUTPUT_DIR = "latency_logs"
 
-default_keys = [
+CONFIG_KEYS = [
     ("device", "Enter the device on which the experiment is conducted"),
     ("baud_rate", "Enter baud rate (e.g. 9600 or 115200)"),
     ("method", "Enter method description"),
@@ -27,107 +43,252 @@ default_keys = [
     ("output_method", "Enter output method ('aux_speaker', 'aux_direct', 'focusrite')")
 ]
 
-# ---------------------- Load config ----------------------
-config = {}
-if os.path.exists(default_config_path):
-    with open(default_config_path, "r") as cfg_file:
-        config = json.load(cfg_file)
-
-    use_cfg = input(f"Load existing config from {default_config_path}? [Y/n]: ").strip().lower() or "y"
-    if use_cfg == "y":
-        modify = input("Modify this config? [y/N]: ").strip().lower() or "n"
-        if modify == "y":
-            for key, prompt in default_keys:
-                current = config.get(key, "")
-                new_val = input(f"{prompt} [{current}]: ").strip()
-                if new_val:
-                    if key == "baud_rate":
-                        new_val = int(new_val)
-                    config[key] = new_val
-            with open(default_config_path, "w") as cfg_file:
-                json.dump(config, cfg_file, indent=4)
+# timestamps: host perf_counter seconds; press and onset mapped from the Teensy clock
+# (text protocol: all three are the arrival time)
+TABLE_A_COLUMNS = ["timestamp_perf_counter", "latency_ms", "onset_perf_counter", "arrival_perf_counter", "seq",
+                   "clock_synced"]
+TABLE_A_DTYPES = ["f8", "f8", "f8", "f8", "i8", "i1"]
+
+WAIT_S = 0.5  # longest wait for a record, to check the duration and sample the sync round trip
+
+
+# ---------------------- Config ----------------------
+def _ask(config, key, prompt, show_current=False):
+    current = config.get(key, "")
+    value = input(f"{prompt} [{current}]: " if show_current else f"{prompt}: ").strip()
+    if value:
+        config[key] = int(value) if key == "baud_rate" else value
+
+
+def prompt_config(config_path=DEFAULT_CONFIG_PATH):
+    """
+    Interactive config: load, modify or create the config file, as the original script did
+    """
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path, "r") as cfg_file:
+            config = json.load(cfg_file)
+        use_cfg = input(f"Load existing config from {config_path}? [Y/n]: ").strip().lower() or "y"
+        if use_cfg == "y":
+            modify = input("Modify this config? [y/N]: ").strip().lower() or "n"
+            if modify != "y":
+                return config
+            for key, prompt in CONFIG_KEYS:
+                _ask(config, key, prompt, show_current=True)
+        else:
+            # Create fresh config
+            config = {}
+            for key, prompt in CONFIG_KEYS:
+                _ask(config, key, prompt)
     else:
-        # Create fresh config
-        for key, prompt in default_keys:
-            val = input(f"{prompt}: ").strip()
-            if key == "baud_rate":
-                val = int(val)
-            config[key] = val
-        with open(default_config_path, "w") as cfg_file:
-            json.dump(config, cfg_file, indent=4)
-else:
-    print(f"No config file found. Creating new one at {default_config_path}.")
-    for key, prompt in default_keys:
-        val = input(f"{prompt}: ").strip()
-        if key == "baud_rate":
-            val = int(val)
-        config[key] = val
-    with open(default_config_path, "w") as cfg_file:
+        print(f"No config file found. Creating new one at {config_path}.")
+        for key, prompt in CONFIG_KEYS:
+            _ask(config, key, prompt)
+    with open(config_path, "w") as cfg_file:
         json.dump(config, cfg_file, indent=4)
+    return config
+
 
-# ---------------------- Extract config ----------------------
-device = config["device"]
-baud_rate = int(config["baud_rate"])
-method = config["method"]
-frequency = config["frequency"]
-threshold = config["threshold"]
-pd_delay = config["pd_delay"]
-output_method = config["output_method"]
+def load_config(config_path=DEFAULT_CONFIG_PATH, overrides=()):
+    """
+    Prompt-free config: the config file (if any) with `key=value` overrides
 
-# ---------------------- Make output directory ----------------------
-# Format: latency_logs/device_method_freqXXHz_thYY_outMethod
-dir_name = f"{device}_{method}_freq{frequency}Hz_th{threshold}_out{output_method}"
-dir_name = dir_name.replace(" ", "_")  # sanitize spaces
-output_dir = os.path.join(base_output_dir, dir_name)
+    Raises
+    ---
+    ValueError if an experiment parameter of CONFIG_KEYS is missing
+    """
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path, "r") as cfg_file:
+            config = json.load(cfg_file)
+    for override in overrides:
+        key, sep, value = override.partition("=")
+        if not sep:
+            raise ValueError(f"Expected key=value, got {override!r}")
+        config[key.strip()] = value.strip()
+    missing = [key for key, _ in CONFIG_KEYS if key not in config]
+    if missing:
+        raise ValueError(f"Missing experiment parameter(s) {missing} in {config_path}: "
+                         f"add them with --set key=value or use --interactive")
+    config["baud_rate"] = int(config["baud_rate"])
+    return config
 
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
 
-log_file = os.path.join(output_dir, "log.txt")
-csv_file = os.path.join(output_dir, "tableA.csv")
+def experiment_folder(config, base_output_dir=BASE_OUTPUT_DIR):
+    # Format: latency_logs/device_method_freqXXHz_thYY_outMethod
+    dir_name = (f"{config['device']}_{config['method']}_freq{config['frequency']}Hz_th{config['threshold']}"
+                f"_out{config['output_method']}")
+    dir_name = dir_name.replace(" ", "_")  # sanitize spaces
+    output_dir = os.path.join(base_output_dir, dir_name)
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+
+def write_metadata(log_file, config):
+    with open(log_file, "w+") as f_txt:
+        f_txt.write(f"# Logging started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        for key in config:
+            f_txt.write(f"# {key.replace('_', ' ').title()}: {config[key]}\n")
+        f_txt.write("\n")
 
-# ---------------------- Serial setup ----------------------
-port = "/dev/ttyACM0"
-ser = serial.Serial(port, baud_rate)
 
 # ---------------------- Logging ----------------------
-with open(log_file, "w+") as f_txt, open(csv_file, "w", newline="") as f_csv:
-    csv_writer = csv.writer(f_csv)
-    csv_writer.writerow(["timestamp_perf_counter", "latency_ms"])  # headers
+async def log_serial(config, output_dir, port=None, protocol='binary', ping_interval=PING_INTERVAL_S,
+                     queue_size=QUEUE_SIZE, formats=('csv',), stream_to=None, metrics_port=None,
+                     metrics_interval=None, duration=None, quiet=False):
+    """
+    Logs the Teensy records to tableA.csv and log.txt in `output_dir` until cancelled or `duration` (s) elapsed.
+
+    Parameters
+    ---
+    config: dict
+        Experiment parameters (written to the log.txt header; `baud_rate` is used)
+
+    port: str, optional
+        Serial device, default: discovered (see utils/serial_ingest.py)
+
+    protocol: str, default='binary'
+        One of PROTOCOLS
+
+    stream_to: (str, int), optional
+        Local UDP address also receiving the tableA rows (data_cleanup/stream_join.py)
+
+    quiet: bool, default=False
+        Do not print every record
 
-    # Write metadata
-    f_txt.write(f"# Logging started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-    for key in config:
-        f_txt.write(f"# {key.replace('_', ' ').title()}: {config[key]}\n")
-    f_txt.write("\n")
-    f_txt.flush()
+    Returns
+    ---
+    The ingest statistics
+    """
+    log_file = os.path.join(output_dir, "log.txt")
+    write_metadata(log_file, config)
+    RunStore(output_dir).write_metadata(config)
+
+    # Rows are written to tableA.csv and log.txt in batches by a background thread
+    table_a = RunLogger(output_dir, "tableA", TABLE_A_COLUMNS, TABLE_A_DTYPES, formats=formats,
+                        text_log=(log_file, "{}, {} ms"), stream_to=stream_to)
+
+    # Live rolling metrics (utils/metrics.py)
+    metrics = Metrics('log_serial')
+    m_latency = metrics.latency('teensy_latency', 'End-to-end latency reported by the Teensy')
+    m_samples = metrics.counter('samples', 'Latency samples received')
+    m_dropped = metrics.counter('dropped', 'Records dropped because the logger fell behind')
+    m_arrival = metrics.latency('arrival_delay', 'Audio onset to record read by the host (USB-serial buffering)')
+    m_rtt = metrics.latency('sync_rtt', 'Clock sync ping round trip')
+    metrics.start(http_port=metrics_port, summary_interval=metrics_interval)
+
+    ingest = SerialIngest(port, config["baud_rate"], protocol, ping_interval, queue_size)
+    link = ingest.link
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration if duration else None
+    n_echoes, n_dropped = 0, 0
 
     print(f"\nLogging started.")
     print(f"Experiment folder: {output_dir}")
     print(f"TXT log: {log_file}")
-    print(f"CSV table: {csv_file}\n")
+    print(f"CSV table: {os.path.join(output_dir, 'tableA.csv')}\n")
+
+    def handle(record):
+        timestamp = record.press_ns / 1e9
+        if not quiet:
+            print(f"{timestamp:.6f}, {record.latency_ms:.3f} ms"
+                  + ("" if record.synced or protocol == 'text' else " (clock sync not ready)"))
+        table_a.log((timestamp, record.latency_ms, record.onset_ns / 1e9, record.arrival_ns / 1e9, record.seq,
+                     record.synced))
+        m_latency.record(record.latency_ms)
+        m_samples.inc()
+        if record.synced:
+            m_arrival.record((record.arrival_ns - record.onset_ns) / 1e6)
+
+    run = asyncio.create_task(ingest.run())
+    try:
+        while not run.done() and (deadline is None or loop.time() < deadline):
+            try:
+                handle(await asyncio.wait_for(ingest.queue.get(), WAIT_S))
+            except asyncio.TimeoutError:
+                pass
+            if link.n_echoes != n_echoes:
+                n_echoes = link.n_echoes
+                m_rtt.record(link.last_rtt_ns / 1e6)
+            if ingest.dropped != n_dropped:
+                m_dropped.inc(ingest.dropped - n_dropped)
+                n_dropped = ingest.dropped
+    finally:
+        ingest.stop()
+        await asyncio.gather(run, return_exceptions=True)
+        while not ingest.queue.empty():
+            handle(ingest.queue.get_nowait())
+        table_a.close()
+        print(ingest)
+        if ingest.dropped:
+            print(f"WARNING: {ingest.dropped} records dropped by the serial ingest, {table_a.dropped} by the writer")
+        metrics.collect()
+        print(metrics.summary())
+        metrics.close()
+    return ingest.stats()
+
+
+# ---------------------- Arguments ----------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Logs the latencies measured by the Teensy.")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH,
+                        help=f'Experiment config (default: {DEFAULT_CONFIG_PATH})')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='Override an experiment parameter of the config, repeatable (e.g. --set method=aux)')
+    parser.add_argument('--interactive', action='store_true',
+                        help='Ask for the experiment parameters and update the config file, as before')
+    parser.add_argument('--output_dir', default=BASE_OUTPUT_DIR,
+                        help=f'Base folder of the experiment folders (default: {BASE_OUTPUT_DIR})')
+    parser.add_argument('--metrics_port', type=int, default=9102,
+                        help='Local HTTP port of the live metrics, 0 to disable (default: 9102)')
+    parser.add_argument('--metrics_interval', type=float, default=10.0,
+                        help='Period (s) of the terminal metrics summary, 0 to disable (default: 10)')
+    parser.add_argument('--sched_profile', default=None,
+                        help='Scheduling profile of config/scheduling.json applied to this logger '
+                             '(role "serial_logger")')
+    parser.add_argument('--port', default=None,
+                        help='Serial port of the Teensy, e.g. the pty of latency_measurement/fake_teensy.py '
+                             '(default: the config "port", else discovered)')
+    parser.add_argument('--protocol', choices=PROTOCOLS, default=None,
+                        help='Binary timestamped records with clock sync (needs the current arduino/latency/latency.ino) '
+                             'or the decimal lines of the older firmware (default: the config "protocol", '
+                             'else binary)')
+    parser.add_argument('--ping_interval', type=float, default=PING_INTERVAL_S,
+                        help=f'Binary protocol: period (s) of the clock sync pings (default: {PING_INTERVAL_S})')
+    parser.add_argument('--queue_size', type=int, default=QUEUE_SIZE,
+                        help=f'Records buffered between the serial reader and the logger (default: {QUEUE_SIZE})')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='Stop after this many seconds (default: until Ctrl-C)')
+    parser.add_argument('--quiet', action='store_true', help='Do not print every record')
+    return parser, parser.parse_args()
 
-    while True:
+
+def main():
+    parser, args = parse_args()
+
+    sched_name, sched = load_scheduling_profile(args.sched_profile)
+    print(f"Scheduling profile: {sched_name}")
+    apply_role('serial_logger', sched)
+
+    if args.interactive:
+        config = prompt_config(args.config)
+    else:
         try:
-            line = ser.readline().decode().strip()
-            if not line:
-                continue
-
-            if line.isdigit():
-                timestamp = time.perf_counter()
-                latency_ms = int(line)
-                entry_txt = f"{timestamp}, {latency_ms} ms"
-
-                print(entry_txt)
-                f_txt.write(entry_txt + "\n")
-                f_txt.flush()
-
-                csv_writer.writerow([timestamp, latency_ms])
-                f_csv.flush()
-
-        except KeyboardInterrupt:
-            print("\nLogging stopped by user.")
-            break
-        except Exception as e:
-            print("Error:", e)
-            continue
+            config = load_config(args.config, args.set)
+        except ValueError as e:
+            parser.error(str(e))
+    output_dir = experiment_folder(config, args.output_dir)
+
+    try:
+        asyncio.run(log_serial(config, output_dir, port=args.port or config.get("port"),
+                               protocol=args.protocol or config.get("protocol", "binary"),
+                               ping_interval=args.ping_interval, queue_size=args.queue_size,
+                               formats=load_log_formats(args.config),
+                               stream_to=load_stream_address(args.config), metrics_port=args.metrics_port,
+                               metrics_interval=args.metrics_interval, duration=args.duration, quiet=args.quiet))
+    except KeyboardInterrupt:
+        print("\nLogging stopped by user.")
+
+
+if __name__ == "__main__":
+    main()
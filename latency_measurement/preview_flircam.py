@@ -1,10 +1,11 @@
+import argparse
 import cv2
-from video.flircam import Flircam
+from video.sources import add_video_source_args, open_video_input, video_source_kwargs
 
 
-def main():
-    # Initialize FLIR camera
-    cam = Flircam()
+def main(video_source=None):
+    # Initialize FLIR camera (or replay source)
+    cam = open_video_input(**(video_source or {}))
 
     print("Press 'q' to quit.")
 
@@ -13,7 +14,12 @@ def main():
 
     try:
         while True:
-            frame, ts, _ = cam.read_frame()
+            result = cam.read_frame()
+            if result is None:
+                if cam.finished:
+                    break
+                continue
+            frame, ts, _ = result
             if not frame.any():
                 print("Failed to grab frame.")
                 break
@@ -47,4 +53,7 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Live camera preview for positioning.")
+    add_video_source_args(parser)
+    args = parser.parse_args()
+    main(video_source_kwargs(args))
@@ -0,0 +1,391 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from utils.tap_detection import LineTapDetector, TapDetector
+from utils.tap_prediction import PredictiveTapDetector
+from utils.trigger_zones import TriggerZones, load_zones
+from utils.clock_sync import NS_PER_S
+from utils.landmark_stream import LandmarkStream, load_stream_config
+from utils.metrics import Metrics
+from utils.recalibration import OnlineRecalibrator
+from utils.reference_line import is_tilted, line_angle_deg, load_reference_line
+from utils.run_logger import RunLogger, load_log_formats, load_stream_address
+from utils.trigger_output import DEFAULT_TARGETS, TriggerOutput
+
+TABLE_B_COLUMNS = [('record_time_perf', 'f8'), ('tap_number', 'i4'), ('frame_age_ms', 'f8'),
+                   ('t_read_total_ms', 'f8'), ('t_frameacq_ms', 'f8'), ('t_getts_ms', 'f8'), ('t_frameconv_ms', 'f8'),
+                   ('detect_time_ms', 'f8'), ('frames_folder', 'U'),  # sized per run, see table_b_dtypes
+                   ('trigger_mode', 'U32'), ('fire_frame_id', 'i8'), ('contact_frame_id', 'i8'),
+                   ('predicted_ttc_ms', 'f8'), ('lead_ms', 'f8'),
+                   ('osc_send_us', 'f8'), ('exposure_to_read_ms', 'f8'), ('exposure_to_osc_ms', 'f8'),
+                   ('zone', 'U32')]
+TABLE_B_HEADER = [name for name, _ in TABLE_B_COLUMNS]
+TRIAL_SUBFOLDER = 'frames/trial_{counter:04d}_{stamp}'  # stamp: %Y%m%d_%H%M%S
+
+
+def table_b_dtypes(run_folder):
+    """
+    Column dtypes of tableB, `frames_folder` sized for the longest trial folder of `run_folder`
+    (tap number up to the i4 maximum) so that the columnar format never truncates it
+    """
+    longest = os.path.join(run_folder, TRIAL_SUBFOLDER.format(counter=2 ** 31 - 1, stamp='YYYYmmdd_HHMMSS'))
+    return [f'U{len(longest)}' if name == 'frames_folder' else dt for name, dt in TABLE_B_COLUMNS]
+
+
+def load_calibration(calib_file='config/calibration.json'):
+    with open(calib_file, 'r') as fp:
+        data = json.load(fp)
+    return data['y_line'], data['std_offset'], data['mean_offset']
+
+
+def consumer_step(cursor, ring, detector, decision, roi_tracker=None, telemetry=None):
+    """
+    Per-frame step of the single consumer of latency_mp.py: waits for the next frame, detects the hands
+    (on the ROI of `roi_tracker` if set), runs the tap logic and records the telemetry.
+
+    Parameters
+    ---
+    cursor: FrameCursor
+        Cursor of the consumer on the frame ring (its `meta` buffer receives the slot metadata)
+
+    ring: FrameRing
+
+    detector: HandPoseDetector or ContactDetector
+        Anything with `detect_landmarks(frame, roi)` returning a `HandLandmarks`
+
+    decision: TapDecision
+
+    roi_tracker: RoiTracker, optional
+
+    telemetry: TelemetryRing, optional
+
+    Returns
+    ---
+    None if no frame was processed (wait interrupted, or view torn by the producer), else True if a tap fired
+    """
+    claimed = cursor.next_frame()  # sleeps until a new frame is published
+    if claimed is None:
+        return None
+    frame_id, frame = claimed  # zero-copy view on the shared-memory slot
+    frame_age_ms = cursor.frame_age_ms
+    meta = cursor.meta
+    roi = roi_tracker.roi() if roi_tracker is not None else None
+
+    detect_start = time.perf_counter()
+    hands = detector.detect_landmarks(frame, roi)
+    detect_end = time.perf_counter()
+    detect_time = detect_end - detect_start
+
+    if not ring.is_valid(frame_id):
+        # the producer lapped the ring during detection: the view was torn, drop the result
+        if telemetry is not None:
+            telemetry.record(frame_id, meta, frame_age_ms / 1000.0, detect_time, detect_end, valid=False)
+        return None
+
+    if roi_tracker is not None:
+        roi_tracker.update(hands)
+
+    fired = decision.on_frame(frame_id, meta, hands, detect_time, frame_age_ms)
+
+    if telemetry is not None:
+        telemetry.record(frame_id, meta, frame_age_ms / 1000.0, detect_time, time.perf_counter(),
+                         hands.n, decision.taps.last_dist if hands.n else float('nan'), tap=fired)
+    return fired
+
+
+class TapDecision:
+    """
+    Turns per-frame detection results into taps: hysteresis on the calibrated threshold,
+    OSC trigger, tableB row and optional capture of the frames preceding the tap.
+    When config/calibration.json holds a zone set, every zone triggers its own OSC address
+    (see utils/trigger_zones.py) instead of the single reference line.
+
+    It runs inside the single consumer, or inside the decision process when a detector pool is used.
+
+    Parameters
+    ---
+    ring: FrameRing
+        Frame ring the detected frames come from
+
+    run_folder: str
+        Experiment folder receiving tableB.csv and the saved frames
+
+    trial_requests: multiprocessing.Queue, optional
+        If set, the frames preceding each tap are saved by the trial writer process
+        (see latency_measurement/trial_writer.py), which is only sent the tap frame id
+
+    prediction: dict, optional
+        If set, taps are triggered early on the predicted contact (see utils/tap_prediction.py), using these
+        `PredictiveTapDetector` parameters. The row of an early tap is written once its actual contact frame
+        is known (or once it is ruled a false positive), with the lead gained in `lead_ms`
+
+    osc_targets: list of str, default=DEFAULT_TARGETS
+        Receivers of the `/trigger` OSC message, see utils/trigger_output.py
+
+    metrics: dict, optional
+        If set, live metrics (see utils/metrics.py) are started with these `Metrics.start` arguments
+        (`http_port`, `summary_interval`)
+
+    threshold: float, optional
+        Contact distance (pixels) replacing the calibrated `mean + 3 * std`, for detectors whose distance
+        is not measured on landmarks (`ContactDetector.tap_threshold`); with zones, the default threshold of
+        the line zones
+
+    stream: dict, optional
+        If set, hand control parameters are streamed over OSC after the tap logic of every frame
+        (see utils/landmark_stream.py): `config` path of the streaming config, `targets` receivers
+        (default: `osc_targets`)
+
+    recalibrate: dict, optional
+        If set, the resting-position mean/std are updated online from the frames where the hand rests on
+        the surface, with these `OnlineRecalibrator` parameters (see utils/recalibration.py), and the
+        threshold follows them
+    """
+    def __init__(self, ring, run_folder, trial_requests=None, prediction=None, osc_targets=DEFAULT_TARGETS,
+                 metrics=None, threshold=None, stream=None, recalibrate=None):
+        y_line, stdev, mean = load_calibration()
+        line = load_reference_line(ring.frame_shape[1])
+        self.recalibrator = None
+        if recalibrate is not None:
+            if threshold is not None:
+                raise ValueError("Online recalibration measures landmark offsets, it cannot be combined with a "
+                                 "threshold override")
+            self.recalibrator = OnlineRecalibrator(line, ring.frame_shape, mean, stdev, **recalibrate)
+            print(f"Online recalibration: {self.recalibrator}")
+        if threshold is None:
+            threshold = mean + 3 * stdev
+        self.trigger = TriggerOutput(osc_targets)
+        zones = load_zones()
+        tilted = zones is None and is_tilted(line)
+        if tilted and prediction is not None:
+            print(f"Reference line tilted by {line_angle_deg(line):.1f} deg: the predictive trigger uses "
+                  f"y_line={y_line} at the frame center")
+        if zones is not None:
+            if prediction is not None:
+                raise ValueError("The predictive trigger needs the single reference line, "
+                                 "remove the zones from config/calibration.json")
+            self.taps = TriggerZones(zones, ring.frame_shape, default_threshold=threshold)
+            for name, address in zip(self.taps.names, self.taps.addresses):
+                self.trigger.register(name, address, 1)
+            print(f"Trigger zones: {self.taps}")
+        else:
+            print(f"Using y_line={y_line}, threshold={threshold:.2f}px")
+            if prediction is not None:
+                self.taps = PredictiveTapDetector(y_line, threshold, **prediction)
+                print(f"Predictive trigger: {prediction}")
+            elif tilted:
+                # a single line needs no zone engine: perpendicular distance to the tilted line
+                self.taps = LineTapDetector(y_line, threshold, line, ring.frame_shape)
+                print(f"Reference line tilted by {line_angle_deg(line):.1f} deg")
+            else:
+                self.taps = TapDetector(y_line, threshold)
+            self.trigger.register('trigger', '/trigger', 1)
+        self.pending_rows = {}  # tap number -> (row, fire frame time) of early taps awaiting their contact
+        print(f"Trigger output: {self.trigger}")
+
+        self.run_folder = run_folder
+        self.trial_requests = trial_requests
+        self.frame_height = ring.frame_shape[0]
+
+        self.metrics = None
+        if metrics is not None:
+            self.metrics = Metrics('latency_mp')
+            self.m_frame_age = self.metrics.latency('frame_age', 'Frame age when its detection started')
+            self.m_detect = self.metrics.latency('detect_time', 'Hand landmark detection time')
+            self.m_read = self.metrics.latency('camera_read', 'Camera read time (acquisition, timestamp, conversion)')
+            self.m_exposure = self.metrics.latency('exposure_to_read', 'Exposure start to host read (readout, USB transfer)')
+            self.m_frames = self.metrics.counter('frames', 'Frames processed')
+            self.m_dropped = self.metrics.counter('dropped_frames', 'Camera frames never processed (skipped or torn)')
+            self.m_taps = self.metrics.counter('taps', 'Taps fired')
+
+        self.stream = None
+        if stream is not None:
+            config = load_stream_config(stream['config'])
+            self.stream = LandmarkStream(y_line, ring.frame_shape, config['parameters'],
+                                         stream.get('targets') or osc_targets, config.get('keepalive_s', 1.0),
+                                         config.get('address_prefix', '/hand'), self.metrics)
+            max_messages, max_bytes = self.stream.max_throughput()
+            print(f"Landmark stream: {self.stream}, at most {max_messages:.0f} msg/s, {max_bytes / 1024:.1f} kB/s")
+
+        if self.metrics is not None:
+            self.metrics.start(**metrics)
+        self._last_frame_id = 0
+
+        # tableB inside the experiment folder, written by a background thread off the detection path
+        self.log = RunLogger(run_folder, 'tableB', TABLE_B_HEADER, table_b_dtypes(run_folder),
+                             formats=load_log_formats(), stream_to=load_stream_address())
+
+    def on_frame(self, frame_id, meta, hands, detect_time, frame_age_ms):
+        """
+        Processes the detection result of one frame: tap logic, then landmark streaming.
+
+        Parameters
+        ---
+        frame_id: int
+            Id of the frame in the ring
+
+        meta: np.ndarray of SLOT_META_DTYPE with shape (1,)
+            Slot metadata of the frame (camera timings)
+
+        hands: HandLandmarks
+            Output of `HandPoseDetector.detect_landmarks`
+
+        detect_time: float
+            Detection time (s)
+
+        frame_age_ms: float
+            Age of the frame when the detection started (ms), from the exposure when the camera clock is mapped
+
+        Returns
+        ---
+        True if a tap fired on this frame
+        """
+        fired = self._decide(frame_id, meta, hands, detect_time, frame_age_ms)
+        if self.stream is not None:
+            # after the trigger, which must not wait for the control stream
+            self.stream.update(hands, float(meta['ts'][0]))
+        if self.recalibrator is not None:
+            estimate = self.recalibrator.update(hands, float(meta['ts'][0]))
+            if estimate is not None:
+                self._set_threshold(estimate[0] + 3 * estimate[1])
+        return fired
+
+    def _set_threshold(self, threshold):
+        if isinstance(self.taps, TriggerZones):
+            self.taps.set_default_threshold(threshold)
+        else:
+            self.taps.threshold = threshold
+        print(f"[recalibration] {self.recalibrator}, threshold {threshold:.2f}px")
+
+    def _decide(self, frame_id, meta, hands, detect_time, frame_age_ms):
+        """
+        Tap logic of one frame, see `on_frame`
+        """
+        t_frame = float(meta['ts'][0])
+        fired = self.taps.update(hands, self.frame_height, t_frame, frame_id)
+        exposure_ns = int(meta['exposure_ns'][0])
+        t_exposure = exposure_ns / NS_PER_S if exposure_ns else None
+
+        if self.metrics is not None:
+            self.m_frame_age.record(frame_age_ms)
+            self.m_detect.record(detect_time * 1000.0)
+            self.m_read.record(float(meta['t_read_total'][0]) * 1000.0)
+            if t_exposure is not None:
+                self.m_exposure.record((t_frame - t_exposure) * 1000.0)
+            self.m_frames.inc()
+            if self._last_frame_id and frame_id > self._last_frame_id + 1:
+                self.m_dropped.inc(frame_id - self._last_frame_id - 1)
+            if fired:
+                self.m_taps.inc(len(self.taps.fired) if isinstance(self.taps, TriggerZones) else 1)
+        self._last_frame_id = frame_id
+
+        resolution = self.taps.pop_resolution()
+        if resolution is not None:
+            self._resolve(*resolution)
+
+        if not fired:
+            return False
+
+        if isinstance(self.taps, TriggerZones):
+            # Send every zone first: printing and logging come after the triggers
+            zones = self.taps.fired
+            sends = [(self.trigger.send(self.taps.names[i]), time.perf_counter()) for i in zones]
+            for i, (send_time, t_sent) in zip(zones, sends):
+                self._on_tap(int(self.taps.tap_numbers[i]), frame_id, meta, detect_time, frame_age_ms,
+                             send_time, t_sent, t_frame, t_exposure, self.taps.names[i])
+            return True
+
+        # Send first: printing and logging come after the trigger
+        send_time = self.trigger.send('trigger')
+        t_sent = time.perf_counter()
+        self._on_tap(self.taps.counter, frame_id, meta, detect_time, frame_age_ms,
+                     send_time, t_sent, t_frame, t_exposure)
+        return True
+
+    def _on_tap(self, counter, frame_id, meta, detect_time, frame_age_ms, send_time, t_sent, t_frame, t_exposure,
+                zone=''):
+        """
+        Frame capture request, console message and tableB row of a tap whose trigger was sent
+        """
+        trial_folder = ''
+        if self.trial_requests is not None:
+            # The frames are still in the ring: the writer process copies them out by frame id
+            trial_sub = TRIAL_SUBFOLDER.format(counter=counter, stamp=datetime.now().strftime('%Y%m%d_%H%M%S'))
+            trial_folder = os.path.join(self.run_folder, trial_sub)
+            self.trial_requests.put_nowait((counter, frame_id, trial_folder))
+
+        print(f"Tap #{counter}" + (" (predicted)" if self.taps.fire_mode == 'predicted' else "")
+              + (f" on {zone}" if zone else ""))
+
+        row = {
+            'record_time_perf': time.perf_counter(),
+            'tap_number': counter,
+            'frame_age_ms': round(frame_age_ms, 6),
+            't_read_total_ms': round(float(meta['t_read_total'][0]) * 1000.0, 6),
+            't_frameacq_ms': round(float(meta['t_frameacq'][0]) * 1000.0, 6),
+            't_getts_ms': round(float(meta['t_getts'][0]) * 1000.0, 6),
+            't_frameconv_ms': round(float(meta['t_frameconv'][0]) * 1000.0, 6),
+            'detect_time_ms': round(detect_time * 1000.0, 6),
+            'frames_folder': trial_folder,
+            'trigger_mode': self.taps.fire_mode,
+            'fire_frame_id': frame_id,
+            'contact_frame_id': frame_id,
+            'predicted_ttc_ms': '',
+            'lead_ms': 0.0,
+            'osc_send_us': round(send_time * 1e6, 3),
+            # photon to OSC breakdown, empty while the camera clock is not mapped
+            'exposure_to_read_ms': round((t_frame - t_exposure) * 1000.0, 6) if t_exposure is not None else '',
+            'exposure_to_osc_ms': round((t_sent - t_exposure) * 1000.0, 6) if t_exposure is not None else '',
+            'zone': zone,
+        }
+
+        if self.taps.fire_mode == 'predicted':
+            row['contact_frame_id'] = ''
+            row['predicted_ttc_ms'] = round(self.taps.predicted_ttc * 1000.0, 6)
+            self.pending_rows[counter] = (row, t_frame)
+        else:
+            self._write_row(row)
+
+    def _resolve(self, tap_number, contact_frame_id, t_contact):
+        """
+        Completes the row of an early tap with its actual contact frame, or marks it as a false positive
+        """
+        pending = self.pending_rows.pop(tap_number, None)
+        if pending is None:
+            return
+        row, t_fire = pending
+        if contact_frame_id is None:
+            row['trigger_mode'] = 'predicted_false_positive'
+            row['lead_ms'] = ''
+        else:
+            row['contact_frame_id'] = contact_frame_id
+            row['lead_ms'] = round((t_contact - t_fire) * 1000.0, 6)
+            print(f"Tap #{tap_number} contact confirmed, lead {row['lead_ms']:.2f} ms")
+        self._write_row(row)
+
+    def _write_row(self, row):
+        self.log.log([row[key] for key in TABLE_B_HEADER])
+
+    def close(self):
+        """
+        Writes the rows of early taps still awaiting their contact (run stopped in between) and flushes tableB
+        """
+        for row, _ in self.pending_rows.values():
+            self._write_row(row)
+        self.pending_rows.clear()
+        self.log.close()
+        if self.metrics is not None:
+            self.metrics.collect()
+            print(self.metrics.summary())
+            self.metrics.close()
+        if self.trigger.dropped:
+            print(f"Trigger output: {self.trigger.dropped} message(s) dropped ({self.trigger.drop_report()})")
+        self.trigger.close()
+        if self.stream is not None:
+            print(f"Landmark stream: {self.stream.stats()}")
+            self.stream.close()
+        if self.recalibrator is not None:
+            self.recalibrator.close()
+            print(f"Online recalibration: {self.recalibrator}")
@@ -0,0 +1,155 @@
+import csv
+import os
+import queue
+import signal
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from utils.bayer import BAYER_RG2BGR, demosaic
+from utils.frame_ring import SLOT_META_DTYPE, FrameRing
+
+"""
+Trial frame capture for latency_mp.py, off the detection path.
+
+When a tap fires, the decision side only puts `(tap number, frame id, trial folder)` on a queue.
+The writer process then copies the frames preceding the tap straight out of the shared-memory
+frame ring (by frame id, i.e. ring slot, never through a pickled copy) into one of its preallocated
+trial buffers, and encodes them in the background:
+- 'raw': `frames.npy` (n, height, width, 3) BGR stack, no encoding at all
+  ((n, height, width) RGGB mosaics when the pipeline runs in Bayer mode)
+- 'png': one `frame_XXX.png` per frame, fast zlib level
+- 'jpg': one `frame_XXX.jpg` per frame
+  (Bayer frames are demosaiced to BGR here, off the detection path)
+Every trial folder also gets `index.csv` with the frame ids and timestamps, which ReplayVideoInput
+uses to replay the trial with its recorded timing.
+
+The ring must hold enough frames for the writer to pick the trial up before the producer overwrites
+it (see `RING_SLOTS` in latency_mp.py). Frames already overwritten, and trials arriving while every
+buffer is still being encoded, are dropped and counted.
+"""
+
+TRIAL_FORMATS = ('raw', 'png', 'jpg')
+TRIAL_INDEX_HEADER = ['position', 'frame_id', 'ts', 'cam_ts']
+REPORT_INTERVAL_S = 5.0
+
+
+def save_trial(folder, frames, meta, fmt='raw'):
+    """
+    Writes the frames of one trial and its index in `folder`
+    """
+    os.makedirs(folder, exist_ok=True)
+    if fmt != 'raw' and frames.ndim == 3:
+        frames = [demosaic(frame, BAYER_RG2BGR) for frame in frames]
+    if fmt == 'raw':
+        np.save(os.path.join(folder, 'frames.npy'), frames)
+    elif fmt == 'png':
+        for i, frame in enumerate(frames):
+            cv2.imwrite(os.path.join(folder, f'frame_{i:03d}.png'), frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    elif fmt == 'jpg':
+        for i, frame in enumerate(frames):
+            cv2.imwrite(os.path.join(folder, f'frame_{i:03d}.jpg'), frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    else:
+        raise ValueError(f'Unknown trial format {fmt}, expected one of {TRIAL_FORMATS}')
+
+    with open(os.path.join(folder, 'index.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TRIAL_INDEX_HEADER)
+        for i, m in enumerate(meta):
+            writer.writerow([i, int(m['frame_id']), float(m['ts']), float(m['cam_ts'])])
+
+
+def trial_writer(ring: FrameRing, requests, stop_event, last_n_frames, fmt='raw', n_buffers=4):
+    """
+    Writer process: captures the frames of every requested trial from the ring and saves them.
+
+    Parameters
+    ---
+    ring: FrameRing
+
+    requests: multiprocessing.Queue
+        `(tap number, frame id, trial folder)` items, put by `TapDecision`
+
+    stop_event: multiprocessing.Event
+        Once set, the queued trials are still written before the process exits
+
+    last_n_frames: int
+        Frames saved per trial, up to and including the tap frame
+
+    fmt: str, default='raw'
+        One of TRIAL_FORMATS
+
+    n_buffers: int, default=4
+        Trial buffers: how many captured trials may wait for encoding
+    """
+    # Ctrl+C stops the pipeline through `stop_event`; the writer still has to drain its backlog
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    buffers = np.empty((n_buffers, last_n_frames) + ring.frame_shape, dtype=ring.dtype)
+    metas = np.zeros((n_buffers, last_n_frames), dtype=SLOT_META_DTYPE)
+    free = deque(range(n_buffers))
+    ready = deque()  # (buffer index, frames captured, tap number, folder)
+    stats = {'trials': 0, 'written': 0, 'dropped_trials': 0, 'dropped_frames': 0}
+    capture_done = threading.Event()
+
+    def capture():
+        # Copies trials out of the ring as soon as they are requested, while the main thread encodes
+        while True:
+            try:
+                item = requests.get(timeout=0.05)
+            except queue.Empty:
+                if stop_event.is_set():
+                    break
+                continue
+            if item is None:
+                break
+            tap_number, frame_id, folder = item
+            stats['trials'] += 1
+            try:
+                idx = free.popleft()
+            except IndexError:
+                stats['dropped_trials'] += 1
+                print(f"[trial writer] tap #{tap_number} dropped: {n_buffers} trials still being written")
+                continue
+            n = ring.snapshot(frame_id, buffers[idx], meta_out=metas[idx])
+            stats['dropped_frames'] += last_n_frames - n
+            ready.append((idx, n, tap_number, folder))
+        capture_done.set()
+
+    capture_thread = threading.Thread(target=capture, name='trial-capture', daemon=True)
+    capture_thread.start()
+    print(f"Trial writer ready ({fmt}, {last_n_frames} frames per trial)")
+
+    last_report = time.perf_counter()
+    try:
+        while True:
+            try:
+                idx, n, tap_number, folder = ready.popleft()
+            except IndexError:
+                if capture_done.is_set() and not ready:
+                    break
+                time.sleep(0.005)
+            else:
+                try:
+                    save_trial(folder, buffers[idx, :n], metas[idx, :n], fmt)
+                    stats['written'] += 1
+                except Exception as e:
+                    print(f"[trial writer] failed to save tap #{tap_number}: {e}")
+                free.append(idx)
+
+            now = time.perf_counter()
+            if now - last_report >= REPORT_INTERVAL_S:
+                last_report = now
+                if stats['trials']:
+                    print(f"[trial writer] backlog {len(ready)} trial(s) + {requests.qsize()} queued | "
+                          f"written {stats['written']}/{stats['trials']} | dropped trials {stats['dropped_trials']} | "
+                          f"dropped frames {stats['dropped_frames']}")
+    finally:
+        capture_done.wait(timeout=1.0)
+        print(f"[trial writer] written {stats['written']}/{stats['trials']} trial(s), "
+              f"dropped trials {stats['dropped_trials']}, dropped frames {stats['dropped_frames']}")
+        ring.close()
+        print("TRIAL WRITER EXITS GRACEFULLY")
@@ -1,24 +1,28 @@
 import argparse
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
+
+from utils.session_store import load_table
 
 # Parse command-line arguments
-parser = argparse.ArgumentParser(description="Plot bar plot of latency data from a CSV log file.")
-parser.add_argument("log_file", type=str, help="Path to the CSV log file containing latency data.")
+parser = argparse.ArgumentParser(description="Plot bar plot of latency data from a run table.")
+parser.add_argument("log_file", type=str,
+                    help="Table containing latency data: a CSV file, a <table>_columns folder or a run folder with --table.")
+parser.add_argument("--table", type=str, default=None, help="Table of the run folder (e.g. tableA, merged_filtered).")
 args = parser.parse_args()
 
 log_file = args.log_file
 
-# Read and extract latency values
+# Read and extract latency values (only the latency column is loaded)
 try:
-    data = pd.read_csv(log_file)
-    if 'latency_ms' not in data.columns:
-        print("The CSV file does not contain a 'latency_ms' column.")
+    table = load_table(log_file, args.table)
+    if 'latency_ms' not in table:
+        print("The table does not contain a 'latency_ms' column.")
         exit()
-    latencies = data['latency_ms'].dropna().astype(int).values
+    latencies = np.asarray(table['latency_ms'], dtype=np.float64)
+    latencies = latencies[~np.isnan(latencies)].astype(int)
 except Exception as e:
-    print(f"Error reading the CSV file: {e}")
+    print(f"Error reading the table: {e}")
     exit()
 
 if len(latencies) == 0:
@@ -82,8 +86,10 @@ import os
 os.makedirs("figures", exist_ok=True)
 
 
-base_name = os.path.basename(log_file)
+base_name = os.path.basename(os.path.normpath(log_file))
 name, ext = os.path.splitext(base_name)
+if args.table and os.path.isdir(log_file):
+    name = f"{name}_{args.table}"
 output_file = f"figures/{name}_histogram.svg"
 
 plt.savefig(output_file)
@@ -1,36 +1,40 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+import numpy as np
 import argparse
 
+from utils.session_store import load_table
+
 # Parse command-line arguments
-parser = argparse.ArgumentParser(description="Plot frame age and detection time latencies from a CSV file.")
-parser.add_argument("file_path", type=str, help="Path to the input CSV file.")
+parser = argparse.ArgumentParser(description="Plot frame age and detection time latencies from a run table.")
+parser.add_argument("file_path", type=str,
+                    help="Input table: a CSV file, a <table>_columns folder or a run folder with --table.")
+parser.add_argument("--table", type=str, default=None, help="Table of the run folder (e.g. tableB, merged).")
 args = parser.parse_args()
 
-# Load CSV
-df = pd.read_csv(args.file_path)
+# Load the two plotted columns
+df = load_table(args.file_path, args.table, columns=['frame_age_ms', 'detect_time_ms'])
 
 # Remove outliers using IQR (optional)
 # valid_frame_age = remove_outliers(df['frame_age_ms'])
 # valid_detect_time = remove_outliers(df['detect_time_ms'])
-valid_frame_age = df['frame_age_ms']
-valid_detect_time = df['detect_time_ms']
+valid_frame_age = ~np.isnan(df['frame_age_ms'])
+valid_detect_time = ~np.isnan(df['detect_time_ms'])
 
 # Keep only indices where both are valid
-valid_indices = valid_frame_age.index.intersection(valid_detect_time.index)
-df_clean = df.loc[valid_indices]
+valid_indices = np.flatnonzero(valid_frame_age & valid_detect_time)
+df_clean = df.take(valid_indices)
 
 # Compute stats
 def stats_text(series):
-    return (f"(mean={series.mean():.2f}ms, median={series.median():.2f}ms, "
-            f"min={series.min():.2f}ms, max={series.max():.2f}ms, std={series.std():.2f}ms)")
+    return (f"(mean={np.mean(series):.2f}ms, median={np.median(series):.2f}ms, "
+            f"min={np.min(series):.2f}ms, max={np.max(series):.2f}ms, std={np.std(series, ddof=1):.2f}ms)")
 
 label_frame_age = f"Frame Age {stats_text(df_clean['frame_age_ms'])}"
 label_detect_time = f"Detection Time {stats_text(df_clean['detect_time_ms'])}"
 
 # Plot
-plt.plot(df_clean.index, df_clean['frame_age_ms'], label=label_frame_age)
-plt.plot(df_clean.index, df_clean['detect_time_ms'], label=label_detect_time)
+plt.plot(valid_indices, df_clean['frame_age_ms'], label=label_frame_age)
+plt.plot(valid_indices, df_clean['detect_time_ms'], label=label_detect_time)
 plt.xlabel('Sample #')
 plt.ylabel('Latency (ms)')
 plt.title('Latency per Sample')
@@ -1,33 +1,30 @@
 import argparse
 import matplotlib.pyplot as plt
 import numpy as np
-import csv
+
+from utils.session_store import load_table
 
 # Parse command-line arguments
-parser = argparse.ArgumentParser(description="Plot latency data from a CSV log file.")
-parser.add_argument("log_file", type=str, help="Path to the CSV log file containing latency data.")
+parser = argparse.ArgumentParser(description="Plot latency data from a run table.")
+parser.add_argument("log_file", type=str,
+                    help="Table containing latency data: a CSV file, a <table>_columns folder or a run folder with --table.")
+parser.add_argument("--table", type=str, default=None, help="Table of the run folder (e.g. tableA, merged_filtered).")
 args = parser.parse_args()
 
 log_file = args.log_file
 
-# Read and extract latency values
-latencies = []
-with open(log_file, 'r') as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        try:
-            latency = int(row['latency_ms'])
-            latencies.append(latency)
-        except (KeyError, ValueError):
-            continue
+# Read and extract latency values (only the latency column is loaded)
+try:
+    latencies = np.asarray(load_table(log_file, args.table, columns=['latency_ms'])['latency_ms'], dtype=np.float64)
+except (FileNotFoundError, KeyError, ValueError) as e:
+    print(f"Error reading {log_file}: {e}")
+    exit()
+latencies = latencies[~np.isnan(latencies)]
 
-if not latencies:
+if len(latencies) == 0:
     print("No latency data found.")
     exit()
 
-# Convert to numpy array
-latencies = np.array(latencies)
-
 # Compute mean and std of full data
 mean_all = np.mean(latencies)
 std_all = np.std(latencies)
@@ -79,8 +76,10 @@ import os
 # Ensure the 'figures' directory exists
 os.makedirs("figures", exist_ok=True)
 
-log_filename = os.path.basename(log_file)
-plot_filename = f"figures/{os.path.splitext(log_filename)[0]}_latency_plot.svg"
+log_filename = os.path.splitext(os.path.basename(os.path.normpath(log_file)))[0]
+if args.table and os.path.isdir(log_file):
+    log_filename = f"{log_filename}_{args.table}"
+plot_filename = f"figures/{log_filename}_latency_plot.svg"
 plt.savefig(plot_filename)
 print(f"Plot saved to {plot_filename}")
 plt.close()
\ No newline at end of file
@@ -1,82 +1,91 @@
 """
-Simple outlier removal script for CSV performance data.
-Removes outliers from latency_ms using IQR method and saves as merged_filtered.csv
+Simple outlier removal script for the merged tables of the runs.
+Removes outliers from latency_ms using IQR method and saves merged_filtered.csv in each run
+(tables read through the session store, utils/session_store.py; with --persist the columnar
+`merged_filtered` table is written too)
 """
 
-import pandas as pd
+import argparse
+import os
+
 import numpy as np
-from pathlib import Path
 
-def remove_outliers_iqr(df, column):
-    """Remove outliers using Interquartile Range (IQR) method."""
-    Q1 = df[column].quantile(0.25)
-    Q3 = df[column].quantile(0.75)
+from utils.session_store import RunStore, find_runs, write_csv
+
+def remove_outliers_iqr(values):
+    """Rows kept by the Interquartile Range (IQR) method, as a boolean mask."""
+    Q1, Q3 = np.percentile(values, [25, 75])
     IQR = Q3 - Q1
-    
+
     lower_bound = Q1 - 1.5 * IQR
     upper_bound = Q3 + 1.5 * IQR
-    
-    return df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
 
-def process_csv_file(csv_path):
-    """Process a single CSV file and remove outliers."""
+    return (values >= lower_bound) & (values <= upper_bound)
+
+def process_run(run_dir, persist=False):
+    """Process the merged table of a single run and remove outliers."""
     try:
-        # Read the CSV file
-        df = pd.read_csv(csv_path)
-        
-        if 'latency_ms' not in df.columns:
-            print(f"Error: 'latency_ms' column not found in {csv_path}")
+        store = RunStore(run_dir, persist=persist)
+        merged = store.load('merged')
+
+        if 'latency_ms' not in merged:
+            print(f"Error: 'latency_ms' column not found in {run_dir}")
             return False
-        
-        original_count = len(df)
-        
+
+        original_count = len(merged)
+        if not original_count:
+            print(f"Warning: No data found in {run_dir}")
+            return False
+
         # Remove outliers
-        df_filtered = remove_outliers_iqr(df, 'latency_ms')
-        filtered_count = len(df_filtered)
+        keep = remove_outliers_iqr(np.asarray(merged['latency_ms'], dtype=np.float64))
+        filtered_count = int(keep.sum())
         removed_count = original_count - filtered_count
-        
+
         # Save filtered data
-        output_path = csv_path.parent / 'merged_filtered.csv'
-        df_filtered.to_csv(output_path, index=False)
-        
-        print(f"Processed {csv_path}")
+        if persist:
+            store.save('merged_filtered', merged.take(keep), source='remove_outliers', export_csv=True)
+        else:
+            write_csv(os.path.join(run_dir, 'merged_filtered.csv'), merged.take(keep))
+
+        print(f"Processed {run_dir}")
         print(f"  Original: {original_count} rows")
         print(f"  Filtered: {filtered_count} rows")
         print(f"  Removed: {removed_count} outliers ({removed_count/original_count*100:.1f}%)")
-        print(f"  Saved to: {output_path}")
-        
+        print(f"  Saved to: {os.path.join(run_dir, 'merged_filtered.csv')}")
+
         return True
-        
+
     except Exception as e:
-        print(f"Error processing {csv_path}: {str(e)}")
+        print(f"Error processing {run_dir}: {str(e)}")
         return False
 
-def main(root_directory="freezed_logs"):
-    """Main function to process all merged.csv files."""
-    
-    root_path = Path(root_directory)
-    
-    if not root_path.exists():
-        print(f"Error: Root directory '{root_directory}' does not exist!")
-        return
-    
-    # Find all merged.csv files
-    csv_files = list(root_path.glob("*/merged.csv"))
-    
-    if not csv_files:
-        print(f"No merged.csv files found in {root_directory}")
+def main(root_directory="freezed_logs", persist=False):
+    """Main function to process the merged table of all runs."""
+
+    runs = find_runs(root_directory, 'merged')
+
+    if not runs:
+        print(f"No run with a merged table found in {root_directory}")
         return
-    
-    print(f"Found {len(csv_files)} CSV files to filter...")
+
+    print(f"Found {len(runs)} runs to filter...")
     print("=" * 50)
-    
+
     processed = 0
-    for csv_file in csv_files:
-        if process_csv_file(csv_file):
+    for run_dir in runs:
+        if process_run(run_dir, persist):
             processed += 1
         print("-" * 30)
-    
-    print(f"Successfully processed {processed}/{len(csv_files)} files")
+
+    print(f"Successfully processed {processed}/{len(runs)} runs")
 
 if __name__ == "__main__":
-    main(root_directory="latency_measurement/freezed_logs")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Remove the latency outliers of the merged table of every run.")
+    parser.add_argument("--root_dir", type=str, default="freezed_logs",
+                        help="Root directory containing the run folders (default: 'freezed_logs')")
+    parser.add_argument("--persist", action="store_true",
+                        help="Also write the columnar copies of merged and merged_filtered in the run folders")
+    args = parser.parse_args()
+
+    main(args.root_dir, args.persist)
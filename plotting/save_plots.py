@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 """
-CSV Performance Data Plotter
+Performance Data Plotter
 
-This script processes performance data CSV files and generates three types of plots:
+This script processes the merged_filtered table of every run (session store,
+utils/session_store.py) and generates three types of plots:
 1. Latency vs Timestamp (line plot)
 2. Latency distribution (histogram)  
 3. Sum of frame_age and t_read_total vs Latency (scatter plot)
@@ -10,7 +11,6 @@ This script processes performance data CSV files and generates three types of pl
 Each plot includes statistical annotations (mean, median, min, max, std dev).
 """
 
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import os
@@ -18,6 +18,10 @@ from pathlib import Path
 import seaborn as sns
 import argparse
 
+from utils.session_store import RunStore, find_runs
+
+REQUIRED_COLUMNS = ['timestamp_perf_counter', 'latency_ms', 'frame_age_ms', 't_read_total_ms']
+
 def calculate_stats(data):
     """Calculate statistical measures for the data."""
     return {
@@ -168,29 +172,30 @@ def plot_combined_time_vs_latency(df, output_dir, folder_name):
     
     return output_path
 
-def process_csv_file(csv_path, output_dir):
-    """Process a single CSV file and generate all plots."""
+def process_run(run_dir, output_dir):
+    """Process the merged_filtered table of a single run and generate all plots."""
     try:
-        # Read the CSV file
-        df = pd.read_csv(csv_path)
+        # Load the run table (columns are read on access)
+        table = RunStore(run_dir).load('merged_filtered')
         
         # Validate required columns
-        required_columns = ['timestamp_perf_counter', 'latency_ms', 'frame_age_ms', 't_read_total_ms']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in table]
         
         if missing_columns:
-            print(f"Error: Missing columns in {csv_path}: {missing_columns}")
+            print(f"Error: Missing columns in {run_dir}: {missing_columns}")
             return False
         
+        df = table.select(REQUIRED_COLUMNS)
+        
         # Check if we have data
         if len(df) == 0:
-            print(f"Warning: No data found in {csv_path}")
+            print(f"Warning: No data found in {run_dir}")
             return False
         
         # Get folder name for titles
-        folder_name = os.path.basename(os.path.dirname(csv_path))
+        folder_name = os.path.basename(os.path.normpath(run_dir))
         
-        print(f"Processing {csv_path} with {len(df)} records...")
+        print(f"Processing {run_dir} with {len(df)} records...")
         
         # Generate all plots
         plot1_path = plot_latency_vs_timestamp(df, output_dir, folder_name)
@@ -205,11 +210,11 @@ def process_csv_file(csv_path, output_dir):
         return True
         
     except Exception as e:
-        print(f"Error processing {csv_path}: {str(e)}")
+        print(f"Error processing {run_dir}: {str(e)}")
         return False
 
 def main(root_directory="freezed_logs"):
-    """Main function to iterate through all merged_filtered.csv files and generate plots."""
+    """Main function to iterate through the merged_filtered tables of all runs and generate plots."""
     
     # Set style for better looking plots
     plt.style.use('default')
@@ -224,21 +229,19 @@ def main(root_directory="freezed_logs"):
     processed_count = 0
     error_count = 0
     
-    # Find all merged_filtered.csv files
-    csv_files = list(root_path.glob("*/merged_filtered.csv"))
+    # Find all runs with a merged_filtered table
+    runs = find_runs(root_directory, 'merged_filtered')
     
-    if not csv_files:
-        print(f"No merged_filtered.csv files found in {root_directory}")
+    if not runs:
+        print(f"No merged_filtered table found in {root_directory}")
         return
     
-    print(f"Found {len(csv_files)} CSV files to process...")
+    print(f"Found {len(runs)} runs to process...")
     print("=" * 50)
     
-    for csv_file in csv_files:
-        folder_dir = csv_file.parent
-        
-        # Process the CSV and generate plots
-        success = process_csv_file(csv_file, folder_dir)
+    for run_dir in runs:
+        # Process the run and generate plots in its folder
+        success = process_run(run_dir, run_dir)
         
         if success:
             processed_count += 1
@@ -249,17 +252,17 @@ def main(root_directory="freezed_logs"):
     
     print("=" * 50)
     print(f"Processing complete!")
-    print(f"Successfully processed: {processed_count} files")
-    print(f"Errors encountered: {error_count} files")
+    print(f"Successfully processed: {processed_count} runs")
+    print(f"Errors encountered: {error_count} runs")
 
 if __name__ == "__main__":
 
-    parser = argparse.ArgumentParser(description="Process CSV files and generate plots.")
+    parser = argparse.ArgumentParser(description="Process the runs and generate plots.")
     parser.add_argument(
         "--root_dir",
         type=str,
         default="freezed_logs",
-        help="Root directory containing the CSV files (default: 'freezed_logs')"
+        help="Root directory containing the run folders (default: 'freezed_logs')"
     )
     args = parser.parse_args()
 
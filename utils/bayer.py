@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+
+"""
+Helpers for the raw Bayer frame path.
+
+The Blackfly S delivers BayerRG8 (RGGB) mosaics. Shipping the mosaic through shared memory moves a
+third of the bytes of a BGR frame, and it is demosaiced once, straight to RGB, right before inference
+(see `HandPoseDetector.detect_landmarks`).
+
+OpenCV names Bayer patterns after the second row of the mosaic, so an RGGB sensor is `BayerBG` there.
+"""
+
+BAYER_RG2RGB = cv2.COLOR_BayerBG2RGB
+BAYER_RG2BGR = cv2.COLOR_BayerBG2BGR
+
+
+def mosaic_rg(bgr, out=None):
+    """
+    RGGB mosaic of a BGR frame, e.g. to replay recordings or to benchmark the raw path without the camera.
+    Rows/columns (even, even) hold red, (odd, odd) blue, the others green.
+    """
+    h, w = bgr.shape[:2]
+    if out is None:
+        out = np.empty((h, w), dtype=bgr.dtype)
+    out[0::2, 0::2] = bgr[0::2, 0::2, 2]
+    out[0::2, 1::2] = bgr[0::2, 1::2, 1]
+    out[1::2, 0::2] = bgr[1::2, 0::2, 1]
+    out[1::2, 1::2] = bgr[1::2, 1::2, 0]
+    return out
+
+
+def demosaic(raw, code=BAYER_RG2RGB, out=None):
+    """
+    Demosaics an RGGB frame with OpenCV's bilinear interpolation, into `out` if given
+    (preallocated, shape (h, w, 3), C-contiguous)
+    """
+    if out is None:
+        return cv2.cvtColor(raw, code)
+    return cv2.cvtColor(raw, code, dst=out)
+
+
+def even_roi(roi):
+    """
+    Rounds an (x0, y0, x1, y1) crop outwards to even coordinates, so the crop of an RGGB mosaic is RGGB too
+    """
+    x0, y0, x1, y1 = roi
+    return x0 & ~1, y0 & ~1, (x1 + 1) & ~1, (y1 + 1) & ~1
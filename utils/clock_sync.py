@@ -0,0 +1,195 @@
+from collections import deque
+
+import numpy as np
+
+"""
+Mapping of a device clock (camera chunk timestamps, Teensy micros) onto the host
+`time.perf_counter_ns()` clock.
+
+The device periodically provides sync samples: a device timestamp together with the host time at
+which it was taken and the uncertainty of that host time, e.g. half the round trip of the request
+that latched the device clock (`VideoInput.latch_timestamp`, or a ping/echo exchange over serial).
+
+`ClockSync` fits `host = device + offset + drift * (device - ref)` over a sliding window of the
+last samples:
+- weighted least squares, samples with a shorter round trip weighing more
+- outliers (samples delayed by the OS or the USB stack) are rejected against a robust (MAD)
+  estimate of the residual spread, then the fit is redone on the inliers
+- the sliding window tracks slow drift changes (temperature); a run of consecutive outliers
+  means the device clock jumped (reset, reconnect) and restarts the fit
+
+Timestamps are integer nanoseconds throughout. The fit itself runs in float64 on differences
+relative to the newest sample, which stay small enough to be exact.
+"""
+
+NS_PER_S = 1_000_000_000
+MAD_TO_STD = 1.4826
+
+
+class ClockSync:
+    """
+    Online robust linear fit of a device clock onto host `time.perf_counter_ns()`.
+
+    Parameters
+    ---
+    window: int, default=32
+        Sync samples kept in the fit
+
+    min_samples: int, default=4
+        Samples required before `to_host` returns mapped times
+
+    outlier_k: float, default=4.0
+        Samples farther than `outlier_k` robust standard deviations from the fit are rejected
+
+    noise_floor_ns: int, default=2000
+        Lower bound of the residual spread used for the outlier test and the weights, so a
+        run of very consistent samples does not make the fit reject everything else
+
+    max_outlier_run: int, default=3
+        Consecutive rejected samples after which the fit restarts from the latest ones
+    """
+    def __init__(self, window=32, min_samples=4, outlier_k=4.0, noise_floor_ns=2000, max_outlier_run=3):
+        self.window = window
+        self.min_samples = max(2, min_samples)
+        self.outlier_k = outlier_k
+        self.noise_floor_ns = noise_floor_ns
+        self.max_outlier_run = max_outlier_run
+        self.reset()
+
+    def reset(self):
+        self._device = deque(maxlen=self.window)
+        self._host = deque(maxlen=self.window)
+        self._uncertainty = deque(maxlen=self.window)
+        self._recent = deque(maxlen=self.max_outlier_run)  # latest samples, to restart from after a jump
+        self._ref_device = 0
+        self._ref_offset = 0  # host - device at the reference point, ns
+        self._intercept = 0.0
+        self._slope = 0.0  # drift: host ns gained per device ns, minus 1
+        self._spread = float(self.noise_floor_ns)
+        self._outlier_run = 0
+        self.ready = False
+        self.n_samples = 0
+        self.n_outliers = 0
+        self.n_resets = 0
+
+    # ---------------------- Sync samples ----------------------
+    def add(self, device_ns, host_ns, uncertainty_ns=0):
+        """
+        Adds one sync sample and refits.
+
+        Parameters
+        ---
+        device_ns: int
+            Device clock reading (ns)
+
+        host_ns: int
+            Host `time.perf_counter_ns()` at which the device clock had that value
+
+        uncertainty_ns: int, default=0
+            Uncertainty of `host_ns`, typically half the round trip of the exchange
+
+        Returns
+        ---
+        False if the sample was rejected as an outlier
+        """
+        device_ns, host_ns, uncertainty_ns = int(device_ns), int(host_ns), int(uncertainty_ns)
+        self.n_samples += 1
+        self._recent.append((device_ns, host_ns, uncertainty_ns))
+
+        if self.ready:
+            residual = host_ns - self.to_host(device_ns)
+            if abs(residual) > self.outlier_k * self._spread + uncertainty_ns:
+                self.n_outliers += 1
+                self._outlier_run += 1
+                if self._outlier_run >= self.max_outlier_run:
+                    # the device clock jumped: start again from the latest samples
+                    recent = list(self._recent)
+                    n_resets, n_samples, n_outliers = self.n_resets + 1, self.n_samples, self.n_outliers
+                    self.reset()
+                    self.n_resets, self.n_samples, self.n_outliers = n_resets, n_samples, n_outliers
+                    for d, h, u in recent:
+                        self._append(d, h, u)
+                    self._fit()
+                return False
+
+        self._outlier_run = 0
+        self._append(device_ns, host_ns, uncertainty_ns)
+        self._fit()
+        return True
+
+    def _append(self, device_ns, host_ns, uncertainty_ns):
+        self._device.append(device_ns)
+        self._host.append(host_ns)
+        self._uncertainty.append(uncertainty_ns)
+
+    def _fit(self):
+        n = len(self._device)
+        if n < self.min_samples:
+            return
+        ref_device, ref_host = self._device[-1], self._host[-1]
+        ref_offset = ref_host - ref_device
+        # small differences relative to the newest sample: exact in float64
+        dx = np.array([d - ref_device for d in self._device], dtype=np.float64)
+        dy = np.array([h - d - ref_offset for d, h in zip(self._device, self._host)], dtype=np.float64)
+        unc = np.array(self._uncertainty, dtype=np.float64)
+
+        inliers = np.ones(n, dtype=bool)
+        for _ in range(2):
+            weights = 1.0 / (unc ** 2 + float(self.noise_floor_ns) ** 2)
+            intercept, slope = self._weighted_line(dx[inliers], dy[inliers], weights[inliers])
+            residuals = dy - (intercept + slope * dx)
+            spread = max(MAD_TO_STD * float(np.median(np.abs(residuals - np.median(residuals)))),
+                         float(self.noise_floor_ns))
+            keep = np.abs(residuals) <= self.outlier_k * spread + unc
+            if keep.sum() < self.min_samples or np.array_equal(keep, inliers):
+                break
+            inliers = keep
+
+        self._ref_device = ref_device
+        self._ref_offset = ref_offset
+        self._intercept = intercept
+        self._slope = slope
+        self._spread = spread
+        self.ready = True
+
+    @staticmethod
+    def _weighted_line(x, y, w):
+        sw = w.sum()
+        mx, my = (w * x).sum() / sw, (w * y).sum() / sw
+        var = (w * (x - mx) ** 2).sum()
+        slope = (w * (x - mx) * (y - my)).sum() / var if var > 0 else 0.0
+        return my - slope * mx, slope
+
+    def __len__(self):
+        """
+        Samples in the fit window; sync samples may be taken faster until it is full
+        """
+        return len(self._device)
+
+    # ---------------------- Mapping ----------------------
+    def to_host(self, device_ns):
+        """
+        Host `perf_counter_ns` time of a device timestamp (ns), 0 while the fit is not ready
+        """
+        if not self.ready:
+            return 0
+        dx = device_ns - self._ref_device
+        return device_ns + self._ref_offset + int(round(self._intercept + self._slope * dx))
+
+    @property
+    def drift_ppm(self):
+        return self._slope * 1e6
+
+    @property
+    def spread_ns(self):
+        """
+        Robust standard deviation of the sync residuals (ns), the precision of the mapping
+        """
+        return self._spread
+
+    def __repr__(self):
+        state = (f"drift {self.drift_ppm:+.2f} ppm, spread {self._spread / 1000:.1f} us"
+                 if self.ready else "not ready")
+        return (f"ClockSync({state}, {self.n_samples} samples, {self.n_outliers} outliers, "
+                f"{self.n_resets} resets)")
+
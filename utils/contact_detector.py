@@ -0,0 +1,179 @@
+import cv2
+import numpy as np
+
+from utils.hand_landmarks import LEFT, UNKNOWN, HandLandmarks
+
+"""
+Classical (non-ML) surface-contact detector, a fast path for the surface-tap use case.
+
+Tap detection only needs to know when the pinky edge reaches the foil line recorded by
+calibration.py. Instead of running the hand landmark model on the whole frame, this detector only
+looks at a thin band of rows around the calibrated `y_line`:
+- a background model of the band (running average, updated only while the band is empty) is
+  subtracted from every frame, and the pixels that differ by more than `diff_threshold` form the
+  occupancy mask
+- the lowest band row whose occupancy exceeds `min_fill` is the edge of whatever entered the band,
+  i.e. the pinky edge of the hand coming down on the surface
+
+It works on the green channel of BGR/RGB frames or directly on raw Bayer mosaics, a few hundred
+microseconds per frame on CPU, so it keeps up with the camera (500+ fps).
+
+`ContactDetector.detect_landmarks` has the interface of `HandPoseDetector.detect_landmarks`: the
+edge is reported as a single hand whose landmarks all sit at the edge, so `TapDetector` and the rest
+of the pipeline are unchanged. Its distance to the line is the gap between the edge and the line,
+hence the detector's own `tap_threshold` instead of the calibrated landmark offset.
+
+Optionally, a `HandPoseDetector` validates each occupancy episode: it runs once when something
+enters the band, well before the contact, and tells whether it is a hand and which one.
+"""
+
+
+class ContactDetector:
+    """
+    Background-subtracted band occupancy around the reference line.
+
+    Parameters
+    ---
+    y_line: int
+        Y-coordinate (pixels) of the calibrated reference line
+
+    frame_shape: tuple
+        (height, width, ...) of the frames
+
+    band_above: int, default=24
+        Rows above the line watched for the approaching hand
+
+    band_below: int, default=4
+        Rows below the line (the edge may cover the line itself at contact)
+
+    diff_threshold: int, default=25
+        Minimum absolute difference to the background (grey levels) of an occupied pixel
+
+    min_fill: float, default=0.02
+        Fraction of a band row that must be occupied for the row to count
+
+    bg_alpha: float, default=0.02
+        Background learning rate, applied on frames where the band is empty
+
+    tap_threshold: float, default=2.0
+        Edge-to-line distance (pixels) below which the surface is considered touched, to be used as the
+        `TapDetector` threshold
+
+    validator: HandPoseDetector, optional
+        Runs once per occupancy episode (when the band gets occupied) to check it is a hand and get its handedness.
+        Episodes without a hand are ignored
+    """
+    def __init__(self, y_line, frame_shape, band_above=24, band_below=4, diff_threshold=25, min_fill=0.02,
+                 bg_alpha=0.02, tap_threshold=2.0, validator=None):
+        self.height, self.width = frame_shape[0], frame_shape[1]
+        self.y_line = int(y_line)
+        self.y0 = max(0, self.y_line - band_above)
+        self.y1 = min(self.height, self.y_line + band_below + 1)
+        self.diff_threshold = diff_threshold
+        self.min_row_count = max(1, int(min_fill * self.width))
+        self.bg_alpha = bg_alpha
+        self.tap_threshold = tap_threshold
+        self.validator = validator
+
+        band_shape = (self.y1 - self.y0, self.width)
+        self.output = HandLandmarks(1)
+        self._background = None  # float32 running average of the band
+        self._grey = np.empty(band_shape, dtype=np.uint8)
+        self._background_u8 = np.empty(band_shape, dtype=np.uint8)
+        self._diff = np.empty(band_shape, dtype=np.uint8)
+        self._mask = np.empty(band_shape, dtype=np.uint8)
+        self._row_counts = np.empty((band_shape[0], 1), dtype=np.int32)
+        self._col_counts = np.empty((1, band_shape[1]), dtype=np.int32)
+        self._columns = np.arange(band_shape[1], dtype=np.float64)
+
+        self.occupied = False
+        self.episode_handedness = LEFT
+        self.n_episodes = 0
+        self.n_rejected = 0
+
+    def _band(self, image):
+        band = image[self.y0:self.y1]
+        if band.ndim == 3:
+            # green, in BGR and RGB alike
+            return cv2.extractChannel(band, 1, dst=self._grey)
+        return band
+
+    def detect_landmarks(self, image, roi=None, color=None) -> HandLandmarks:
+        """
+        Detects the edge of whatever occupies the band around the line.
+
+        Parameters
+        ---
+        image: np.ndarray
+            BGR or RGB frame (h, w, 3), or raw Bayer mosaic (h, w)
+
+        roi, color:
+            Accepted for compatibility with `HandPoseDetector.detect_landmarks`; the band is the ROI, and only
+            `validator` uses `color`
+
+        Returns
+        ---
+        The detector's preallocated `HandLandmarks` (`self.output`): one hand with every landmark at the edge
+        (x: occupancy centroid) when the band is occupied, none otherwise
+        """
+        band = self._band(image)
+        out = self.output
+        if self._background is None:
+            self._background = band.astype(np.float32)
+            out.n = 0
+            return out
+
+        cv2.convertScaleAbs(self._background, dst=self._background_u8)
+        cv2.absdiff(band, self._background_u8, dst=self._diff)
+        cv2.threshold(self._diff, self.diff_threshold, 1, cv2.THRESH_BINARY, dst=self._mask)
+        cv2.reduce(self._mask, 1, cv2.REDUCE_SUM, dst=self._row_counts, dtype=cv2.CV_32S)
+        rows = np.flatnonzero(self._row_counts[:, 0] >= self.min_row_count)
+
+        if len(rows) == 0:
+            self.occupied = False
+            cv2.accumulateWeighted(band, self._background, self.bg_alpha)
+            out.n = 0
+            return out
+
+        if not self.occupied:
+            self.occupied = True
+            self.n_episodes += 1
+            self.episode_handedness = self._validate(image, color)
+        if self.episode_handedness == UNKNOWN:
+            out.n = 0
+            return out
+
+        edge = rows[-1]
+        cv2.reduce(self._mask[edge:edge + 1], 0, cv2.REDUCE_SUM, dst=self._col_counts, dtype=cv2.CV_32S)
+        counts = self._col_counts[0]
+        total = counts.sum()
+        x = float(counts @ self._columns) / total if total else self.width / 2.0
+
+        out.n = 1
+        out.landmarks[0, :, 0] = x / self.width
+        # bottom of the lowest occupied row, clamped to the line: past it, the hand only occludes the line
+        out.landmarks[0, :, 1] = min(self.y0 + edge + 1, self.y_line) / self.height
+        out.landmarks[0, :, 2] = 0.0
+        out.handedness[0] = self.episode_handedness
+        out.scores[0] = min(1.0, float(self._row_counts[edge, 0]) / self.width)
+        return out
+
+    def _validate(self, image, color):
+        """
+        Handedness of the hand entering the band (LEFT without validator), UNKNOWN if there is no hand
+        """
+        if self.validator is None:
+            return LEFT
+        hands = self.validator.detect_landmarks(image, None, color)
+        if hands.n == 0:
+            self.n_rejected += 1
+            return UNKNOWN
+        # the hand closest to the line is the one entering the band
+        lowest = int(np.argmax(hands.landmarks[:hands.n, :, 1].max(axis=1)))
+        return int(hands.handedness[lowest]) if hands.handedness[lowest] != UNKNOWN else LEFT
+
+    def __repr__(self):
+        return (f"ContactDetector(band rows {self.y0}-{self.y1}, {self.n_episodes} episodes"
+                + (f", {self.n_rejected} rejected by the hand validator" if self.validator is not None else "")
+                + ")")
+
@@ -0,0 +1,408 @@
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.clock_sync import NS_PER_S
+from utils.metrics import CounterMetric
+
+"""
+N-slot shared-memory frame ring used between the producer and the consumer(s) of the pipeline.
+
+Every slot carries a frame together with its metadata (frame id, host/camera timestamps and
+the camera read timings), published under a per-slot seqlock:
+- the writer stores `seq = 2*frame_id - 1` (odd = write in progress), copies the frame and the
+  metadata, then stores `seq = 2*frame_id` (even = stable) and advances the ring head
+- a reader checks `seq == 2*frame_id` before and after reading; any other value means the slot
+  has been (or is being) overwritten by a newer frame and the read must be discarded
+
+There is a single writer (the producer), any number of readers and no lock on the data.
+
+Readers do not need to poll the ring head: every reader has a wakeup semaphore, posted by the writer
+after each publication (a non-blocking `sem_post`, the writer never waits for a reader), on which
+`wait_for_frame` sleeps. `FrameCursor` builds on it to hand every frame out at most once, keeping
+exact counts of the frames it had to wait for, skipped or dropped as stale.
+"""
+
+SLOT_META_DTYPE = np.dtype([
+    ('seq', np.uint64),
+    ('frame_id', np.uint64),
+    ('ts', np.float64),            # host time.perf_counter() when the frame was read
+    ('cam_ts', np.float64),        # camera chunk timestamp (s)
+    ('t_read_total', np.float64),
+    ('t_frameacq', np.float64),
+    ('t_getts', np.float64),
+    ('t_frameconv', np.float64),
+    ('exposure_ns', np.int64),     # host time.perf_counter_ns() of the exposure start, 0 if unknown (utils/clock_sync.py)
+])
+
+_ALIGN = 64
+_HEADER_SIZE = _ALIGN  # ring head: last published frame id (uint64)
+
+
+def _align(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class FrameRing:
+    """
+    Lock-free, tear-free ring of frames in a single `SharedMemory` block.
+
+    Frame ids start at 1 and frame `i` lives in slot `(i - 1) % n_slots`, so a published frame
+    stays readable until `n_slots - 1` newer frames have been written.
+
+    A `FrameRing` pickles as a reference to its shared memory block, so it can be passed
+    directly as a `multiprocessing.Process` argument and is re-attached in the child.
+
+    Parameters
+    ---
+    name: str
+        Name of an existing shared memory block (use `FrameRing.create` to allocate a new one)
+
+    n_slots: int
+        Number of frame slots in the ring
+
+    frame_shape: tuple
+        Shape of a single frame, e.g. (540, 720, 3)
+
+    dtype: numpy dtype, default=np.uint8
+        Pixel dtype
+    """
+    def __init__(self, name, n_slots, frame_shape, dtype=np.uint8, _create=False, _wakeups=()):
+        # Per-reader wakeup semaphores, created with the ring and handed to the processes it is passed to.
+        # Rings attached by name only have none: `wait_for_frame` then polls.
+        self._wakeups = tuple(_wakeups)
+        self.n_slots = int(n_slots)
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+
+        meta_size = _align(self.n_slots * SLOT_META_DTYPE.itemsize)
+        frame_nbytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        self._slot_stride = _align(frame_nbytes)
+        size = _HEADER_SIZE + meta_size + self.n_slots * self._slot_stride
+
+        if _create:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        self._head = np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=0)
+        self._meta = np.ndarray((self.n_slots,), dtype=SLOT_META_DTYPE, buffer=buf, offset=_HEADER_SIZE)
+        if _create:
+            self._head[0] = 0
+            self._meta[:] = 0
+
+        # Field and slot views are built once so the hot paths never create arrays
+        self._seq = self._meta['seq']
+        self._frame_id = self._meta['frame_id']
+        self._ts = self._meta['ts']
+        self._cam_ts = self._meta['cam_ts']
+        self._t_read_total = self._meta['t_read_total']
+        self._t_frameacq = self._meta['t_frameacq']
+        self._t_getts = self._meta['t_getts']
+        self._t_frameconv = self._meta['t_frameconv']
+        self._exposure_ns = self._meta['exposure_ns']
+        self._meta_slots = [self._meta[i:i + 1] for i in range(self.n_slots)]
+
+        frames_offset = _HEADER_SIZE + meta_size
+        self._slots = [
+            np.ndarray(self.frame_shape, dtype=self.dtype, buffer=buf,
+                       offset=frames_offset + i * self._slot_stride)
+            for i in range(self.n_slots)
+        ]
+
+        self._next_id = int(self._head[0]) + 1
+
+    @classmethod
+    def create(cls, n_slots, frame_shape, dtype=np.uint8, n_readers=1):
+        """
+        Allocates a new ring. The creating process is in charge of calling `unlink` at exit.
+        `n_readers` is the number of processes blocking in `wait_for_frame`, each with its own `reader` index.
+        """
+        return cls(None, n_slots, frame_shape, dtype, _create=True,
+                   _wakeups=[mp.Semaphore(0) for _ in range(n_readers)])
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __reduce__(self):
+        return (self.__class__, (self.shm.name, self.n_slots, self.frame_shape, self.dtype.str, False, self._wakeups))
+
+    # ---------------------- Writer side ----------------------
+    def write(self, frame, ts, cam_ts=0.0, t_read_total=0.0, t_frameacq=0.0, t_getts=0.0, t_frameconv=0.0,
+              exposure_ns=0):
+        """
+        Publishes a frame and its metadata. Only one process may write to a ring.
+
+        Returns
+        ---
+        The id of the published frame
+        """
+        frame_id = self._next_id
+        slot = (frame_id - 1) % self.n_slots
+
+        self._seq[slot] = 2 * frame_id - 1
+        np.copyto(self._slots[slot], frame)
+        self._frame_id[slot] = frame_id
+        self._ts[slot] = ts
+        self._cam_ts[slot] = cam_ts
+        self._t_read_total[slot] = t_read_total
+        self._t_frameacq[slot] = t_frameacq
+        self._t_getts[slot] = t_getts
+        self._t_frameconv[slot] = t_frameconv
+        self._exposure_ns[slot] = exposure_ns
+        self._seq[slot] = 2 * frame_id
+
+        self._head[0] = frame_id
+        self._next_id = frame_id + 1
+        for wakeup in self._wakeups:
+            wakeup.release()
+        return frame_id
+
+    # ---------------------- Reader side ----------------------
+    def latest_id(self):
+        """
+        Id of the last published frame, 0 if nothing has been published yet
+        """
+        return int(self._head[0])
+
+    def wait_for_frame(self, last_id, timeout=None, reader=0):
+        """
+        Blocks until a frame newer than `last_id` is published, or `timeout` seconds have passed.
+
+        Parameters
+        ---
+        last_id: int
+            Last frame id seen by the caller
+
+        timeout: float, optional
+
+        reader: int, default=0
+            Index of the calling reader, below the `n_readers` of `create`. Two processes must never
+            wait with the same index.
+
+        Returns
+        ---
+        The id of the last published frame, which is still `last_id` (or older) on timeout
+        """
+        latest = int(self._head[0])
+        if latest > last_id:
+            return latest
+        end = None if timeout is None else time.perf_counter() + timeout
+        if not self._wakeups:
+            while int(self._head[0]) <= last_id and (end is None or time.perf_counter() < end):
+                pass
+            return int(self._head[0])
+
+        wakeup = self._wakeups[reader]
+        # drop the wakeups of the frames published while the reader was busy: they have been seen
+        while wakeup.acquire(False):
+            pass
+        while True:
+            # a frame published after the drain posts again, so it can not be missed
+            latest = int(self._head[0])
+            if latest > last_id:
+                return latest
+            remaining = None if end is None else end - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                return latest
+            wakeup.acquire(timeout=remaining)
+
+    def is_valid(self, frame_id):
+        """
+        True if `frame_id` is still stored, unmodified, in its slot.
+        Call it after using a view returned by `acquire` to know whether the view was torn.
+        """
+        slot = (frame_id - 1) % self.n_slots
+        return int(self._seq[slot]) == 2 * frame_id
+
+    def acquire(self, frame_id, meta_out=None):
+        """
+        Zero-copy access to a published frame.
+
+        Parameters
+        ---
+        frame_id: int
+            Id of the frame to access (typically `latest_id()`)
+
+        meta_out: np.ndarray of SLOT_META_DTYPE with shape (1,), optional
+            Preallocated record receiving the slot metadata, copied under the seqlock
+
+        Returns
+        ---
+        A read view on the frame in shared memory, or None if the frame is not available anymore.
+        The view is only guaranteed consistent if `is_valid(frame_id)` still holds after it has been
+        used; it must never be written to.
+        """
+        if frame_id <= 0:
+            return None
+        slot = (frame_id - 1) % self.n_slots
+        expected = 2 * frame_id
+        if int(self._seq[slot]) != expected:
+            return None
+        if meta_out is not None:
+            np.copyto(meta_out, self._meta_slots[slot])
+            if int(self._seq[slot]) != expected:
+                return None
+        return self._slots[slot]
+
+    def read(self, frame_id, out, meta_out=None):
+        """
+        Copies a published frame into a preallocated array.
+
+        Returns
+        ---
+        True if `out` (and `meta_out`) hold a consistent copy of the frame, False if it was overwritten
+        """
+        view = self.acquire(frame_id, meta_out)
+        if view is None:
+            return False
+        np.copyto(out, view)
+        return self.is_valid(frame_id)
+
+    def snapshot(self, last_id, out, ids_out=None, meta_out=None):
+        """
+        Copies the frames `last_id - len(out) + 1 ... last_id` into a preallocated array, oldest first.
+        Frames that were already overwritten are skipped, the copied ones are packed at the start of `out`.
+
+        Parameters
+        ---
+        last_id: int
+            Id of the most recent frame of the snapshot
+
+        out: np.ndarray of shape (n, *frame_shape)
+            Preallocated destination
+
+        ids_out: np.ndarray of shape (n,), optional
+            Receives the ids of the copied frames
+
+        meta_out: np.ndarray of SLOT_META_DTYPE with shape (n,), optional
+            Receives the metadata of the copied frames
+
+        Returns
+        ---
+        Number of frames copied
+        """
+        n = 0
+        for frame_id in range(max(1, last_id - len(out) + 1), last_id + 1):
+            if self.read(frame_id, out[n], None if meta_out is None else meta_out[n:n + 1]):
+                if ids_out is not None:
+                    ids_out[n] = frame_id
+                n += 1
+        return n
+
+    # ---------------------- Cleanup ----------------------
+    def close(self):
+        # Drop every view on the buffer first, otherwise SharedMemory.close() raises BufferError
+        self._head = self._meta = None
+        self._seq = self._frame_id = self._ts = self._cam_ts = None
+        self._t_read_total = self._t_frameacq = self._t_getts = self._t_frameconv = self._exposure_ns = None
+        self._meta_slots = []
+        self._slots = []
+        try:
+            self.shm.close()
+        except BufferError:
+            # a caller still holds a view from `acquire`; the mapping is released at process exit
+            pass
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class FrameCursor:
+    """
+    Reader position in a `FrameRing`: hands out the newest frame, each frame at most once, sleeping
+    until the producer publishes one.
+
+    Counters, exact over the run:
+    - `processed`: frames handed out
+    - `duplicate`: calls that found no new frame and had to wait, i.e. detections a polling loop
+      would have re-run on the frame it had just processed
+    - `skipped`: frames overwritten by newer ones before the reader was ready for them
+    - `stale`: frames dropped by the deadline policy
+
+    Parameters
+    ---
+    ring: FrameRing
+
+    deadline_ms: float, optional
+        Frames older than this (from their exposure when known, see `SLOT_META_DTYPE`) are dropped
+        instead of being handed out
+
+    timeout: float, default=0.1
+        Longest wait (s), so callers can check their stop event
+
+    reader: int, default=0
+        Wakeup index of the calling process (see `FrameRing.wait_for_frame`)
+
+    metrics: Metrics, optional
+        Registry the counters are added to, for the live metrics (see utils/metrics.py)
+    """
+    def __init__(self, ring, deadline_ms=None, timeout=0.1, reader=0, metrics=None):
+        self.ring = ring
+        self.reader = reader
+        self.deadline_ms = deadline_ms
+        self.timeout = timeout
+        self.meta = new_meta_record()
+        self._meta_ts = self.meta['ts']
+        self._meta_exposure = self.meta['exposure_ns']
+        self.last_id = 0
+        self.frame_age_ms = 0.0
+
+        counter = metrics.counter if metrics is not None else CounterMetric
+        self.processed = counter('cursor_frames', 'Frames handed out to detection')
+        self.duplicate = counter('duplicate_frames', 'Waits for a new frame (detections a polling loop would have repeated)')
+        self.skipped = counter('skipped_frames', 'Frames overwritten before detection was ready for them')
+        self.stale = counter('stale_frames', 'Frames dropped as older than the deadline')
+
+    def next_frame(self):
+        """
+        Waits for the next frame.
+
+        Returns
+        ---
+        `(frame_id, view)`, the view being a zero-copy `FrameRing.acquire` view (check `ring.is_valid(frame_id)`
+        after using it), or None on timeout. The frame metadata is in `self.meta` and its age when it was
+        handed out in `self.frame_age_ms`.
+        """
+        ring = self.ring
+        frame_id = ring.latest_id()
+        if frame_id <= self.last_id:
+            self.duplicate.inc()
+            frame_id = ring.wait_for_frame(self.last_id, self.timeout, self.reader)
+            if frame_id <= self.last_id:
+                return None
+
+        last_id = self.last_id
+        self.last_id = frame_id
+        if last_id and frame_id > last_id + 1:
+            self.skipped.inc(frame_id - last_id - 1)
+        frame = ring.acquire(frame_id, self.meta)
+        if frame is None:
+            self.skipped.inc()
+            return None
+
+        # age since the exposure when the camera clock is mapped, since the read otherwise
+        exposure_ns = int(self._meta_exposure[0])
+        t_origin = exposure_ns / NS_PER_S if exposure_ns else self._meta_ts[0]
+        self.frame_age_ms = (time.perf_counter() - t_origin) * 1000.0
+        if self.deadline_ms is not None and self.frame_age_ms > self.deadline_ms:
+            self.stale.inc()
+            return None
+
+        self.processed.inc()
+        return frame_id, frame
+
+    def stats(self):
+        return (f"processed {self.processed.value}, duplicate (waited) {self.duplicate.value}, "
+                f"skipped {self.skipped.value}, stale {self.stale.value}")
+
+
+def new_meta_record():
+    """
+    Preallocated metadata record to be passed as `meta_out` to `FrameRing.acquire` / `FrameRing.read`
+    """
+    return np.zeros(1, dtype=SLOT_META_DTYPE)
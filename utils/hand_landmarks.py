@@ -0,0 +1,126 @@
+import numpy as np
+
+"""
+NumPy container for hand detection results.
+
+`HandPoseDetector.detect_landmarks` fills one preallocated `HandLandmarks` per detector instead of
+building a protobuf landmark list per hand, so downstream code (tap detection, ROI tracking,
+calibration) can work on all the landmarks at once with vectorized NumPy.
+"""
+
+N_LANDMARKS = 21
+
+# Handedness codes
+UNKNOWN = -1
+LEFT = 0
+RIGHT = 1
+HANDEDNESS_CODES = {'left': LEFT, 'right': RIGHT}
+HANDEDNESS_LABELS = {LEFT: 'Left', RIGHT: 'Right', UNKNOWN: ''}
+
+
+class HandLandmarks:
+    """
+    Preallocated detection output, overwritten by every detection.
+
+    Attributes
+    ---
+    n: int
+        Number of hands detected; only the first `n` rows of the arrays are meaningful
+
+    landmarks: np.ndarray of shape (max_hands, 21, 3), float32
+        Landmarks (x, y, z) in full-frame normalized coordinates
+
+    handedness: np.ndarray of shape (max_hands,), int8
+        Handedness codes (LEFT, RIGHT or UNKNOWN)
+
+    scores: np.ndarray of shape (max_hands,), float32
+        Handedness scores
+    """
+    def __init__(self, max_hands=1):
+        self.n = 0
+        self.landmarks = np.zeros((max_hands, N_LANDMARKS, 3), dtype=np.float32)
+        self.handedness = np.full(max_hands, UNKNOWN, dtype=np.int8)
+        self.scores = np.zeros(max_hands, dtype=np.float32)
+
+    def fill(self, results, scale_x=1.0, offset_x=0.0, scale_y=1.0, offset_y=0.0):
+        """
+        Copies a MediaPipe `HandLandmarkerResult` into the arrays.
+        The optional affine mapping `x * scale + offset` maps landmarks normalized to a crop back to full-frame coordinates.
+        """
+        n = 0
+        max_hands = len(self.scores)
+        if results.hand_landmarks and results.handedness:
+            for hand_landmarks, handedness in zip(results.hand_landmarks, results.handedness):
+                if n == max_hands:
+                    break
+                self.landmarks[n] = [(lm.x, lm.y, lm.z) for lm in hand_landmarks]
+                category = handedness[0]
+                label = category.display_name or category.category_name or ''
+                self.handedness[n] = HANDEDNESS_CODES.get(label.lower(), UNKNOWN)
+                self.scores[n] = category.score
+                n += 1
+        self.n = n
+
+        if n and (scale_x != 1.0 or scale_y != 1.0 or offset_x or offset_y):
+            lms = self.landmarks[:n]
+            lms[:, :, 0] *= scale_x
+            lms[:, :, 0] += offset_x
+            lms[:, :, 1] *= scale_y
+            lms[:, :, 1] += offset_y
+            lms[:, :, 2] *= scale_x
+        return self
+
+    def copy(self):
+        """
+        Compact copy holding only the detected hands, e.g. to send the result to another process
+        """
+        out = HandLandmarks(max(self.n, 1))
+        out.n = self.n
+        out.landmarks[:self.n] = self.landmarks[:self.n]
+        out.handedness[:self.n] = self.handedness[:self.n]
+        out.scores[:self.n] = self.scores[:self.n]
+        return out
+
+    def to_dicts(self):
+        """
+        Compatibility layer: the `[{'label': ..., 'landmarks': ...}]` form returned by `HandPoseDetector.detect_hand_pose`
+        """
+        from mediapipe.framework.formats import landmark_pb2
+        from utils.hand_pose_detector import TempHandLandmarks
+
+        output = []
+        for i in range(self.n):
+            landmark_list = landmark_pb2.NormalizedLandmarkList()
+            for x, y, z in self.landmarks[i].tolist():
+                new_landmark = landmark_list.landmark.add()
+                new_landmark.x, new_landmark.y, new_landmark.z = x, y, z
+            output.append({"label": HANDEDNESS_LABELS[int(self.handedness[i])],
+                           "landmarks": TempHandLandmarks(list(landmark_list.landmark))})
+        return output
+
+
+def pinky_edge_y(hands, frame_height, out=None):
+    """
+    Average y-coordinate (pixels) of the pinky edge (landmarks 17 to 20) of every detected hand.
+
+    Parameters
+    ---
+    hands: HandLandmarks
+
+    frame_height: int
+
+    out: np.ndarray, optional
+        Preallocated destination of shape (>= hands.n,), so the hot path does not allocate
+
+    Returns
+    ---
+    Array of shape (hands.n,)
+    """
+    n = hands.n
+    if out is None or len(out) < n:
+        out = np.empty(n, dtype=np.float32)
+    else:
+        out = out[:n]
+    np.mean(hands.landmarks[:n, 17:21, 1], axis=1, out=out)
+    out *= frame_height
+    return out
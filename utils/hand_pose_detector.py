@@ -1,4 +1,5 @@
 import cv2
+import numpy as np
 import mediapipe as mp
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
@@ -7,15 +8,21 @@ from typing import List
 
 from mediapipe.tasks.python.components.containers import landmark as landmark_module
 
-from mediapipe.framework.formats import landmark_pb2
+from utils.bayer import BAYER_RG2RGB, even_roi
+from utils.hand_landmarks import HandLandmarks
 
-def convert_to_landmark_list(normalized_landmarks: List[landmark_module.NormalizedLandmark]) -> landmark_pb2.NormalizedLandmarkList:
+def convert_to_landmark_list(normalized_landmarks: List[landmark_module.NormalizedLandmark],
+                             scale_x=1.0, offset_x=0.0, scale_y=1.0, offset_y=0.0) -> landmark_pb2.NormalizedLandmarkList:
+    """
+    Converts landmarks to a protobuf landmark list.
+    The optional affine mapping `x * scale + offset` maps landmarks normalized to a crop back to full-frame normalized coordinates.
+    """
     landmark_list = landmark_pb2.NormalizedLandmarkList()
     for landmark in normalized_landmarks:
         new_landmark = landmark_list.landmark.add()
-        new_landmark.x = landmark.x
-        new_landmark.y = landmark.y
-        new_landmark.z = landmark.z
+        new_landmark.x = landmark.x * scale_x + offset_x
+        new_landmark.y = landmark.y * scale_y + offset_y
+        new_landmark.z = landmark.z * scale_x
     return landmark_list
 
 
@@ -53,15 +60,86 @@ class HandPoseDetector:
             min_tracking_confidence=0.5,
         )
         self.hands = vision.HandLandmarker.create_from_options(options)
+        self.output = HandLandmarks(n_hands)
+        self._rgb = None  # preallocated RGB storage, sized for the largest input (the full frame)
+
+    def _to_rgb(self, image, color):
+        """
+        Converts the detector input to RGB with a single conversion into the preallocated buffer.
+        RGB input is passed through untouched.
+
+        ROI crops change size almost every frame: they are converted into a contiguous (h, w, 3) view of the
+        start of the same storage, which is only reallocated for an input larger than any before.
+        """
+        if color == 'rgb':
+            return image
+        height, width = image.shape[:2]
+        size = height * width * 3
+        if self._rgb is None or self._rgb.size < size:
+            self._rgb = np.empty(size, dtype=np.uint8)
+        code = BAYER_RG2RGB if color == 'bayer_rg' else cv2.COLOR_BGR2RGB
+        return cv2.cvtColor(image, code, dst=self._rgb[:size].reshape(height, width, 3))
+
+    def _detect(self, image, roi, color=None):
+        """
+        Runs the model on the frame (or on the `roi` crop of it).
 
-    def detect_hand_pose(self, image): # image is pass by reference, any operations done to the frame inside this method will be reflected in method call origin.
-        # Convert the image to RGB
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        Returns
+        ---
+        The MediaPipe result and the (scale_x, offset_x, scale_y, offset_y) mapping from crop to full-frame coordinates
+        """
+        if color is None:
+            color = 'bayer_rg' if image.ndim == 2 else 'bgr'
+        height, width = image.shape[:2]
+        scale_x, offset_x, scale_y, offset_y = 1.0, 0.0, 1.0, 0.0
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            if color == 'bayer_rg':
+                # keep the RGGB phase of the mosaic
+                x0, y0, x1, y1 = even_roi(roi)
+                x1, y1 = min(x1, width), min(y1, height)
+            image = image[y0:y1, x0:x1]
+            scale_x, offset_x = (x1 - x0) / width, x0 / width
+            scale_y, offset_y = (y1 - y0) / height, y0 / height
+
+        image_rgb = self._to_rgb(image, color)
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image_rgb)
 
         # Process the image using MediaPipe Hands
         # results = self.hands.process(image_rgb)
         results = self.hands.detect(mp_image)
+        return results, (scale_x, offset_x, scale_y, offset_y)
+
+    def detect_landmarks(self, image, roi=None, color=None) -> HandLandmarks:
+        """
+        Detects hands on a frame and returns them as arrays.
+
+        Parameters
+        ---
+        image: np.ndarray
+            BGR frame (h, w, 3), RGB frame with `color='rgb'`, or raw BayerRG8 mosaic (h, w)
+
+        roi: tuple, optional
+            (x0, y0, x1, y1) crop in pixels (see utils/roi_tracker.py). Only the crop is converted and fed to the model;
+            landmarks are still returned in full-frame normalized coordinates
+
+        color: str, optional
+            'bgr', 'rgb' (no conversion) or 'bayer_rg' (demosaiced straight to RGB).
+            By default 2-D frames are Bayer mosaics and 3-channel frames are BGR
+
+        Returns
+        ---
+        The detector's preallocated `HandLandmarks` (`self.output`), overwritten by the next call
+        """
+        results, affine = self._detect(image, roi, color)
+        return self.output.fill(results, *affine)
+
+    def detect_hand_pose(self, image, roi=None, color=None): # image is pass by reference, any operations done to the frame inside this method will be reflected in method call origin.
+        """
+        Compatibility API: same detection as `detect_landmarks`, returned as a list of
+        `{'label': 'Left' | 'Right', 'landmarks': TempHandLandmarks}` dicts holding protobuf landmarks.
+        """
+        results, (scale_x, offset_x, scale_y, offset_y) = self._detect(image, roi, color)
 
         output = []
         if results.hand_landmarks and results.handedness:
@@ -70,7 +148,7 @@ class HandPoseDetector:
                 hand = {"label": None, "landmarks": None}
                 label = handedness[0].display_name
                 # Draw landmarks on the image
-                lms_list = list(convert_to_landmark_list(hand_landmarks).landmark)
+                lms_list = list(convert_to_landmark_list(hand_landmarks, scale_x, offset_x, scale_y, offset_y).landmark)
                 
                 # for landmark in lms_list:
                 #     x = int(landmark.x * image.shape[1])
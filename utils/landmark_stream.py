@@ -0,0 +1,202 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from utils.hand_landmarks import LEFT, RIGHT
+from utils.trigger_output import TriggerOutput, encode_osc_bundle, encode_osc_message
+
+"""
+Rate-controlled continuous landmark streaming over OSC, for gesture control in PureData.
+
+Besides the discrete `/trigger` taps, a few control parameters are computed from every detection
+and streamed per hand (`/hand/left/...`, `/hand/right/...`):
+- `tips`: x, y of the five fingertips (landmarks 4, 8, 12, 16, 20), normalized frame coordinates
+- `pinch`: thumb tip to index tip distance, relative to the palm length (wrist to middle finger base)
+- `height`: height (pixels) of the pinky edge above the calibrated reference line
+- `present`: 1 when the hand appears, 0 when it is lost (sent on change only)
+
+Sending every landmark at the camera rate would swamp the socket and PD's scheduler, so each
+parameter has its own maximum rate and deadband: it is sent when its period has elapsed AND it
+moved by more than the deadband since it was last sent, or when `keepalive_s` elapsed without a
+send (the receiver catches up after a lost datagram). All the messages due on a frame go out in
+one OSC bundle (a single message is sent bare), through the trigger output transports
+(utils/trigger_output.py). The configured rates bound the throughput; `LandmarkStream.stats()`
+reports the messages and bytes actually sent per second.
+
+Parameters are configured in config/streaming.json, e.g. `"pinch": {"rate": 100, "deadband": 0.02}`.
+"""
+
+DEFAULT_CONFIG_PATH = "config/streaming.json"
+STREAM_PARAMETERS = ('tips', 'pinch', 'height')
+FINGERTIPS = [4, 8, 12, 16, 20]
+HANDS = {LEFT: 'left', RIGHT: 'right'}
+SIZES = {'tips': 2 * len(FINGERTIPS), 'pinch': 1, 'height': 1}
+
+
+def load_stream_config(config_path=DEFAULT_CONFIG_PATH):
+    """
+    Streaming config: {'parameters': {name: {'rate', 'deadband'}}, 'keepalive_s', 'address_prefix'}
+    """
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path, "r") as cfg_file:
+            config = json.load(cfg_file)
+    parameters = config.get('parameters', {name: {} for name in STREAM_PARAMETERS})
+    unknown = set(parameters) - set(STREAM_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown stream parameter(s) {sorted(unknown)}, expected {STREAM_PARAMETERS}")
+    config['parameters'] = parameters
+    return config
+
+
+class LandmarkStream:
+    """
+    Per-parameter rate-limited, deadbanded streaming of hand control parameters.
+
+    Parameters
+    ---
+    y_line: float
+        Y-coordinate (pixels) of the reference line, for `height`
+
+    frame_shape: tuple
+        (height, width, ...) of the frames
+
+    parameters: dict
+        {name: {'rate': max sends per second (default 60), 'deadband': minimum change (default 0)}},
+        names among `STREAM_PARAMETERS`
+
+    targets: list of str
+        Receivers, see `utils.trigger_output.make_transport`
+
+    keepalive_s: float, default=1.0
+        Longest time without sending a parameter of a present hand, 0 to disable
+
+    address_prefix: str, default='/hand'
+
+    metrics: Metrics, optional
+        If set, `stream_messages` and `stream_bytes` counters are registered on it
+    """
+    def __init__(self, y_line, frame_shape, parameters, targets, keepalive_s=1.0, address_prefix='/hand',
+                 metrics=None):
+        self.y_line = float(y_line)
+        self.frame_height = frame_shape[0]
+        self.names = [name for name in STREAM_PARAMETERS if name in parameters]
+        self.period = {name: 1.0 / float(parameters[name].get('rate', 60.0)) for name in self.names}
+        self.deadband = {name: float(parameters[name].get('deadband', 0.0)) for name in self.names}
+        self.keepalive_s = keepalive_s
+        self.addresses = {(code, name): f"{address_prefix}/{side}/{name}"
+                          for code, side in HANDS.items() for name in self.names + ['present']}
+
+        # per hand code: current value, last sent value and time of every parameter
+        self.values = {code: {name: np.zeros(SIZES[name], dtype=np.float32) for name in self.names} for code in HANDS}
+        self.sent = {code: {name: np.full(SIZES[name], np.nan, dtype=np.float32) for name in self.names}
+                     for code in HANDS}
+        self.t_sent = {code: {name: -np.inf for name in self.names} for code in HANDS}
+        self.present = {code: False for code in HANDS}
+        self._edge = np.empty(1, dtype=np.float32)
+
+        self.output = TriggerOutput(targets)
+        self.n_messages = self.n_bytes = self.n_packets = 0
+        self.t_start = time.perf_counter()
+        self.m_messages = self.m_bytes = None
+        if metrics is not None:
+            self.m_messages = metrics.counter('stream_messages', 'OSC control messages streamed')
+            self.m_bytes = metrics.counter('stream_bytes', 'OSC control bytes streamed')
+
+    def max_throughput(self):
+        """
+        Upper bound of (messages/s, bytes/s) set by the configured rates, both hands streaming
+        (`present` changes aside)
+        """
+        messages = bytes_ = 0.0
+        for code in HANDS:
+            for name in self.names:
+                size = len(encode_osc_message(self.addresses[code, name], *([0.0] * SIZES[name])))
+                messages += 1.0 / self.period[name]
+                bytes_ += (size + 4) / self.period[name]  # + its size prefix inside a bundle
+        return messages, bytes_ + 16 * messages  # at worst, one bundle header per message
+
+    def _compute(self, hands, i, values):
+        landmarks = hands.landmarks[i]
+        if 'tips' in values:
+            values['tips'][:] = landmarks[FINGERTIPS, :2].ravel()
+        if 'pinch' in values:
+            palm = np.hypot(*(landmarks[9, :2] - landmarks[0, :2]))
+            pinch = np.hypot(*(landmarks[8, :2] - landmarks[4, :2]))
+            values['pinch'][0] = pinch / palm if palm > 0 else 0.0
+        if 'height' in values:
+            np.mean(landmarks[17:21, 1], keepdims=True, out=self._edge)
+            values['height'][0] = self.y_line - self._edge[0] * self.frame_height
+
+    def update(self, hands, t):
+        """
+        Streams the parameters of the hands detected on a frame.
+
+        Parameters
+        ---
+        hands: HandLandmarks
+
+        t: float
+            Frame timestamp (s), the rates are enforced on frame time
+
+        Returns
+        ---
+        Number of messages sent
+        """
+        messages = []
+        seen = set()
+        for i in range(hands.n):
+            code = int(hands.handedness[i])
+            if code not in HANDS or code in seen:
+                continue  # unknown handedness, or a second hand with the same label
+            seen.add(code)
+            if not self.present[code]:
+                self.present[code] = True
+                messages.append(encode_osc_message(self.addresses[code, 'present'], 1))
+            values, sent, t_sent = self.values[code], self.sent[code], self.t_sent[code]
+            self._compute(hands, i, values)
+            for name in self.names:
+                elapsed = t - t_sent[name]
+                if elapsed < self.period[name]:
+                    continue
+                value = values[name]
+                moved = not (np.abs(value - sent[name]) <= self.deadband[name]).all()  # NaN: never sent
+                if moved or (self.keepalive_s and elapsed >= self.keepalive_s):
+                    messages.append(encode_osc_message(self.addresses[code, name], *value.tolist()))
+                    sent[name][:] = value
+                    t_sent[name] = t
+        for code in HANDS:
+            if self.present[code] and code not in seen:
+                self.present[code] = False
+                messages.append(encode_osc_message(self.addresses[code, 'present'], 0))
+                for name in self.names:
+                    self.sent[code][name][:] = np.nan  # resent in full when the hand comes back
+                    self.t_sent[code][name] = -np.inf
+
+        if not messages:
+            return 0
+        data = messages[0] if len(messages) == 1 else encode_osc_bundle(messages)
+        self.output.send_raw(data)
+        self.n_messages += len(messages)
+        self.n_bytes += len(data)
+        self.n_packets += 1
+        if self.m_messages is not None:
+            self.m_messages.inc(len(messages))
+            self.m_bytes.inc(len(data))
+        return len(messages)
+
+    def stats(self):
+        elapsed = max(time.perf_counter() - self.t_start, 1e-9)
+        return (f"{self.n_messages} messages in {self.n_packets} packets, {self.n_bytes / 1024:.1f} kB "
+                f"({self.n_messages / elapsed:.0f} msg/s, {self.n_bytes / elapsed / 1024:.1f} kB/s)")
+
+    def close(self):
+        if self.output.dropped:
+            print(f"Landmark stream: {self.output.dropped} packet(s) dropped")
+        self.output.close()
+
+    def __repr__(self):
+        rates = ", ".join(f"{name} {1.0 / self.period[name]:.0f} Hz / {self.deadband[name]:g}" for name in self.names)
+        return f"LandmarkStream({rates} -> {self.output})"
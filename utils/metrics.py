@@ -0,0 +1,291 @@
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+"""
+Live rolling metrics shared by latency_mp.py and log_serial.py.
+
+The hot path only stores a float in a preallocated list (`LatencyMetric.record`) or increments an
+integer (`CounterMetric.inc`), ~0.2 us each. A background collector thread picks the new samples up
+every `slice_s` seconds and bins them into HDR-style log-linear histograms (constant relative
+precision, 1% by default): one for the whole run and one per time slice, from which rolling
+p50/p95/p99 are computed over fixed windows (10 s and 60 s by default). Counters are turned into
+rates the same way (e.g. effective FPS).
+
+The metrics are exposed as plain text (Prometheus exposition format) on a local HTTP endpoint and
+as a periodic one-line terminal summary.
+"""
+
+DEFAULT_WINDOWS = (10, 60)
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    """
+    Log-linear histogram with a constant relative precision, HdrHistogram style.
+
+    Parameters
+    ---
+    lowest, highest: float
+        Range of the tracked values; values outside are clamped to the first/last bucket
+
+    precision: float, default=0.01
+        Relative bucket width
+    """
+    def __init__(self, lowest=1e-3, highest=1e5, precision=0.01):
+        self.lowest = lowest
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self.n_buckets = int(math.ceil(math.log(highest / lowest) / self._log_base)) + 1
+        self.counts = np.zeros(self.n_buckets, dtype=np.int64)
+        self.total = 0
+        self.max = 0.0
+
+    def bucket_counts(self, values):
+        """
+        Bucket counts of `values`, to be added to `counts` of any histogram with the same layout
+        """
+        values = np.asarray(values, dtype=np.float64)
+        idx = np.floor(np.log(np.maximum(values, self.lowest) / self.lowest) / self._log_base).astype(np.int64)
+        np.clip(idx, 0, self.n_buckets - 1, out=idx)
+        return np.bincount(idx, minlength=self.n_buckets)
+
+    def add_counts(self, counts, max_value=0.0):
+        self.counts += counts
+        self.total += int(counts.sum())
+        self.max = max(self.max, max_value)
+
+    def bucket_value(self, idx):
+        """
+        Upper edge of a bucket
+        """
+        return self.lowest * (1.0 + self.precision) ** (idx + 1)
+
+    def percentiles(self, ps=PERCENTILES, counts=None):
+        """
+        Percentiles of the histogram, or of other `counts` with the same layout (NaN when empty)
+        """
+        counts = self.counts if counts is None else counts
+        total = counts.sum()
+        if total == 0:
+            return [float('nan')] * len(ps)
+        cum = np.cumsum(counts)
+        return [self.bucket_value(int(np.searchsorted(cum, total * p / 100.0))) for p in ps]
+
+
+class LatencyMetric:
+    """
+    Latency samples (e.g. ms). `record` is the only method called on the hot path.
+    """
+    def __init__(self, name, help='', unit='ms', capacity=8192, max_slices=60):
+        self.name = name
+        self.help = help
+        self.unit = unit
+        self._mask = (1 << max(1, capacity - 1).bit_length()) - 1  # capacity rounded up to a power of 2
+        self._buf = [0.0] * (self._mask + 1)
+        self._count = 0
+        self._read = 0
+        self.lost = 0  # samples overwritten before the collector picked them up
+        self.hist = Histogram()
+        self.slices = deque(maxlen=max_slices)
+
+    def record(self, value):
+        self._buf[self._count & self._mask] = value
+        self._count += 1
+
+    def collect(self):
+        count = self._count
+        start = self._read
+        if count - start > self._mask + 1:
+            self.lost += count - start - self._mask - 1
+            start = count - self._mask - 1
+        buf, mask = self._buf, self._mask
+        values = [buf[i & mask] for i in range(start, count)]
+        self._read = count
+        counts = self.hist.bucket_counts(values) if values else np.zeros(self.hist.n_buckets, dtype=np.int64)
+        self.hist.add_counts(counts, max(values) if values else 0.0)
+        self.slices.append(counts)
+
+    def window_percentiles(self, n_slices, ps=PERCENTILES):
+        if not self.slices:
+            return [float('nan')] * len(ps)
+        recent = list(self.slices)[-n_slices:]
+        return self.hist.percentiles(ps, np.sum(recent, axis=0))
+
+
+class CounterMetric:
+    """
+    Monotonic counter (e.g. frames, dropped frames). `inc` is the only method called on the hot path.
+    """
+    def __init__(self, name, help='', max_slices=60):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._collected = 0
+        self.slices = deque(maxlen=max_slices)
+
+    def inc(self, n=1):
+        self.value += n
+
+    def collect(self):
+        value = self.value
+        self.slices.append(value - self._collected)
+        self._collected = value
+
+    def window_rate(self, n_slices, slice_s):
+        recent = list(self.slices)[-n_slices:]
+        return sum(recent) / (len(recent) * slice_s) if recent else 0.0
+
+
+class Metrics:
+    """
+    Registry of the metrics of one process, with the collector thread, HTTP endpoint and terminal summary.
+
+    Parameters
+    ---
+    prefix: str
+        Prefix of the exported metric names, e.g. 'latency_mp'
+
+    windows: tuple of int, default=DEFAULT_WINDOWS
+        Rolling windows (s) of the percentiles and rates
+
+    slice_s: float, default=1.0
+        Collection period (s), i.e. the granularity of the rolling windows
+    """
+    def __init__(self, prefix, windows=DEFAULT_WINDOWS, slice_s=1.0):
+        self.prefix = prefix
+        self.windows = tuple(windows)
+        self.slice_s = slice_s
+        self._max_slices = int(math.ceil(max(self.windows) / slice_s))
+        self.latencies = []
+        self.counters = []
+        self._lock = threading.Lock()  # collector vs HTTP thread, never taken on the hot path
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+        self.t_start = time.perf_counter()
+
+    def latency(self, name, help='', unit='ms'):
+        metric = LatencyMetric(name, help, unit, max_slices=self._max_slices)
+        self.latencies.append(metric)
+        return metric
+
+    def counter(self, name, help=''):
+        metric = CounterMetric(name, help, max_slices=self._max_slices)
+        self.counters.append(metric)
+        return metric
+
+    # ---------------------- Background side ----------------------
+    def start(self, http_port=None, summary_interval=None):
+        """
+        Starts the collector thread, and optionally the HTTP endpoint (127.0.0.1:`http_port`)
+        and the terminal summary every `summary_interval` seconds
+        """
+        if http_port:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = metrics.text().encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                self._server = ThreadingHTTPServer(('127.0.0.1', http_port), Handler)
+            except OSError as e:
+                # e.g. port already taken by another run: the measurement goes on without the endpoint
+                print(f"WARNING: metrics endpoint not started on 127.0.0.1:{http_port} ({e})")
+            else:
+                self._server.daemon_threads = True
+                threading.Thread(target=self._server.serve_forever, name=f'{self.prefix}-metrics-http',
+                                 daemon=True).start()
+                print(f"Metrics: http://127.0.0.1:{http_port}/metrics")
+
+        self._thread = threading.Thread(target=self._run, args=(summary_interval,),
+                                        name=f'{self.prefix}-metrics', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, summary_interval):
+        t_summary = time.perf_counter()
+        while not self._stop.wait(self.slice_s):
+            self.collect()
+            now = time.perf_counter()
+            if summary_interval and now - t_summary >= summary_interval:
+                t_summary = now
+                print(self.summary())
+
+    def collect(self):
+        with self._lock:
+            for metric in self.latencies + self.counters:
+                metric.collect()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # ---------------------- Reports ----------------------
+    def summary(self):
+        """
+        One-line summary over the shortest window
+        """
+        window = self.windows[0]
+        n = int(round(window / self.slice_s))
+        parts = []
+        with self._lock:
+            for c in self.counters:
+                parts.append(f"{c.name} {c.window_rate(n, self.slice_s):.1f}/s ({c.value})")
+            for m in self.latencies:
+                p50, p95, p99 = m.window_percentiles(n)
+                parts.append(f"{m.name} p50 {p50:.2f} p95 {p95:.2f} p99 {p99:.2f} {m.unit}")
+        return f"[metrics {window}s] " + " | ".join(parts)
+
+    def text(self):
+        """
+        Prometheus text exposition of every metric: counters, rates and rolling/overall percentiles
+        """
+        lines = []
+        uptime = time.perf_counter() - self.t_start
+        lines.append(f"# TYPE {self.prefix}_uptime_seconds gauge")
+        lines.append(f"{self.prefix}_uptime_seconds {uptime:.3f}")
+        with self._lock:
+            for c in self.counters:
+                name = f"{self.prefix}_{c.name}"
+                if c.help:
+                    lines.append(f"# HELP {name}_total {c.help}")
+                lines.append(f"# TYPE {name}_total counter")
+                lines.append(f"{name}_total {c.value}")
+                lines.append(f"# TYPE {name}_rate gauge")
+                for window in self.windows:
+                    rate = c.window_rate(int(round(window / self.slice_s)), self.slice_s)
+                    lines.append(f'{name}_rate{{window="{window}s"}} {rate:.3f}')
+            for m in self.latencies:
+                name = f"{self.prefix}_{m.name}_{m.unit}"
+                if m.help:
+                    lines.append(f"# HELP {name} {m.help}")
+                lines.append(f"# TYPE {name} summary")
+                for window in self.windows:
+                    values = m.window_percentiles(int(round(window / self.slice_s)))
+                    for p, v in zip(PERCENTILES, values):
+                        lines.append(f'{name}{{window="{window}s",quantile="{p / 100:g}"}} {v:.4f}')
+                for p, v in zip(PERCENTILES, m.hist.percentiles()):
+                    lines.append(f'{name}{{window="run",quantile="{p / 100:g}"}} {v:.4f}')
+                lines.append(f"{name}_count {m.hist.total}")
+                lines.append(f"{name}_max {m.hist.max:.4f}")
+                if m.lost:
+                    lines.append(f"{name}_lost {m.lost}")
+        return "\n".join(lines) + "\n"
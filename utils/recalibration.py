@@ -0,0 +1,235 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from utils.hand_landmarks import RIGHT
+from utils.reference_line import line_distances, pinky_edge_points
+
+"""
+Atomic calibration writes and online drift recalibration.
+
+`save_calibration` / `update_calibration` write config/calibration.json through a temporary file in
+the same folder and an atomic rename, so a process starting meanwhile (or a crash) never sees a
+truncated file.
+
+`OnlineRecalibrator` keeps the resting-position statistics (`mean_offset`, `std_offset`: distance
+of the pinky edge to the reference line while the hand rests on the surface) up to date while the
+pipeline runs, instead of stopping it for calibration.py's noise sampling:
+- a frame counts as "at rest" when the smoothed distance of the tracked hand's pinky edge to the
+  line has moved by less than `still_px` per frame for `min_still_frames` consecutive frames (the
+  smoothing keeps the landmark jitter from breaking the stillness), close to the line (within 6 std
+  of the current mean), so taps, approaches and a hand hovering above are left out
+- rest samples update an exponentially weighted mean and variance (about the last `window`
+  samples), a few float operations per frame on the detection path
+- every `write_interval_s`, when enough new samples came in, the estimate is handed to a
+  background thread that updates the calibration file; the detection path never waits for the disk
+- a mean further than `max_drift_px` from the starting calibration is not applied (the camera or the
+  foil probably moved: rerun calibration.py to find the line again)
+"""
+
+DEFAULT_CALIBRATION_PATH = 'config/calibration.json'
+
+
+def load_calibration_file(calib_file=DEFAULT_CALIBRATION_PATH):
+    if not os.path.exists(calib_file):
+        return {}
+    with open(calib_file, 'r') as fp:
+        return json.load(fp)
+
+
+def save_calibration(data, calib_file=DEFAULT_CALIBRATION_PATH):
+    """
+    Writes the calibration atomically: temporary file in the same folder, fsync, rename over the old one
+    """
+    folder = os.path.dirname(os.path.abspath(calib_file))
+    fd, tmp_path = tempfile.mkstemp(prefix='.calibration_', suffix='.json', dir=folder)
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(data, fp, indent=2 if data.get('zones') else None)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, calib_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def update_calibration(fields, calib_file=DEFAULT_CALIBRATION_PATH):
+    """
+    Sets some fields of the calibration file, keeping the others (line, zones, ...)
+    """
+    data = load_calibration_file(calib_file)
+    data.update(fields)
+    save_calibration(data, calib_file)
+    return data
+
+
+class OnlineRecalibrator:
+    """
+    Incremental estimate of the resting-position mean/std, written back to the calibration file.
+
+    Parameters
+    ---
+    line: list
+        Reference line end points [[x0, y0], [x1, y1]] (pixels)
+
+    frame_shape: tuple
+        (height, width, ...) of the frames
+
+    mean, std: float
+        Starting resting statistics (the calibration file's `mean_offset`, `std_offset`)
+
+    calib_file: str, default=DEFAULT_CALIBRATION_PATH
+
+    window: int, default=2000
+        Rest samples weighted in the estimate (exponential forgetting)
+
+    min_still_frames: int, default=25
+        Consecutive still frames before the samples count as rest
+
+    still_px: float, default=1.0
+        Largest frame-to-frame motion (pixels) of the smoothed distance of a still pinky edge
+
+    smoothing: float, default=0.2
+        Weight of the new frame in the smoothed distance
+
+    min_samples: int, default=500
+        New rest samples required before an update is written
+
+    write_interval_s: float, default=30.0
+        Shortest time between two writes, on frame time
+
+    max_drift_px: float, default=10.0
+        Largest accepted distance between the updated and the starting mean
+
+    skip_hand: int, default=RIGHT
+        Handedness code of the hand to ignore, as `TapDetector`
+    """
+    def __init__(self, line, frame_shape, mean, std, calib_file=DEFAULT_CALIBRATION_PATH, window=2000,
+                 min_still_frames=25, still_px=1.0, smoothing=0.2, min_samples=500, write_interval_s=30.0,
+                 max_drift_px=10.0, skip_hand=RIGHT, max_hands=2):
+        self.line = line
+        self.frame_shape = frame_shape
+        self.calib_file = calib_file
+        self.alpha = 1.0 / window
+        self.min_still_frames = min_still_frames
+        self.still_px = still_px
+        self.smoothing = smoothing
+        self.min_samples = min_samples
+        self.write_interval_s = write_interval_s
+        self.max_drift_px = max_drift_px
+        self.skip_hand = skip_hand
+
+        self.initial_mean = float(mean)
+        self.mean = float(mean)
+        self.var = float(std) ** 2
+        self.n_samples = 0
+        self.n_new = 0
+        self.n_rejected = 0
+        self.n_writes = 0
+        self.still_frames = 0
+        self.smooth_dist = None
+        self.drift_warned = False
+        self.t_write = None
+
+        self._points = np.empty((max_hands, 2), dtype=np.float32)
+        self._dist = np.empty(max_hands, dtype=np.float32)
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='recalibration-writer', daemon=True)
+        self._writer.start()
+
+    @property
+    def std(self):
+        return self.var ** 0.5
+
+    def update(self, hands, t=None):
+        """
+        Feeds the detection result of one frame.
+
+        Parameters
+        ---
+        hands: HandLandmarks
+
+        t: float, optional
+            Frame timestamp (s), default: now
+
+        Returns
+        ---
+        (mean, std) when a new estimate was published (and queued for writing), None otherwise
+        """
+        n = hands.n
+        dist = None
+        if n:
+            distances = line_distances(pinky_edge_points(hands, self.frame_shape, self._points), self.line, self._dist)
+            for i in range(n):
+                # the eligible hand closest to the line, as the tap logic sees it
+                if hands.handedness[i] != self.skip_hand and (dist is None or distances[i] < dist):
+                    dist = float(distances[i])
+        if dist is None:
+            self.still_frames = 0
+            self.smooth_dist = None
+            return None
+
+        if self.smooth_dist is None:
+            self.smooth_dist = dist
+        else:
+            step = self.smoothing * (dist - self.smooth_dist)
+            self.smooth_dist += step
+            self.still_frames = self.still_frames + 1 if abs(step) < self.still_px else 0
+        if self.still_frames < self.min_still_frames:
+            return None
+        if abs(dist - self.mean) > 6.0 * max(self.std, self.still_px):
+            self.n_rejected += 1
+            return None
+
+        # exponentially weighted mean and variance
+        delta = dist - self.mean
+        self.mean += self.alpha * delta
+        self.var = (1.0 - self.alpha) * (self.var + self.alpha * delta * delta)
+        self.n_samples += 1
+        self.n_new += 1
+
+        now = time.perf_counter() if t is None else t
+        if self.t_write is None:
+            self.t_write = now
+        if self.n_new < self.min_samples or now - self.t_write < self.write_interval_s:
+            return None
+        self.n_new = 0
+        self.t_write = now
+        if abs(self.mean - self.initial_mean) > self.max_drift_px:
+            if not self.drift_warned:
+                print(f"[recalibration] resting offset drifted by {self.mean - self.initial_mean:+.1f} px, "
+                      f"not applied: rerun calibration.py to find the reference line again")
+                self.drift_warned = True
+            return None
+        self._writes.put((self.mean, self.std, self.n_samples))
+        return self.mean, self.std
+
+    def _write_loop(self):
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            mean, std, n_samples = item
+            try:
+                update_calibration({'mean_offset': mean, 'std_offset': std,
+                                    'recalibrated_at': datetime.now().isoformat(timespec='seconds'),
+                                    'recalibration_samples': n_samples}, self.calib_file)
+                self.n_writes += 1
+            except (OSError, ValueError) as e:
+                print(f"[recalibration] failed to update {self.calib_file}: {e}")
+
+    def close(self):
+        self._writes.put(None)
+        self._writer.join()
+
+    def __repr__(self):
+        return (f"OnlineRecalibrator(mean {self.mean:.2f} px, std {self.std:.2f} px, {self.n_samples} rest samples, "
+                f"{self.n_rejected} rejected, {self.n_writes} writes)")
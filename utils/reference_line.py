@@ -0,0 +1,167 @@
+import json
+
+import cv2
+import numpy as np
+
+"""
+Reference line geometry and automatic detection of the foil edge.
+
+The reference line is stored in config/calibration.json as `y_line` (its y at the center of the
+frame, used by the horizontal-line code paths) and, when it was fitted or clicked on two points,
+as `line`: its end points [[0, y0], [width - 1, y1]], so it may be tilted.
+
+`detect_reference_line` finds it on a calibration frame without clicks:
+- Canny edges of the (blurred) grey frame, optionally restricted to a band of rows
+- probabilistic Hough segments at most `max_tilt_deg` from horizontal and longer than a fraction of
+  the frame width are the candidates
+- among the candidate lines well supported by edge pixels, the top one (the foil strip has two
+  edges, the hand rests above it) or the bottom one, or the most supported one, is kept, and a
+  robust (Huber) line fit on its supporting pixels gives the sub-pixel line
+"""
+
+EDGES = ('top', 'bottom', 'strongest')
+
+PINKY_EDGE = slice(17, 21)
+
+
+def line_through(p0, p1, width):
+    """
+    End points at x=0 and x=width-1 of the line through p0 and p1 (not vertical)
+    """
+    (x0, y0), (x1, y1) = p0, p1
+    slope = (y1 - y0) / (x1 - x0)
+    return [[0.0, y0 - slope * x0], [float(width - 1), y0 + slope * (width - 1 - x0)]]
+
+
+def line_y_at(line, x):
+    (x0, y0), (x1, y1) = line
+    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+
+def line_angle_deg(line):
+    (x0, y0), (x1, y1) = line
+    return float(np.degrees(np.arctan2(y1 - y0, x1 - x0)))
+
+
+def load_reference_line(frame_width, calib_file='config/calibration.json'):
+    """
+    Reference line of the calibration file as end points, horizontal at `y_line` when no `line` is stored
+    """
+    with open(calib_file, 'r') as fp:
+        data = json.load(fp)
+    if data.get('line'):
+        return data['line']
+    return [[0.0, float(data['y_line'])], [float(frame_width - 1), float(data['y_line'])]]
+
+
+def is_tilted(line, tolerance_px=0.5):
+    return abs(line[1][1] - line[0][1]) > tolerance_px
+
+
+def line_distances(points, line, out=None):
+    """
+    Perpendicular distance (pixels) of (n, 2) points to the line
+    """
+    (x0, y0), (x1, y1) = line
+    dx, dy = x1 - x0, y1 - y0
+    norm = np.hypot(dx, dy)
+    if out is None:
+        out = np.empty(len(points), dtype=np.float32)
+    else:
+        out = out[:len(points)]
+    # |cross(direction, point - p0)| / |direction|
+    np.multiply(points[:, 1] - y0, dx / norm, out=out)
+    out -= (points[:, 0] - x0) * (dy / norm)
+    np.abs(out, out=out)
+    return out
+
+
+def pinky_edge_points(hands, frame_shape, out=None):
+    """
+    Pinky edge point (mean of landmarks 17 to 20, pixels) of every detected hand, shape (hands.n, 2)
+    """
+    n = hands.n
+    if out is None:
+        out = np.empty((n, 2), dtype=np.float32)
+    else:
+        out = out[:n]
+    np.mean(hands.landmarks[:n, PINKY_EDGE, :2], axis=1, out=out)
+    out[:, 0] *= frame_shape[1]
+    out[:, 1] *= frame_shape[0]
+    return out
+
+
+def detect_reference_line(frame, y_range=None, edge='top', max_tilt_deg=20.0, min_length=0.3, support_px=2.0,
+                          min_support=0.5, canny_thresholds=(50, 150)):
+    """
+    Finds the dominant near-horizontal straight edge of a frame (the foil edge).
+
+    Parameters
+    ---
+    frame: np.ndarray
+        BGR (h, w, 3) or grey (h, w) calibration frame, without hand in the search band
+
+    y_range: (int, int), optional
+        Rows searched, default: the whole frame
+
+    edge: str, default='top'
+        Line kept among the well-supported candidates: 'top', 'bottom' or 'strongest'
+
+    max_tilt_deg: float, default=20.0
+        Largest accepted angle to the horizontal
+
+    min_length: float, default=0.3
+        Shortest accepted Hough segment, as a fraction of the frame width
+
+    support_px: float, default=2.0
+        Distance (pixels) within which an edge pixel supports a line
+
+    min_support: float, default=0.5
+        Support of a candidate, relative to the most supported one, for it to count as well supported
+
+    Returns
+    ---
+    (line end points [[0, y0], [w - 1, y1]], number of supporting edge pixels, RMS residual in pixels),
+    or None when no line is found
+    """
+    grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    height, width = grey.shape
+    edges = cv2.Canny(cv2.GaussianBlur(grey, (5, 5), 0), *canny_thresholds)
+    if y_range is not None:
+        y0, y1 = max(0, int(y_range[0])), min(height, int(y_range[1]))
+        edges[:y0] = 0
+        edges[y1:] = 0
+
+    segments = cv2.HoughLinesP(edges, 1, np.pi / 360, threshold=max(20, int(0.1 * width)),
+                               minLineLength=int(min_length * width), maxLineGap=max(5, width // 50))
+    if segments is None:
+        return None
+    segments = segments.reshape(-1, 4).astype(np.float64)
+    dx, dy = segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]
+    tilt = np.degrees(np.abs(np.arctan2(dy, np.abs(dx))))
+    segments = segments[(tilt <= max_tilt_deg) & (dx != 0)]
+    if len(segments) == 0:
+        return None
+
+    if edge not in EDGES:
+        raise ValueError(f"Unknown edge {edge!r}, expected one of {EDGES}")
+    ys, xs = np.nonzero(edges)
+    points = np.column_stack([xs, ys]).astype(np.float32)
+    # the longest segments; the same edge is usually found several times
+    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    candidates = [line_through((x0, y0), (x1, y1), width) for x0, y0, x1, y1 in segments[np.argsort(-lengths)[:20]]]
+    support = np.array([np.count_nonzero(line_distances(points, line) <= support_px) for line in candidates])
+    if edge == 'strongest':
+        best = candidates[int(np.argmax(support))]
+    else:
+        kept = [line for line, s in zip(candidates, support) if s >= min_support * support.max()]
+        center_y = [line_y_at(line, width / 2) for line in kept]
+        best = kept[int(np.argmin(center_y) if edge == 'top' else np.argmax(center_y))]
+
+    inliers = points[line_distances(points, best) <= support_px]
+    vx, vy, cx, cy = cv2.fitLine(inliers, cv2.DIST_HUBER, 0, 0.01, 0.01).ravel()
+    if abs(vx) < 1e-6:
+        return None
+    line = [[float(x), float(y)] for x, y in line_through((cx, cy), (cx + vx, cy + vy), width)]
+    residuals = line_distances(inliers, line)
+    return line, len(inliers), float(np.sqrt(np.mean(residuals ** 2)))
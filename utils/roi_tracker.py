@@ -0,0 +1,89 @@
+"""
+Region-of-interest tracking for the hand pose detector.
+
+Only a band around the calibrated reference line matters for tap detection. Instead of feeding
+the full frame to MediaPipe, the detector is given the bounding box of the hand found on the
+previous frame, padded and clamped to that band. Smaller inputs make both the color conversion
+and the inference cheaper. When no hand is found in the ROI, tracking is lost and the next frame
+is processed in full again.
+"""
+
+
+class RoiTracker:
+    """
+    Tracks the hand bounding box between frames and proposes the crop for the next detection.
+
+    Parameters
+    ---
+    frame_shape: tuple
+        (height, width, ...) of the full frames
+
+    y_line: int
+        Y-coordinate (pixels) of the calibrated reference line
+
+    band_above: int, default=320
+        How far (pixels) above the reference line the ROI may extend. It must leave room for a whole hand,
+        the landmark model needs it to find the hand
+
+    band_below: int, default=60
+        How far (pixels) below the reference line the ROI may extend
+
+    pad: float, default=0.3
+        Padding added on each side of the hand box, as a fraction of the box size, to absorb motion between frames
+
+    min_size: int, default=192
+        Minimum ROI width and height (pixels); palm detection degrades on tiny crops
+    """
+    def __init__(self, frame_shape, y_line, band_above=320, band_below=60, pad=0.3, min_size=192):
+        self.height, self.width = frame_shape[0], frame_shape[1]
+        self.band_top = max(0, int(y_line) - band_above)
+        self.band_bottom = min(self.height, int(y_line) + band_below)
+        self.pad = pad
+        self.min_size = min_size
+        self._box = None  # last hand box in pixels: (x0, y0, x1, y1)
+        self.n_tracked = 0
+        self.n_lost = 0
+
+    def roi(self):
+        """
+        Crop (x0, y0, x1, y1) in pixels for the next detection, or None to process the full frame
+        """
+        if self._box is None:
+            return None
+        x0, y0, x1, y1 = self._box
+        pad_x = (x1 - x0) * self.pad
+        pad_y = (y1 - y0) * self.pad
+        x0, x1 = self._grow(x0 - pad_x, x1 + pad_x, 0, self.width)
+        y0, y1 = self._grow(max(y0 - pad_y, self.band_top), min(y1 + pad_y, self.band_bottom),
+                            self.band_top, self.band_bottom)
+        return x0, y0, x1, y1
+
+    def _grow(self, lo, hi, lower, upper):
+        """
+        Enforces the minimum size around the center of [lo, hi], within [lower, upper]
+        """
+        size = min(max(hi - lo, self.min_size), upper - lower)
+        center = (lo + hi) / 2.0
+        lo = int(min(max(center - size / 2.0, lower), upper - size))
+        return lo, int(lo + size)
+
+    def update(self, hands):
+        """
+        Updates the tracked box from the hands detected on the last frame.
+
+        Parameters
+        ---
+        hands: HandLandmarks
+            Detection result, landmarks in full-frame normalized coordinates
+        """
+        if hands.n == 0:
+            if self._box is not None:
+                self.n_lost += 1
+            self._box = None
+            return
+
+        pts = hands.landmarks[:hands.n, :, :2].reshape(-1, 2)
+        (x0, y0), (x1, y1) = pts.min(axis=0), pts.max(axis=0)
+        self._box = (float(x0) * self.width, float(y0) * self.height,
+                     float(x1) * self.width, float(y1) * self.height)
+        self.n_tracked += 1
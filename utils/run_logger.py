@@ -0,0 +1,298 @@
+import csv
+import json
+import os
+import socket
+import struct
+import threading
+from collections import deque
+
+import numpy as np
+
+"""
+Background run logger shared by latency_mp.py and log_serial.py.
+
+The measurement loops only append a row to an in-memory queue (`RunLogger.log`, a `collections.deque`
+append, no lock and no I/O). A writer thread wakes up periodically, drains the queue and writes the
+rows in batches to one or several sinks:
+- CSV table (`<name>.csv`), the format consumed by data_cleanup/ and plotting/
+- columnar binary store (`<name>_columns/`): one `.npy` file per column, readable with
+  `np.load(path, mmap_mode='r')` even while the run is in progress (utils/session_store.py)
+- text log (`log.txt` style lines)
+- local UDP stream (`stream_to` entry of the experiment config): each batch sent as JSON datagrams,
+  consumed live by data_cleanup/stream_join.py
+
+The queue is bounded: if the writer falls behind by more than `max_pending` rows, new rows are dropped
+and counted rather than growing memory. `close()` drains everything still queued.
+"""
+
+DEFAULT_CONFIG_PATH = "config/log_config.json"
+LOG_FORMATS = ('csv', 'columnar')
+NPY_HEADER_SIZE = 128  # fixed .npy header size, so the row count can be rewritten in place
+COLUMNS_FILE = 'columns.json'  # column order of a columnar table
+STREAM_ROWS_PER_DATAGRAM = 100  # ~30 KB per tableB datagram, under the UDP size limit
+
+
+def load_log_formats(config_path=DEFAULT_CONFIG_PATH):
+    """
+    Output formats of the run tables, from the `log_formats` entry of the experiment config (default: both)
+    """
+    formats = list(LOG_FORMATS)
+    if os.path.exists(config_path):
+        with open(config_path, "r") as cfg_file:
+            formats = json.load(cfg_file).get('log_formats', formats)
+    if isinstance(formats, str):
+        formats = [formats]
+    unknown = set(formats) - set(LOG_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown log format(s) {sorted(unknown)}, expected {LOG_FORMATS}")
+    return tuple(formats)
+
+
+def parse_address(address):
+    """
+    (host, port) of a 'host:port' string, host defaulting to 127.0.0.1 (':9210' or '9210')
+    """
+    host, _, port = str(address).rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def load_stream_address(config_path=DEFAULT_CONFIG_PATH):
+    """
+    (host, port) receiving the rows of the run tables, from the `stream_to` entry of the experiment
+    config ('host:port'), None if absent
+    """
+    if not os.path.exists(config_path):
+        return None
+    with open(config_path, "r") as cfg_file:
+        address = json.load(cfg_file).get('stream_to')
+    return parse_address(address) if address else None
+
+
+# ---------------------- Sinks ----------------------
+class CsvSink:
+    def __init__(self, path, columns):
+        self.path = path
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+        self.file.flush()
+
+    def write_batch(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _npy_header(dtype, n):
+    d = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (n,)}
+    header = repr(d).ljust(NPY_HEADER_SIZE - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def _column_values(values, dtype):
+    """
+    Converts the values of one column to `dtype`. Empty CSV cells become NaN (float) or -1 (int)
+    """
+    if dtype.kind == 'f':
+        return np.array([float('nan') if v == '' or v is None else v for v in values], dtype=dtype)
+    if dtype.kind in 'iu':
+        return np.array([-1 if v == '' or v is None else v for v in values], dtype=dtype)
+    return np.array([str(v) for v in values], dtype=dtype)
+
+
+class ColumnarSink:
+    """
+    One `.npy` file per column, appended in batches; the header row count is updated after each batch
+    """
+    def __init__(self, folder, columns, dtypes):
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, COLUMNS_FILE), 'w') as f:
+            json.dump(list(columns), f)
+        self.folder = folder
+        self.dtypes = [np.dtype(dt) for dt in dtypes]
+        self.files = []
+        for column, dtype in zip(columns, self.dtypes):
+            f = open(os.path.join(folder, f'{column}.npy'), 'wb')
+            f.write(_npy_header(dtype, 0))
+            f.flush()  # readable (empty) before the first batch
+            self.files.append(f)
+        self.n_rows = 0
+
+    def write_batch(self, rows):
+        self.n_rows += len(rows)
+        for f, values, dtype in zip(self.files, zip(*rows), self.dtypes):
+            f.write(_column_values(values, dtype).tobytes())
+            f.seek(0)
+            f.write(_npy_header(dtype, self.n_rows))
+            f.seek(0, os.SEEK_END)
+            f.flush()
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+class TextSink:
+    """
+    Text lines built with `line_format.format(*row)`, appended to an existing log (e.g. after its metadata header)
+    """
+    def __init__(self, path, line_format):
+        self.file = open(path, 'a')
+        self.line_format = line_format
+
+    def write_batch(self, rows):
+        self.file.write(''.join(self.line_format.format(*row) + '\n' for row in rows))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _json_value(value):
+    # NumPy scalars (e.g. np.int64 frame ids) are not JSON serializable
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class StreamSink:
+    """
+    Rows sent to a local UDP port as JSON datagrams {"table", "columns", "batch", "rows"}; nobody
+    listening is not an error. `batch` numbers the datagrams, so the receiver can count losses.
+    """
+    def __init__(self, address, name, columns):
+        self.address = address
+        self.name = name
+        self.columns = list(columns)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.n_batches = 0
+        self.n_errors = 0
+
+    def write_batch(self, rows):
+        for i in range(0, len(rows), STREAM_ROWS_PER_DATAGRAM):
+            message = {'table': self.name, 'columns': self.columns, 'batch': self.n_batches,
+                       'rows': [list(row) for row in rows[i:i + STREAM_ROWS_PER_DATAGRAM]]}
+            self.n_batches += 1
+            try:
+                self.sock.sendto(json.dumps(message, default=_json_value).encode(), self.address)
+            except OSError:
+                self.n_errors += 1
+
+    def close(self):
+        self.sock.close()
+
+
+# ---------------------- Logger ----------------------
+class RunLogger:
+    """
+    Queues rows and writes them from a background thread.
+
+    Parameters
+    ---
+    folder: str
+        Run folder
+
+    name: str
+        Table name, e.g. 'tableB' for `tableB.csv` and `tableB_columns/`
+
+    columns: list of str
+
+    dtypes: list, optional
+        NumPy dtype of each column, required by the columnar format
+
+    formats: tuple of str, default=('csv',)
+        Any of LOG_FORMATS
+
+    text_log: (str, str), optional
+        (path, line format) of an additional text log receiving every row
+
+    stream_to: (str, int), optional
+        Local UDP address also receiving every row (see `load_stream_address`)
+
+    max_pending: int, default=100000
+        Maximum number of rows waiting for the writer; rows beyond are dropped
+
+    flush_interval: float, default=0.25
+        Writer period (s)
+    """
+    def __init__(self, folder, name, columns, dtypes=None, formats=('csv',), text_log=None, stream_to=None,
+                 max_pending=100000, flush_interval=0.25):
+        self.columns = list(columns)
+        self.sinks = []
+        if 'csv' in formats:
+            self.sinks.append(CsvSink(os.path.join(folder, f'{name}.csv'), self.columns))
+        if 'columnar' in formats:
+            if dtypes is None:
+                raise ValueError("The columnar format needs the column dtypes")
+            self.sinks.append(ColumnarSink(os.path.join(folder, f'{name}_columns'), self.columns, dtypes))
+        if text_log is not None:
+            self.sinks.append(TextSink(*text_log))
+        if stream_to is not None:
+            self.sinks.append(StreamSink(stream_to, name, self.columns))
+
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._queue = deque()
+        self.n_logged = 0
+        self.n_written = 0
+        self.dropped = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'{name}-writer', daemon=True)
+        self._thread.start()
+
+    def log(self, row):
+        """
+        Queues one row (sequence in column order). Never blocks on I/O.
+
+        Returns
+        ---
+        False if the row was dropped because the queue is full
+        """
+        if len(self._queue) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._queue.append(row)
+        self.n_logged += 1
+        return True
+
+    def _drain(self):
+        queue = self._queue
+        batch = []
+        while True:
+            try:
+                batch.append(queue.popleft())
+            except IndexError:
+                break
+        if batch:
+            for sink in self.sinks:
+                try:
+                    sink.write_batch(batch)
+                except Exception as e:
+                    print(f"Run logger: failed to write {len(batch)} row(s) to {type(sink).__name__}: {e}")
+            self.n_written += len(batch)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+
+    def close(self):
+        """
+        Stops the writer after it has written every queued row
+        """
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+        if self.dropped:
+            print(f"Run logger: {self.dropped} row(s) dropped (queue full)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
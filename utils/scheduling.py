@@ -0,0 +1,164 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import resource
+
+"""
+CPU affinity, scheduling priority and memory locking of the pipeline processes.
+
+Profiles are defined in `config/scheduling.json`: each profile maps a process role
+(`ROLES`) to the settings applied by that process at startup, before it starts any thread:
+
+    "cpus": [2, 3]          pin the process to these cores
+    "policy": "fifo"        SCHED_FIFO ("rr": SCHED_RR, "other": default time sharing)...
+    "priority": 50          ...with this real-time priority (1-99)
+    "nice": -10             nice value, also the fallback when the real-time policy is refused
+    "mlock": "current"      lock the memory mapped so far ("all": also every future mapping)
+
+Real-time policies, negative nice values and memory locking usually need root or the matching
+capabilities / rlimits (CAP_SYS_NICE, RLIMIT_RTPRIO, RLIMIT_MEMLOCK). Whatever the system refuses
+is skipped and reported: `apply_scheduling` returns what actually took effect, read back from the
+kernel, so every process can print it at startup.
+"""
+
+DEFAULT_CONFIG_PATH = "config/scheduling.json"
+ROLES = ('producer', 'consumer', 'decision', 'writer', 'serial_logger')
+POLICIES = {
+    'other': getattr(os, 'SCHED_OTHER', None),
+    'fifo': getattr(os, 'SCHED_FIFO', None),
+    'rr': getattr(os, 'SCHED_RR', None),
+}
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+
+def load_scheduling_profile(name=None, config_path=DEFAULT_CONFIG_PATH):
+    """
+    Settings of every role in a profile of the scheduling config.
+
+    Parameters
+    ---
+    name: str, optional
+        Profile name, default: the `profile` entry of the config
+
+    Returns
+    ---
+    (profile name, {role: settings}); ('none', {}) when there is no config
+    """
+    if not os.path.exists(config_path):
+        if name not in (None, 'none'):
+            raise FileNotFoundError(f"Scheduling profile '{name}' requested but {config_path} does not exist")
+        return 'none', {}
+    with open(config_path, "r") as cfg_file:
+        config = json.load(cfg_file)
+    name = name or config.get('profile', 'none')
+    if name == 'none':
+        return name, {}
+    profiles = config.get('profiles', {})
+    if name not in profiles:
+        raise ValueError(f"Unknown scheduling profile '{name}', expected one of {['none'] + sorted(profiles)}")
+    profile = profiles[name]
+    unknown = set(profile) - set(ROLES)
+    if unknown:
+        raise ValueError(f"Unknown role(s) {sorted(unknown)} in scheduling profile '{name}', expected {ROLES}")
+    return name, profile
+
+
+def _set_affinity(cpus):
+    if not hasattr(os, 'sched_setaffinity'):
+        return "affinity: not supported on this platform"
+    available = os.sched_getaffinity(0)
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError as e:
+        return f"affinity {sorted(cpus)} refused ({e.strerror}), running on {sorted(available)}"
+    return f"affinity {sorted(os.sched_getaffinity(0))}"
+
+
+def _set_policy(policy, priority):
+    policy_id = POLICIES.get(policy)
+    if policy_id is None or not hasattr(os, 'sched_setscheduler'):
+        return False, f"policy {policy}: not supported on this platform"
+    try:
+        os.sched_setscheduler(0, policy_id, os.sched_param(priority if policy != 'other' else 0))
+    except (OSError, PermissionError) as e:
+        return False, f"policy {policy} {priority} refused ({e.strerror})"
+    names = {v: k for k, v in POLICIES.items() if v is not None}
+    current = os.sched_getscheduler(0)
+    return True, f"policy {names.get(current, current)} {os.sched_getparam(0).sched_priority}"
+
+
+def _set_nice(nice):
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, nice)
+    except (OSError, PermissionError) as e:
+        return f"nice {nice} refused ({e.strerror}), nice {os.getpriority(os.PRIO_PROCESS, 0)}"
+    return f"nice {os.getpriority(os.PRIO_PROCESS, 0)}"
+
+
+def _lock_memory(mode):
+    libc_name = ctypes.util.find_library('c')
+    if libc_name is None:
+        return "mlock: libc not found"
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(libc, 'mlockall'):
+        return "mlock: not supported on this platform"
+    flags = MCL_CURRENT
+    if mode == 'all':
+        soft, _ = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+        if os.geteuid() != 0 and soft != resource.RLIM_INFINITY:
+            # with MCL_FUTURE, any allocation beyond the limit would fail later on
+            mode = 'current'
+        else:
+            flags |= MCL_FUTURE
+    if libc.mlockall(flags) != 0:
+        return f"mlock {mode} refused ({os.strerror(ctypes.get_errno())})"
+    return f"mlock {mode}"
+
+
+def apply_scheduling(settings):
+    """
+    Applies the settings of one role to the calling process (and the threads it starts afterwards).
+
+    Parameters
+    ---
+    settings: dict
+        Settings of the role (see the module docstring); None or empty leaves the process untouched
+
+    Returns
+    ---
+    Report of what took effect, e.g. "affinity [2], policy fifo 50, mlock current"
+    """
+    if not settings:
+        return "default scheduling"
+    report = []
+    if 'cpus' in settings:
+        report.append(_set_affinity(set(settings['cpus'])))
+    policy_applied = False
+    if settings.get('policy'):
+        policy_applied, message = _set_policy(settings['policy'], int(settings.get('priority', 1)))
+        report.append(message)
+    if 'nice' in settings and not (policy_applied and settings['policy'] != 'other'):
+        report.append(_set_nice(int(settings['nice'])))
+    if settings.get('mlock'):
+        report.append(_lock_memory(settings['mlock']))
+    return ", ".join(report)
+
+
+def apply_role(role, profile):
+    """
+    Applies the settings of `role` from a profile loaded by `load_scheduling_profile` and prints the report
+    """
+    if not profile:
+        return
+    print(f"[scheduling] {role} (pid {os.getpid()}): {apply_scheduling(profile.get(role))}")
+
+
+def run_role(role, profile, target, *args):
+    """
+    Process entry point: applies the scheduling of `role`, then runs `target(*args)`, e.g.
+    `Process(target=run_role, args=('producer', profile, producer, ring, stop_event))`
+    """
+    apply_role(role, profile)
+    return target(*args)
@@ -0,0 +1,192 @@
+import asyncio
+import glob
+import time
+
+import serial
+from serial.tools import list_ports
+
+from utils.teensy_protocol import PING_INTERVAL_S, TeensyLink, TextLink
+
+"""
+Asyncio serial ingest of the Teensy latency records.
+
+`SerialIngest` is importable and runs in any asyncio loop (log_serial.py, or next to other
+components of an orchestrated run):
+- the port is given, or discovered: the first PJRC (Teensy) USB device, else the first USB CDC
+  port (/dev/ttyACM*, /dev/tty.usbmodem*); a path may be a stable symlink such as /dev/serial/by-id/...
+- the port is read from the event loop (`loop.add_reader` on the non-blocking file descriptor,
+  POSIX): no thread and no blocking `readline`. Every read is stamped and parsed at once
+  (binary frames with clock sync, or the decimal lines of the older firmware, utils/teensy_protocol.py)
+- records go to a bounded `asyncio.Queue`; when the consumer falls behind, new records are dropped
+  and counted instead of growing memory or stalling the reads
+- when the device goes away (unplugged, reset), the port is closed and reopened, discovering it
+  again, with an exponential backoff; the clock sync restarts on the new connection
+- `stop()` ends `run()`; the consumer then drains the queue
+
+Disk writes belong to the consumer side (`RunLogger` writes from its own thread).
+"""
+
+PJRC_VID = 0x16C0
+PORT_PATTERNS = ('/dev/ttyACM*', '/dev/tty.usbmodem*')
+PROTOCOLS = ('binary', 'text')
+QUEUE_SIZE = 4096
+RECONNECT_DELAY_S = (0.2, 5.0)  # first and longest delay between two connection attempts
+READ_SIZE = 65536
+
+
+def discover_port():
+    """
+    Serial port of the Teensy, None if no candidate is connected
+    """
+    ports = sorted(list_ports.comports(), key=lambda p: p.device)
+    for port in ports:
+        if port.vid == PJRC_VID or 'teensy' in (port.description or '').lower():
+            return port.device
+    for pattern in PORT_PATTERNS:
+        candidates = sorted(glob.glob(pattern))
+        if candidates:
+            return candidates[0]
+    return None
+
+
+class SerialIngest:
+    """
+    Parameters
+    ---
+    port: str, optional
+        Serial device path, default: `discover_port()` at every (re)connection
+
+    baud_rate: int, default=115200
+
+    protocol: str, default='binary'
+        'binary' (timestamped records and clock sync) or 'text' (decimal latency lines)
+
+    ping_interval: float, default=PING_INTERVAL_S
+        Binary protocol: clock sync ping period (s)
+
+    queue_size: int, default=QUEUE_SIZE
+        Records kept for the consumer; further records are dropped and counted in `dropped`
+
+    reconnect_delay: (float, float), default=RECONNECT_DELAY_S
+        First and longest delay (s) between connection attempts, doubled after every failure
+
+    Attributes
+    ---
+    queue: asyncio.Queue of TapRecord
+    """
+    def __init__(self, port=None, baud_rate=115200, protocol='binary', ping_interval=PING_INTERVAL_S,
+                 queue_size=QUEUE_SIZE, reconnect_delay=RECONNECT_DELAY_S):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol {protocol!r}, expected one of {PROTOCOLS}")
+        self.port = port
+        self.baud_rate = baud_rate
+        self.link = TeensyLink(ping_interval=ping_interval) if protocol == 'binary' else TextLink()
+        self.queue = asyncio.Queue(queue_size)
+        self.reconnect_delay = reconnect_delay
+        self.connected_port = None
+        self.received = 0
+        self.dropped = 0
+        self.n_connections = 0
+        self.n_read_errors = 0
+        self._stop = None
+
+    def _put(self, record):
+        self.received += 1
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _open(self):
+        port = self.port or discover_port()
+        if port is None:
+            return None
+        try:
+            # timeout=0: reads return what is buffered, the event loop waits for the data
+            return serial.Serial(port, self.baud_rate, timeout=0, write_timeout=0.1)
+        except (OSError, serial.SerialException):
+            return None
+
+    async def _session(self, ser):
+        """
+        Reads `ser` until the device goes away or `stop()`
+        """
+        loop = asyncio.get_running_loop()
+        lost = loop.create_future()
+        link = self.link
+
+        def on_readable():
+            try:
+                data = ser.read(ser.in_waiting or READ_SIZE)
+            except (OSError, serial.SerialException) as e:
+                if not lost.done():
+                    lost.set_result(e)
+                return
+            if data:
+                for record in link.feed(data, time.perf_counter_ns()):
+                    self._put(record)
+
+        loop.add_reader(ser.fileno(), on_readable)
+        stop = asyncio.ensure_future(self._stop.wait())
+        try:
+            while not lost.done() and not stop.done():
+                now = time.perf_counter()
+                if link.ping_due(now):
+                    try:
+                        ser.write(link.ping_frame(now))
+                    except (OSError, serial.SerialException) as e:
+                        lost.set_result(e)
+                        break
+                await asyncio.wait([lost, stop], timeout=max(0.001, link.t_next_ping - time.perf_counter())
+                                   if link.ping_interval else None, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            loop.remove_reader(ser.fileno())
+            stop.cancel()
+        return lost.result() if lost.done() else None
+
+    async def run(self):
+        """
+        Connects, reads and reconnects until `stop()`
+        """
+        self._stop = asyncio.Event()
+        delay = self.reconnect_delay[0]
+        waiting_reported = False
+        while not self._stop.is_set():
+            ser = self._open()
+            if ser is None:
+                if not waiting_reported:
+                    print(f"[serial] waiting for {self.port or 'a Teensy'} ...")
+                    waiting_reported = True
+                try:
+                    await asyncio.wait_for(self._stop.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(2 * delay, self.reconnect_delay[1])
+                continue
+
+            delay = self.reconnect_delay[0]
+            waiting_reported = False
+            self.n_connections += 1
+            self.connected_port = ser.port
+            self.link.reset()
+            print(f"[serial] connected to {ser.port}")
+            try:
+                error = await self._session(ser)
+            finally:
+                self.connected_port = None
+                ser.close()
+            if error is not None:
+                self.n_read_errors += 1
+                print(f"[serial] {ser.port} lost ({error}), reconnecting")
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    def stats(self):
+        return dict(self.link.stats(), received=self.received, dropped=self.dropped,
+                    connections=self.n_connections, disconnections=self.n_read_errors)
+
+    def __repr__(self):
+        stats = ", ".join(f"{k} {v}" for k, v in self.stats().items())
+        return f"SerialIngest({stats})"
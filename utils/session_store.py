@@ -0,0 +1,399 @@
+import argparse
+import csv
+import json
+import math
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+from utils.run_logger import COLUMNS_FILE
+
+"""
+Per-run columnar session store, the single loader of the data_cleanup/ and plotting/ tools.
+
+A run folder (latency_logs/<experiment>, freezed_logs/<experiment>) holds its tables in the
+columnar format of the run loggers (utils/run_logger.py): one `.npy` file per typed column in
+`<table>_columns/` (tableA, tableB, merged, merged_filtered), plus `session.json` with the
+experiment config (config/log_config.json, written by log_serial.py and latency_mp.py when the run
+starts) and where each table came from.
+
+- `RunStore(run_dir).load(table, columns)` returns a `Table` whose columns are memory-mapped
+  only when accessed, so a tool reading `latency_ms` never parses the other columns
+- tables only found as CSV (runs logged before the columnar format, or with `log_formats: ["csv"]`)
+  are parsed in memory, with inferred dtypes, so reading a run never writes into it; `persist=True`
+  (`python -m utils.session_store RUN_DIR ...`, `--persist` of the tools) stores the columnar copy
+  once instead, converted again if the CSV is modified since
+- `save` writes a derived table (merged, merged_filtered), `export_csv` writes any table as CSV,
+  the export format for other programs
+- `load_table(path)` accepts a run folder, a `<table>.csv` path or a `<table>_columns/` path
+"""
+
+SESSION_FILE = 'session.json'
+COLUMNS_SUFFIX = '_columns'
+
+
+def _infer_column(values):
+    """
+    Typed array of the CSV cells `values`: bool, int64, float64 (empty cells: NaN) or unicode
+    """
+    if values and all(v in ('True', 'False') for v in values):
+        return np.array([v == 'True' for v in values])
+    try:
+        return np.array(values, dtype=np.int64)
+    except ValueError:
+        pass
+    try:
+        return np.array([v if v != '' else 'nan' for v in values], dtype=np.float64)
+    except ValueError:
+        return np.array(values, dtype=str)
+
+
+def read_csv_columns(path):
+    """
+    Columns of a CSV file as a dict of typed arrays, in file order
+    """
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        rows = [row for row in reader if row]
+    # short rows (truncated last line) are padded with empty cells
+    cells = zip(*[row + [''] * (len(header) - len(row)) for row in rows]) if rows else [[] for _ in header]
+    return {name: _infer_column(list(values)) for name, values in zip(header, cells)}
+
+
+def _csv_cell(value):
+    if isinstance(value, float) and math.isnan(value):
+        return ''
+    return value
+
+
+def write_csv(path, data):
+    """
+    Writes a Table or a dict of columns as CSV, NaN as empty cells
+    """
+    columns = list(data.columns if isinstance(data, Table) else data)
+    values = [np.asarray(data[c]).tolist() for c in columns]
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows([_csv_cell(v) for v in row] for row in zip(*values))
+
+
+class Table:
+    """
+    Columns of one run table, memory-mapped on first access (read-only).
+
+    Parameters
+    ---
+    name: str
+
+    paths: dict
+        Column name -> `.npy` path, in column order
+
+    arrays: dict, optional
+        Column name -> array already in memory (e.g. a CSV parsed without a writable run folder)
+    """
+    def __init__(self, name, paths=None, arrays=None):
+        self.name = name
+        self.paths = dict(paths or {})
+        self._arrays = dict(arrays or {})
+        self.columns = list(self.paths) + [c for c in self._arrays if c not in self.paths]
+
+    def __getitem__(self, column):
+        if column not in self._arrays:
+            if column not in self.paths:
+                raise KeyError(f"{self.name} has no column {column!r} (columns: {self.columns})")
+            self._arrays[column] = np.load(self.paths[column], mmap_mode='r')
+        # columns are appended one after the other by the run logger: cut to the common length
+        return self._arrays[column][:len(self)]
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return min(self._length(column) for column in self.columns)
+
+    def _length(self, column):
+        if column in self._arrays:
+            return len(self._arrays[column])
+        self._arrays[column] = np.load(self.paths[column], mmap_mode='r')
+        return len(self._arrays[column])
+
+    def select(self, columns):
+        """
+        Table restricted to `columns`, in that order
+
+        Raises
+        ---
+        KeyError if a column is missing
+        """
+        missing = [c for c in columns if c not in self.columns]
+        if missing:
+            raise KeyError(f"{self.name} has no column(s) {missing} (columns: {self.columns})")
+        return Table(self.name, {c: self.paths[c] for c in columns if c in self.paths},
+                     {c: self._arrays[c] for c in columns if c not in self.paths})
+
+    def take(self, index):
+        """
+        In-memory table of the rows `index` (boolean mask or indices) of every column
+        """
+        return Table(self.name, arrays={c: np.asarray(self[c])[index] for c in self.columns})
+
+    def to_dict(self):
+        return {c: np.asarray(self[c]) for c in self.columns}
+
+    def __repr__(self):
+        return f"Table({self.name}, {len(self)} rows, columns {self.columns})"
+
+
+class RunStore:
+    """
+    Parameters
+    ---
+    run_dir: str
+        Run folder
+
+    persist: bool, default=False
+        Write the columnar copy (and `session.json`) of the tables only found as CSV when they are
+        loaded; by default they are parsed in memory and the run folder is left untouched
+    """
+    def __init__(self, run_dir, persist=False):
+        self.run_dir = run_dir
+        self.persist = persist
+        self.metadata_path = os.path.join(run_dir, SESSION_FILE)
+        self._metadata = None
+
+    # ---------------------- Metadata ----------------------
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            if os.path.exists(self.metadata_path):
+                with open(self.metadata_path, 'r') as f:
+                    self._metadata = json.load(f)
+            else:
+                # runs logged before the store: no config recorded
+                self._metadata = {'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'config': {},
+                                  'tables': {}}
+        return self._metadata
+
+    def write_metadata(self, config=None):
+        """
+        Writes `session.json`, with `config` as the experiment config if given
+        """
+        metadata = self.metadata
+        if config is not None:
+            metadata['config'] = dict(config)
+        os.makedirs(self.run_dir, exist_ok=True)
+        tmp_path = f'{self.metadata_path}.{os.getpid()}.tmp'  # both loggers of a run may write it
+        with open(tmp_path, 'w') as f:
+            json.dump(metadata, f, indent=4)
+        os.replace(tmp_path, self.metadata_path)
+
+    @property
+    def config(self):
+        return self.metadata.get('config', {})
+
+    # ---------------------- Tables ----------------------
+    def _columns_dir(self, table):
+        return os.path.join(self.run_dir, table + COLUMNS_SUFFIX)
+
+    def _csv_path(self, table):
+        return os.path.join(self.run_dir, table + '.csv')
+
+    def tables(self):
+        """
+        Names of the tables of the run, columnar or CSV
+        """
+        if not os.path.isdir(self.run_dir):
+            return []
+        names = set()
+        for entry in os.listdir(self.run_dir):
+            if entry.endswith(COLUMNS_SUFFIX) and os.path.isdir(os.path.join(self.run_dir, entry)):
+                names.add(entry[:-len(COLUMNS_SUFFIX)])
+            elif entry.endswith('.csv'):
+                names.add(entry[:-len('.csv')])
+        return sorted(names)
+
+    def __contains__(self, table):
+        return os.path.isdir(self._columns_dir(table)) or os.path.exists(self._csv_path(table))
+
+    def _stale(self, table):
+        """
+        True if the table has to be (re)converted from its CSV
+        """
+        csv_path = self._csv_path(table)
+        if not os.path.isdir(self._columns_dir(table)):
+            return os.path.exists(csv_path)
+        imported = self.metadata.get('tables', {}).get(table, {}).get('csv_mtime')
+        # tables written in columnar form by the run loggers are never replaced by their CSV twin
+        return imported is not None and os.path.exists(csv_path) and os.path.getmtime(csv_path) != imported
+
+    def _paths(self, table):
+        folder = self._columns_dir(table)
+        order_path = os.path.join(folder, COLUMNS_FILE)
+        if os.path.exists(order_path):
+            with open(order_path, 'r') as f:
+                columns = json.load(f)
+        else:
+            columns = sorted(f[:-len('.npy')] for f in os.listdir(folder) if f.endswith('.npy'))
+        return {c: os.path.join(folder, c + '.npy') for c in columns}
+
+    def load(self, table, columns=None):
+        """
+        Parameters
+        ---
+        table: str
+            e.g. 'tableA', 'tableB', 'merged', 'merged_filtered'
+
+        columns: list of str, optional
+            Columns to keep, default: all
+
+        Returns
+        ---
+        Table
+
+        Raises
+        ---
+        FileNotFoundError if the run has no such table, KeyError if a column is missing
+        """
+        if table not in self:
+            raise FileNotFoundError(f"No table {table!r} in {self.run_dir} (tables: {self.tables()})")
+        if self._stale(table):
+            data = read_csv_columns(self._csv_path(table))
+            if not self.persist or not self._convert(table, data):
+                result = Table(table, arrays=data)
+                return result.select(columns) if columns is not None else result
+        result = Table(table, self._paths(table))
+        return result.select(columns) if columns is not None else result
+
+    def _convert(self, table, data):
+        """
+        Stores the columns `data` parsed from the CSV of `table`, False if the run folder is not writable
+        """
+        try:
+            self.save(table, data, source='csv', csv_mtime=os.path.getmtime(self._csv_path(table)))
+        except OSError as e:
+            print(f"Session store: cannot write {table} to {self.run_dir} ({e}), reading the CSV")
+            return False
+        return True
+
+    def convert(self, tables=None):
+        """
+        Stores the columnar copy of the tables (default: all) only found as CSV, or whose CSV changed
+
+        Returns
+        ---
+        Names of the converted tables
+        """
+        converted = []
+        for table in tables or self.tables():
+            if self._stale(table) and self._convert(table, read_csv_columns(self._csv_path(table))):
+                converted.append(table)
+        return converted
+
+    def save(self, table, data, source=None, csv_mtime=None, export_csv=False):
+        """
+        Writes a table, replacing any previous version.
+
+        Parameters
+        ---
+        data: dict or Table
+            Column name -> array, all of the same length
+
+        source: str, optional
+            Provenance recorded in `session.json`, e.g. 'join_tables'
+
+        export_csv: bool, default=False
+            Also write `<table>.csv`
+        """
+        columns = list(data.columns if isinstance(data, Table) else data)
+        arrays = [np.asarray(data[c]) for c in columns]
+        if len({len(a) for a in arrays}) > 1:
+            raise ValueError(f"Columns of {table} have different lengths")
+        folder = self._columns_dir(table)
+        tmp_folder = folder + '.tmp'
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        os.makedirs(tmp_folder)
+        for column, array in zip(columns, arrays):
+            np.save(os.path.join(tmp_folder, column + '.npy'), array)
+        with open(os.path.join(tmp_folder, COLUMNS_FILE), 'w') as f:
+            json.dump(columns, f)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(tmp_folder, folder)
+
+        if export_csv:
+            self.export_csv(table)
+            # the export is not a newer source of the table
+            csv_mtime = os.path.getmtime(self._csv_path(table))
+        info = {'columns': columns, 'dtypes': [a.dtype.str for a in arrays], 'rows': len(arrays[0]) if arrays else 0,
+                'source': source, 'saved': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        if csv_mtime is not None:
+            info['csv_mtime'] = csv_mtime
+        self.metadata.setdefault('tables', {})[table] = info
+        self.write_metadata()
+
+    def export_csv(self, table, path=None, columns=None):
+        """
+        Writes a table as CSV (default: `<table>.csv` in the run folder), NaN as empty cells
+
+        Returns
+        ---
+        The CSV path
+        """
+        path = path or self._csv_path(table)
+        write_csv(path, self.load(table, columns))
+        return path
+
+    def __repr__(self):
+        return f"RunStore({self.run_dir}, tables {self.tables()})"
+
+
+def load_table(path, table=None, columns=None, persist=False):
+    """
+    Loads a table from a run folder (`table` required), a `<table>.csv` or a `<table>_columns/` path,
+    see `RunStore` for `persist`
+
+    Returns
+    ---
+    Table
+    """
+    path = os.path.normpath(path)
+    if os.path.isdir(path) and not path.endswith(COLUMNS_SUFFIX):
+        if table is None:
+            raise ValueError(f"{path} is a run folder: give the table name, one of {RunStore(path).tables()}")
+        return RunStore(path, persist).load(table, columns)
+    name = os.path.basename(path)
+    name = name[:-len(COLUMNS_SUFFIX)] if name.endswith(COLUMNS_SUFFIX) else os.path.splitext(name)[0]
+    return RunStore(os.path.dirname(path) or '.', persist).load(name, columns)
+
+
+def find_runs(root_dir, table):
+    """
+    Run folders directly under `root_dir` holding `table`, sorted
+    """
+    if not os.path.isdir(root_dir):
+        return []
+    runs = [os.path.join(root_dir, d) for d in sorted(os.listdir(root_dir))]
+    return [run for run in runs if os.path.isdir(run) and table in RunStore(run)]
+
+
+def main():
+    p = argparse.ArgumentParser(description="Store the columnar copy of the CSV tables of run folders.")
+    p.add_argument('run_dirs', nargs='+', help='Run folders, e.g. freezed_logs/A15_direct')
+    p.add_argument('--tables', nargs='+', default=None, help='Tables to convert (default: every CSV table)')
+    args = p.parse_args()
+
+    for run_dir in args.run_dirs:
+        if not os.path.isdir(run_dir):
+            print(f"Error: {run_dir} is not a folder")
+            continue
+        converted = RunStore(run_dir).convert(args.tables)
+        print(f"{run_dir}: {', '.join(converted) if converted else 'nothing to convert'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import json
+import os
+import queue
+import time
+
+import cv2
+import numpy as np
+
+"""
+Detector warm-up and startup profiling for latency_mp.py.
+
+The first inferences of a freshly created `HandPoseDetector` are much slower than the steady state
+(graph initialization, delegate and kernel compilation, memory pools), and a tap landing on them
+reports an inflated latency. Every detector process therefore:
+- builds its detector and runs dummy inferences at the real frame shape (`warm_up_detector`) until
+  the inference time stabilizes: the median of the last `window` runs moved by less than
+  `tolerance` from the median of the window before, after at least `min_runs` runs and at most
+  `max_runs`
+- then sets its ready event; the producer initializes the camera meanwhile and only starts the
+  acquisition once every process is ready (`wait_ready`), so no frame is captured, aged and dropped
+  while a detector is still loading
+
+Every process times its startup phases in a `StartupProfile` (imports, model load, camera init,
+warm-up, waiting for the others) and sends it to the main process, which prints the breakdown and
+saves it as startup_profile.json in the run folder.
+
+The default dummy frame is sensor-like noise: it warms up the palm detection path. Pass a frame
+with a hand (`load_warmup_frame`, e.g. a frame of a saved trial) to warm up the landmark model too.
+"""
+
+WARMUP_MIN_RUNS = 10
+WARMUP_MAX_RUNS = 200
+WARMUP_WINDOW = 5
+WARMUP_TOLERANCE = 0.1  # relative change of the windowed median inference time
+READY_TIMEOUT_S = 120.0
+
+
+class StartupProfile:
+    """
+    Durations (s) of the startup phases of one process, in order.
+
+    Parameters
+    ---
+    role: str
+        Process name in the report, e.g. 'producer', 'consumer', 'worker 1'
+    """
+    def __init__(self, role):
+        self.role = role
+        self.phases = {}
+        self.info = {}
+        self._t_phase = None
+
+    def start(self):
+        self._t_phase = time.perf_counter()
+
+    def lap(self, name):
+        """
+        Ends the current phase as `name` and starts the next one
+        """
+        now = time.perf_counter()
+        if self._t_phase is not None:
+            self.phases[name] = self.phases.get(name, 0.0) + now - self._t_phase
+        self._t_phase = now
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        return {'role': self.role, 'pid': os.getpid(), 'phases': dict(self.phases), 'info': dict(self.info)}
+
+    def send(self, reports):
+        """
+        Sends the profile to the main process (`reports`: multiprocessing.Queue, may be None)
+        """
+        if reports is not None:
+            reports.put(self.as_dict())
+
+
+def load_warmup_frame(path, frame_shape):
+    """
+    Loads a warm-up frame (image, or `.npy` frame / frame stack) and converts it to the pipeline frame shape
+    """
+    if path.endswith('.npy'):
+        frame = np.load(path, mmap_mode='r')
+        if frame.ndim == len(frame_shape) + 1:
+            frame = frame[-1]
+        frame = np.array(frame, dtype=np.uint8)
+    else:
+        frame = cv2.imread(path, cv2.IMREAD_COLOR if len(frame_shape) == 3 else cv2.IMREAD_GRAYSCALE)
+        if frame is None:
+            raise ValueError(f"Cannot read the warm-up frame {path}")
+    if frame.shape[:2] != tuple(frame_shape[:2]):
+        frame = cv2.resize(frame, (frame_shape[1], frame_shape[0]))
+    if frame.shape != tuple(frame_shape):
+        raise ValueError(f"Warm-up frame {path} has shape {frame.shape}, the pipeline expects {tuple(frame_shape)}")
+    return frame
+
+
+def dummy_frame(frame_shape, seed=0):
+    """
+    Sensor-like noise around mid-grey at the pipeline frame shape (BGR, or Bayer mosaic when 2-D)
+    """
+    rng = np.random.default_rng(seed)
+    return rng.normal(110, 20, frame_shape).clip(0, 255).astype(np.uint8)
+
+
+def warm_up_detector(detector, frame_shape, frame=None, min_runs=WARMUP_MIN_RUNS, max_runs=WARMUP_MAX_RUNS,
+                     window=WARMUP_WINDOW, tolerance=WARMUP_TOLERANCE):
+    """
+    Runs dummy inferences until the inference time stabilizes.
+
+    Parameters
+    ---
+    detector: HandPoseDetector
+        Any detector with `detect_landmarks(image)`; it must not keep state across frames
+
+    frame_shape: tuple
+        Shape of the pipeline frames, (h, w, 3) BGR or (h, w) Bayer mosaics
+
+    frame: np.ndarray, optional
+        Warm-up frame of that shape, default: `dummy_frame`
+
+    min_runs, max_runs: int
+        Bounds on the number of inferences, `max_runs=0` disables the warm-up
+
+    window: int
+        Runs per median in the stability test
+
+    tolerance: float
+        Largest relative change between two consecutive window medians for the time to count as stable
+
+    Returns
+    ---
+    dict with the number of runs, the first and the stable inference times (ms) and whether it stabilized
+    """
+    if max_runs <= 0:
+        return {'runs': 0, 'first_ms': None, 'stable_ms': None, 'stable': False}
+    if frame is None:
+        frame = dummy_frame(frame_shape)
+    times = []
+    stable = False
+    while len(times) < max_runs:
+        t0 = time.perf_counter()
+        detector.detect_landmarks(frame)
+        times.append(time.perf_counter() - t0)
+        if len(times) >= max(min_runs, 2 * window):
+            current = float(np.median(times[-window:]))
+            previous = float(np.median(times[-2 * window:-window]))
+            if abs(current - previous) <= tolerance * previous:
+                stable = True
+                break
+    return {'runs': len(times), 'first_ms': 1000.0 * times[0],
+            'stable_ms': 1000.0 * float(np.median(times[-window:])), 'stable': stable}
+
+
+def warm_up(detector, frame_shape, warmup, profile):
+    """
+    Warm-up stage of a detector process: `warm_up_detector` with the `warmup` settings of latency_mp.py
+    ({'max_runs': int, 'frame': path or None}, None for the defaults), timed in `profile` as 'warm-up'
+    """
+    warmup = warmup or {}
+    max_runs = warmup.get('max_runs', WARMUP_MAX_RUNS)
+    frame = load_warmup_frame(warmup['frame'], frame_shape) if warmup.get('frame') and max_runs > 0 else None
+    result = warm_up_detector(detector, frame_shape, frame, max_runs=max_runs)
+    profile.info['warmup'] = result
+    profile.lap('warm-up')
+    return result
+
+
+def wait_ready(ready_events, stop_event, timeout=READY_TIMEOUT_S, poll_s=0.05):
+    """
+    Waits until every event of `ready_events` is set.
+
+    Returns
+    ---
+    True when all are ready, False on timeout or when `stop_event` is set first (a process failed)
+    """
+    deadline = time.perf_counter() + timeout
+    for event in ready_events:
+        while not event.wait(poll_s):
+            if stop_event.is_set() or time.perf_counter() > deadline:
+                return False
+    return not stop_event.is_set()
+
+
+def collect_profiles(reports, n_expected, timeout):
+    """
+    Gets the profiles sent by the processes until `n_expected` arrived or `timeout` (s) elapsed
+    """
+    profiles = []
+    deadline = time.perf_counter() + timeout
+    while len(profiles) < n_expected:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        try:
+            profiles.append(reports.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return profiles
+
+
+def format_profiles(profiles):
+    """
+    One line per process: total startup time and its phases (ms)
+    """
+    lines = []
+    for profile in profiles:
+        phases = profile['phases']
+        breakdown = " | ".join(f"{name} {1000.0 * seconds:.0f} ms" for name, seconds in phases.items())
+        line = f"  {profile['role']:<10} {1000.0 * sum(phases.values()):7.0f} ms: {breakdown}"
+        warmup = profile['info'].get('warmup')
+        if warmup and warmup['runs']:
+            line += (f" (warm-up: {warmup['runs']} runs, first {warmup['first_ms']:.1f} ms -> "
+                     f"{warmup['stable_ms']:.1f} ms{'' if warmup['stable'] else ', not stable'})")
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def save_profiles(profiles, path):
+    with open(path, 'w') as fp:
+        json.dump(profiles, fp, indent=2)
@@ -0,0 +1,139 @@
+import numpy as np
+
+from utils.hand_landmarks import RIGHT, pinky_edge_y
+
+"""
+Tap detection logic shared by the pipeline scripts.
+
+A tap is detected on the left hand when the average y-coordinate of the pinky edge
+(landmarks 17 to 20) gets closer to the calibrated reference line than the threshold
+`mean + 3 * std` (see calibration.py). A hysteresis state prevents firing again until
+the hand moves back above the threshold. `LineTapDetector` does the same on a tilted reference line.
+"""
+
+
+class TapDetector:
+    """
+    Hysteresis tap detector.
+
+    Parameters
+    ---
+    y_line: float
+        Y-coordinate (pixels) of the reference line
+
+    threshold: float
+        Distance (pixels) below which the hand is considered in contact with the surface
+
+    skip_hand: int, default=RIGHT
+        Handedness code of the hand to ignore (see utils/hand_landmarks.py)
+
+    max_hands: int, default=2
+        Maximum number of hands per detection, to size the preallocated buffers
+    """
+    def __init__(self, y_line, threshold, skip_hand=RIGHT, max_hands=2):
+        self.y_line = y_line
+        self.threshold = threshold
+        self.skip_hand = skip_hand
+        self.state = 0
+        self.counter = 0
+        self.last_dist = float('nan')
+        self.fire_mode = 'contact'
+        self._dist = np.empty(max_hands, dtype=np.float32)
+
+    def distances(self, hands, frame_height):
+        """
+        Distance (pixels) of every detected hand to the reference line, computed at once in a preallocated buffer
+        """
+        dist = pinky_edge_y(hands, frame_height, self._dist)
+        dist -= self.y_line
+        np.abs(dist, out=dist)
+        return dist
+
+    def update(self, hands, frame_height, t=0.0, frame_id=0):
+        """
+        Updates the contact state with the hands detected on a frame.
+
+        Parameters
+        ---
+        hands: HandLandmarks
+            Output of `HandPoseDetector.detect_landmarks`
+
+        frame_height: int
+
+        t: float, optional
+            Frame timestamp (s), used by subclasses
+
+        frame_id: int, optional
+            Frame id, used by subclasses
+
+        Returns
+        ---
+        True if a new tap fired on this frame (`self.counter` holds its number)
+        """
+        n = hands.n
+        if n == 0:
+            return False
+
+        dist = self.distances(hands, frame_height)
+
+        fired = False
+        handedness = hands.handedness
+        for i in range(n):
+            if handedness[i] == self.skip_hand:
+                continue
+            d = float(dist[i])
+            self.last_dist = d
+
+            if d >= self.threshold and self.state == 1:
+                self.state = 0
+            elif d < self.threshold and self.state == 0:
+                self.state = 1
+                self.counter += 1
+                fired = True
+        return fired
+
+    def pop_resolution(self):
+        """
+        Contact taps are resolved as soon as they fire; see `PredictiveTapDetector` for early triggers
+        """
+        return None
+
+
+class LineTapDetector(TapDetector):
+    """
+    `TapDetector` on a tilted reference line: the perpendicular distance of the pinky edge point to the
+    line (`line_distances` of utils/reference_line.py) is folded into one weight vector over the normalized
+    pinky edge landmarks, so a frame costs a single dot product. The multi-zone engine of
+    utils/trigger_zones.py is only needed for several zones.
+
+    Parameters
+    ---
+    y_line, threshold, skip_hand, max_hands:
+        See `TapDetector`
+
+    line: list
+        End points [[x0, y0], [x1, y1]] (pixels) of the reference line
+
+    frame_shape: tuple
+        (height, width, ...) of the frames, to convert normalized landmarks to pixels
+    """
+    def __init__(self, y_line, threshold, line, frame_shape, **kwargs):
+        super().__init__(y_line, threshold, **kwargs)
+        self.line = line
+        (x0, y0), (x1, y1) = line
+        norm = np.hypot(x1 - x0, y1 - y0)
+        ux, uy = (x1 - x0) / norm, (y1 - y0) / norm
+        # signed distance y * ux - x * uy + offset of the mean pinky edge point, over landmarks 17 to 20 (x, y, z)
+        weights = np.zeros((4, 3), dtype=np.float32)
+        weights[:, 0] = -uy * frame_shape[1] / 4
+        weights[:, 1] = ux * frame_shape[0] / 4
+        self._weights = weights.ravel()
+        self._offset = np.float32(x0 * uy - y0 * ux)
+
+    def distances(self, hands, frame_height):
+        n = hands.n
+        dist = self._dist[:n]
+        np.dot(hands.landmarks[:n, 17:21].reshape(n, -1), self._weights, out=dist)
+        dist += self._offset
+        np.abs(dist, out=dist)
+        return dist
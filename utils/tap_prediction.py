@@ -0,0 +1,172 @@
+import numpy as np
+
+from utils.tap_detection import TapDetector
+
+"""
+Predictive tap trigger.
+
+`TapDetector` only fires once the pinky edge is already within the threshold of the reference line,
+so every tap pays at least one frame period plus inference before the OSC message goes out.
+`PredictiveTapDetector` keeps a short history of the pinky edge distance to the line, estimates the
+approach velocity and the time to contact, and fires early once the predicted contact falls inside
+the downstream latency budget (`lead_ms`, e.g. the measured OSC-to-sound latency).
+
+An early trigger is then resolved either by the actual contact (threshold crossing), or as a false
+positive if the hand leaves the arming zone or the contact does not happen in time.
+"""
+
+
+class PredictiveTapDetector(TapDetector):
+    """
+    Tap detector firing on the predicted contact time.
+
+    Parameters
+    ---
+    y_line, threshold, skip_hand, max_hands:
+        See `TapDetector`
+
+    lead_ms: float, default=8.0
+        Fire when the predicted time to contact is below this budget (ms)
+
+    min_velocity: float, default=150.0
+        Minimum approach velocity (px/s) towards the line; slower motions only trigger on contact
+
+    arm_distance: float, default=40.0
+        Prediction is only active when the pinky edge is closer than this distance (px) to the line
+
+    min_frames: int, default=3
+        Number of consecutive approaching frames required before firing early
+
+    history: int, default=6
+        Number of frames used for the velocity fit
+
+    max_overshoot_ms: float, default=30.0
+        An early trigger not confirmed by a contact within `predicted time to contact + max_overshoot_ms`
+        is counted as a false positive
+    """
+    def __init__(self, y_line, threshold, lead_ms=8.0, min_velocity=150.0, arm_distance=40.0, min_frames=3,
+                 history=6, max_overshoot_ms=30.0, **kwargs):
+        super().__init__(y_line, threshold, **kwargs)
+        self.lead_s = lead_ms / 1000.0
+        self.min_velocity = min_velocity
+        self.arm_distance = arm_distance
+        self.min_frames = min_frames
+        self.max_overshoot_s = max_overshoot_ms / 1000.0
+
+        self._t = np.zeros(history, dtype=np.float64)
+        self._gap = np.zeros(history, dtype=np.float64)
+        self._len = 0
+        self._pos = 0
+        self._approaching = 0
+
+        self.fire_mode = 'contact'
+        self.predicted_ttc = float('nan')
+        self._pending = None  # (tap number, fire time, predicted contact time)
+        self._resolution = None
+        self.n_predicted = 0
+        self.n_false_positives = 0
+
+    def _push(self, t, gap):
+        if self._len:
+            prev = self._gap[(self._pos - 1) % len(self._gap)]
+            self._approaching = self._approaching + 1 if gap < prev else 0
+        self._t[self._pos] = t
+        self._gap[self._pos] = gap
+        self._pos = (self._pos + 1) % len(self._t)
+        self._len = min(self._len + 1, len(self._t))
+
+    def _reset_history(self):
+        self._len = 0
+        self._approaching = 0
+
+    def _approach_velocity(self):
+        """
+        Least-squares slope of the gap over the history, as a positive approach velocity (px/s).
+        Plain float sums: the history is a handful of samples.
+        """
+        n = self._len
+        if n < 2:
+            return 0.0
+        t0 = self._t[(self._pos - 1) % len(self._t)]
+        st = sg = stt = stg = 0.0
+        for i in range(n):
+            j = (self._pos - 1 - i) % len(self._t)
+            t = float(self._t[j] - t0)
+            g = float(self._gap[j])
+            st += t
+            sg += g
+            stt += t * t
+            stg += t * g
+        den = n * stt - st * st
+        if den <= 0.0:
+            return 0.0
+        return -(n * stg - st * sg) / den
+
+    def update(self, hands, frame_height, t=0.0, frame_id=0):
+        """
+        Same as `TapDetector.update`, with `t` the frame timestamp (s) used for the velocity estimate.
+        After an early trigger, `pop_resolution` tells when and whether the contact happened.
+        """
+        self.fire_mode = 'contact'
+        n = hands.n
+        handedness = hands.handedness
+        tap_hand = -1
+        for i in range(n):
+            if handedness[i] != self.skip_hand:
+                tap_hand = i
+                break
+        if tap_hand < 0:
+            self._reset_history()
+            if self._pending is not None and t > self._pending[2] + self.max_overshoot_s:
+                self._resolution = (self._pending[0], None, t)
+                self._pending = None
+                self.n_false_positives += 1
+                self.state = 0
+            return super().update(hands, frame_height, t, frame_id)
+
+        if self._pending is not None:
+            # the hysteresis is on hold until the early trigger is resolved
+            gap = float(self.distances(hands, frame_height)[tap_hand])
+            self.last_dist = gap
+            tap_number, t_fire, t_predicted = self._pending
+            if gap < self.threshold:
+                # early trigger confirmed by the actual contact
+                self._resolution = (tap_number, frame_id, t)
+                self._pending = None
+            elif gap >= self.arm_distance or t > t_predicted + self.max_overshoot_s:
+                self._resolution = (tap_number, None, t)
+                self._pending = None
+                self.n_false_positives += 1
+                self.state = 0
+            self._push(t, gap)
+            return False
+
+        was_state = self.state
+        fired = super().update(hands, frame_height, t, frame_id)
+        gap = self.last_dist
+        self._push(t, gap)
+        if fired:
+            # plain threshold crossing, not anticipated
+            return True
+
+        if was_state == 0 and self.state == 0 and gap < self.arm_distance and self._approaching >= self.min_frames:
+            velocity = self._approach_velocity()
+            if velocity >= self.min_velocity:
+                ttc = (gap - self.threshold) / velocity
+                if ttc <= self.lead_s:
+                    self.state = 1
+                    self.counter += 1
+                    self.fire_mode = 'predicted'
+                    self.predicted_ttc = ttc
+                    self._pending = (self.counter, t, t + ttc)
+                    self.n_predicted += 1
+                    return True
+        return False
+
+    def pop_resolution(self):
+        """
+        Resolution of the last early trigger, if any since the previous call:
+        `(tap number, contact frame id, time)`, with a None frame id for a false positive.
+        """
+        resolution, self._resolution = self._resolution, None
+        return resolution
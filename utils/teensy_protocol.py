@@ -0,0 +1,297 @@
+import binascii
+import struct
+import time
+from collections import namedtuple
+
+from utils.clock_sync import ClockSync
+
+"""
+Binary serial protocol of the Teensy latency firmware (arduino/latency/latency.ino) and host clock sync.
+
+The text protocol sent the latency as a decimal line, stamped by the host when the line was read:
+the USB-serial buffering delay ended up in the timestamp used to join the tables. The binary
+protocol carries the Teensy's own microsecond timestamps, mapped onto the host clock.
+
+Every message is one frame:
+
+    0xA5 0x5A | type (u8) | payload length (u8) | payload | CRC-16/CCITT (u16, init 0xFFFF)
+
+little-endian, the CRC covering type, length and payload. A corrupted or truncated frame is skipped
+up to the next sync marker.
+
+Messages:
+- TAP (Teensy -> host): seq (u32), press_us (u64), onset_us (u64). Button press and audio onset on
+  the Teensy's 64-bit `micros()` clock
+- PING (host -> Teensy): ping id (u32)
+- ECHO (Teensy -> host): ping id (u32), device_us (u64): Teensy time when the ping was received
+
+`TeensyLink` sends a ping every `ping_interval` (ten times faster until the fit window is full) and
+feeds each echo to a `ClockSync` (utils/clock_sync.py) as a sample taken at the middle of the round
+trip, with half the round trip as uncertainty. The offset and drift fit maps the press and onset
+timestamps of every TAP record to host `time.perf_counter_ns()`.
+"""
+
+SYNC = b'\xa5\x5a'
+MSG_TAP = 0x01
+MSG_PING = 0x02
+MSG_ECHO = 0x03
+PAYLOADS = {
+    MSG_TAP: struct.Struct('<IQQ'),
+    MSG_PING: struct.Struct('<I'),
+    MSG_ECHO: struct.Struct('<IQ'),
+}
+HEADER = struct.Struct('<2sBB')
+CRC = struct.Struct('<H')
+CRC_INIT = 0xFFFF
+NS_PER_US = 1000
+
+PING_INTERVAL_S = 0.5
+PING_TIMEOUT_S = 0.5  # echoes arriving later are not used as sync samples
+
+TapRecord = namedtuple('TapRecord', [
+    'seq',            # record number on the Teensy since its reset
+    'press_us',       # Teensy clock
+    'onset_us',
+    'latency_ms',     # onset - press
+    'press_ns',       # host perf_counter_ns, mapped through the clock sync
+    'onset_ns',
+    'arrival_ns',     # host perf_counter_ns when the record was read
+    'synced',         # False: clock sync not ready, press/onset estimated from the arrival time
+])
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, CRC_INIT)
+
+
+def encode_frame(msg_type, *fields):
+    payload = PAYLOADS[msg_type].pack(*fields)
+    body = bytes((msg_type, len(payload))) + payload
+    return SYNC + body + CRC.pack(crc16(body))
+
+
+class FrameParser:
+    """
+    Incremental frame decoder: `feed` the received bytes, get the complete messages back.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.n_frames = 0
+        self.n_crc_errors = 0
+        self.n_skipped_bytes = 0
+
+    def feed(self, data):
+        """
+        Returns
+        ---
+        List of (msg_type, fields) of the frames completed by `data`
+        """
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        while True:
+            start = buffer.find(SYNC)
+            if start < 0:
+                # keep a trailing first sync byte, the frame may start there
+                keep = 1 if buffer[-1:] == SYNC[:1] else 0
+                self.n_skipped_bytes += len(buffer) - keep
+                del buffer[:len(buffer) - keep]
+                break
+            if start:
+                self.n_skipped_bytes += start
+                del buffer[:start]
+            if len(buffer) < HEADER.size:
+                break
+            _, msg_type, length = HEADER.unpack_from(buffer)
+            payload = PAYLOADS.get(msg_type)
+            if payload is None or length != payload.size:
+                # not a frame start: look for the next marker
+                self.n_skipped_bytes += 1
+                del buffer[:1]
+                continue
+            end = HEADER.size + length + CRC.size
+            if len(buffer) < end:
+                break
+            (crc,) = CRC.unpack_from(buffer, end - CRC.size)
+            if crc != crc16(bytes(buffer[2:end - CRC.size])):
+                self.n_crc_errors += 1
+                self.n_skipped_bytes += 1
+                del buffer[:1]
+                continue
+            messages.append((msg_type, payload.unpack_from(buffer, HEADER.size)))
+            self.n_frames += 1
+            del buffer[:end]
+        return messages
+
+
+class TeensyLink:
+    """
+    Host side of the binary protocol: `poll` a serial port, or `feed` it the bytes read elsewhere
+    (utils/serial_ingest.py) and write the `ping_frame` when `ping_due`.
+
+    Parameters
+    ---
+    ser: serial.Serial, optional
+        Port polled by `poll`, opened with a short read timeout (it bounds the ping period jitter), e.g. 0.01 s
+
+    ping_interval: float, default=PING_INTERVAL_S
+        Period (s) of the clock sync pings once the fit window is full, 0 to disable clock sync
+
+    clock: ClockSync, optional
+        Device clock fit, in nanoseconds
+    """
+    def __init__(self, ser=None, ping_interval=PING_INTERVAL_S, clock=None):
+        self.ser = ser
+        self.ping_interval = ping_interval
+        self.clock = clock if clock is not None else ClockSync()
+        self.parser = FrameParser()
+        self.next_ping_id = 0
+        self.pending_pings = {}  # ping id -> host send time (ns)
+        self.t_next_ping = 0.0
+        self.last_seq = None
+        self.n_records = 0
+        self.n_lost = 0
+        self.n_echoes = 0
+        self.last_rtt_ns = 0
+
+    def ping_due(self, now):
+        return bool(self.ping_interval) and now >= self.t_next_ping
+
+    def ping_frame(self, now):
+        """
+        Next PING frame, to be written right away: its send time is taken now
+        """
+        ping_id = self.next_ping_id
+        self.next_ping_id = (ping_id + 1) & 0xFFFFFFFF
+        # drop the pings whose echo never came back
+        stale = now - PING_TIMEOUT_S
+        self.pending_pings = {i: t for i, t in self.pending_pings.items() if t / 1e9 > stale}
+        fast = len(self.clock) < self.clock.window
+        self.t_next_ping = now + (self.ping_interval / 10 if fast else self.ping_interval)
+        self.pending_pings[ping_id] = time.perf_counter_ns()
+        return encode_frame(MSG_PING, ping_id)
+
+    def reset(self):
+        """
+        Starts over after a reconnection (the Teensy may have been reset), keeping the counters
+        """
+        self.clock.reset()
+        self.parser = FrameParser()
+        self.pending_pings = {}
+        self.t_next_ping = 0.0
+        self.last_seq = None
+
+    def _echo(self, ping_id, device_us, arrival_ns):
+        t_send = self.pending_pings.pop(ping_id, None)
+        if t_send is None:
+            return
+        rtt = arrival_ns - t_send
+        self.n_echoes += 1
+        self.last_rtt_ns = rtt
+        self.clock.add(device_us * NS_PER_US, t_send + rtt // 2, rtt // 2)
+
+    def _record(self, seq, press_us, onset_us, arrival_ns):
+        if self.last_seq is not None and seq > self.last_seq + 1:
+            self.n_lost += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.n_records += 1
+        latency_ms = (onset_us - press_us) / 1000.0
+        if self.clock.ready:
+            press_ns = self.clock.to_host(press_us * NS_PER_US)
+            onset_ns = self.clock.to_host(onset_us * NS_PER_US)
+            return TapRecord(seq, press_us, onset_us, latency_ms, press_ns, onset_ns, arrival_ns, True)
+        # no mapping yet: the record left the Teensy at the onset at the earliest
+        onset_ns = arrival_ns
+        press_ns = onset_ns - (onset_us - press_us) * NS_PER_US
+        return TapRecord(seq, press_us, onset_us, latency_ms, press_ns, onset_ns, arrival_ns, False)
+
+    def feed(self, data, arrival_ns):
+        """
+        Handles bytes read at host time `arrival_ns`.
+
+        Returns
+        ---
+        List of the `TapRecord` completed by `data`
+        """
+        records = []
+        for msg_type, fields in self.parser.feed(data):
+            if msg_type == MSG_TAP:
+                records.append(self._record(*fields, arrival_ns))
+            elif msg_type == MSG_ECHO:
+                self._echo(*fields, arrival_ns)
+        return records
+
+    def poll(self):
+        """
+        Sends the ping due, reads what arrived on `ser` (blocking up to the port timeout) and handles it.
+
+        Returns
+        ---
+        List of the `TapRecord` received
+        """
+        now = time.perf_counter()
+        if self.ping_due(now):
+            self.ser.write(self.ping_frame(now))
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if not data:
+            return []
+        return self.feed(data, time.perf_counter_ns())
+
+    def stats(self):
+        return {'records': self.n_records, 'lost': self.n_lost, 'echoes': self.n_echoes,
+                'crc_errors': self.parser.n_crc_errors, 'skipped_bytes': self.parser.n_skipped_bytes}
+
+    def __repr__(self):
+        stats = ", ".join(f"{k} {v}" for k, v in self.stats().items())
+        return f"TeensyLink({stats}, {self.clock})"
+
+
+class TextLink:
+    """
+    Decimal latency lines of the older firmware, with the `TeensyLink` interface (no clock sync):
+    records are stamped with their arrival time, like the original log_serial.py.
+    """
+    ping_interval = 0
+
+    def __init__(self, ser=None):
+        self.ser = ser
+        self.buffer = bytearray()
+        self.n_records = 0
+        self.n_invalid = 0
+        self.n_echoes = 0
+
+    def ping_due(self, now):
+        return False
+
+    def reset(self):
+        self.buffer.clear()
+
+    def feed(self, data, arrival_ns):
+        buffer = self.buffer
+        buffer += data
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            return []
+        lines = bytes(buffer[:end]).split(b'\n')
+        del buffer[:end + 1]
+        records = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.isdigit():
+                self.n_invalid += 1
+                continue
+            self.n_records += 1
+            records.append(TapRecord(self.n_records - 1, 0, 0, int(line), arrival_ns, arrival_ns, arrival_ns, False))
+        return records
+
+    def poll(self):
+        data = self.ser.read(self.ser.in_waiting or 1)
+        return self.feed(data, time.perf_counter_ns()) if data else []
+
+    def stats(self):
+        return {'records': self.n_records, 'invalid_lines': self.n_invalid}
+
+    def __repr__(self):
+        return f"TextLink(records {self.n_records}, invalid lines {self.n_invalid})"
@@ -0,0 +1,171 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.frame_ring import SLOT_META_DTYPE
+
+"""
+Per-frame telemetry ring.
+
+tableB.csv only holds the timings of the frames where a tap fired. The telemetry ring keeps one
+compact record for every frame the pipeline processed: the producer timings (the frame ring slot
+metadata), the consumer timings, the hand presence and the tap state, so the tail behaviour between
+taps can be analysed after the run.
+
+The ring is a fixed-size `SharedMemory` block written by a single process (the consumer, or the
+decision process of a detector pool) and read by any other one, e.g. the main process exporting it
+at exit or on demand. Once full, the oldest records are overwritten. Writing a record is a handful
+of scalar stores (~2 us), no allocation.
+
+Durations are in seconds, like the frame ring metadata.
+"""
+
+TELEMETRY_DTYPE = np.dtype([
+    ('meta', SLOT_META_DTYPE),     # producer side: frame id, timestamps and camera read timings
+    ('frame_age', np.float32),     # age of the frame when its detection started
+    ('detect_time', np.float32),
+    ('queue_delay', np.float32),   # detector pool: time spent in the reorder buffer
+    ('t_done', np.float64),        # host time.perf_counter() when the result was processed
+    ('last_dist', np.float32),     # pinky edge distance to the reference line, NaN without hand
+    ('n_hands', np.int8),
+    ('worker', np.int8),
+    ('valid', np.int8),            # 0 when the frame was overwritten during detection (result dropped)
+    ('tap', np.int8),              # 1 when a tap fired on this frame
+])
+
+_HEADER_SIZE = 64  # records written so far (uint64)
+
+
+class TelemetryRing:
+    """
+    Fixed-size shared-memory ring of per-frame records.
+
+    Like `FrameRing`, it pickles as a reference to its shared memory block and can be passed
+    directly as a `multiprocessing.Process` argument.
+
+    Parameters
+    ---
+    name: str
+        Name of an existing shared memory block (use `TelemetryRing.create` to allocate a new one)
+
+    capacity: int
+        Number of records kept
+    """
+    def __init__(self, name, capacity, _create=False):
+        self.capacity = int(capacity)
+        size = _HEADER_SIZE + self.capacity * TELEMETRY_DTYPE.itemsize
+        if _create:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        self._head = np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=0)
+        self._records = np.ndarray((self.capacity,), dtype=TELEMETRY_DTYPE, buffer=buf, offset=_HEADER_SIZE)
+        if _create:
+            self._head[0] = 0
+
+        # Column views built once, so `record` only does scalar stores
+        self._meta = self._records['meta']
+        self._frame_id = self._meta['frame_id']
+        self._frame_age = self._records['frame_age']
+        self._detect_time = self._records['detect_time']
+        self._queue_delay = self._records['queue_delay']
+        self._t_done = self._records['t_done']
+        self._last_dist = self._records['last_dist']
+        self._n_hands = self._records['n_hands']
+        self._worker = self._records['worker']
+        self._valid = self._records['valid']
+        self._tap = self._records['tap']
+        self._count = int(self._head[0])
+
+    @classmethod
+    def create(cls, capacity):
+        """
+        Allocates a new ring. The creating process is in charge of calling `unlink` at exit.
+        """
+        return cls(None, capacity, _create=True)
+
+    def __reduce__(self):
+        return (self.__class__, (self.shm.name, self.capacity))
+
+    # ---------------------- Writer side ----------------------
+    def record(self, frame_id, meta, frame_age, detect_time, t_done, n_hands=0, last_dist=float('nan'),
+               valid=True, tap=False, worker=0, queue_delay=0.0):
+        """
+        Appends the record of one processed frame. Only one process may write to a ring.
+
+        Parameters
+        ---
+        frame_id: int
+
+        meta: np.ndarray of SLOT_META_DTYPE with shape (1,), or None
+            Slot metadata of the frame; None if it could not be read consistently
+
+        frame_age, detect_time, t_done, queue_delay: float
+            Seconds (`t_done` is a `time.perf_counter()` value)
+        """
+        i = self._count % self.capacity
+        self._meta[i] = meta[0] if meta is not None else 0
+        self._frame_id[i] = frame_id
+        self._frame_age[i] = frame_age
+        self._detect_time[i] = detect_time
+        self._queue_delay[i] = queue_delay
+        self._t_done[i] = t_done
+        self._last_dist[i] = last_dist
+        self._n_hands[i] = n_hands
+        self._worker[i] = worker
+        self._valid[i] = valid
+        self._tap[i] = tap
+        self._count += 1
+        self._head[0] = self._count
+
+    # ---------------------- Reader side ----------------------
+    def __len__(self):
+        return min(int(self._head[0]), self.capacity)
+
+    def records(self):
+        """
+        Copy of the stored records, oldest first. While the writer is running, the copy is taken
+        without synchronization: the record being written at that moment may be incomplete.
+        """
+        count = int(self._head[0])
+        if count <= self.capacity:
+            return self._records[:count].copy()
+        start = count % self.capacity
+        return np.concatenate([self._records[start:], self._records[:start]])
+
+    def columns(self):
+        """
+        Stored records as a dict of flat columns (the `meta` fields are inlined), oldest first
+        """
+        records = self.records()
+        columns = {name: records['meta'][name] for name in SLOT_META_DTYPE.names if name != 'seq'}
+        columns.update({name: records[name] for name in TELEMETRY_DTYPE.names if name != 'meta'})
+        return columns
+
+    def export(self, path):
+        """
+        Writes the stored records as an uncompressed `.npz` file, one array per column
+        (`np.load(path)['detect_time']`).
+
+        Returns
+        ---
+        Number of records exported
+        """
+        columns = self.columns()
+        np.savez(path, **columns)
+        return len(columns['frame_id'])
+
+    # ---------------------- Cleanup ----------------------
+    def close(self):
+        self._head = self._records = self._meta = self._frame_id = None
+        self._frame_age = self._detect_time = self._queue_delay = self._t_done = self._last_dist = None
+        self._n_hands = self._worker = self._valid = self._tap = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+    def unlink(self):
+        self.shm.unlink()
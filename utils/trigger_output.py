@@ -0,0 +1,212 @@
+import errno
+import socket
+import struct
+import time
+
+"""
+Low-overhead trigger output layer.
+
+OSC messages sent on taps have fixed addresses and arguments, so they are encoded once
+(`TriggerOutput.register`) and every send is then a single non-blocking `sendto` per target.
+Several transports can be combined:
+- UDP unicast to one or several receivers (`udp:HOST:PORT`)
+- UDP multicast (`multicast:GROUP:PORT[:TTL]`)
+- Unix-domain datagram sockets (`unix:PATH`)
+"""
+
+DEFAULT_TARGETS = ('udp:127.0.0.1:11111',)
+
+
+# ---------------------- OSC encoding ----------------------
+def _osc_string(s):
+    b = s.encode('ascii') + b'\0'
+    return b + b'\0' * (-len(b) % 4)
+
+
+def _osc_blob(b):
+    return struct.pack('>i', len(b)) + b + b'\0' * (-len(b) % 4)
+
+
+def encode_osc_message(address, *args):
+    """
+    Encodes an OSC 1.0 message. Supported arguments: int (int32), float (float32), str, bytes (blob), bool.
+    """
+    tags = ','
+    payload = b''
+    for arg in args:
+        if isinstance(arg, bool):
+            tags += 'T' if arg else 'F'
+        elif isinstance(arg, int):
+            tags += 'i'
+            payload += struct.pack('>i', arg)
+        elif isinstance(arg, float):
+            tags += 'f'
+            payload += struct.pack('>f', arg)
+        elif isinstance(arg, str):
+            tags += 's'
+            payload += _osc_string(arg)
+        elif isinstance(arg, (bytes, bytearray)):
+            tags += 'b'
+            payload += _osc_blob(bytes(arg))
+        else:
+            raise TypeError(f'Unsupported OSC argument type: {type(arg).__name__}')
+    return _osc_string(address) + _osc_string(tags) + payload
+
+
+def encode_osc_bundle(messages, timetag=1):
+    """
+    Encodes an OSC bundle of already encoded messages. The default timetag (1) means "immediately".
+    """
+    out = _osc_string('#bundle') + struct.pack('>Q', timetag)
+    for message in messages:
+        out += struct.pack('>i', len(message)) + message
+    return out
+
+
+# ---------------------- Transports ----------------------
+class UdpTransport:
+    """
+    Non-blocking UDP sender to one or several (host, port) targets
+    """
+    def __init__(self, targets):
+        self.targets = [(host, int(port)) for host, port in targets]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.dropped = 0
+        self.last_errno = None
+
+    def send(self, data):
+        for target in self.targets:
+            try:
+                self.sock.sendto(data, target)
+            except OSError as e:
+                # full buffer, no receiver, no route, ...: a trigger is never worth blocking the loop
+                self.dropped += 1
+                self.last_errno = e.errno
+
+    def close(self):
+        self.sock.close()
+
+    def __repr__(self):
+        return f"udp{self.targets}"
+
+
+class MulticastTransport(UdpTransport):
+    """
+    Non-blocking UDP multicast sender, reaching every receiver subscribed to the group
+    """
+    def __init__(self, group, port, ttl=1, loopback=True):
+        super().__init__([(group, port)])
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, struct.pack('b', ttl))
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1 if loopback else 0)
+
+    def __repr__(self):
+        return f"multicast{self.targets}"
+
+
+class UnixSocketTransport:
+    """
+    Non-blocking Unix-domain datagram sender, for receivers on the same machine
+    """
+    def __init__(self, path):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.dropped = 0
+        self.last_errno = None
+
+    def send(self, data):
+        try:
+            self.sock.sendto(data, self.path)
+        except OSError as e:
+            self.dropped += 1
+            self.last_errno = e.errno
+
+    def close(self):
+        self.sock.close()
+
+    def __repr__(self):
+        return f"unix[{self.path}]"
+
+
+def make_transport(spec):
+    """
+    Builds a transport from its description: `udp:HOST:PORT`, `multicast:GROUP:PORT[:TTL]` or `unix:PATH`.
+    A bare `HOST:PORT` is read as UDP.
+    """
+    kind, _, rest = spec.partition(':')
+    if kind == 'udp':
+        host, port = rest.rsplit(':', 1)
+        return UdpTransport([(host, port)])
+    if kind == 'multicast':
+        parts = rest.split(':')
+        ttl = int(parts[2]) if len(parts) > 2 else 1
+        return MulticastTransport(parts[0], int(parts[1]), ttl)
+    if kind == 'unix':
+        return UnixSocketTransport(rest)
+    if rest.isdigit():
+        return UdpTransport([(kind, rest)])
+    raise ValueError(f'Unknown trigger output target: {spec}')
+
+
+# ---------------------- Output ----------------------
+class TriggerOutput:
+    """
+    Sends pre-encoded OSC messages to every configured transport.
+
+    Parameters
+    ---
+    targets: list of str
+        Transport descriptions, see `make_transport`
+    """
+    def __init__(self, targets=DEFAULT_TARGETS):
+        self.transports = [make_transport(spec) for spec in targets]
+        self.templates = {}
+        self.n_sent = 0
+
+    def register(self, name, address, *args):
+        """
+        Pre-encodes the message sent by `send(name)`
+        """
+        self.templates[name] = encode_osc_message(address, *args)
+        return self.templates[name]
+
+    def send(self, name):
+        """
+        Sends a registered message.
+
+        Returns
+        ---
+        Time spent sending (s)
+        """
+        t0 = time.perf_counter()
+        data = self.templates[name]
+        for transport in self.transports:
+            transport.send(data)
+        self.n_sent += 1
+        return time.perf_counter() - t0
+
+    def send_raw(self, data):
+        """
+        Sends already encoded data (e.g. a bundle)
+        """
+        for transport in self.transports:
+            transport.send(data)
+
+    @property
+    def dropped(self):
+        return sum(t.dropped for t in self.transports)
+
+    def drop_report(self):
+        """
+        Dropped sends per transport with the last error, e.g. "udp[('127.0.0.1', 11111)]: 3 (last ECONNREFUSED)"
+        """
+        return ', '.join(f"{t!r}: {t.dropped} (last {errno.errorcode.get(t.last_errno, t.last_errno)})"
+                         for t in self.transports if t.dropped)
+
+    def close(self):
+        for transport in self.transports:
+            transport.close()
+
+    def __repr__(self):
+        return f"TriggerOutput({', '.join(map(repr, self.transports))})"
@@ -0,0 +1,304 @@
+import json
+import os
+
+import numpy as np
+
+from utils.hand_landmarks import LEFT, N_LANDMARKS, RIGHT, UNKNOWN
+
+"""
+Multi-zone trigger engine.
+
+A trigger zone is a region of the image tied to a set of landmarks, a hand and an OSC address:
+- `line`: contact when the landmarks get within `threshold` pixels of the (possibly tilted) line
+  through `p0` and `p1`; the calibrated reference line is a `line` zone
+- `rect`: contact when the landmarks enter the rectangle of corners `p0`, `p1`, rotated by `angle`
+  degrees around its center (`threshold` > 0 widens it)
+- `pad`: contact when the landmarks enter the disc of `center` and `radius`
+
+Every zone kind is described by the same parameters (center, rotation, half extents, corner radius),
+so the distance of every zone's landmark point to its zone is one rounded-box signed distance,
+evaluated for all hands and all zones at once with a fixed number of NumPy operations on preallocated
+buffers: the landmark averaging, the conversion to pixels and the move to every zone's axes are folded
+into one matrix, so a frame costs a single matmul followed by element-wise operations. The per-zone
+hysteresis state and counters are arrays too, and the hand eligibility of every zone is precomputed
+per handedness: the per-frame cost barely grows from one zone to dozens
+(`python -m benchmarks.trigger_zones`).
+
+Zones are stored in the `zones` list of config/calibration.json, e.g.:
+
+    {"name": "pad_1", "kind": "pad", "center": [200, 380], "radius": 30,
+     "landmarks": [8], "hand": "right", "address": "/pad/1", "hysteresis": 2}
+
+Optional fields and defaults: `landmarks` [17, 18, 19, 20] (pinky edge, averaged), `hand` "left"
+(hand codes: "left", "right", "any"; hands of unknown handedness match every zone), `address`
+"/trigger", `threshold` the calibrated `mean + 3 * std` for lines and 0 for rects and pads,
+`hysteresis` 0 (pixels beyond the threshold before the zone is released).
+"""
+
+ANY_HAND = -2
+HAND_CODES = {'left': LEFT, 'right': RIGHT, 'any': ANY_HAND}
+ZONE_KINDS = ('line', 'rect', 'pad')
+PINKY_EDGE = [17, 18, 19, 20]
+DEFAULT_ADDRESS = '/trigger'
+
+
+def legacy_line_zone(y_line, threshold=None, line=None):
+    """
+    The single trigger of the original pipeline: pinky edge of the left hand on the reference line
+    (horizontal at `y_line`, or through the end points `line` when it is tilted)
+    """
+    p0, p1 = line if line is not None else ([0, y_line], [1, y_line])
+    zone = {'name': 'line', 'kind': 'line', 'p0': list(p0), 'p1': list(p1),
+            'landmarks': PINKY_EDGE, 'hand': 'left', 'address': DEFAULT_ADDRESS}
+    if threshold is not None:
+        zone['threshold'] = threshold
+    return zone
+
+
+def load_zones(calib_file='config/calibration.json'):
+    """
+    Zone set stored in the calibration file, None if it only holds the reference line
+    """
+    if not os.path.exists(calib_file):
+        return None
+    with open(calib_file, 'r') as fp:
+        return json.load(fp).get('zones') or None
+
+
+def _zone_geometry(zone):
+    """
+    (center, direction of the local x axis, half extents, corner radius) of a zone
+    """
+    kind = zone.get('kind')
+    if kind == 'line':
+        p0, p1 = np.asarray(zone['p0'], dtype=np.float64), np.asarray(zone['p1'], dtype=np.float64)
+        direction = p1 - p0
+        length = np.hypot(*direction)
+        if length == 0:
+            raise ValueError(f"Zone '{zone.get('name')}': p0 and p1 of a line must differ")
+        return p0, direction / length, (np.inf, 0.0), 0.0
+    if kind == 'rect':
+        p0, p1 = np.asarray(zone['p0'], dtype=np.float64), np.asarray(zone['p1'], dtype=np.float64)
+        angle = np.radians(zone.get('angle', 0.0))
+        half = np.abs(p1 - p0) / 2
+        return (p0 + p1) / 2, np.array([np.cos(angle), np.sin(angle)]), tuple(half), 0.0
+    if kind == 'pad':
+        return np.asarray(zone['center'], dtype=np.float64), np.array([1.0, 0.0]), (0.0, 0.0), float(zone['radius'])
+    raise ValueError(f"Zone '{zone.get('name')}': unknown kind {kind!r}, expected one of {ZONE_KINDS}")
+
+
+class TriggerZones:
+    """
+    Vectorized hysteresis trigger over a set of zones, a drop-in replacement for `TapDetector`.
+
+    Parameters
+    ---
+    zones: list of dict
+        Zone descriptions, see the module docstring
+
+    frame_shape: tuple
+        (height, width, ...) of the frames, to convert normalized landmarks to pixels
+
+    default_threshold: float, default=0.0
+        Threshold (pixels) of the line zones without their own `threshold`
+
+    max_hands: int, default=2
+        Maximum number of hands per detection, to size the preallocated buffers
+
+    Attributes
+    ---
+    fired: np.ndarray of int
+        Indices of the zones that fired on the last `update`
+
+    tap_numbers: np.ndarray of shape (n_zones,), int64
+        Tap number (`counter` value) of the last tap of every zone
+    """
+    def __init__(self, zones, frame_shape, default_threshold=0.0, max_hands=2):
+        if not zones:
+            raise ValueError("TriggerZones needs at least one zone")
+        self.zones = [dict(zone) for zone in zones]
+        n_zones = len(zones)
+        self.names = []
+        self.addresses = []
+        self.weights = np.zeros((n_zones, N_LANDMARKS), dtype=np.float32)
+        self.center = np.empty((n_zones, 2), dtype=np.float32)
+        self.rotation = np.empty((n_zones, 2, 2), dtype=np.float32)  # image -> zone axes
+        self.half = np.empty((n_zones, 2), dtype=np.float32)
+        self.radius = np.empty(n_zones, dtype=np.float32)
+        self.hand = np.empty(n_zones, dtype=np.int8)
+        self.threshold = np.empty(n_zones, dtype=np.float32)
+        self.release = np.empty(n_zones, dtype=np.float32)
+        self.default_threshold_zones = np.zeros(n_zones, dtype=bool)
+
+        for i, zone in enumerate(self.zones):
+            name = zone.setdefault('name', f'zone_{i}')
+            if name in self.names:
+                raise ValueError(f"Duplicate zone name '{name}'")
+            self.names.append(name)
+            self.addresses.append(zone.setdefault('address', DEFAULT_ADDRESS))
+            landmarks = zone.setdefault('landmarks', PINKY_EDGE)
+            if not landmarks or min(landmarks) < 0 or max(landmarks) >= N_LANDMARKS:
+                raise ValueError(f"Zone '{name}': landmarks must be indices in [0, {N_LANDMARKS})")
+            self.weights[i, landmarks] = 1.0 / len(landmarks)
+            center, axis, half, radius = _zone_geometry(zone)
+            self.center[i] = center
+            self.rotation[i] = [[axis[0], axis[1]], [-axis[1], axis[0]]]
+            self.half[i] = half
+            self.radius[i] = radius
+            hand = zone.setdefault('hand', 'left')
+            if hand not in HAND_CODES:
+                raise ValueError(f"Zone '{name}': unknown hand {hand!r}, expected one of {list(HAND_CODES)}")
+            self.hand[i] = HAND_CODES[hand]
+            self.default_threshold_zones[i] = zone['kind'] == 'line' and 'threshold' not in zone
+            self.threshold[i] = zone.get('threshold', default_threshold if zone['kind'] == 'line' else 0.0)
+            self.release[i] = self.threshold[i] + zone.get('hysteresis', 0.0)
+
+        self.scale = np.array([frame_shape[1], frame_shape[0]], dtype=np.float32)
+        self.any_hand = self.hand == ANY_HAND
+        self._fold_affine()
+        # +inf added to the distances of the zones a hand of this handedness (LEFT, RIGHT, UNKNOWN) cannot trigger
+        self._hand_penalty = {}
+        for code in (LEFT, RIGHT, UNKNOWN):
+            eligible = self.any_hand | (self.hand == code) | (code == UNKNOWN)
+            self._hand_penalty[code] = np.where(eligible, 0.0, np.inf).astype(np.float32)
+
+        # state
+        self.state = np.zeros(n_zones, dtype=bool)
+        self.counts = np.zeros(n_zones, dtype=np.int64)
+        self.tap_numbers = np.zeros(n_zones, dtype=np.int64)
+        self.counter = 0
+        self.fired = np.empty(0, dtype=np.intp)
+        self.last_dist = float('nan')
+        self.fire_mode = 'contact'
+
+        # preallocated buffers, sliced to the number of hands detected
+        self._local = np.empty((max_hands, n_zones, 2), dtype=np.float32)
+        self._dist = np.empty((max_hands, n_zones), dtype=np.float32)
+        self._inside = np.empty((max_hands, n_zones), dtype=np.float32)
+        self._masked = np.empty((max_hands, n_zones), dtype=np.float32)
+        self._min_dist = np.empty(n_zones, dtype=np.float32)
+        self._enter = np.empty(n_zones, dtype=bool)
+        self._leave = np.empty(n_zones, dtype=bool)
+        self._not_state = np.empty(n_zones, dtype=bool)
+        self._seen = np.empty(n_zones, dtype=bool)
+
+    def _fold_affine(self):
+        """
+        Folds landmark weights, pixel scale, zone center and zone rotation into one affine map from the
+        flattened (x, y, z) landmarks of a hand to the coordinates of its landmark point in every zone's axes:
+        `local = landmarks.reshape(n, -1) @ self._affine - self._offset`, viewed as (n, n_zones, 2)
+        """
+        n_zones = len(self.names)
+        affine = np.zeros((N_LANDMARKS, 3, n_zones, 2), dtype=np.float64)
+        for c in range(2):  # x, y; z does not contribute
+            # local[z, d] = sum_k rotation[z, d, c] * scale[c] * weights[z, k] * landmarks[k, c] - rotation[z] @ center[z]
+            affine[:, c] = (self.weights.T.astype(np.float64)[:, :, None]
+                            * (self.rotation[:, :, c].astype(np.float64) * float(self.scale[c]))[None])
+        self._affine = affine.reshape(N_LANDMARKS * 3, n_zones * 2).astype(np.float32)
+        self._offset = np.einsum('zdc,zc->zd', self.rotation.astype(np.float64),
+                                 self.center.astype(np.float64)).astype(np.float32)
+
+    def set_default_threshold(self, threshold):
+        """
+        Moves the threshold (and release distance) of the line zones without their own `threshold`,
+        e.g. after an online recalibration
+        """
+        mask = self.default_threshold_zones
+        self.release[mask] += threshold - self.threshold[mask]
+        self.threshold[mask] = threshold
+
+    @property
+    def n_zones(self):
+        return len(self.names)
+
+    def distances(self, hands):
+        """
+        Signed distance (pixels, negative inside) of every hand's landmark point to every zone.
+
+        Returns
+        ---
+        Array of shape (hands.n, n_zones), a view on a preallocated buffer
+        """
+        n = hands.n
+        local, dist, inside = self._local[:n], self._dist[:n], self._inside[:n]
+        # landmark point of every (hand, zone) in the zone's axes: weighted mean of the zone's landmarks,
+        # in pixels, relative to the zone center, rotated (one matmul, see `_fold_affine`)
+        np.matmul(hands.landmarks[:n].reshape(n, N_LANDMARKS * 3), self._affine,
+                  out=local.reshape(n, self._affine.shape[1]))
+        local -= self._offset
+        # rounded-box distance: |max(|q| - half, 0)| + min(max(qx, qy), 0) - radius
+        np.abs(local, out=local)
+        local -= self.half
+        qx, qy = local[:, :, 0], local[:, :, 1]
+        np.maximum(qx, qy, out=inside)
+        np.minimum(inside, 0.0, out=inside)
+        np.maximum(local, 0.0, out=local)
+        np.hypot(qx, qy, out=dist)
+        dist += inside
+        dist -= self.radius
+        return dist
+
+    def update(self, hands, frame_height=None, t=0.0, frame_id=0):
+        """
+        Updates the contact state of every zone with the hands detected on a frame.
+
+        Parameters
+        ---
+        hands: HandLandmarks
+            Output of `HandPoseDetector.detect_landmarks`
+
+        frame_height, t, frame_id:
+            Accepted for compatibility with `TapDetector.update` (the frame shape is given at construction)
+
+        Returns
+        ---
+        True if at least one zone fired on this frame (`self.fired` holds their indices)
+        """
+        n = hands.n
+        if n == 0:
+            self.fired = self.fired[:0]
+            return False
+
+        dist = self.distances(hands)
+        # closest eligible hand of every zone, +inf when no hand is eligible
+        masked = self._masked[:n]
+        handedness = hands.handedness
+        for i in range(n):
+            np.add(dist[i], self._hand_penalty[int(handedness[i])], out=masked[i])
+        min_dist = self._min_dist
+        np.min(masked, axis=0, out=min_dist)
+
+        enter, leave, seen = self._enter, self._leave, self._seen
+        np.less(min_dist, np.inf, out=seen)  # a zone without an eligible hand keeps its state
+        np.logical_not(self.state, out=self._not_state)
+        np.less(min_dist, self.threshold, out=enter)
+        enter &= self._not_state
+        np.greater_equal(min_dist, self.release, out=leave)
+        leave &= self.state
+        leave &= seen
+        self.state |= enter
+        np.logical_not(leave, out=leave)
+        self.state &= leave
+
+        closest = float(min_dist.min())
+        if closest != np.inf:
+            self.last_dist = closest
+
+        if not enter.any():
+            self.fired = self.fired[:0]
+            return False
+        self.fired = np.flatnonzero(enter)
+        self.counts[self.fired] += 1
+        for i in self.fired:
+            self.counter += 1
+            self.tap_numbers[i] = self.counter
+        return True
+
+    def pop_resolution(self):
+        """
+        Zone taps are resolved as soon as they fire
+        """
+        return None
+
+    def __repr__(self):
+        return f"TriggerZones({', '.join(f'{name} -> {address}' for name, address in zip(self.names, self.addresses))})"
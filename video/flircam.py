@@ -33,9 +33,14 @@ class Flircam(VideoInput):
     color_processor: PySpin.ImageProcessor
         In charge of defining the very first processing steps after image acquisition.
         It includes the expected raw pixel format (may vary from one camera to another) and the interpolation algorithm (can be changed according to expected image quality)
+
+    bayer: bool
+        If True, `read_frame` returns the raw BayerRG8 mosaic (height, width) without any color conversion,
+        to be demosaiced once, straight to RGB, by the detector (see utils/bayer.py)
     """
-    def __init__(self):
+    def __init__(self, bayer=False):
         self.system = None
+        self.bayer = bayer
 
         logger.debug('Finding camera')
         self.cam = self._find_camera()
@@ -155,9 +160,13 @@ class Flircam(VideoInput):
             if frame_cam.IsIncomplete():
                 logger.warning('Image incomplete')
                 return None
-            frame_conv = self.color_processor.Convert(frame_cam, PySpin.PixelFormat_BGR8)
-            frame = frame_conv.GetNDArray()
-            frame.flags.writeable = True
+            if self.bayer:
+                # the camera buffer goes back to the driver on Release: keep a copy of the mosaic
+                frame = frame_cam.GetNDArray().copy()
+            else:
+                frame_conv = self.color_processor.Convert(frame_cam, PySpin.PixelFormat_BGR8)
+                frame = frame_conv.GetNDArray()
+                frame.flags.writeable = True
             frame_cam.Release()
             time_3 = time.perf_counter()
             
@@ -170,6 +179,22 @@ class Flircam(VideoInput):
             logger.exception(e)
 
 
+    def latch_timestamp(self):
+        """
+        Latches the camera timestamp counter (the clock of the chunk timestamps, latched at exposure start).
+        The host time is the middle of the latch command, the uncertainty half its USB round trip.
+        """
+        try:
+            time_0 = time.perf_counter_ns()
+            self.cam.TimestampLatch.Execute()
+            time_1 = time.perf_counter_ns()
+            device_ns = self.cam.TimestampLatchValue.GetValue()
+        except PySpin.SpinnakerException as e:
+            logger.warning(f'Timestamp latch failed: {e}')
+            return None
+        return device_ns, (time_0 + time_1) // 2, (time_1 - time_0) // 2
+
+
     def cleanup(self):
         """
         Abstract method implementation
@@ -0,0 +1,287 @@
+import glob
+import logging
+import os
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from utils.bayer import BAYER_RG2BGR, demosaic, mosaic_rg
+from video.video_input import VideoInput
+
+logger = logging.getLogger(__name__)
+
+NS_PER_S = 1000000000
+
+
+class ReplayVideoInput(VideoInput):
+    """
+    Plays back recorded frames as if they came from the camera, so the pipeline can run without the Blackfly and PySpin.
+
+    Supported sources:
+    - video files readable by OpenCV (e.g. the AVI files written by record_flircam.py)
+    - `.npy` frame stacks of shape (n_frames, height, width, 3), or (n_frames, height, width) Bayer mosaics, memory-mapped
+    - trial folders saved by latency_mp.py (`frames.npy` stacks or images), or a `frames` folder holding several
+      trials; their `index.csv` timestamps are honored, trials being played back to back
+    - folders of images
+
+    `read_frame` returns the same `(frame, ts, (t_frameacq, t_getts, t_frameconv))` tuple as `Flircam.read_frame`,
+    where `ts` is the recorded timestamp of the frame in seconds and `t_frameacq` includes the pacing wait.
+
+    Parameters
+    ---
+    source: str
+        Path to the video file, frame stack or image folder
+
+    fps: float, optional
+        Target frame rate. If None, the recorded inter-frame timestamps are honored when the source has them
+        (video files, trial folders), otherwise frames are paced at `default_fps`
+
+    free_run: bool, default=False
+        Deliver frames as fast as possible, without any pacing
+
+    loop: bool, default=False
+        Restart from the first frame at the end of the source instead of finishing
+
+    frame_size: tuple, optional
+        (width, height) to resize frames to, e.g. to match the pipeline frame shape
+
+    preload: bool, default=True
+        Decode all the frames into memory before playback, so decoding cost does not leak into the measured timings
+
+    default_fps: float, default=522.0
+        Frame rate used for sources without timestamps (image folders, frame stacks)
+
+    bayer: bool, default=False
+        Deliver raw RGGB mosaics (height, width) like `Flircam(bayer=True)`; BGR sources are mosaiced on the fly.
+        Without it, raw trials recorded in Bayer mode are demosaiced to BGR
+    """
+    def __init__(self, source, fps=None, free_run=False, loop=False, frame_size=None, preload=True,
+                 default_fps=522.0, bayer=False):
+        self.source = source
+        self.fps = fps
+        self.free_run = free_run
+        self.loop = loop
+        self.frame_size = frame_size
+        self.preload = preload
+        self.default_fps = default_fps
+        self.bayer = bayer
+        self.finished = False
+        super().__init__()
+
+
+    def configure(self):
+        """
+        Abstract method implementation
+        Opens the source and computes the playback timeline
+        """
+        self._capture = None
+        self._paths = None
+        self._frames = None
+
+        stack_paths = self._list_stacks(self.source) if os.path.isdir(self.source) else []
+        if stack_paths:
+            # raw trials: memory-mapped, frames are only read from disk when played
+            stacks = [np.load(p, mmap_mode='r') for p in stack_paths]
+            self._frames = [stack[i] for stack in stacks for i in range(len(stack))]
+            self.n_frames = len(self._frames)
+            timestamps = self._trial_timestamps([os.path.dirname(p) for p, stack in zip(stack_paths, stacks)
+                                                 for _ in range(len(stack))])
+        elif os.path.isdir(self.source):
+            self._paths = self._list_images(self.source)
+            if not self._paths:
+                raise FileNotFoundError(f'No image found in {self.source}')
+            self.n_frames = len(self._paths)
+            timestamps = self._trial_timestamps([os.path.dirname(p) for p in self._paths])
+        elif self.source.endswith('.npy'):
+            self._frames = np.load(self.source, mmap_mode='r')
+            self.n_frames = len(self._frames)
+            timestamps = None
+        else:
+            self._capture = cv2.VideoCapture(self.source)
+            if not self._capture.isOpened():
+                raise FileNotFoundError(f'Cannot open video {self.source}')
+            timestamps = []
+            frames = [] if self.preload else None
+            while True:
+                ok, frame = self._capture.read()
+                if not ok:
+                    break
+                timestamps.append(self._capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+                if frames is not None:
+                    frames.append(self._resize(frame))
+            self.n_frames = len(timestamps)
+            if frames is not None:
+                self._frames = frames
+                self._capture.release()
+                self._capture = None
+            else:
+                self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            # Containers without per-frame timestamps report 0 everywhere
+            if self.n_frames < 2 or timestamps[-1] <= timestamps[0]:
+                timestamps = None
+
+        if self.n_frames == 0:
+            raise ValueError(f'{self.source} holds no frame')
+
+        if self._paths is not None and self.preload:
+            self._frames = [self._load_image(p) for p in self._paths]
+
+        if self.fps is not None or timestamps is None:
+            period = 1.0 / (self.fps or self.default_fps)
+            timestamps = [i * period for i in range(self.n_frames)]
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self._period = (self.timestamps[-1] - self.timestamps[0]) / max(self.n_frames - 1, 1)
+
+        logger.info(f'Replaying {self.n_frames} frames from {self.source}')
+        self._index = 0
+        self._lap = 0
+        self._t_start = None
+
+
+    @staticmethod
+    def _list_images(folder):
+        """
+        Images of a trial folder, or of every trial folder below it, in recording order
+        """
+        exts = ('*.png', '*.jpg', '*.bmp')
+        paths = sorted(p for ext in exts for p in glob.glob(os.path.join(folder, ext)))
+        if not paths:
+            paths = sorted(p for ext in exts for p in glob.glob(os.path.join(folder, '*', ext)))
+        return paths
+
+
+    @staticmethod
+    def _list_stacks(folder):
+        """
+        Raw `frames.npy` stacks of a trial folder, or of every trial folder below it, in recording order
+        """
+        path = os.path.join(folder, 'frames.npy')
+        if os.path.exists(path):
+            return [path]
+        return sorted(glob.glob(os.path.join(folder, '*', 'frames.npy')))
+
+
+    def _trial_timestamps(self, frame_dirs):
+        """
+        Timeline of frames saved by the trial writer, from the `index.csv` of their trial folder.
+        Trials are chained back to back, one frame period apart. None if a trial has no usable index.
+
+        Parameters
+        ---
+        frame_dirs: list of str
+            Trial folder of every frame, in playback order
+        """
+        counts = Counter(frame_dirs)
+        timeline = []
+        end = None
+        periods = []
+        for folder in counts:
+            index = os.path.join(folder, 'index.csv')
+            if not os.path.exists(index):
+                return None
+            ts = np.genfromtxt(index, delimiter=',', names=True)['ts'].reshape(-1)
+            if len(ts) != counts[folder] or np.any(np.diff(ts) <= 0):
+                return None
+            if len(ts) > 1:
+                periods.append(float(np.median(np.diff(ts))))
+            period = periods[-1] if periods else 1.0 / self.default_fps
+            start = 0.0 if end is None else end + period
+            timeline.extend(start + ts - ts[0])
+            end = timeline[-1]
+        return timeline
+
+
+    def _resize(self, frame):
+        if self.frame_size is not None and (frame.shape[1], frame.shape[0]) != tuple(self.frame_size):
+            frame = cv2.resize(frame, tuple(self.frame_size), interpolation=cv2.INTER_AREA)
+        return frame
+
+
+    def _load_image(self, path):
+        frame = cv2.imread(path, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError(f'Cannot read image {path}')
+        return self._resize(frame)
+
+
+    def _next_raw_frame(self):
+        if self._frames is not None:
+            return self._frames[self._index]
+        if self._paths is not None:
+            return self._load_image(self._paths[self._index])
+        ok, frame = self._capture.read()
+        return self._resize(frame) if ok else None
+
+
+    def read_frame(self):
+        """
+        Abstract method implementation
+        Waits until the frame is due (unless in free-run mode) and returns it.
+        Returns None once the source is exhausted (`finished` is then set).
+        """
+        if self.finished:
+            return None
+        if self._index >= self.n_frames:
+            if not self.loop:
+                self.finished = True
+                return None
+            self._index = 0
+            self._lap += 1
+            if self._capture is not None:
+                self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+        time_0 = time.perf_counter()
+        lap_offset = self._lap * (self.timestamps[-1] - self.timestamps[0] + self._period)
+        rec_ts = self.timestamps[self._index] - self.timestamps[0] + lap_offset
+        if self._t_start is None:
+            self._t_start = time_0
+        if not self.free_run:
+            due = self._t_start + rec_ts
+            # sleep coarsely, then spin for the last millisecond
+            remaining = due - time.perf_counter()
+            if remaining > 0.002:
+                time.sleep(remaining - 0.001)
+            while time.perf_counter() < due:
+                pass
+
+        raw = self._next_raw_frame()
+        time_1 = time.perf_counter()
+        if raw is None:
+            self._index = self.n_frames
+            return self.read_frame()
+        ts = float(rec_ts)
+        time_2 = time.perf_counter()
+        # the conversion stands in for the camera's, and always returns a new array: callers may draw on the frame
+        if self.bayer and raw.ndim == 3:
+            frame = mosaic_rg(raw)
+        elif not self.bayer and raw.ndim == 2:
+            frame = demosaic(np.ascontiguousarray(raw, dtype=np.uint8), BAYER_RG2BGR)
+        else:
+            frame = np.array(raw, dtype=np.uint8, copy=True)
+        time_3 = time.perf_counter()
+        self._index += 1
+
+        return frame, ts, (time_1 - time_0, time_2 - time_1, time_3 - time_2)
+
+
+    def latch_timestamp(self):
+        """
+        The replay clock is the playback time of the recording: frame `ts` is due at playback start + `ts`
+        """
+        now = time.perf_counter_ns()
+        if self._t_start is None:
+            return None
+        return now - int(round(self._t_start * NS_PER_S)), now, 0
+
+
+    def cleanup(self):
+        """
+        Abstract method implementation
+        """
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+        self._frames = None
+        logger.debug('Released replay source')
@@ -0,0 +1,49 @@
+"""
+Selection of the video input used by the pipeline scripts.
+
+The FLIR camera is the default; `--replay PATH` plays back a recording instead
+(see video/replay_video_input.py), so the scripts can run on machines without the camera or PySpin.
+"""
+
+
+def add_video_source_args(parser):
+    """
+    Adds the video source command-line flags to an argparse parser
+    """
+    group = parser.add_argument_group('video source')
+    group.add_argument('--replay', default=None, metavar='PATH',
+                       help='Replay a recording (video file, .npy frame stack or frames folder) instead of using the FLIR camera')
+    group.add_argument('--replay_fps', type=float, default=None,
+                       help='Replay at this frame rate instead of the recorded timestamps')
+    group.add_argument('--free_run', action='store_true',
+                       help='Replay frames as fast as possible')
+    group.add_argument('--loop', action='store_true',
+                       help='Loop the replay source instead of stopping at its end')
+    return parser
+
+
+def video_source_kwargs(args):
+    """
+    Picklable video source description extracted from parsed arguments, to be passed to `open_video_input`
+    """
+    return {
+        'replay': args.replay,
+        'replay_fps': args.replay_fps,
+        'free_run': args.free_run,
+        'loop': args.loop,
+    }
+
+
+def open_video_input(replay=None, replay_fps=None, free_run=False, loop=False, frame_size=(720, 540), bayer=False):
+    """
+    Instantiates the video input: the FLIR camera, or a `ReplayVideoInput` if `replay` is set.
+    Imports are local so that replaying never requires PySpin.
+    With `bayer`, either input delivers raw RGGB mosaics (height, width) instead of BGR frames.
+    """
+    if replay is None:
+        from video.flircam import Flircam
+        return Flircam(bayer=bayer)
+
+    from video.replay_video_input import ReplayVideoInput
+    return ReplayVideoInput(replay, fps=replay_fps, free_run=free_run, loop=loop, frame_size=frame_size,
+                            bayer=bayer)
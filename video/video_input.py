@@ -11,6 +11,9 @@ class VideoInput(ABC):
     Wrapper for all the possible video inputs of the pipeline.
     The frame acquisition process by the app runs its own thread in order not to interfere add any delay in the main loop of the program.
     """
+    # Set by finite inputs (e.g. replays) once there is no frame left to read
+    finished = False
+
     def __init__(self):
         super().__init__()
         self.configure()
@@ -38,6 +41,19 @@ class VideoInput(ABC):
         pass
 
 
+    def latch_timestamp(self):
+        """
+        Latches the device clock, the one of the `ts` returned by `read_frame`, to map it onto the host clock
+        (see utils/clock_sync.py).
+
+        Returns
+        ---
+        (device_ns, host_ns, uncertainty_ns): device clock value, host `time.perf_counter_ns()` at which it was
+        latched and uncertainty of that host time. None if the input has no such clock.
+        """
+        return None
+
+
     @abstractmethod
     def cleanup(self) -> None:
         """